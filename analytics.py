@@ -1,4 +1,10 @@
-from datetime import datetime, timedelta
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from metrics import enrich_flock_data, time_span_minutes
 
 # Common Poultry Diseases in Malaysia / Tropical Regions
 DISEASE_KNOWLEDGE_BASE = {
@@ -44,179 +50,279 @@ DISEASE_KNOWLEDGE_BASE = {
     }
 }
 
-def predict_diseases(note_text):
+class KeywordAutomaton(object):
     """
-    Scans the clinical note text for keywords and returns a list of potential diseases.
+    Aho-Corasick automaton over a fixed set of lower-case phrases.
+    find_all scans the text once and reports every phrase it contains,
+    overlapping ones included, in time linear to the text length.
     """
-    if not note_text:
-        return []
 
-    found_diseases = []
-    text_lower = note_text.lower()
-
-    for disease, info in DISEASE_KNOWLEDGE_BASE.items():
-        matched_keywords = []
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for keyword in keywords:
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            if keyword not in self._out[state]:
+                self._out[state] += (keyword,)
+
+        # Breadth-first pass for the failure links; each state also inherits
+        # the matches of its failure state so shorter phrases are not lost
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                # Children of the root always fall back to the root
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if state else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+def build_disease_matcher(knowledge_base):
+    """Compiles the knowledge base into (automaton, {keyword: [disease index]})."""
+    keyword_diseases = {}
+    for idx, info in enumerate(knowledge_base.values()):
         for keyword in info['keywords']:
-            if keyword in text_lower:
-                matched_keywords.append(keyword)
-
-        if matched_keywords:
-            found_diseases.append({
-                "name": disease,
-                "severity": info['severity'],
-                "matched_symptoms": matched_keywords
-            })
+            keyword_diseases.setdefault(keyword.lower(), []).append(idx)
+    return KeywordAutomaton(keyword_diseases), keyword_diseases
 
-    # Sort by severity (High first)
-    found_diseases.sort(key=lambda x: 0 if x['severity'] == 'High' else 1)
 
-    return found_diseases
+_DISEASES = list(DISEASE_KNOWLEDGE_BASE.items())
+_DISEASE_AUTOMATON, _KEYWORD_DISEASES = build_disease_matcher(DISEASE_KNOWLEDGE_BASE)
 
-def calculate_feed_cleanup_duration(start_time_str, end_time_str):
-    """
-    Calculates duration in minutes between two time strings (HH:MM).
-    Returns None if invalid.
-    """
-    if not start_time_str or not end_time_str:
-        return None
 
-    try:
-        # Check if format includes seconds, if so strip them or parse accordingly
-        # But app.py uses %H:%M usually.
-        # Let's try flexible parsing
-        fmt = '%H:%M'
-        if len(start_time_str) > 5: fmt = '%H:%M:%S'
+@lru_cache(maxsize=4096)
+def _match_note(text_lower):
+    found = _DISEASE_AUTOMATON.find_all(text_lower)
+    if not found:
+        return ()
 
-        t1 = datetime.strptime(start_time_str, fmt)
-        t2 = datetime.strptime(end_time_str, fmt)
+    hit_indexes = sorted({idx for keyword in found for idx in _KEYWORD_DISEASES[keyword]})
+    matches = []
+    for idx in hit_indexes:
+        disease, info = _DISEASES[idx]
+        matched_keywords = tuple(k for k in info['keywords'] if k.lower() in found)
+        matches.append((disease, info['severity'], matched_keywords))
 
-        # Handle overnight cleanup (End < Start)
-        if t2 < t1:
-            t2 += timedelta(days=1)
+    # Sort by severity (High first)
+    matches.sort(key=lambda x: 0 if x[1] == 'High' else 1)
+    return tuple(matches)
 
-        duration = (t2 - t1).total_seconds() / 60 # Minutes
-        return int(duration)
-    except ValueError:
-        return None
 
-def analyze_health_events(flock_logs):
+def predict_diseases(note_text):
     """
-    Processes a list of DailyLog objects to identify health events.
-    Returns a list of event dictionaries sorted by date (descending).
+    Scans the clinical note text for keywords and returns a list of potential diseases.
     """
-    events = []
-
-    # Sort logs by date ascending to calculate rolling averages
-    sorted_logs = sorted(flock_logs, key=lambda x: x.date)
-
-    # Rolling Window Helpers
-    rolling_mortality = [] # List of (mortality_total_pct)
-    rolling_water = []     # List of (water_per_bird)
-    rolling_cleanup = []   # List of (cleanup_duration)
+    if not note_text:
+        return []
 
-    WINDOW_SIZE = 7
+    return [
+        {"name": name, "severity": severity, "matched_symptoms": list(keywords)}
+        for name, severity, keywords in _match_note(note_text.lower())
+    ]
 
-    for log in sorted_logs:
-        # 1. Basic Data Extraction
-        date_str = log.date.strftime('%Y-%m-%d')
+def calculate_feed_cleanup_duration(start_time_str, end_time_str):
+    """
+    Calculates duration in minutes between two time strings (HH:MM).
+    Returns None if invalid.
+    """
+    # Overnight cleanup (End < Start) wraps past midnight
+    return time_span_minutes(start_time_str, end_time_str)
+
+# Deviation rules for the health event detector. Baselines are the rolling
+# mean of the previous `window` valid observations of the same flock.
+HEALTH_EVENT_DEFAULTS = {
+    'window': 7,
+    'mortality_spike_ratio': 1.5,   # mortality % above baseline * ratio ...
+    'mortality_min_birds': 5,       # ... and more than this many birds lost
+    'water_drop_pct': 10.0,         # water per bird below baseline by this %
+    'cleanup_increase_min': 30,     # feed cleanup slower than baseline by this many minutes
+}
 
-        # Metrics
-        stock_start = (log.flock.intake_male + log.flock.intake_female) # Simplified baseline or use enriched logic
-        # Ideally we should use the enriched metrics from `metrics.py` but for simplicity in this standalone analysis:
-        # We will recalculate basic metrics or use raw values if enriched data isn't passed.
-        # However, to be accurate on deviations, we need "Per Bird" metrics.
+_HEALTH_FRAME_COLUMNS = ['flock_key', 'date', 'age_week', 'notes', 'mortality', 'mortality_pct', 'water', 'water_per_bird', 'cleanup_min']
+
+
+def _health_rows(flock_key, flock, daily_stats):
+    rows = []
+    for d in daily_stats:
+        log = d['log']
+        mortality = (d['mortality_male'] or 0) + (d['mortality_female'] or 0) + (d['culls_male'] or 0) + (d['culls_female'] or 0)
+        stock = (d['stock_male_start'] or 0) + (d['stock_female_start'] or 0)
+        rows.append((
+            flock_key,
+            d['date'],
+            (d['date'] - flock.intake_date).days // 7 + 1,
+            log.clinical_notes or "",
+            mortality,
+            (mortality / stock * 100) if stock > 0 else 0.0,
+            d['water_total'] or 0.0,
+            d['water_per_bird'] or 0.0,
+            calculate_feed_cleanup_duration(log.feed_cleanup_start, log.feed_cleanup_end),
+        ))
+    return rows
+
+
+def _prior_mean(frame, column, valid, window):
+    """
+    Mean of the previous `window` valid values per flock, aligned to every row.
+    Rows that are not valid (no water reading, no cleanup time) neither count
+    towards the window nor reset it.
+    """
+    keys = frame['flock_key']
+    running = frame[column][valid].groupby(keys[valid]).rolling(window, min_periods=1).mean()
+    running = running.reset_index(level=0, drop=True).reindex(frame.index)
+    return running.groupby(keys).ffill().groupby(keys).shift(1)
 
-        # Let's rely on raw values and simple calc for now to avoid circular imports or heavy dependency.
-        # app.py passes `logs` which are SQLAlchemy objects.
 
-        # Note Parsing
-        notes = log.clinical_notes or ""
-        predicted_diseases = predict_diseases(notes)
+def detect_health_events(frame, **config):
+    """
+    Vectorized event detection over a frame with _HEALTH_FRAME_COLUMNS,
+    which may hold any number of flocks. Returns the frame with baseline
+    columns and boolean flag columns added.
+    """
+    cfg = dict(HEALTH_EVENT_DEFAULTS, **config)
+    window = int(cfg['window'])
+    frame = frame.sort_values(['flock_key', 'date'], kind='mergesort').reset_index(drop=True)
+    if frame.empty:
+        return frame
 
-        # Feed Cleanup
-        cleanup_duration = calculate_feed_cleanup_duration(log.feed_cleanup_start, log.feed_cleanup_end)
+    frame['mortality_avg'] = _prior_mean(frame, 'mortality', frame['mortality'].notna(), window)
+    frame['mortality_pct_avg'] = _prior_mean(frame, 'mortality_pct', frame['mortality_pct'].notna(), window)
+    frame['water_per_bird_avg'] = _prior_mean(frame, 'water_per_bird', frame['water_per_bird'] > 0, window)
+    frame['water_avg'] = _prior_mean(frame, 'water', frame['water'] > 0, window)
+    frame['cleanup_avg'] = _prior_mean(frame, 'cleanup_min', frame['cleanup_min'].notna(), window)
 
-        # Mortality % (Daily) - Approximate using Intake as denominator if stock history is complex
-        # Or calculate cumulative loss.
-        # For trend analysis, raw count is okay if stock doesn't change drastically, but % is better.
-        # Let's use a simplified stock estimate: Intake. (Deviation will still show spikes)
-        current_mort = (log.mortality_male + log.mortality_female + log.culls_male + log.culls_female)
+    mort_pct_avg = frame['mortality_pct_avg'].fillna(0.0).to_numpy()
+    mort_pct = frame['mortality_pct'].to_numpy()
+    over_min = frame['mortality'].to_numpy() > cfg['mortality_min_birds']
+    frame['flag_mortality'] = over_min & np.where(mort_pct_avg > 0, mort_pct > mort_pct_avg * cfg['mortality_spike_ratio'], True)
 
-        # Water
-        water_vol = log.water_intake_calculated or 0
+    water_avg = frame['water_per_bird_avg'].fillna(0.0).to_numpy()
+    water = frame['water_per_bird'].to_numpy()
+    frame['flag_water'] = (water_avg > 0) & (water > 0) & (water < water_avg * (1 - cfg['water_drop_pct'] / 100.0))
 
-        # 2. Calculate Deviations (vs Rolling Average of previous days)
-        def get_avg(lst):
-            return sum(lst) / len(lst) if lst else 0
+    cleanup_avg = frame['cleanup_avg'].fillna(0.0).to_numpy()
+    cleanup = frame['cleanup_min'].fillna(0.0).to_numpy()
+    frame['flag_cleanup'] = (cleanup_avg > 0) & (cleanup > cleanup_avg + cfg['cleanup_increase_min'])
 
-        avg_mort = get_avg(rolling_mortality)
-        avg_water = get_avg(rolling_water)
-        avg_cleanup = get_avg(rolling_cleanup)
+    frame['flag_notes'] = frame['notes'].str.len().to_numpy() > 0
+    frame['is_event'] = frame['flag_notes'] | frame['flag_mortality'] | frame['flag_water'] | frame['flag_cleanup']
+    return frame
 
-        # Deviations
-        mort_diff = current_mort - avg_mort
-        water_diff = water_vol - avg_water
-        cleanup_diff = (cleanup_duration - avg_cleanup) if (cleanup_duration is not None and avg_cleanup > 0) else 0
 
-        # Thresholds for "Significant Event"
-        # 1. Clinical Notes exist
-        # 2. Mortality Spike (> 50% increase vs avg AND > 5 birds)
-        # 3. Water Drop (> 10% decrease)
-        # 4. Feed Cleanup Increase (> 30 mins)
+def _event_dicts(frame, flocks_by_key=None):
+    events = []
+    for row in frame[frame['is_event']].itertuples(index=False):
+        mortality_avg = 0.0 if pd.isna(row.mortality_avg) else row.mortality_avg
+        water_avg = 0.0 if pd.isna(row.water_per_bird_avg) else row.water_per_bird_avg
+        cleanup_min = None if pd.isna(row.cleanup_min) else int(row.cleanup_min)
+        cleanup_avg = 0.0 if pd.isna(row.cleanup_avg) else row.cleanup_avg
 
-        is_significant = False
         reasons = []
-
-        if notes:
-            is_significant = True
+        if row.flag_notes:
             reasons.append("Clinical Signs Observed")
+        if row.flag_mortality:
+            if mortality_avg > 0:
+                reasons.append(f"Mortality Spike (+{int(row.mortality - mortality_avg)})")
+            else:
+                reasons.append(f"Mortality Spike ({int(row.mortality)})")
+        if row.flag_water:
+            reasons.append(f"Water Intake Drop (-{int((1 - row.water_per_bird / water_avg) * 100)}%)")
+        if row.flag_cleanup:
+            reasons.append(f"Slow Feed Cleanup (+{int(cleanup_min - cleanup_avg)}m)")
+
+        event = {
+            "date": row.date,
+            "age_week": int(row.age_week),
+            "notes": row.notes,
+            "predicted_diseases": predict_diseases(row.notes),
+            "metrics": {
+                "mortality": int(row.mortality),
+                "mortality_avg": round(mortality_avg, 1),
+                "mortality_pct": round(row.mortality_pct, 3),
+                "mortality_pct_avg": round(0.0 if pd.isna(row.mortality_pct_avg) else row.mortality_pct_avg, 3),
+                "water": round(row.water, 1),
+                "water_avg": round(0.0 if pd.isna(row.water_avg) else row.water_avg, 1),
+                "water_per_bird": round(row.water_per_bird, 1),
+                "water_per_bird_avg": round(water_avg, 1),
+                "cleanup_min": cleanup_min,
+                "cleanup_avg": round(cleanup_avg, 1)
+            },
+            "flags": reasons
+        }
+        if flocks_by_key is not None:
+            event["flock"] = flocks_by_key[row.flock_key]
+        events.append(event)
+    return events
+
+
+def analyze_health_events(flock_logs, daily_stats=None, **config):
+    """
+    Processes a list of DailyLog objects to identify health events.
+    Pass the flock's enrich_flock_data output as daily_stats when it is already
+    computed; mortality and water are then measured against the real stock.
+    Returns a list of event dictionaries sorted by date (descending).
+    """
+    if daily_stats is None:
+        if not flock_logs:
+            return []
+        daily_stats = enrich_flock_data(flock_logs[0].flock, flock_logs)
+    if not daily_stats:
+        return []
 
-        if avg_mort > 0 and current_mort > avg_mort * 1.5 and current_mort > 5:
-            is_significant = True
-            reasons.append(f"Mortality Spike (+{int(mort_diff)})")
-        elif avg_mort == 0 and current_mort > 5:
-             is_significant = True
-             reasons.append(f"Mortality Spike ({current_mort})")
-
-        if avg_water > 0 and water_vol < avg_water * 0.9 and water_vol > 0:
-            is_significant = True
-            pct_drop = int((1 - water_vol/avg_water)*100)
-            reasons.append(f"Water Intake Drop (-{pct_drop}%)")
-
-        if avg_cleanup > 0 and cleanup_duration and cleanup_duration > avg_cleanup + 30:
-            is_significant = True
-            reasons.append(f"Slow Feed Cleanup (+{int(cleanup_diff)}m)")
-
-        # 3. Construct Event Object
-        if is_significant:
-            event = {
-                "date": log.date,
-                "age_week": (log.date - log.flock.intake_date).days // 7 + 1,
-                "notes": notes,
-                "predicted_diseases": predicted_diseases,
-                "metrics": {
-                    "mortality": current_mort,
-                    "mortality_avg": round(avg_mort, 1),
-                    "water": round(water_vol, 1),
-                    "water_avg": round(avg_water, 1),
-                    "cleanup_min": cleanup_duration,
-                    "cleanup_avg": round(avg_cleanup, 1)
-                },
-                "flags": reasons
-            }
-            events.append(event)
-
-        # 4. Update Rolling Windows
-        rolling_mortality.append(current_mort)
-        if len(rolling_mortality) > WINDOW_SIZE: rolling_mortality.pop(0)
-
-        if water_vol > 0:
-            rolling_water.append(water_vol)
-            if len(rolling_water) > WINDOW_SIZE: rolling_water.pop(0)
-
-        if cleanup_duration is not None:
-            rolling_cleanup.append(cleanup_duration)
-            if len(rolling_cleanup) > WINDOW_SIZE: rolling_cleanup.pop(0)
+    flock = daily_stats[0]['log'].flock
+    frame = pd.DataFrame(_health_rows(flock.id, flock, daily_stats), columns=_HEALTH_FRAME_COLUMNS)
+    events = _event_dicts(detect_health_events(frame, **config))
 
     # Return reversed (Newest first)
     return events[::-1]
+
+
+def detect_farm_health_events(flock_stats, since=None, limit=None, **config):
+    """
+    Farm-wide event feed. flock_stats is an iterable of (flock, daily_stats)
+    pairs; all flocks are stacked into one frame and scored together.
+    Returns events newest first, each with a 'flock' key.
+    """
+    rows = []
+    flocks_by_key = {}
+    for flock, daily_stats in flock_stats:
+        if not daily_stats:
+            continue
+        flocks_by_key[flock.id] = flock
+        rows.extend(_health_rows(flock.id, flock, daily_stats))
+    if not rows:
+        return []
+
+    frame = detect_health_events(pd.DataFrame(rows, columns=_HEALTH_FRAME_COLUMNS), **config)
+    if since is not None:
+        frame = frame[frame['date'] >= since]
+    frame = frame[frame['is_event']].sort_values(['date', 'flock_key'], ascending=[False, True], kind='mergesort')
+    if limit is not None:
+        frame = frame.head(limit)
+    return _event_dicts(frame, flocks_by_key)
@@ -54,6 +54,36 @@ def create_app(config_class=Config):
     app.register_blueprint(broiler_bp)
     app.register_blueprint(presentation_views_bp)
 
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Inventory ledger snapshots are kept in step on every flush
+    from app.services.inventory_service import register_ledger_events
+    register_ledger_events()
+
+    # Push alerts queued during a request are delivered after commit by a background thread
+    from app.services.notification_service import register_push_events
+    register_push_events()
+
+    from app.services.rule_engine import register_rule_events
+    register_rule_events()
+
+    # Weekly / monthly flock rollups are refreshed from the first changed period on commit
+    from app.services.rollup_service import register_rollup_events
+    register_rollup_events()
+
+    # Closed flocks serve their analytics from a frozen archive until the flock or its data changes
+    from app.services.flock_archive_service import register_archive_events
+    register_archive_events()
+
+    # Egg receiving routes batches through an in-memory house -> flock index rebuilt once a routing change commits in any worker
+    from app.services.flock_routing_service import register_routing_events
+    register_routing_events()
+
+    # Broiler FCR comparisons read a standard curve rebuilt once a broiler log change commits in any worker
+    from app.services.broiler_metrics_service import register_broiler_events
+    register_broiler_events()
+
 
     import logging
     from logging.handlers import RotatingFileHandler
@@ -0,0 +1,75 @@
+import click
+
+
+def register_commands(app):
+
+    @app.cli.command('inventory-reconcile')
+    @click.option('--fix', is_flag=True, help='Rebuild the snapshots from the raw ledger when they disagree.')
+    def inventory_reconcile(fix):
+        """Check inventory balance snapshots against the raw transaction ledger."""
+        from app.services.inventory_service import reconcile_snapshots
+
+        mismatches = reconcile_snapshots(fix=fix)
+        if not mismatches:
+            click.echo("Inventory snapshots match the ledger.")
+            return
+
+        for (item_id, location, year, month, tx_type), snap, real in mismatches:
+            click.echo(f"Item {item_id} @ {location} {year}-{month:02d} {tx_type}: snapshot {snap[0]:.2f} ({snap[1]} tx) vs ledger {real[0]:.2f} ({real[1]} tx)")
+
+        if fix:
+            click.echo(f"Rebuilt snapshots, {len(mismatches)} mismatched rows corrected.")
+        else:
+            click.echo(f"{len(mismatches)} mismatched rows. Re-run with --fix to rebuild.")
+            raise SystemExit(1)
+
+    @app.cli.command('push-dispatch')
+    def push_dispatch():
+        """Deliver every due push notification in the outbox now, then prune old delivered and failed rows."""
+        from app.services.notification_service import drain_outbox, prune_outbox
+
+        totals = drain_outbox()
+        click.echo(f"Processed {totals['claimed']} queued pushes: {totals['sent']} sent, {totals['retry']} scheduled for retry, {totals['failed']} failed.")
+        click.echo(f"Pruned {prune_outbox()} old outbox rows.")
+
+    @app.cli.command('evaluate-rules')
+    @click.option('--date', 'target_date', default=None, help='Log date to check (YYYY-MM-DD), defaults to yesterday.')
+    @click.option('--notify', is_flag=True, help='Queue push alerts for the rules that fire.')
+    def evaluate_rules(target_date, notify):
+        """Evaluate the notification rules for every active flock on one date."""
+        from datetime import date, datetime, timedelta
+        from app.database import db
+        from app.services.rule_engine import evaluate_flocks_for_date, format_rule_alert, queue_rule_alerts
+
+        day = datetime.strptime(target_date, '%Y-%m-%d').date() if target_date else date.today() - timedelta(days=1)
+        hits = evaluate_flocks_for_date(day)
+        for hit in hits:
+            click.echo(f"{hit.flock.flock_id}: {format_rule_alert(hit)[1]}")
+        click.echo(f"{len(hits)} rule hits for {day.isoformat()}.")
+
+        if notify and hits:
+            queue_rule_alerts(hits)
+            db.session.commit()
+
+    @app.cli.command('rollup-rebuild')
+    @click.option('--flock', 'flock_ids', type=int, multiple=True, help='Flock id to rebuild (repeatable), defaults to every flock.')
+    def rollup_rebuild(flock_ids):
+        """Rebuild the weekly and monthly flock rollups from the daily logs."""
+        from app.services.rollup_service import rebuild_rollups
+
+        count = rebuild_rollups(list(flock_ids) or None)
+        click.echo(f"Rebuilt rollups for {count} flocks.")
+
+    @app.cli.command('photos-backfill')
+    @click.option('--rehash', is_flag=True, help='Also move photos saved under upload names to content-hash names.')
+    def photos_backfill(rehash):
+        """Build the thumbnail and web-size variants of every stored daily log photo."""
+        from app.services.photo_service import backfill_photos, Image
+
+        if Image is None:
+            click.echo("Photo variants require the 'Pillow' package.")
+            if not rehash:
+                raise SystemExit(1)
+
+        stats = backfill_photos(rehash=rehash)
+        click.echo(f"Checked {stats['photos']} photos: {stats['variants']} variants built, {stats['renamed']} renamed, {stats['missing']} missing on disk.")
@@ -10,6 +10,10 @@ INV_TX_TYPES_USAGE_WASTE = frozenset(['Usage', 'Waste'])
 REARING_PHASES = frozenset(['Brooding', 'Growing', 'Pre-lay'])
 EMPTY_NOTE_VALUES = frozenset(['none', 'nan'])
 
+# Executive dashboard farm-wide health event feed
+HEALTH_FEED_DAYS = 14
+HEALTH_FEED_LIMIT = 25
+
 # Initial User Data for Seeding
 INITIAL_USERS = [
     {'username': 'admin', 'password': 'admin123', 'dept': 'Admin', 'role': 'Admin'},
@@ -47,6 +47,14 @@ def register_template_filters(app):
         if not s:
             return None
         return os.path.basename(str(s).replace('\\', '/'))
+    @app.template_filter('photo_url')
+    def photo_url_filter(file_path, variant=None):
+        from app.services.photo_service import photo_url
+        return photo_url(file_path, variant)
+    @app.template_filter('photo_srcset')
+    def photo_srcset_filter(file_path):
+        from app.services.photo_service import photo_srcset
+        return photo_srcset(file_path)
     @app.template_filter('from_json')
     def from_json_filter(value):
         import json
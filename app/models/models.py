@@ -39,8 +39,28 @@ class NotificationRule(db.Model):
     metric = db.Column(db.String(50), nullable=False) # e.g. 'mortality_female_pct'
     operator = db.Column(db.String(10), nullable=False) # '>', '<', '==', '>=', '<='
     threshold = db.Column(db.Float, nullable=False)
+    window_days = db.Column(db.Integer, nullable=True) # Rolling mean over N days, None = that day's value
     is_active = db.Column(db.Boolean, default=True)
 
+class PushOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    title = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    url = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # 'pending', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(36), nullable=True, index=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_push_outbox_due', 'status', 'next_attempt_at'),
+    )
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -118,6 +138,90 @@ class InventoryTransaction(VersionedMixin, db.Model):
     batch_number = db.Column(db.String(50), nullable=True)
     expiry_date = db.Column(db.Date, nullable=True)
 
+class InventoryBalanceSnapshot(db.Model):
+    # Per item / location / month / transaction type running totals of the ledger.
+    # Maintained on every InventoryTransaction flush (see app/services/inventory_service.py).
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False, index=True)
+    location = db.Column(db.String(50), nullable=False, default='Farm')
+    period_year = db.Column(db.Integer, nullable=False)
+    period_month = db.Column(db.Integer, nullable=False)
+    transaction_type = db.Column(db.String(20), nullable=False)
+    classification = db.Column(db.String(50), nullable=False, default='', server_default='')
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('inventory_item_id', 'location', 'period_year', 'period_month', 'transaction_type', 'classification', name='uq_inventory_balance_snapshot_key'),
+        db.Index('ix_inventory_balance_snapshot_period', 'period_year', 'period_month'),
+    )
+
+class FlockRollupMixin(object):
+    # Summed daily figures of one flock over a period.
+    # Maintained on every DailyLog / Hatchability flush (see app/services/rollup_service.py).
+    id = db.Column(db.Integer, primary_key=True)
+
+    @declared_attr
+    def flock_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('flock.id'), nullable=False, index=True)
+
+    period_start = db.Column(db.Date, nullable=False)
+    days = db.Column(db.Integer, nullable=False, default=0)
+    laying_days = db.Column(db.Integer, nullable=False, default=0)
+
+    mortality_male = db.Column(db.Integer, nullable=False, default=0)
+    mortality_female = db.Column(db.Integer, nullable=False, default=0)
+    culls_male = db.Column(db.Integer, nullable=False, default=0)
+    culls_female = db.Column(db.Integer, nullable=False, default=0)
+    eggs_collected = db.Column(db.Integer, nullable=False, default=0)
+    cull_eggs = db.Column(db.Integer, nullable=False, default=0)
+
+    # Stock-days for weighted averages: opening female stock summed over all days / laying days only
+    opening_stock_female = db.Column(db.Integer, nullable=False, default=0)
+    stock_days_female = db.Column(db.Integer, nullable=False, default=0)
+    hen_days = db.Column(db.Integer, nullable=False, default=0)
+    laying_mortality_female = db.Column(db.Integer, nullable=False, default=0)
+
+    # Sum and number of days with a reading
+    feed_female_gp_sum = db.Column(db.Float, nullable=False, default=0.0)
+    feed_female_gp_days = db.Column(db.Integer, nullable=False, default=0)
+    bw_female_sum = db.Column(db.Float, nullable=False, default=0.0)
+    bw_female_days = db.Column(db.Integer, nullable=False, default=0)
+    uniformity_female_sum = db.Column(db.Float, nullable=False, default=0.0)
+    uniformity_female_days = db.Column(db.Integer, nullable=False, default=0)
+
+    # Hatchery totals by hatching date
+    egg_set = db.Column(db.Integer, nullable=False, default=0)
+    hatched_chicks = db.Column(db.Integer, nullable=False, default=0)
+
+class FlockWeeklyRollup(FlockRollupMixin, db.Model):
+    iso_year = db.Column(db.Integer, nullable=False)
+    iso_week = db.Column(db.Integer, nullable=False)
+    feed_code_id = db.Column(db.Integer, db.ForeignKey('feed_code.id'), nullable=True) # Last used in the week
+    spark_json = db.Column(db.Text, nullable=True) # Daily egg % and female BW for sparklines
+
+    __table_args__ = (
+        db.UniqueConstraint('flock_id', 'iso_year', 'iso_week', name='uq_flock_weekly_rollup_key'),
+        db.Index('ix_flock_weekly_rollup_period', 'iso_year', 'iso_week'),
+    )
+
+class FlockMonthlyRollup(FlockRollupMixin, db.Model):
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('flock_id', 'year', 'month', name='uq_flock_monthly_rollup_key'),
+        db.Index('ix_flock_monthly_rollup_period', 'year', 'month'),
+    )
+
+class FlockAnalyticsArchive(db.Model):
+    # Frozen enrichment, weekly/monthly aggregates and summary of a closed flock.
+    # Dropped whenever the flock or its data changes (see app/services/flock_archive_service.py).
+    id = db.Column(db.Integer, primary_key=True)
+    flock_id = db.Column(db.Integer, db.ForeignKey('flock.id'), nullable=False, unique=True)
+    built_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    payload = db.Column(db.LargeBinary, nullable=False) # zlib-compressed JSON
+
 class Flock(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     house_id = db.Column(db.Integer, db.ForeignKey('house.id'), nullable=False, index=True)
@@ -165,6 +269,9 @@ class Flock(db.Model):
 
     end_date = db.Column(db.Date, nullable=True)
 
+    # Bumped on every change to the flock, its logs or hatch records (see app/services/flock_archive_service.py)
+    data_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+
     logs = db.relationship('DailyLog', backref='flock', lazy=True, cascade="all, delete-orphan")
     weekly_benchmarks = db.relationship('ImportedWeeklyBenchmark', backref='flock', lazy=True, cascade="all, delete-orphan")
 
@@ -489,11 +596,15 @@ class FlockGrading(VersionedMixin, db.Model):
     average_weight = db.Column(db.Float, default=0.0)
     uniformity = db.Column(db.Float, default=0.0)
 
+    cv = db.Column(db.Float, nullable=True) # Coefficient of variation, %
+
     # Limits
     lowest_weight = db.Column(db.Float, default=0.0)
     highest_weight = db.Column(db.Float, default=0.0)
+    percentiles = db.Column(db.Text, nullable=True) # e.g. '{"P10": 1420.0, "P50": 1530.0}'
 
     # Bins Mapping in JSON
+    bin_width = db.Column(db.Integer, default=100)
     grading_bins = db.Column(db.Text, nullable=True) # e.g. '{"700": 5, "800": 10}'
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
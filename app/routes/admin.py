@@ -8,12 +8,14 @@ from werkzeug.security import check_password_hash
 import os
 from datetime import datetime, date, timedelta
 import json
+from metrics import METRICS_REGISTRY
 
 def register_admin_routes(app):
 
     from app.utils import safe_commit, send_push_alert, dept_required, round_to_whole, get_dashboard_url
     from app.services.data_service import process_import
     from app.services.seed_service import seed_standards_from_file, seed_arbor_acres_standards
+    from app.services.rule_engine import RULE_OPERATORS
 
     @app.route('/import', methods=['GET', 'POST'])
     @login_required
@@ -672,13 +674,19 @@ def register_admin_routes(app):
             metric = request.form.get('metric')
             operator = request.form.get('operator')
             threshold = float(request.form.get('threshold'))
+            window_days = request.form.get('window_days', type=int)
             is_active = True if request.form.get('is_active') else False
 
+            if metric not in METRICS_REGISTRY or operator not in RULE_OPERATORS:
+                flash("Invalid metric or operator.", "danger")
+                return redirect(url_for('manage_rules'))
+
             rule = NotificationRule(
                 name=name,
                 metric=metric,
                 operator=operator,
                 threshold=threshold,
+                window_days=window_days if window_days and window_days > 1 else None,
                 is_active=is_active
             )
             db.session.add(rule)
@@ -693,7 +701,7 @@ def register_admin_routes(app):
         subbed_user_ids = [uid[0] for uid in subbed_user_ids]
         subscribed_users = User.query.filter(User.id.in_(subbed_user_ids)).order_by(User.username).all()
 
-        return render_template('admin/rules_manager.html', rules=rules, subscribed_users=subscribed_users)
+        return render_template('admin/rules_manager.html', rules=rules, subscribed_users=subscribed_users, metrics_registry=METRICS_REGISTRY, operators=list(RULE_OPERATORS))
 
     @app.route('/admin/activity_log')
     def admin_activity_log():
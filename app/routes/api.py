@@ -23,6 +23,9 @@ def register_api_routes(app):
     )
     from app.utils import safe_commit, send_push_alert, log_user_activity, dept_required, round_to_whole, get_gemini_response, get_dashboard_url
     from app.services.data_service import generate_spreadsheet_data, recalculate_flock_inventory
+    from app.services.export_service import export_flock, export_year, ExportError
+    from app.services.flock_archive_service import get_frozen_analytics, get_flock_summary
+    from app.services.photo_service import photo_urls
 
     @app.route('/api/offline_snapshot')
     @login_required
@@ -326,17 +329,7 @@ def register_api_routes(app):
         std_obj = std_map_by_week.get(end_day_log.get('week', 0))
         std_egg_weight = std_obj.std_egg_weight if std_obj and std_obj.std_egg_weight else 0.0
 
-        # Calculate Lighting and Feed Cleanup manually as they are view-specific in other parts of app.py
-        lighting_hours = 0.0
-        if log.light_on_time and log.light_off_time:
-            try:
-                t1 = datetime.strptime(log.light_on_time, '%H:%M')
-                t2 = datetime.strptime(log.light_off_time, '%H:%M')
-                diff = (t2 - t1).total_seconds() / 3600
-                if diff < 0: diff += 24
-                lighting_hours = round(diff, 1)
-            except: pass
-
+        lighting_hours = end_day_log.get('lighting_hours') or 0.0
         feed_cleanup_hours = end_day_log.get('feed_cleanup_hours') or 0.0
 
         notes_str = ", ".join(notes) if notes else "None"
@@ -589,7 +582,7 @@ def register_api_routes(app):
                  photo_list = []
                  for p in log.photos:
                      photo_list.append({
-                         'url': url_for('uploaded_file', filename=os.path.basename(p.file_path)),
+                         **photo_urls(p.file_path),
                          'name': p.original_filename or 'Photo'
                      })
 
@@ -717,6 +710,92 @@ def register_api_routes(app):
 
         return jsonify(data), 200
 
+    SPREADSHEET_NUMERIC_FIELDS = [
+        'mortality_male', 'mortality_female', 'mortality_male_hosp', 'mortality_female_hosp',
+        'culls_male', 'culls_female', 'culls_male_hosp', 'culls_female_hosp',
+        'males_moved_to_hosp', 'females_moved_to_hosp', 'males_moved_to_prod', 'females_moved_to_prod',
+        'males_in_flock', 'males_out_flock', 'females_in_flock', 'females_out_flock',
+        'water_reading_1', 'water_reading_2', 'water_reading_3',
+        'eggs_collected', 'cull_eggs_jumbo', 'cull_eggs_small', 'cull_eggs_abnormal', 'cull_eggs_crack'
+    ]
+    SPREADSHEET_FLOAT_FIELDS = [
+        'feed_male_gp_bird', 'feed_female_gp_bird', 'egg_weight',
+        'body_weight_male', 'body_weight_female', 'uniformity_male', 'uniformity_female',
+        'standard_bw_male', 'standard_bw_female'
+    ]
+    SPREADSHEET_STRING_FIELDS = [
+        'feed_program', 'feed_cleanup_start', 'feed_cleanup_end', 'light_on_time', 'light_off_time'
+    ]
+    SPREADSHEET_BOOLEAN_FIELDS = [
+        'flushing', 'is_weighing_day'
+    ]
+
+    def parse_spreadsheet_row(row, feed_code_map):
+        """Coerce one grid row into column values (same rules the grid always used)."""
+        values = {}
+        for field in SPREADSHEET_NUMERIC_FIELDS:
+            val = row.get(field)
+            if val == '' or val is None:
+                val = 0
+            else:
+                try: val = int(float(val))
+                except ValueError: val = 0
+            values[field] = val
+
+        for field in SPREADSHEET_FLOAT_FIELDS:
+            val = row.get(field)
+            if val == '' or val is None:
+                val = 0.0
+            else:
+                try: val = float(val)
+                except ValueError: val = 0.0
+            values[field] = val
+
+        for field in SPREADSHEET_STRING_FIELDS:
+            val = row.get(field)
+            values[field] = val if val else None
+
+        for field in SPREADSHEET_BOOLEAN_FIELDS:
+            val = row.get(field)
+            if isinstance(val, str):
+                val = val.lower() == 'true'
+            values[field] = bool(val)
+
+        fc_m_code = row.get('feed_code_male')
+        values['feed_code_male_id'] = feed_code_map.get(fc_m_code) if fc_m_code else None
+        fc_f_code = row.get('feed_code_female')
+        values['feed_code_female_id'] = feed_code_map.get(fc_f_code) if fc_f_code else None
+
+        clinical_signs_val = row.get('clinical_signs')
+        if clinical_signs_val and clinical_signs_val.strip() and clinical_signs_val.strip().lower() not in EMPTY_NOTE_VALUES:
+            values['clinical_notes'] = clinical_signs_val.strip()
+        else:
+            values['clinical_notes'] = None
+
+        # Partitions: name -> (bw, uniformity), only partitions with a weight are kept
+        partitions = {}
+        for prefix in ('M', 'F'):
+            for i in range(1, 9):
+                p_bw = row.get(f'bw_{prefix}{i}')
+                p_uni = row.get(f'uni_{prefix}{i}')
+                try: p_bw = int(float(p_bw)) if p_bw else 0
+                except: p_bw = 0
+                try: p_uni = float(p_uni) if p_uni else 0.0
+                except: p_uni = 0.0
+                if p_bw > 0:
+                    partitions[f'{prefix}{i}'] = (p_bw, p_uni)
+
+        # Auto calculate average if not provided but partitions exist
+        for prefix, bw_field, uni_field in (('M', 'body_weight_male', 'uniformity_male'), ('F', 'body_weight_female', 'uniformity_female')):
+            bws = [bw for name, (bw, uni) in partitions.items() if name[0] == prefix]
+            unis = [uni for name, (bw, uni) in partitions.items() if name[0] == prefix and uni > 0]
+            if values[bw_field] == 0 and bws:
+                values[bw_field] = round_to_whole(sum(bws) / len(bws))
+            if values[uni_field] == 0.0 and unis:
+                values[uni_field] = sum(unis) / len(unis)
+
+        return values, partitions
+
     @app.route('/api/flock/<int:flock_id>/spreadsheet_save', methods=['POST'])
     def flock_spreadsheet_save(flock_id):
         if not current_user.role == 'Admin':
@@ -727,31 +806,44 @@ def register_api_routes(app):
             return jsonify({'success': False, 'error': 'No data provided'}), 400
 
         try:
+            flock = db.session.get(Flock, flock_id)
+            if not flock:
+                return jsonify({'success': False, 'error': 'Flock not found'}), 404
+
             # Pre-fetch Feed Codes
             feed_codes = FeedCode.query.all()
             feed_code_map = {fc.code: fc.id for fc in feed_codes}
+            feed_code_by_id = {fc.id: fc.code for fc in feed_codes}
 
-            # Fetch logs mapped by ID
-            log_ids = [row.get('id') for row in data if row.get('id')]
-            logs = {log.id: log for log in DailyLog.query.filter(DailyLog.id.in_(log_ids), DailyLog.flock_id == flock_id).all()}
-
-            # Fetch all existing logs for new row existence checks to avoid N+1 query
+            # One query for every log the grid can reference (by id or by date for new rows)
+            log_ids = []
             new_row_dates = []
             for row in data:
-                if not row.get('id') and row.get('date'):
-                    try:
-                        parsed_date = datetime.strptime(row.get('date'), '%Y-%m-%d').date()
-                        new_row_dates.append(parsed_date)
-                    except ValueError:
-                        continue
-
+                if row.get('id'):
+                    try: log_ids.append(int(row.get('id')))
+                    except (ValueError, TypeError): continue
+                elif row.get('date'):
+                    try: new_row_dates.append(datetime.strptime(row.get('date'), '%Y-%m-%d').date())
+                    except ValueError: continue
+
+            logs = {}
             existing_logs_by_date = {}
-            if new_row_dates:
-                existing_logs_by_date = {log.date: log for log in DailyLog.query.filter(DailyLog.date.in_(new_row_dates), DailyLog.flock_id == flock_id).all()}
-
-            flock = Flock.query.get(flock_id)
-            if not flock:
-                return jsonify({'success': False, 'error': 'Flock not found'}), 404
+            if log_ids or new_row_dates:
+                for log in DailyLog.query.filter(DailyLog.flock_id == flock_id, or_(DailyLog.id.in_(log_ids), DailyLog.date.in_(new_row_dates))).all():
+                    logs[log.id] = log
+                    existing_logs_by_date[log.date] = log
+
+            # Existing partitions for all of those logs in one query: log_id -> {name: PartitionWeight}
+            partitions_by_log = {}
+            if logs:
+                for pw in PartitionWeight.query.filter(PartitionWeight.log_id.in_(list(logs.keys()))).all():
+                    partitions_by_log.setdefault(pw.log_id, {})[pw.partition_name] = pw
+
+            earliest_changed = None
+            latest_changed = None
+            changed_count = 0
+            new_logs = []
+            pending_partitions = []  # (log, name, bw, uniformity) inserted in one go after the loop
 
             for row in data:
                 log_id = row.get('id')
@@ -771,7 +863,8 @@ def register_api_routes(app):
                     if not log:
                         log = DailyLog(
                             flock_id=flock_id,
-                            date=log_date,                        body_weight_male=0,
+                            date=log_date,
+                            body_weight_male=0,
                             body_weight_female=0
                         )
                         db.session.add(log)
@@ -786,176 +879,85 @@ def register_api_routes(app):
                         continue
                     log = logs[log_id_int]
 
-                old_data = {}
-
-                # Update fields
-                numeric_fields = [
-                    'mortality_male', 'mortality_female', 'mortality_male_hosp', 'mortality_female_hosp',
-                    'culls_male', 'culls_female', 'culls_male_hosp', 'culls_female_hosp',
-                    'males_moved_to_hosp', 'females_moved_to_hosp', 'males_moved_to_prod', 'females_moved_to_prod',
-                    'males_in_flock', 'males_out_flock', 'females_in_flock', 'females_out_flock',
-                    'water_reading_1', 'water_reading_2', 'water_reading_3',
-                    'eggs_collected', 'cull_eggs_jumbo', 'cull_eggs_small', 'cull_eggs_abnormal', 'cull_eggs_crack'
-                ]
-
-                float_fields = [
-                    'feed_male_gp_bird', 'feed_female_gp_bird', 'egg_weight',
-                    'body_weight_male', 'body_weight_female', 'uniformity_male', 'uniformity_female',
-                    'standard_bw_male', 'standard_bw_female'
-                ]
-
-                string_fields = [
-                    'feed_program', 'feed_cleanup_start', 'feed_cleanup_end', 'light_on_time', 'light_off_time'
-                ]
-
-                boolean_fields = [
-                    'flushing', 'is_weighing_day'
-                ]
-
-                for field in numeric_fields:
-                    if not is_new: old_data[field] = getattr(log, field)
-                    val = row.get(field)
-                    if val == '': val = 0
-                    if val is not None:
-                        try: val = int(float(val))
-                        except ValueError: val = 0
-                    else: val = 0
-                    setattr(log, field, val)
-
-                for field in float_fields:
-                    if not is_new: old_data[field] = getattr(log, field)
-                    val = row.get(field)
-                    if val == '': val = 0.0
-                    if val is not None:
-                        try: val = float(val)
-                        except ValueError: val = 0.0
-                    else: val = 0.0
-                    setattr(log, field, val)
-
-                for field in string_fields:
-                    if not is_new: old_data[field] = getattr(log, field)
-                    val = row.get(field)
-                    setattr(log, field, val if val else None)
-
-                for field in boolean_fields:
-                    if not is_new: old_data[field] = getattr(log, field)
-                    val = row.get(field)
-                    if isinstance(val, str):
-                        val = val.lower() == 'true'
-                    setattr(log, field, bool(val))
-
-                # Calculate feed totals based on g/bird and current stock
-                # We must use start-of-day stock.
-                # In recalculate_flock_inventory, we'll recompute the stock properly.
-                # However, for now, we can rely on log.males_at_start if it exists or use fallback.
-                start_m = log.males_at_start or 0
-                start_f = log.females_at_start or 0
-
-                multiplier = 1.0
-                if log.feed_program == 'Skip-a-day':
-                    multiplier = 2.0
-                elif log.feed_program == '2/1':
-                    multiplier = 1.5
-
-                # Handle Feed Code mapping for Male
-                fc_m_code = row.get('feed_code_male')
-                if fc_m_code and fc_m_code in feed_code_map:
-                    log.feed_code_male_id = feed_code_map[fc_m_code]
-                else:
-                    log.feed_code_male_id = None
-
-                fc_f_code = row.get('feed_code_female')
-                if fc_f_code and fc_f_code in feed_code_map:
-                    log.feed_code_female_id = feed_code_map[fc_f_code]
+                values, desired_partitions = parse_spreadsheet_row(row, feed_code_map)
+
+                # Column-level diff: only touch what actually changed
+                changes = {}
+                for field, new_val in values.items():
+                    old_val = getattr(log, field)
+                    if not is_new:
+                        # The grid shows NULL as blank, which parses back to 0/False; that is not an edit
+                        if old_val == new_val or (old_val is None and not new_val):
+                            continue
+                        if field == 'feed_code_male_id':
+                            changes['feed_code_male'] = {'old': feed_code_by_id.get(old_val, ''), 'new': feed_code_by_id.get(new_val, '')}
+                        elif field == 'feed_code_female_id':
+                            changes['feed_code_female'] = {'old': feed_code_by_id.get(old_val, ''), 'new': feed_code_by_id.get(new_val, '')}
+                        else:
+                            changes[field] = {'old': old_val, 'new': new_val}
+                    setattr(log, field, new_val)
+
+                # Partition diff against what is stored: update in place, insert missing, drop cleared
+                existing_partitions = partitions_by_log.get(log.id, {}) if not is_new else {}
+                partitions_changed = False
+                for name, pw in existing_partitions.items():
+                    if name not in desired_partitions:
+                        db.session.delete(pw)
+                        partitions_changed = True
+                for name, (bw, uni) in desired_partitions.items():
+                    pw = existing_partitions.get(name)
+                    if pw is None:
+                        pending_partitions.append((log, name, bw, uni))
+                        partitions_changed = True
+                    elif pw.body_weight != bw or (pw.uniformity or 0.0) != uni:
+                        pw.body_weight = bw
+                        pw.uniformity = uni
+                        partitions_changed = True
+                if partitions_changed and not is_new:
+                    changes['partitions'] = {'old': sorted(existing_partitions.keys()), 'new': sorted(desired_partitions.keys())}
+
+                if is_new:
+                    new_logs.append(log)
+                elif changes:
+                    changed_count += 1
+                    log_user_activity(current_user.id, 'Edit', 'DailyLog', log.id, details=changes)
                 else:
-                    log.feed_code_female_id = None
+                    continue
 
-                # Handle clinical signs
-                if not is_new: old_data['clinical_notes'] = log.clinical_notes
-                clinical_signs_val = row.get('clinical_signs')
+                if earliest_changed is None or log.date < earliest_changed:
+                    earliest_changed = log.date
+                if latest_changed is None or log.date > latest_changed:
+                    latest_changed = log.date
 
-                # Since ClinicalNote model list represents detailed notes and clinical_notes text is main note:
-                if clinical_signs_val and clinical_signs_val.strip() and clinical_signs_val.strip().lower() not in EMPTY_NOTE_VALUES:
-                    log.clinical_notes = clinical_signs_val.strip()
-                else:
-                    log.clinical_notes = None
+            if earliest_changed is None:
+                return jsonify({'success': True, 'changed': 0, 'rows': []})
 
-                # Handle Partitions
-                if log.id:
-                    PartitionWeight.query.filter_by(log_id=log.id).delete()
-                else:
-                    db.session.flush() # Get log.id
-
-                sum_bw_m = 0; count_bw_m = 0
-                sum_uni_m = 0; count_uni_m = 0
-                sum_bw_f = 0; count_bw_f = 0
-                sum_uni_f = 0; count_uni_f = 0
-
-                for i in range(1, 9):
-                    # Male partitions
-                    p_m_bw = row.get(f'bw_M{i}')
-                    p_m_uni = row.get(f'uni_M{i}')
-                    try: p_m_bw = int(float(p_m_bw)) if p_m_bw else 0
-                    except: p_m_bw = 0
-                    try: p_m_uni = float(p_m_uni) if p_m_uni else 0.0
-                    except: p_m_uni = 0.0
-
-                    if p_m_bw > 0:
-                        pw_m = PartitionWeight(log_id=log.id, partition_name=f'M{i}', body_weight=p_m_bw, uniformity=p_m_uni)
-                        db.session.add(pw_m)
-                        sum_bw_m += p_m_bw
-                        count_bw_m += 1
-                        if p_m_uni > 0:
-                            sum_uni_m += p_m_uni
-                            count_uni_m += 1
-
-                    # Female partitions
-                    p_f_bw = row.get(f'bw_F{i}')
-                    p_f_uni = row.get(f'uni_F{i}')
-                    try: p_f_bw = int(float(p_f_bw)) if p_f_bw else 0
-                    except: p_f_bw = 0
-                    try: p_f_uni = float(p_f_uni) if p_f_uni else 0.0
-                    except: p_f_uni = 0.0
-
-                    if p_f_bw > 0:
-                        pw_f = PartitionWeight(log_id=log.id, partition_name=f'F{i}', body_weight=p_f_bw, uniformity=p_f_uni)
-                        db.session.add(pw_f)
-                        sum_bw_f += p_f_bw
-                        count_bw_f += 1
-                        if p_f_uni > 0:
-                            sum_uni_f += p_f_uni
-                            count_uni_f += 1
-
-                # Auto calculate average if not provided but partitions exist
-                if log.body_weight_male == 0 and count_bw_m > 0:
-                    log.body_weight_male = round_to_whole(sum_bw_m / count_bw_m)
-                if log.body_weight_female == 0 and count_bw_f > 0:
-                    log.body_weight_female = round_to_whole(sum_bw_f / count_bw_f)
-                if log.uniformity_male == 0.0 and count_uni_m > 0:
-                    log.uniformity_male = sum_uni_m / count_uni_m
-                if log.uniformity_female == 0.0 and count_uni_f > 0:
-                    log.uniformity_female = sum_uni_f / count_uni_f
-
-                if not is_new:
-                    new_data = {}
-                    for field in numeric_fields + float_fields + string_fields + boolean_fields:
-                        new_data[field] = getattr(log, field)
-                    new_data['clinical_notes'] = log.clinical_notes
-                    new_data['feed_code_male'] = log.feed_code_male.code if log.feed_code_male else ''
-                    new_data['feed_code_female'] = log.feed_code_female.code if log.feed_code_female else ''
-
-                    changes = {k: {'old': old_data[k], 'new': new_data[k]} for k in old_data if old_data[k] != new_data.get(k)}
-                    if changes:
-                        log_user_activity(current_user.id, 'Edit', 'DailyLog', log.id, details=changes)
-                else:
+            # New logs need their ids before partitions/activity can reference them
+            if new_logs:
+                db.session.flush()
+                for log in new_logs:
                     log_user_activity(current_user.id, 'Add', 'DailyLog', log.id, details={'date': str(log.date)})
-
-            safe_commit()
-
-            # Recalculate inventory cascading after bulk save
-            recalculate_flock_inventory(flock_id)
-
-            return jsonify({'success': True})
+            if pending_partitions:
+                db.session.add_all([
+                    PartitionWeight(log_id=log.id, partition_name=name, body_weight=bw, uniformity=uni)
+                    for log, name, bw, uni in pending_partitions
+                ])
+
+            if not safe_commit():
+                return jsonify({'success': False, 'error': 'Database error, changes rolled back'}), 500
+
+            # Recalculate inventory cascading from the earliest edited day only
+            recalculate_flock_inventory(flock_id, from_date=earliest_changed, to_date=latest_changed)
+
+            # Hand back the recomputed rows from the earliest edit onwards so the grid can patch itself
+            all_logs = DailyLog.query.options(joinedload(DailyLog.partition_weights), joinedload(DailyLog.clinical_notes_list)).filter_by(flock_id=flock_id).order_by(DailyLog.date.asc()).all()
+            standards_list = Standard.query.all()
+            standards_by_week = {getattr(s, 'week'): s for s in standards_list if hasattr(s, 'week')}
+            standards_by_prod_week = {s.production_week: s for s in standards_list}
+            earliest_str = earliest_changed.strftime('%Y-%m-%d')
+            rows = [r for r in generate_spreadsheet_data(flock, all_logs, standards_by_week, standards_by_prod_week) if r[1] >= earliest_str]
+
+            return jsonify({'success': True, 'changed': changed_count + len(new_logs), 'from_date': earliest_str, 'rows': rows})
         except Exception as e:
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -972,51 +974,34 @@ def register_api_routes(app):
             flash('Flock not found', 'danger')
             return redirect(get_dashboard_url(current_user))
 
-        # Load all logs for this flock
-        logs = DailyLog.query.options(joinedload(DailyLog.partition_weights), joinedload(DailyLog.photos), joinedload(DailyLog.clinical_notes_list)).filter_by(flock_id=flock_id).order_by(DailyLog.date.asc()).all()
-
-        # Enrich with standards (for benchmarks)
-        standards_list = Standard.query.all()
-        standards_by_week = {getattr(s, 'week'): s for s in standards_list if hasattr(s, 'week')}
-        standards_by_prod_week = {s.production_week: s for s in standards_list}
-
-        spreadsheet_data = generate_spreadsheet_data(flock, logs, standards_by_week, standards_by_prod_week)
-
-        headers = [
-            "ID", "Date", "Age (Days)", "Clinical Signs",
-            "Mortality (M)", "Mortality (F)", "Hosp Mort (M)", "Hosp Mort (F)",
-            "Culls (M)", "Culls (F)", "Hosp Culls (M)", "Hosp Culls (F)",
-            "Moved to Hosp (M)", "Moved to Hosp (F)", "Moved to Prod (M)", "Moved to Prod (F)",
-            "Males In", "Males Out", "Females In", "Females Out",
-            "Feed Program", "Feed Code (M)", "Feed Code (F)",
-            "Feed (g/bird M)", "Feed (g/bird F)", "Feed Cleanup Start", "Feed Cleanup End",
-            "Water 1", "Water 2", "Water 3", "Flushing",
-            "Eggs Collected", "Egg Weight", "Eggs Jumbo", "Eggs Small", "Eggs Abnormal", "Eggs Crack",
-            "Weighing Day", "Avg BW (M)", "Avg BW (F)", "Avg Unif (M)", "Avg Unif (F)", "Std BW (M)", "Std BW (F)"
-        ]
-
-        for i in range(1, 9):
-            headers.extend([f"M{i} BW", f"M{i} Unif"])
-        for i in range(1, 9):
-            headers.extend([f"F{i} BW", f"F{i} Unif"])
-
-        headers.extend([
-            "Light On", "Light Off",
-            "Std Mort %", "Std Egg Prod %", "Std BW (M) Bench", "Std BW (F) Bench"
-        ])
-
-        import io
-        import csv
-        from flask import Response
-
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        for row in spreadsheet_data:
-            writer.writerow(row)
-
-        response = Response(output.getvalue(), mimetype='text/csv')
-        response.headers["Content-Disposition"] = f"attachment; filename=flock_{flock_id}_raw_data.csv"
+        # ?format=xlsx|parquet|arrow, defaults to the legacy CSV
+        fmt = (request.args.get('format') or 'csv').lower()
+        try:
+            payload, mimetype, filename = export_flock(flock, fmt)
+        except ExportError as e:
+            flash(str(e), 'danger')
+            return redirect(get_dashboard_url(current_user))
+
+        response = Response(payload, mimetype=mimetype)
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    @app.route('/api/export/metrics/<int:year>')
+    @login_required
+    def export_year_metrics(year):
+        if not current_user.role == 'Admin' and current_user.role not in ALLOWED_EXPORT_ROLES:
+            flash('Access Denied.', 'danger')
+            return redirect(get_dashboard_url(current_user))
+
+        fmt = (request.args.get('format') or 'parquet').lower()
+        try:
+            payload, mimetype, filename = export_year(year, fmt)
+        except ExportError as e:
+            flash(str(e), 'danger')
+            return redirect(get_dashboard_url(current_user))
+
+        response = Response(payload, mimetype=mimetype)
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
         return response
 
     @app.route('/api/chart_data/<int:flock_id>')
@@ -1037,7 +1022,8 @@ def register_api_routes(app):
         vacs = Vaccine.query.filter_by(flock_id=flock_id).filter(Vaccine.actual_date != None).all()
 
         all_standards = Standard.query.all()
-        daily_stats = enrich_flock_data(flock, all_logs, hatch_records, all_standards=all_standards)
+        frozen = get_frozen_analytics(flock, all_logs, hatch_records, all_standards)
+        daily_stats = frozen['daily'] if frozen else enrich_flock_data(flock, all_logs, hatch_records, all_standards=all_standards)
 
         filtered_daily = []
         for d in daily_stats:
@@ -1080,7 +1066,7 @@ def register_api_routes(app):
                 data['metrics']['mortality_m_pct'].append(round(mort_m, 2))
                 data['metrics']['egg_prod_pct'].append(round(d['egg_prod_pct'], 2))
                 data['metrics'].setdefault('std_egg_prod', []).append(round(d.get('std_egg_prod', 0.0), 2))
-                data['metrics']['hatch_egg_pct'].append(round(d['hatch_egg_pct'], 2))
+                data['metrics']['hatch_egg_pct'].append(round(d['hatch_egg_pct'], 2) if d['hatch_egg_pct'] is not None else None)
                 data['metrics']['bw_f'].append(d['body_weight_female'])
                 data['metrics']['bw_m'].append(d['body_weight_male'])
                 data['metrics']['uni_f'].append(d['uniformity_female'])
@@ -1148,12 +1134,14 @@ def register_api_routes(app):
 
         else:
             # Aggregated
+            # The archive holds whole-flock buckets, a date range needs its own
+            whole_flock = frozen and not start_date_str and not end_date_str
             if mode == 'weekly':
-                agg_stats = aggregate_weekly_metrics(filtered_daily)
+                agg_stats = frozen['week'] if whole_flock else aggregate_weekly_metrics(filtered_daily)
                 label_prefix = "Week "
                 data['weeks'] = [a['week'] for a in agg_stats]
             else:
-                agg_stats = aggregate_monthly_metrics(filtered_daily)
+                agg_stats = frozen['month'] if whole_flock else aggregate_monthly_metrics(filtered_daily)
                 label_prefix = ""
 
             for a in agg_stats:
@@ -1169,7 +1157,7 @@ def register_api_routes(app):
                 data['metrics']['mortality_m_pct'].append(round(mort_m, 2))
                 data['metrics']['egg_prod_pct'].append(round(a['egg_prod_pct'], 2))
                 data['metrics'].setdefault('std_egg_prod', []).append(round(a.get('std_egg_prod', 0.0), 2))
-                data['metrics']['hatch_egg_pct'].append(round(a['hatch_egg_pct'], 2))
+                data['metrics']['hatch_egg_pct'].append(round(a['hatch_egg_pct'], 2) if a['hatch_egg_pct'] is not None else None)
                 data['metrics']['bw_f'].append(round(a['body_weight_female'], 0))
                 data['metrics']['bw_m'].append(round(a['body_weight_male'], 0))
                 data['metrics']['uni_f'].append(round(a['uniformity_female'], 2))
@@ -1199,6 +1187,42 @@ def register_api_routes(app):
 
         return data
 
+    # Weekly columns sent with the flock summary, enough for the summary tab on a phone
+    SUMMARY_WEEK_FIELDS = (
+        'week', 'production_week', 'stock_male_start', 'stock_female_start',
+        'mortality_male_pct', 'mortality_female_pct', 'culls_male_pct', 'culls_female_pct',
+        'eggs_collected', 'egg_prod_pct', 'std_egg_prod', 'hatch_egg_pct',
+        'body_weight_male', 'body_weight_female', 'uniformity_male', 'uniformity_female',
+        'feed_male_gp_bird', 'feed_female_gp_bird', 'avg_egg_weight',
+    )
+
+    @app.route('/api/flock/<int:flock_id>/summary')
+    @login_required
+    def get_flock_summary_api(flock_id):
+        if not current_user.role == 'Admin' and current_user.role not in ALLOWED_EXPORT_ROLES:
+            return jsonify({'error': 'Unauthorized'}), 403
+
+        flock = db.session.get(Flock, flock_id)
+        if not flock:
+            return jsonify({'error': 'Flock not found'}), 404
+
+        summary = get_flock_summary(flock)
+        weekly = []
+        for w in summary['weekly']:
+            row = {k: (None if w.get(k) != w.get(k) else w.get(k)) for k in SUMMARY_WEEK_FIELDS} # NaN -> null
+            row['date_start'] = w['date_start'].isoformat()
+            row['date_end'] = w['date_end'].isoformat()
+            weekly.append(row)
+
+        return jsonify({
+            'flock_id': flock.flock_id,
+            'status': flock.status,
+            'data_version': summary['data_version'],
+            'dashboard': summary['dashboard'],
+            'table': summary['table'],
+            'weekly': weekly,
+        })
+
     @app.route('/api/test_notification', methods=['POST'])
     @login_required
     def test_notification():
@@ -1,7 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from app.models.models import BroilerFlock, BroilerDailyLog
 from app.database import db
-from metrics import calculate_broiler_metrics
+from app.services.broiler_metrics_service import calculate_broiler_metrics, broiler_summaries
+from app.services.broiler_import_service import (
+    parse_broiler_sheet, preview_broiler_import, apply_broiler_import, save_pending_import, load_pending_import
+)
 from datetime import datetime
 
 broiler_bp = Blueprint('broiler', __name__, url_prefix='/broiler')
@@ -9,7 +12,8 @@ broiler_bp = Blueprint('broiler', __name__, url_prefix='/broiler')
 @broiler_bp.route('/dashboard')
 def dashboard():
     flocks = BroilerFlock.query.filter_by(is_active=True).all()
-    return render_template('broiler/broiler_dashboard.html', flocks=flocks)
+    summaries = {s['flock_id']: s for s in broiler_summaries(flocks)}
+    return render_template('broiler/broiler_dashboard.html', flocks=flocks, summaries=summaries)
 
 @broiler_bp.route('/new_flock', methods=['GET', 'POST'])
 def new_flock():
@@ -50,14 +54,14 @@ def flock_detail(flock_id):
         active_flocks.sort(key=lambda x: natural_sort_key(f"{x.farm_name} - {x.house_name}"))
 
     # Fetch calculated metrics for display
-    metrics = calculate_broiler_metrics(flock.id)
+    metrics = calculate_broiler_metrics(flock)
 
     intake_birds = flock.intake_birds or 0
     # Prepare JSON-serializable lists for Chart.js
     chart_data = {
         'days': [m['day_number'] for m in metrics],
         'actual_fcr': [m['cumulative_fcr'] for m in metrics],
-        'standard_fcr': [m.get('standard_fcr') or 0.0 for m in metrics],
+        'standard_fcr': [m['standard_fcr_curve'] or 0.0 for m in metrics],
         'body_weights': [m['body_weight_g'] for m in metrics],
         'mortality': [m['death_count'] for m in metrics],
         'weight_gains': [m['weight_gain'] for m in metrics],
@@ -71,6 +75,19 @@ from app.utils import log_user_activity, dept_required, get_dashboard_url
 from flask_login import login_required, current_user
 
 
+@broiler_bp.route('/api/summary')
+@login_required
+def api_summary():
+    """Latest KPIs and FCR comparison curves of the active flocks, or of ?flock_id=1,2."""
+    query = BroilerFlock.query
+    flock_ids = [int(f_id) for f_id in request.args.get('flock_id', '').split(',') if f_id.strip().isdigit()]
+    if flock_ids:
+        query = query.filter(BroilerFlock.id.in_(flock_ids))
+    else:
+        query = query.filter_by(is_active=True)
+    return jsonify({'flocks': broiler_summaries(query.order_by(BroilerFlock.id).all())})
+
+
 @broiler_bp.route('/flock/<int:flock_id>/delete', methods=['POST'])
 @login_required
 @dept_required('Farm')
@@ -152,26 +169,28 @@ def daily_entry(flock_id):
         return redirect(url_for('broiler.daily_entry', flock_id=flock.id))
 
     # Fetch calculated metrics for display
-    metrics = calculate_broiler_metrics(flock.id)
+    metrics = calculate_broiler_metrics(flock)
     today = datetime.now().date()
 
     return render_template('broiler/broiler_daily_entry.html', flock=flock, metrics=metrics, today=today)
 
 
-import pandas as pd
-import math
-
-def extract_metadata(row_idx, df):
-    # Iterate through columns from index 1 to end to find first non-null
-    for col_idx in range(1, len(df.columns)):
-        val = df.iloc[row_idx, col_idx]
-        if pd.notna(val) and val != '':
-            return val
-    return None
-
 @broiler_bp.route('/import', methods=['GET', 'POST'])
 def import_data():
+    from flask import current_app
+
     if request.method == 'POST':
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+
+        # Confirmation of a previewed file: the parsed frame is reused, the workbook is not read again
+        confirm_token = request.form.get('confirm_token')
+        if confirm_token:
+            pending = load_pending_import(upload_folder, confirm_token)
+            if pending is None:
+                flash('The previewed import has expired. Please upload the file again.', 'warning')
+                return redirect(request.url)
+            return _apply_import(*pending)
+
         if 'file' not in request.files:
             flash('No file part', 'danger')
             return redirect(request.url)
@@ -183,143 +202,39 @@ def import_data():
 
         if file and (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
             try:
-                # Read the excel file into memory, without header
-                df = pd.read_excel(file, header=None)
-
-                # Extract metadata
-                farm_name = extract_metadata(1, df)
-                house_name = extract_metadata(2, df)
-                source = extract_metadata(3, df)
-                breed = extract_metadata(4, df)
-
-                intake_birds_raw = extract_metadata(5, df)
-                try:
-                    intake_birds = int(float(intake_birds_raw)) if pd.notna(intake_birds_raw) else 0
-                except (ValueError, TypeError):
-                    intake_birds = 0
-
-                intake_date_raw = extract_metadata(6, df)
-                intake_date = pd.to_datetime(intake_date_raw, errors='coerce').date()
-                if pd.isna(intake_date):
-                    intake_date = datetime.utcnow().date()
-
-                arrival_weight_raw = extract_metadata(7, df)
-                try:
-                    arrival_weight_g = float(arrival_weight_raw) if pd.notna(arrival_weight_raw) else 0.0
-                except (ValueError, TypeError):
-                    arrival_weight_g = 0.0
-
-                # Ensure farm and house and date have string/date representation
-                farm_str = str(farm_name) if pd.notna(farm_name) else ""
-                house_str = str(house_name) if pd.notna(house_name) else ""
-
-                # Find or create flock
-                flock = BroilerFlock.query.filter_by(
-                    farm_name=farm_str,
-                    house_name=house_str,
-                    intake_date=intake_date
-                ).first()
-
-                if not flock:
-                    flock = BroilerFlock(
-                        farm_name=farm_str,
-                        house_name=house_str,
-                        source=str(source) if pd.notna(source) else "",
-                        breed=str(breed) if pd.notna(breed) else "",
-                        intake_birds=intake_birds,
-                        intake_date=intake_date,
-                        arrival_weight_g=arrival_weight_g
-                    )
-                    db.session.add(flock)
-                    db.session.flush() # flush to get flock.id
-
-                # Parse daily logs starting from row 11 (index 10 or 11?)
-                # User said: "Loop through the daily logs starting from row index 11"
-                # Row index 11 means the 12th row in the excel file if 0-indexed.
-                rows_imported = 0
-                for idx in range(11, len(df)):
-                    row = df.iloc[idx]
-
-                    date_raw = row[0]
-                    if pd.isna(date_raw):
-                        continue # Skip empty dates
-
-                    log_date = pd.to_datetime(date_raw, errors='coerce').date()
-                    if pd.isna(log_date):
-                        continue
-
-                    try:
-                        day_number = int(float(row[1])) if pd.notna(row[1]) else (log_date - flock.intake_date).days + 1
-                    except (ValueError, TypeError):
-                        day_number = (log_date - flock.intake_date).days + 1
-
-                    try:
-                        death_count = int(float(row[2])) if pd.notna(row[2]) else 0
-                    except (ValueError, TypeError):
-                        death_count = 0
-
-                    feed_receive = str(row[5]) if pd.notna(row[5]) else None
-                    feed_type = str(row[6]) if pd.notna(row[6]) else None
-
-                    try:
-                        feed_daily_use_kg = float(row[7]) if pd.notna(row[7]) else 0.0
-                    except (ValueError, TypeError):
-                        feed_daily_use_kg = 0.0
-
-                    try:
-                        body_weight_g = float(row[9]) if pd.notna(row[9]) else 0.0
-                    except (ValueError, TypeError):
-                        body_weight_g = 0.0
-
-                    try:
-                        standard_fcr = float(row[13]) if pd.notna(row[13]) else 0.0
-                    except (ValueError, TypeError):
-                        standard_fcr = 0.0
-
-                    remarks = str(row[14]) if pd.notna(row[14]) else None
-
-                    # Check if log already exists
-                    existing_log = BroilerDailyLog.query.filter_by(
-                        flock_id=flock.id,
-                        date=log_date
-                    ).first()
-
-                    if existing_log:
-                        existing_log.day_number = day_number
-                        existing_log.death_count = death_count
-                        existing_log.feed_receive = feed_receive
-                        existing_log.feed_type = feed_type
-                        existing_log.feed_daily_use_kg = feed_daily_use_kg
-                        existing_log.body_weight_g = body_weight_g
-                        existing_log.standard_fcr = standard_fcr
-                        existing_log.remarks = remarks
-                    else:
-                        new_log = BroilerDailyLog(
-                            flock_id=flock.id,
-                            date=log_date,
-                            day_number=day_number,
-                            death_count=death_count,
-                            feed_receive=feed_receive,
-                            feed_type=feed_type,
-                            feed_daily_use_kg=feed_daily_use_kg,
-                            body_weight_g=body_weight_g,
-                            standard_fcr=standard_fcr,
-                            remarks=remarks
-                        )
-                        db.session.add(new_log)
-
-                    rows_imported += 1
-
-                db.session.commit()
-                flash(f'Successfully imported {rows_imported} daily log entries.', 'success')
-                return redirect(url_for('broiler.dashboard'))
-
+                meta, frame = parse_broiler_sheet(file)
             except Exception as e:
-                db.session.rollback()
                 flash(f'Error parsing Excel file: {str(e)}', 'danger')
                 return redirect(request.url)
+
+            if request.form.get('dry_run'):
+                flock, rows = preview_broiler_import(meta, frame)
+                token = save_pending_import(upload_folder, meta, frame)
+                return render_template('broiler/broiler_import.html', preview={
+                    'meta': meta,
+                    'flock': flock,
+                    'rows': rows,
+                    'new_count': sum(1 for r in rows if r['type'] == 'New'),
+                    'filename': file.filename,
+                    'token': token,
+                })
+
+            return _apply_import(meta, frame)
         else:
             flash('Invalid file format. Please upload an .xlsx or .xls file.', 'danger')
             return redirect(request.url)
 
-    return render_template('broiler/broiler_import.html')
+    return render_template('broiler/broiler_import.html', preview=None)
+
+
+def _apply_import(meta, frame):
+    try:
+        flock, new_count, updated_count = apply_broiler_import(meta, frame)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error importing Excel file: {str(e)}', 'danger')
+        return redirect(request.url)
+
+    flash(f'Successfully imported {new_count + updated_count} daily log entries ({new_count} new, {updated_count} updated).', 'success')
+    return redirect(url_for('broiler.dashboard'))
@@ -16,7 +16,12 @@ def register_hatchery_routes(app):
     )
     from metrics import calculate_bio_week
     from app.utils import safe_commit, log_user_activity, dept_required, role_required, natural_sort_key, get_dashboard_url
-    from app.services.data_service import calculate_male_ratio, process_hatchability_import
+    from app.services.data_service import process_hatchability_import
+    from app.services.male_ratio_service import FlockMaleRatios
+    from app.services.inventory_service import get_item_balance, get_month_summary
+    from app.services.hatchery_chart_service import get_hatchery_chart
+    from app.services.hatchery_analytics_service import get_hatchery_analytics
+    from app.services.flock_routing_service import get_houses_by_farm, build_receipt
 
     @app.route('/hatchery_flock_routing', methods=['GET', 'POST'])
     @login_required
@@ -86,21 +91,9 @@ def register_hatchery_routes(app):
         houses = House.query.order_by(House.name).all()
         flocks = Flock.query.filter_by(status='Active').order_by(Flock.flock_id).all()
 
-        # Build houses JSON mapped by farm id for the dynamic dropdown.
-        # Since Houses don't have a direct farm_id, we infer relationship from existing active flocks.
-        houses_by_farm = {}
-        for farm in farms:
-            # Get houses associated with this farm via active flocks or mappings
-            farm_houses = db.session.query(House).join(Flock).filter(Flock.farm_id == farm.id).distinct().all()
-            # If no active flocks, maybe check mappings
-            if not farm_houses:
-                 farm_houses = db.session.query(House).join(HouseFlockMapping).filter(HouseFlockMapping.farm_id == farm.id).distinct().all()
-
-            # Fallback: if still none, just include all houses for now to avoid blocking assignment
-            if not farm_houses:
-                farm_houses = houses
-
-            houses_by_farm[farm.id] = [{'id': h.id, 'name': h.name} for h in farm_houses]
+        # Houses JSON mapped by farm id for the dynamic dropdown.
+        # Since Houses don't have a direct farm_id, the map is inferred from flocks and routings.
+        houses_by_farm = get_houses_by_farm()
 
         return render_template(
             'hatchery_flock_routing.html',
@@ -257,109 +250,7 @@ def register_hatchery_routes(app):
             return redirect(url_for('login'))
 
         flock = Flock.query.get_or_404(flock_id)
-        records = Hatchability.query.filter_by(flock_id=flock_id).order_by(Hatchability.setting_date.asc()).all()
-
-        # Fetch Standards for Hatchability
-        all_standards = Standard.query.all()
-        std_map = {getattr(s, 'week'): (getattr(s, 'std_hatchability', 0.0) or 0.0) for s in all_standards if hasattr(s, 'week')}
-
-        data = {
-            'weeks': [],
-            'fertile_pct': [],
-            'clear_pct': [],
-            'rotten_pct': [],
-            'hatch_pct': [],
-            'std_hatch_pct': [],
-            'male_ratio_pct': [],
-            'notes': []
-        }
-
-        # Aggregate by week
-        weekly_agg = {}
-
-        for r in records:
-            age_days = (r.setting_date - flock.intake_date).days
-            week = calculate_bio_week(flock.intake_date, r.setting_date)
-
-            if week not in weekly_agg:
-                weekly_agg[week] = {
-                    'egg_set': 0, 'clear_eggs': 0, 'rotten_eggs': 0, 'hatched_chicks': 0,
-                    'male_ratios': []
-                }
-
-            weekly_agg[week]['egg_set'] += (r.egg_set or 0)
-            weekly_agg[week]['clear_eggs'] += (r.clear_eggs or 0)
-            weekly_agg[week]['rotten_eggs'] += (r.rotten_eggs or 0)
-            weekly_agg[week]['hatched_chicks'] += (r.hatched_chicks or 0)
-
-            if r.male_ratio_pct is not None:
-                weekly_agg[week]['male_ratios'].append(r.male_ratio_pct)
-
-        sorted_weeks = sorted(weekly_agg.keys())
-
-        for week in sorted_weeks:
-            agg = weekly_agg[week]
-
-            # Standard Lookup
-            std_val = std_map.get(week, 0.0)
-            data['std_hatch_pct'].append(round(std_val, 2))
-
-            data['weeks'].append(f"Week {week}")
-
-            e_set = agg['egg_set'] or 1
-            clear_p = (agg['clear_eggs'] / e_set) * 100
-            rotten_p = (agg['rotten_eggs'] / e_set) * 100
-            fertile_p = ((agg['egg_set'] - agg['clear_eggs'] - agg['rotten_eggs']) / e_set) * 100
-            hatch_p = (agg['hatched_chicks'] / e_set) * 100
-
-            avg_male = 0
-            if agg['male_ratios']:
-                avg_male = sum(agg['male_ratios']) / len(agg['male_ratios'])
-
-            data['clear_pct'].append(round(clear_p, 2))
-            data['rotten_pct'].append(round(rotten_p, 2))
-            data['fertile_pct'].append(round(fertile_p, 2))
-            data['hatch_pct'].append(round(hatch_p, 2))
-            data['male_ratio_pct'].append(round(avg_male, 2))
-
-            # Gather Notes & Medications for the specific week (Age based)
-            # Week starts at: Intake + (Week-1)*7
-            # Week ends at: Intake + Week*7 - 1
-            if week == 0:
-                start_date = flock.intake_date
-                end_date = flock.intake_date
-            elif week > 0:
-                start_date = flock.intake_date + timedelta(days=((week - 1) * 7) + 1)
-                end_date = flock.intake_date + timedelta(days=(week * 7))
-            else:
-                # Negative weeks (e.g. week -1 means days -7 to -1 before intake)
-                start_date = flock.intake_date + timedelta(days=(week * 7))
-                end_date = flock.intake_date + timedelta(days=((week + 1) * 7) - 1)
-
-            logs = DailyLog.query.filter(
-                DailyLog.flock_id == flock_id,
-                DailyLog.date >= start_date,
-                DailyLog.date <= end_date,
-                DailyLog.clinical_notes != None,
-                DailyLog.clinical_notes != ''
-            ).all()
-
-            meds = Medication.query.filter(
-                Medication.flock_id == flock_id,
-                Medication.start_date <= end_date,
-                or_(Medication.end_date == None, Medication.end_date >= start_date)
-            ).all()
-
-            notes_parts = []
-            if logs:
-                notes_str = "; ".join([f"{l.date.strftime('%d/%m')}: {l.clinical_notes}" for l in logs])
-                notes_parts.append(f"Notes: {notes_str}")
-
-            if meds:
-                meds_str = ", ".join([m.drug_name for m in meds]) # Just names to save space
-                notes_parts.append(f"Meds: {meds_str}")
-
-            data['notes'].append(" | ".join(notes_parts) if notes_parts else None)
+        data = get_hatchery_chart(flock)
 
         return render_template('hatchery_charts.html', flock=flock, data=data)
 
@@ -398,12 +289,8 @@ def register_hatchery_routes(app):
                     candling_date = datetime.strptime(request.form.get('candling_date'), '%Y-%m-%d').date()
                     hatching_date = datetime.strptime(request.form.get('hatching_date'), '%Y-%m-%d').date()
 
-                    # Pre-fetch for optimization before ratio calculation
-                    logs = DailyLog.query.filter_by(flock_id=flock.id).order_by(DailyLog.date).all()
-                    hatchery_records = Hatchability.query.filter_by(flock_id=flock.id).order_by(Hatchability.setting_date).all()
-
                     # Calculate Male Ratio
-                    male_ratio, large_window = calculate_male_ratio(flock.id, setting_date, flock_obj=flock, logs=logs, hatchery_records=hatchery_records)
+                    male_ratio, large_window = FlockMaleRatios(flock).ratio(setting_date)
 
                     h = Hatchability(
                         flock_id=flock.id,
@@ -431,6 +318,19 @@ def register_hatchery_routes(app):
                 except ValueError as e:
                     flash(f'Error adding record: {e}', 'danger')
 
+            elif action == 'recalculate_ratios':
+                # Every setting of the flock from one stock series
+                records = Hatchability.query.filter_by(flock_id=flock.id).all()
+                ratios = FlockMaleRatios(flock, setting_dates=[r.setting_date for r in records])
+                changed = 0
+                for r in records:
+                    male_ratio, _ = ratios.ratio(r.setting_date)
+                    if r.male_ratio_pct != male_ratio:
+                        r.male_ratio_pct = male_ratio
+                        changed += 1
+                safe_commit()
+                flash(f'Male ratio recalculated for {len(records)} records ({changed} changed).', 'success')
+
             return redirect(url_for('flock_hatchability', id=id))
 
         records = Hatchability.query.filter_by(flock_id=id).order_by(Hatchability.setting_date.desc()).all()
@@ -449,19 +349,11 @@ def register_hatchery_routes(app):
             days = (today - f.intake_date).days
             f.current_week = calculate_bio_week(f.intake_date, today) if days >= 0 else 0
 
-        # Analytics: Current Month Hatchability (based on Hatch Date)
-        start_month = date(today.year, today.month, 1)
-        # Find records with hatching_date in current month
-        # Note: hatching_date >= start_month
-        # Ideally <= end_month, but >= start is fine for "current month so far"
-        monthly_records = Hatchability.query.filter(Hatchability.hatching_date >= start_month).all()
-
-        total_hatched = sum(r.hatched_chicks for r in monthly_records)
-        total_set = sum(r.egg_set for r in monthly_records)
+        # Analytics: previous and next hatch, current month hatchability (based on Hatch Date)
+        analytics = get_hatchery_analytics(today)
 
-        avg_hatch_pct = (total_hatched / total_set * 100) if total_set > 0 else 0.0
-
-        return render_template('hatchery_dashboard.html', active_flocks=active_flocks, avg_hatch_pct=avg_hatch_pct, current_month=today.strftime('%B %Y'))
+        return render_template('hatchery_dashboard.html', active_flocks=active_flocks, avg_hatch_pct=analytics['month']['hatch_pct'],
+                               last_hatch=analytics['last_hatch'], next_hatch=analytics['next_hatch'], current_month=today.strftime('%B %Y'))
 
     @app.route('/hatchery/inventory')
     @login_required
@@ -486,42 +378,22 @@ def register_hatchery_routes(app):
             filter_month = int(month_str)
             filter_year = int(year_str)
             start_date = date(filter_year, filter_month, 1)
-            if filter_month == 12:
-                end_date = date(filter_year + 1, 1, 1)
-            else:
-                end_date = date(filter_year, filter_month + 1, 1)
         except ValueError:
             filter_month = today.month
             filter_year = today.year
             start_date = date(today.year, today.month, 1)
-            if today.month == 12:
-                end_date = date(today.year + 1, 1, 1)
-            else:
-                end_date = date(today.year, today.month + 1, 1)
-
-        month_txs = InventoryTransaction.query.join(InventoryItem).filter(
-            InventoryTransaction.location == 'Hatchery',
-            InventoryTransaction.transaction_date >= start_date,
-            InventoryTransaction.transaction_date < end_date
-        ).all()
-
-        summary_map = {}
-        for t in month_txs:
-            if t.inventory_item_id not in summary_map:
-                summary_map[t.inventory_item_id] = {'purchase': 0, 'usage': 0, 'waste': 0}
 
-            type_key = t.classification.lower() if t.classification else t.transaction_type.lower()
-            if type_key in summary_map[t.inventory_item_id]:
-                summary_map[t.inventory_item_id][type_key] += t.quantity
+        # Purchase / usage / waste by classification, grouped in SQL from the ledger snapshots
+        summary_map = get_month_summary(start_date.year, start_date.month, location='Hatchery', classified=True)
 
         summary_list = []
         for item in items:
             if item.id in summary_map:
                 summary_list.append({
                     'item': item,
-                    'purchase': summary_map[item.id]['purchase'],
-                    'usage': summary_map[item.id]['usage'],
-                    'waste': summary_map[item.id]['waste']
+                    'purchase': summary_map[item.id].get('purchase', 0),
+                    'usage': summary_map[item.id].get('usage', 0),
+                    'waste': summary_map[item.id].get('waste', 0)
                 })
 
         months = [(i, calendar.month_name[i]) for i in range(1, 13)]
@@ -546,14 +418,7 @@ def register_hatchery_routes(app):
     def hatchery_inventory_balance(item_id):
         item = InventoryItem.query.filter_by(id=item_id, location='Hatchery').first_or_404()
 
-        transactions = InventoryTransaction.query.filter_by(inventory_item_id=item_id, location='Hatchery').all()
-
-        balance = 0.0
-        for t in transactions:
-            if t.transaction_type == 'In':
-                balance += t.quantity
-            elif t.transaction_type == 'Out':
-                balance -= t.quantity
+        balance = get_item_balance(item_id, location='Hatchery')
 
         return jsonify({'balance': balance, 'unit': item.unit_of_measurement or item.unit})
 
@@ -705,70 +570,21 @@ def register_hatchery_routes(app):
     @login_required
     @role_required('Worker', 'Manager', 'Admin')
     def hatchery_egg_receiving():
-        from flask import request, render_template, flash, redirect, url_for
-        from app.models.models import Farm, House, HouseFlockMapping, HatcheryEggReceipt, Flock
-        from app.utils import safe_commit
-        import json
-        from datetime import datetime
-
         if request.method == 'POST':
             arrival_date_str = request.form.get('arrival_date')
-            house_id = request.form.get('house_id')
-            batch_number = request.form.get('batch_number')
-            farm_declared_qty = request.form.get('farm_declared_qty', type=int) or 0
-            actual_received_qty = request.form.get('actual_received_qty', type=int) or 0
-            jumbo_cull = request.form.get('jumbo_cull', type=int) or 0
-            small_cull = request.form.get('small_cull', type=int) or 0
-            abnormal_cull = request.form.get('abnormal_cull', type=int) or 0
-            crack_cull = request.form.get('crack_cull', type=int) or 0
-
-            if not arrival_date_str or not house_id or not batch_number:
+
+            if not arrival_date_str or not request.form.get('house_id') or not request.form.get('batch_number'):
                 flash('Missing required fields.', 'danger')
                 return redirect(url_for('hatchery_egg_receiving'))
 
             arrival_date = datetime.strptime(arrival_date_str, '%Y-%m-%d').date()
 
-            # Basic validation
-            if farm_declared_qty < 0 or actual_received_qty < 0 or jumbo_cull < 0 or small_cull < 0 or abnormal_cull < 0 or crack_cull < 0:
-                flash('Quantities cannot be negative.', 'danger')
-                return redirect(url_for('hatchery_egg_receiving'))
-
-            total_culls = jumbo_cull + small_cull + abnormal_cull + crack_cull
-            if total_culls > actual_received_qty:
-                flash('Total culls cannot exceed actual received quantity.', 'danger')
-                return redirect(url_for('hatchery_egg_receiving'))
-
-            # Find active flock mapping
-            # arrival_date >= start_date AND (arrival_date <= end_date OR end_date IS NULL)
-            from sqlalchemy import or_
-            from app.database import db
-            mapping = HouseFlockMapping.query.filter(
-                HouseFlockMapping.house_id == house_id,
-                HouseFlockMapping.start_date <= arrival_date,
-                or_(HouseFlockMapping.end_date >= arrival_date, HouseFlockMapping.end_date == None)
-            ).first()
-
-            if not mapping:
-                flash('No active flock found in this house for the selected date. Please contact the Manager.', 'danger')
+            # Validated and routed to the house's flock on the arrival date
+            receipt, error = build_receipt(request.form, arrival_date)
+            if error:
+                flash(error, 'danger')
                 return redirect(url_for('hatchery_egg_receiving'))
 
-            settable_eggs = actual_received_qty - total_culls
-
-            receipt = HatcheryEggReceipt(
-                farm_id=mapping.farm_id,
-                house_id=mapping.house_id,
-                flock_id=mapping.flock_id,
-                arrival_date=arrival_date,
-                batch_number=int(batch_number),
-                farm_declared_qty=farm_declared_qty,
-                actual_received_qty=actual_received_qty,
-                jumbo_cull=jumbo_cull,
-                small_cull=small_cull,
-                abnormal_cull=abnormal_cull,
-                crack_cull=crack_cull,
-                settable_eggs=settable_eggs
-            )
-
             db.session.add(receipt)
             safe_commit()
 
@@ -776,26 +592,60 @@ def register_hatchery_routes(app):
             return redirect(url_for('hatchery_egg_receiving'))
 
         # GET Request logic
-        from app.database import db
         farms = Farm.query.order_by(Farm.name).all()
         houses = House.query.order_by(House.name).all()
 
-        houses_by_farm = {}
-        for farm in farms:
-            farm_houses = db.session.query(House).join(Flock).filter(Flock.farm_id == farm.id).distinct().all()
-            if not farm_houses:
-                 farm_houses = db.session.query(House).join(HouseFlockMapping).filter(HouseFlockMapping.farm_id == farm.id).distinct().all()
-            if not farm_houses:
-                farm_houses = houses
-
-            houses_by_farm[farm.id] = [{'id': h.id, 'name': h.name} for h in farm_houses]
-
-        today = datetime.now().strftime('%Y-%m-%d')
-
         return render_template(
             'hatchery_egg_receipt.html',
             farms=farms,
             houses=houses,
-            houses_by_farm=json.dumps(houses_by_farm),
-            today=today
+            houses_by_farm=json.dumps(get_houses_by_farm()),
+            today=datetime.now().strftime('%Y-%m-%d')
         )
+
+    @app.route('/hatchery/egg_receiving/bulk', methods=['POST'])
+    @login_required
+    @role_required('Worker', 'Manager', 'Admin')
+    def hatchery_egg_receiving_bulk():
+        """
+        Records many batches of one arrival at once:
+        {"arrival_date": "YYYY-MM-DD", "batches": [{"house_id", "batch_number", "actual_received_qty", ...}]}.
+        A batch may carry its own arrival_date. Nothing is saved unless every batch is valid.
+        """
+        data = request.get_json(silent=True) or {}
+        batches = data.get('batches')
+        if not isinstance(batches, list) or not batches:
+            return jsonify({'success': False, 'error': 'No batches provided'}), 400
+
+        receipts = []
+        errors = []
+        for i, batch in enumerate(batches):
+            if not isinstance(batch, dict):
+                errors.append({'index': i, 'error': 'Missing required fields.'})
+                continue
+            try:
+                arrival_date = datetime.strptime(batch.get('arrival_date') or data.get('arrival_date') or '', '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                errors.append({'index': i, 'error': 'Invalid date format.'})
+                continue
+
+            receipt, error = build_receipt(batch, arrival_date)
+            if error:
+                errors.append({'index': i, 'error': error})
+            else:
+                receipts.append(receipt)
+
+        if errors:
+            return jsonify({'success': False, 'errors': errors}), 400
+
+        db.session.add_all(receipts)
+        if not safe_commit():
+            return jsonify({'success': False, 'error': 'Could not save receipts'}), 500
+
+        log_user_activity(current_user.id, "Bulk Egg Receipt", "HatcheryEggReceipt", details={"count": len(receipts)})
+        return jsonify({
+            'success': True,
+            'created': len(receipts),
+            'receipts': [{'id': r.id, 'house_id': r.house_id, 'flock_id': r.flock_id, 'batch_number': r.batch_number,
+                          'settable_eggs': r.settable_eggs} for r in receipts]
+        })
@@ -20,8 +20,13 @@ def register_health_routes(app):
     from app.constants import (
         EMPTY_NOTE_VALUES,
     )
-    from app.utils import safe_commit, send_push_alert, dept_required, natural_sort_key, round_to_whole, get_dashboard_url
-    from app.services.data_service import get_flock_stock_history, get_flock_stock_history_bulk, calculate_grading_stats
+    from app.utils import safe_commit, dept_required, natural_sort_key, round_to_whole, get_dashboard_url
+    from app.services.notification_service import queue_push_alert
+    from app.services.data_service import get_flock_stock_history, get_flock_stock_history_bulk
+    from app.services.grading_service import GRADING_BIN_WIDTHS, DEFAULT_BIN_WIDTH, grade_groups, apply_grading
+    from app.services.weigh_file_service import WEIGH_FILE_READERS, WeighFileError, parse_weigh_file
+    from app.services.bodyweight_service import get_bodyweight_history
+    from app.services.photo_service import store_photo
     from app.services.seed_service import initialize_vaccine_schedule
 
     @app.route('/health_log/bodyweight', methods=['GET', 'POST'])
@@ -105,9 +110,9 @@ def register_health_routes(app):
                 body = f"{house_name}: Week {age_week} Bodyweight updated."
                 alert_url = url_for('health_log_bodyweight')
 
-                all_users = User.query.all()
-                for user in all_users:
-                    send_push_alert(user.id, title, body, url=alert_url)
+                user_ids = [uid for (uid,) in db.session.query(User.id).all()]
+                queue_push_alert(user_ids, title, body, url=alert_url)
+                safe_commit()
             except Exception as e:
                 app.logger.error(f"Failed to send Bodyweight push alert: {str(e)}")
 
@@ -123,178 +128,41 @@ def register_health_routes(app):
         if active_flocks:
                 active_flocks.sort(key=lambda x: natural_sort_key(x.house.name if x.house else ''))
 
-        # Fetch all records, sort by house name, then age week descending
-        records = db.session.query(FlockGrading, House.name).join(House).order_by(House.name, FlockGrading.age_week.desc()).all()
+        history_flock_id = request.args.get('flock_id', type=int)
+        page = request.args.get('page', 1, type=int)
+        date_from = date_to = None
+        try:
+            if request.args.get('date_from'):
+                date_from = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date()
+            if request.args.get('date_to'):
+                date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date()
+        except ValueError:
+            flash("Invalid date format.", "danger")
+
+        bodyweight_logs, pagination = get_bodyweight_history(history_flock_id, date_from, date_to, page)
 
-        # Group by House -> Week -> Sex
+        # Selection reports only for the weeks listed on this page
         # Result format: { 'House A': { 13: { 'Male': grading_obj, 'Female': grading_obj } } }
         grouped_data = {}
-        for grading, house_name in records:
-            if house_name not in grouped_data:
-                grouped_data[house_name] = {}
-            if grading.age_week not in grouped_data[house_name]:
-                grouped_data[house_name][grading.age_week] = {}
-            grouped_data[house_name][grading.age_week][grading.sex] = grading
+        report_keys = {(row['house_id'], row['age_weeks']) for row in bodyweight_logs if row['has_report']}
+        if report_keys:
+            records = db.session.query(FlockGrading, House.name).join(House).filter(
+                FlockGrading.house_id.in_({hid for hid, _ in report_keys}),
+                FlockGrading.age_week.in_({week for _, week in report_keys})
+            ).order_by(House.name, FlockGrading.age_week.desc()).all()
+            for grading, house_name in records:
+                if (grading.house_id, grading.age_week) not in report_keys:
+                    continue
+                grouped_data.setdefault(house_name, {}).setdefault(grading.age_week, {})[grading.sex] = grading
 
         houses = House.query.order_by(House.name).all()
 
-        # active_flocks is already fetched and sorted above
-
-        # Fetch bodyweight logs (is_weighing_day=True)
-        logs = DailyLog.query.join(Flock).join(House).options(
-            joinedload(DailyLog.partition_weights),
-            joinedload(DailyLog.flock).joinedload(Flock.house)
-        ).filter(DailyLog.is_weighing_day == True).order_by(DailyLog.date.desc()).all()
-
-        # We also need grading reports to know if "Selection Report" is available
-        reports = FlockGrading.query.all()
-        reports_map = {}
-        for r in reports:
-            key = (r.house_id, r.age_week)
-            reports_map[key] = True
-
-        # Group logs by house to calculate prev week diffs
-        logs_by_house = {}
-        for log in logs:
-            hid = log.flock.house_id
-            if hid not in logs_by_house:
-                logs_by_house[hid] = []
-            logs_by_house[hid].append(log)
-
-        bodyweight_logs = []
-
-        for log in logs:
-            age_weeks = calculate_bio_week(log.flock.intake_date, log.date)
-
-            house_logs = logs_by_house[log.flock.house_id]
-
-            prev_log = None
-            for hl in house_logs:
-                hl_age_weeks = calculate_bio_week(hl.flock.intake_date, hl.date)
-                if hl_age_weeks == age_weeks - 1:
-                    prev_log = hl
-                    break
-
-            def get_p(l, name):
-                if not l: return None
-                for pw in l.partition_weights:
-                    if pw.partition_name == name:
-                        return pw
-                return None
-
-            m_parts = []
-            f_parts = []
-
-            std_m = log.standard_bw_male
-            std_f = log.standard_bw_female
-
-            # Fallback to Standard model if not saved in log or is 0
-            if not std_m or not std_f:
-                std_record = Standard.query.filter_by(week=age_weeks).first()
-                if std_record:
-                    if not std_m: std_m = std_record.std_bw_male
-                    if not std_f: std_f = std_record.std_bw_female
-
-            avg_m_diff = "N/A"
-            if prev_log and log.body_weight_male is not None and prev_log.body_weight_male is not None:
-                diff = log.body_weight_male - prev_log.body_weight_male
-                avg_m_diff = f"{'+' if diff > 0 else ''}{diff:.0f}g"
-
-            avg_f_diff = "N/A"
-            if prev_log and log.body_weight_female is not None and prev_log.body_weight_female is not None:
-                diff = log.body_weight_female - prev_log.body_weight_female
-                avg_f_diff = f"{'+' if diff > 0 else ''}{diff:.0f}g"
-
-            for i in range(1, 9):
-                cur_m = get_p(log, f'M{i}')
-                if cur_m and cur_m.body_weight > 0:
-                    prev_m = get_p(prev_log, f'M{i}')
-                    diff_g = "N/A"
-                    diff_u = "N/A"
-
-                    cur_m_unif = (cur_m.uniformity * 100) if (cur_m.uniformity and cur_m.uniformity <= 1.0) else (cur_m.uniformity or 0)
-
-                    if prev_m and prev_m.body_weight > 0:
-                        dg = cur_m.body_weight - prev_m.body_weight
-                        diff_g = f"{'+' if dg > 0 else ''}{dg:.0f}g"
-
-                        prev_m_unif = (prev_m.uniformity * 100) if (prev_m.uniformity and prev_m.uniformity <= 1.0) else (prev_m.uniformity or 0)
-                        du = cur_m_unif - prev_m_unif
-                        diff_u = f"{'+' if du > 0 else ''}{du:.1f}%"
-
-                    var_pct = 0
-                    if std_m and std_m > 0:
-                        var_pct = ((cur_m.body_weight - std_m) / std_m) * 100
-
-                    m_parts.append({
-                        'name': f'M{i}',
-                        'bw': cur_m.body_weight,
-                        'unif': cur_m_unif,
-                        'diff_g': diff_g,
-                        'diff_u': diff_u,
-                        'var_pct': var_pct
-                    })
-
-                cur_f = get_p(log, f'F{i}')
-                if cur_f and cur_f.body_weight > 0:
-                    prev_f = get_p(prev_log, f'F{i}')
-                    diff_g = "N/A"
-                    diff_u = "N/A"
-
-                    cur_f_unif = (cur_f.uniformity * 100) if (cur_f.uniformity and cur_f.uniformity <= 1.0) else (cur_f.uniformity or 0)
-
-                    if prev_f and prev_f.body_weight > 0:
-                        dg = cur_f.body_weight - prev_f.body_weight
-                        diff_g = f"{'+' if dg > 0 else ''}{dg:.0f}g"
-
-                        prev_f_unif = (prev_f.uniformity * 100) if (prev_f.uniformity and prev_f.uniformity <= 1.0) else (prev_f.uniformity or 0)
-                        du = cur_f_unif - prev_f_unif
-                        diff_u = f"{'+' if du > 0 else ''}{du:.1f}%"
-
-                    var_pct = 0
-                    if std_f and std_f > 0:
-                        var_pct = ((cur_f.body_weight - std_f) / std_f) * 100
-
-                    f_parts.append({
-                        'name': f'F{i}',
-                        'bw': cur_f.body_weight,
-                        'unif': cur_f_unif,
-                        'diff_g': diff_g,
-                        'diff_u': diff_u,
-                        'var_pct': var_pct
-                    })
-
-            has_report = reports_map.get((log.flock.house_id, age_weeks), False)
-
-            avg_m_var = 0
-            if log.body_weight_male and std_m:
-                avg_m_var = ((log.body_weight_male - std_m) / std_m) * 100
-            avg_f_var = 0
-            if log.body_weight_female and std_f:
-                avg_f_var = ((log.body_weight_female - std_f) / std_f) * 100
-
-            bodyweight_logs.append({
-                'log_id': log.id,
-                'house_name': log.flock.house.name,
-                'house_id': log.flock.house_id,
-                'age_weeks': age_weeks,
-                'date': log.date,
-                'std_m': std_m or 0,
-                'std_f': std_f or 0,
-                'avg_m': log.body_weight_male or 0,
-                'avg_f': log.body_weight_female or 0,
-                'avg_m_diff': avg_m_diff,
-                'avg_f_diff': avg_f_diff,
-                'avg_m_var': avg_m_var,
-                'avg_f_var': avg_f_var,
-                'm_parts': m_parts,
-                'f_parts': f_parts,
-                'has_report': has_report,
-                'uni_m': (log.uniformity_male * 100) if (log.uniformity_male and log.uniformity_male <= 1.0) else (log.uniformity_male or 0),
-                'uni_f': (log.uniformity_female * 100) if (log.uniformity_female and log.uniformity_female <= 1.0) else (log.uniformity_female or 0)
-            })
-
-        return render_template('bodyweight.html', houses=houses, active_flocks=active_flocks, bodyweight_logs=bodyweight_logs, grouped_data=grouped_data, today=date.today())
+        history_filters = {
+            'flock_id': history_flock_id,
+            'date_from': date_from.isoformat() if date_from else '',
+            'date_to': date_to.isoformat() if date_to else '',
+        }
+        return render_template('bodyweight.html', houses=houses, active_flocks=active_flocks, bodyweight_logs=bodyweight_logs, grouped_data=grouped_data, pagination=pagination, history_filters=history_filters, grading_bin_widths=GRADING_BIN_WIDTHS, default_bin_width=DEFAULT_BIN_WIDTH, weigh_file_types=sorted(WEIGH_FILE_READERS), today=date.today())
 
     @app.route('/upload_weights', methods=['POST'])
     @login_required
@@ -307,225 +175,55 @@ def register_health_routes(app):
             flash("House and Age Week are required.", "danger")
             return redirect(url_for('health_log_bodyweight'))
 
+        bin_width = request.form.get('bin_width', DEFAULT_BIN_WIDTH, type=int)
+        if bin_width not in GRADING_BIN_WIDTHS:
+            bin_width = DEFAULT_BIN_WIDTH
+
         if 'file' not in request.files:
             flash("No file part.", "danger")
-            return redirect(url_for('weight_grading'))
+            return redirect(url_for('health_log_bodyweight'))
 
         file = request.files['file']
         if file.filename == '':
             flash("No selected file.", "danger")
-            return redirect(url_for('weight_grading'))
+            return redirect(url_for('health_log_bodyweight'))
 
-        if file and (file.filename.endswith('.csv') or file.filename.endswith('.xlsx')):
+        try:
+            weights = parse_weigh_file(file.filename, file.read())
 
+            # Delete existing reports for this house and week
+            existing_reports = FlockGrading.query.filter_by(house_id=house_id, age_week=age_week).all()
+            for report in existing_reports:
+                db.session.delete(report)
+            db.session.flush()
 
+            for sex, stats in grade_groups(weights, bin_width).items():
+                grading = FlockGrading(house_id=house_id, age_week=age_week, sex=sex)
+                db.session.add(apply_grading(grading, stats))
 
-            try:
-                if file.filename.endswith('.csv'):
-                    import io
-                    encodings = ['utf-8', 'utf-16', 'cp1252']
-                    df_dict = None
-
-                    for enc in encodings:
-                        try:
-                            file.seek(0)
-                            # Use TextIOWrapper to safely decode multi-byte characters like UTF-16
-                            text_stream = io.TextIOWrapper(file, encoding=enc, errors='strict')
-                            first_lines = []
-                            for _ in range(15):
-                                try:
-                                    line = text_stream.readline()
-                                except UnicodeDecodeError:
-                                    raise # Re-raise to catch in outer block
-                                if not line:
-                                    break
-                                first_lines.append(line)
-
-                            # Detach so we don't close the underlying stream
-                            text_stream.detach()
-
-                            skip_index = 0
-                            detected_sep = ','
-                            for i, line in enumerate(first_lines):
-                                if 'weight' in line.lower() and 'date' in line.lower():
-                                    skip_index = i
-                                    if '\t' in line:
-                                        detected_sep = '\t'
-                                    break
-
-                            file.seek(0)
-                            df_dict = {'Sheet1': pd.read_csv(file, encoding=enc, sep=detected_sep, skiprows=skip_index, on_bad_lines='skip', header=None)}
-                            break # Success!
-                        except UnicodeDecodeError:
-                            # Detach to preserve the underlying file if error occurs during readline
-                            if 'text_stream' in locals() and not text_stream.closed:
-                                text_stream.detach()
-                            continue
-
-                    if df_dict is None:
-                         flash("Unable to read the CSV file due to unknown encoding.", "danger")
-                         return redirect(url_for('weight_grading'))
-                else:
-                    df_dict = pd.read_excel(file, sheet_name=None, header=None)
-
-
-
-
-                m_weights = []
-                f_weights = []
-
-
-                for sheet_name, df in df_dict.items():
-                    if df.empty:
-                        continue
-
-                    # Search for headers dynamically
-                    header_row_idx = -1
-                    file_col_idx = -1
-                    weight_col_idx = -1
-
-                    for idx in range(min(10, len(df))):
-                        row = df.iloc[idx]
-                        row_strs = [str(val).strip().lower() for val in row if pd.notna(val)]
-
-                        if any('weight' in val for val in row_strs):
-                            header_row_idx = idx
-                            for c_idx, val in enumerate(row):
-                                if pd.notna(val):
-                                    val_lower = str(val).strip().lower()
-                                    if 'file' in val_lower:
-                                        file_col_idx = c_idx
-                                    elif 'weight' in val_lower:
-                                        if weight_col_idx == -1 or '[g]' in val_lower:
-                                            weight_col_idx = c_idx
-                            if file_col_idx != -1 and weight_col_idx != -1:
-                                break
-
-                    if header_row_idx == -1 or weight_col_idx == -1 or file_col_idx == -1:
-                        # Fallback to old scanner logic
-                        active_sex = None
-                        collecting = False
-                        for index in range(len(df)):
-                            row = df.iloc[index]
-                            if len(row) > 1 and pd.notna(row[1]):
-                                col_b_val = str(row[1]).strip()
-                                if col_b_val:
-                                    match = re.search(r'\b(M|F)\b', col_b_val.upper())
-                                    if match:
-                                        active_sex = 'Male' if match.group(1) == 'M' else 'Female'
-                                        collecting = False
-                            if len(row) > 3 and pd.notna(row[3]):
-                                col_d_val = str(row[3]).strip()
-                                if active_sex and 'weight [g]' in col_d_val.lower():
-                                    collecting = True
-                                    continue
-                                if collecting:
-                                    try:
-                                        val_str = col_d_val.replace(',', '')
-                                        w = float(val_str)
-                                        if pd.isna(w) or w <= 0: continue
-                                        if active_sex == 'Male': m_weights.append(w)
-                                        elif active_sex == 'Female': f_weights.append(w)
-                                    except ValueError:
-                                        collecting = False
-                            else:
-                                collecting = False
-                    else:
-                        # Process using mapped columns
-                        for index in range(header_row_idx + 1, len(df)):
-                            row = df.iloc[index]
-                            if len(row) <= max(file_col_idx, weight_col_idx): continue
-                            file_val = row[file_col_idx]
-                            weight_val = row[weight_col_idx]
-                            if pd.isna(weight_val): continue
-
-                            try:
-                                val_str = str(weight_val).strip().replace(',', '')
-                                if not val_str: continue
-                                w = float(val_str)
-                                if w <= 0: continue
-                            except ValueError:
-                                continue
-
-                            if pd.notna(file_val):
-                                file_str = str(file_val).strip().upper()
-                                # Grouping logic by sex regex
-                                # E.g., 'VC1-M P2' will match M or M within a block
-                                # Look for M or F
-                                match = re.search(r'\b(M|F)\b', file_str)
-                                if match:
-                                    if match.group(1) == 'M':
-                                        m_weights.append(w)
-                                    else:
-                                        f_weights.append(w)
-
-                # Process and save
-
-
-
-                # Delete existing reports for this house and week
-                existing_reports = FlockGrading.query.filter_by(house_id=house_id, age_week=age_week).all()
-                for report in existing_reports:
-                    db.session.delete(report)
-                db.session.flush()
+            safe_commit()
 
-                if m_weights:
-
-
-                    stats = calculate_grading_stats(m_weights)
-                    if stats:
-                        # Check if exists
-                        grading = FlockGrading.query.filter_by(house_id=house_id, age_week=age_week, sex='Male').first()
-                        if not grading:
-                            grading = FlockGrading(house_id=house_id, age_week=age_week, sex='Male')
-                            db.session.add(grading)
-
-                        grading.count = stats['count']
-                        grading.average_weight = stats['average_weight']
-                        grading.uniformity = stats['uniformity']
-                        grading.lowest_weight = stats['lowest_weight']
-                        grading.highest_weight = stats['highest_weight']
-                        grading.grading_bins = stats['grading_bins']
-
-                if f_weights:
-                    stats = calculate_grading_stats(f_weights)
-                    if stats:
-                        # Check if exists
-                        grading = FlockGrading.query.filter_by(house_id=house_id, age_week=age_week, sex='Female').first()
-                        if not grading:
-                            grading = FlockGrading(house_id=house_id, age_week=age_week, sex='Female')
-                            db.session.add(grading)
-
-                        grading.count = stats['count']
-                        grading.average_weight = stats['average_weight']
-                        grading.uniformity = stats['uniformity']
-                        grading.lowest_weight = stats['lowest_weight']
-                        grading.highest_weight = stats['highest_weight']
-                        grading.grading_bins = stats['grading_bins']
+            # Unconditional Push Alert
+            try:
+                house = House.query.get(house_id)
+                house_name = house.name if house else "Unknown House"
+                title = "SLH-OP: Grading Report"
+                body = f"{house_name}: Week {age_week} Selection/Grading Report is now available."
+                # We don't have flock id directly, but we can redirect to bodyweight page
+                alert_url = url_for('health_log_bodyweight')
 
+                user_ids = [uid for (uid,) in db.session.query(User.id).all()]
+                queue_push_alert(user_ids, title, body, url=alert_url)
                 safe_commit()
-
-                # Unconditional Push Alert
-                try:
-                    house = House.query.get(house_id)
-                    house_name = house.name if house else "Unknown House"
-                    title = "SLH-OP: Grading Report"
-                    body = f"{house_name}: Week {age_week} Selection/Grading Report is now available."
-                    # We don't have flock id directly, but we can redirect to bodyweight page
-                    alert_url = url_for('health_log_bodyweight')
-
-                    all_users = User.query.all()
-                    for user in all_users:
-                        send_push_alert(user.id, title, body, url=alert_url)
-                except Exception as e:
-                    app.logger.error(f"Failed to send Grading Report push alert: {str(e)}")
-
-                flash(f"Successfully processed weights. Males: {len(m_weights)}, Females: {len(f_weights)}", "success")
             except Exception as e:
-                db.session.rollback()
-                flash(f"Error processing file: {str(e)}", "danger")
-        else:
-            flash("Invalid file format. Please upload .csv or .xlsx", "danger")
+                app.logger.error(f"Failed to send Grading Report push alert: {str(e)}")
+
+            flash(f"Successfully processed weights. Males: {len(weights['Male'])}, Females: {len(weights['Female'])}", "success")
+        except WeighFileError as e:
+            flash(str(e), "danger")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error processing file: {str(e)}", "danger")
 
         return redirect(url_for('health_log_bodyweight'))
 
@@ -1403,11 +1101,7 @@ def register_health_routes(app):
                 files = request.files.getlist('photo')
                 for file in files:
                     if file and file.filename != '':
-                        date_str_short = log.date.strftime('%y%m%d')
-                        raw_name = f"{log.flock.flock_id}_{date_str_short}_{file.filename}"
-                        filename = secure_filename(raw_name)
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                        file.save(filepath)
+                        filepath = store_photo(file, app.config['UPLOAD_FOLDER'])
 
                         new_photo = DailyLogPhoto(
                             log_id=log.id,
@@ -1425,9 +1119,9 @@ def register_health_routes(app):
                 body = f"{house_name}: New Post Mortem report filed. Please review clinical findings."
                 alert_url = url_for('view_flock', id=log.flock.id) if log.flock else '/'
 
-                all_users = User.query.all()
-                for user in all_users:
-                    send_push_alert(user.id, title, body, url=alert_url)
+                user_ids = [uid for (uid,) in db.session.query(User.id).all()]
+                queue_push_alert(user_ids, title, body, url=alert_url)
+                safe_commit()
             except Exception as e:
                 app.logger.error(f"Failed to send Post Mortem push alert: {str(e)}")
 
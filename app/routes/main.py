@@ -187,4 +187,11 @@ def register_main_routes(app):
 
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        from app.services.photo_service import resolve_upload, PHOTO_CACHE_SECONDS
+        name, immutable = resolve_upload(app.config['UPLOAD_FOLDER'], filename)
+        # Content-hash photos and their variants never change under the same name
+        if immutable:
+            response = send_from_directory(app.config['UPLOAD_FOLDER'], name, max_age=PHOTO_CACHE_SECONDS)
+            response.cache_control.immutable = True
+            return response
+        return send_from_directory(app.config['UPLOAD_FOLDER'], name)
@@ -1,6 +1,6 @@
-from analytics import analyze_health_events, calculate_feed_cleanup_duration
-from metrics import calculate_bio_week, calculate_metrics, enrich_flock_data, aggregate_weekly_metrics, aggregate_monthly_metrics, METRICS_REGISTRY, get_std_hatch_map
-from flask import render_template, request, redirect, flash, url_for, session, jsonify
+from analytics import analyze_health_events, detect_farm_health_events, calculate_feed_cleanup_duration
+from metrics import calculate_bio_week, calculate_metrics, enrich_flock_data, with_week_notes, METRICS_REGISTRY, get_std_hatch_map
+from flask import render_template, request, redirect, flash, url_for, session, jsonify, abort
 from flask_login import login_required, current_user
 from app.database import db
 from app.models.models import *
@@ -17,11 +17,18 @@ import re
 def register_production_routes(app):
 
     from app.constants import (
-        REARING_PHASES, INV_TX_TYPES_USAGE_WASTE, INV_TX_TYPES_ALL
+        REARING_PHASES, INV_TX_TYPES_USAGE_WASTE, INV_TX_TYPES_ALL,
+        HEALTH_FEED_DAYS, HEALTH_FEED_LIMIT
         )
     from app.utils import safe_commit, log_user_activity, dept_required, natural_sort_key, round_to_whole, get_dashboard_url
-    from app.services.data_service import get_projected_start_of_lay, get_weekly_data_aggregated, get_hatchery_analytics, calculate_flock_summary, generate_spreadsheet_data, recalculate_flock_inventory, update_log_from_request, check_daily_log_completion
+    from app.services.data_service import get_projected_start_of_lay, get_weekly_data_aggregated, get_iso_aggregated_data, generate_spreadsheet_data, recalculate_flock_inventory, update_log_from_request, check_daily_log_completion
     from app.services.seed_service import initialize_sampling_schedule, initialize_vaccine_schedule
+    from app.services.inventory_service import get_usage_by_month, get_month_summary, USAGE_TYPES
+    from app.services.notification_service import queue_push_alert
+    from app.services.flock_archive_service import get_frozen_analytics, build_flock_archive, get_flock_summary
+    from app.services.flock_view_service import FLOCK_TABS, get_flock_view
+    from app.services.hatchery_analytics_service import get_hatchery_analytics
+    from app.services.photo_service import photo_urls, remove_photo_files
 
     @app.route('/executive/flock/<int:id>')
     @login_required
@@ -55,11 +62,13 @@ def register_production_routes(app):
         # --- Fetch Hatch Data ---
         hatch_records = Hatchability.query.filter_by(flock_id=id).order_by(Hatchability.setting_date.desc()).all()
 
-        # --- Metrics Engine ---
-        daily_stats = enrich_flock_data(flock, logs, hatch_records, all_standards=all_standards)
+        # --- Metrics Engine (closed flocks read their frozen archive) ---
+        frozen = get_frozen_analytics(flock, logs, hatch_records, all_standards)
+        daily_stats = frozen['daily'] if frozen else enrich_flock_data(flock, logs, hatch_records, all_standards=all_standards)
 
-        # --- Calculate Summary Tab Data ---
-        summary_dashboard, summary_table = calculate_flock_summary(flock, daily_stats)
+        # --- Summary Tab & Weekly Data (cached per flock data version) ---
+        flock_summary = get_flock_summary(flock, daily_stats)
+        summary_dashboard, summary_table = flock_summary['dashboard'], flock_summary['table']
 
         # Inject Shifted Standard
         for d in daily_stats:
@@ -68,7 +77,7 @@ def register_production_routes(app):
             d['std_mortality_male'] = (std_bio.std_mortality_male if std_bio and std_bio.std_mortality_male is not None else 0.0)
             d['std_mortality_female'] = (std_bio.std_mortality_female if std_bio and std_bio.std_mortality_female is not None else 0.0)
 
-        weekly_stats = aggregate_weekly_metrics(daily_stats)
+        weekly_stats = with_week_notes(flock_summary['weekly'], daily_stats)
 
         for ws in weekly_stats:
             # Biological Standards
@@ -88,16 +97,7 @@ def register_production_routes(app):
 
         for d in daily_stats:
             log = d['log']
-            lighting_hours = 0
-            if log.light_on_time and log.light_off_time:
-                try:
-                    fmt = '%H:%M'
-                    t1 = datetime.strptime(log.light_on_time, fmt)
-                    t2 = datetime.strptime(log.light_off_time, fmt)
-                    diff = (t2 - t1).total_seconds() / 3600
-                    if diff < 0: diff += 24
-                    lighting_hours = round(diff, 1)
-                except: pass
+            lighting_hours = d['lighting_hours'] or 0
 
             active_meds = []
             for m in medications:
@@ -244,7 +244,7 @@ def register_production_routes(app):
                 photo_list = []
                 for p in log.photos:
                     photo_list.append({
-                        'url': url_for('uploaded_file', filename=os.path.basename(p.file_path)),
+                        **photo_urls(p.file_path),
                         'name': p.original_filename or 'Photo'
                     })
 
@@ -360,7 +360,7 @@ def register_production_routes(app):
 
                         for p in log.photos:
                             week_photos.append({
-                                'url': url_for('uploaded_file', filename=os.path.basename(p.file_path)),
+                                **photo_urls(p.file_path),
                                 'name': f"{log.date.strftime('%d/%m')} {p.original_filename or 'Photo'}"
                             })
 
@@ -601,7 +601,8 @@ def register_production_routes(app):
                     elif round(f.daily_stats['egg_diff'], 2) < 0: f.daily_stats['egg_trend'] = 'down'
 
         # Analytics: Previous & Next Hatch Dates
-        last_hatch, next_hatch = get_hatchery_analytics()
+        hatchery_analytics = get_hatchery_analytics()
+        last_hatch, next_hatch = hatchery_analytics['last_hatch'], hatchery_analytics['next_hatch']
 
         # --- New ISO Reports ---
         # Year Filter Logic
@@ -616,93 +617,9 @@ def register_production_routes(app):
 
         active_tab = request.args.get('active_tab', 'overview')
 
-        # Phase 3 Optimization: Python Enrichment Engine to match SSOT
-        all_enriched_data = []
-
-        # Use the active_flocks we already fetched and enriched above
-        for flock in active_flocks:
-            if hasattr(flock, 'enriched_data') and flock.enriched_data:
-                # Filter for the selected year and append
-                enriched_year = [d for d in flock.enriched_data if d['date'].year == selected_year]
-                all_enriched_data.extend(enriched_year)
-
-        weekly_agg = aggregate_weekly_metrics(all_enriched_data)
-        monthly_agg = aggregate_monthly_metrics(all_enriched_data)
-
-        iso_data = {
-            'weekly': [],
-            'monthly': [],
-            'yearly': []
-        }
-
-        # Format weekly
-        for ws in reversed(weekly_agg):  # frontend expects descending
-            avg_hen = ws['stock_female_start'] - ((ws['mortality_female'] + ws['culls_female']) / 2)
-
-            iso_data['weekly'].append({
-                'period': f"Week {ws['week']}",
-                'avg_female_stock': int(avg_hen),
-                'total_eggs': ws['eggs_collected'],
-                'total_chicks': ws['hatched_chicks'],
-                'mortality_pct': ws['mortality_female_pct'],
-                'hatchability_pct': ws['hatchability_pct'],
-                'egg_production_pct': ws['egg_prod_pct']
-            })
-
-        # Format monthly
-        for ms in reversed(monthly_agg):
-            avg_hen = ms['stock_female_start'] - ((ms['mortality_female'] + ms['culls_female']) / 2)
-
-            iso_data['monthly'].append({
-                'period': ms['month'],
-                'avg_female_stock': int(avg_hen),
-                'total_eggs': ms['eggs_collected'],
-                'total_chicks': ms['hatched_chicks'],
-                'mortality_pct': ms['mortality_female_pct'],
-                'hatchability_pct': ms['hatchability_pct'],
-                'egg_production_pct': ms['egg_prod_pct']
-            })
-
-        # Build yearly aggregation manually since metrics.py doesn't have aggregate_yearly_metrics
-        yearly_stats = {}
-        for d in all_enriched_data:
-            y_key = str(d['date'].year)
-            if y_key not in yearly_stats:
-                yearly_stats[y_key] = {
-                    'period': y_key,
-                    'count': 0,
-                    'stock_female_start': d['stock_female_start'],
-                    'mortality_female': 0,
-                    'culls_female': 0,
-                    'eggs_collected': 0,
-                    'hatched_chicks': 0,
-                    'egg_set': 0
-                }
-
-            ys = yearly_stats[y_key]
-            ys['count'] += 1
-            ys['mortality_female'] += d['mortality_female']
-            ys['culls_female'] += d['culls_female']
-            ys['eggs_collected'] += d['eggs_collected']
-            if d.get('hatched_chicks'): ys['hatched_chicks'] += d['hatched_chicks']
-            if d.get('egg_set'): ys['egg_set'] += d['egg_set']
-
-        for y_key in sorted(yearly_stats.keys(), reverse=True):
-            ys = yearly_stats[y_key]
-            avg_hen = ys['stock_female_start'] - ((ys['mortality_female'] + ys['culls_female']) / 2)
-            mortality_pct = (ys['mortality_female'] / ys['stock_female_start'] * 100) if ys['stock_female_start'] > 0 else 0
-            egg_prod_pct = (ys['eggs_collected'] / (avg_hen * ys['count'])) * 100 if (avg_hen * ys['count']) > 0 else 0
-            hatchability_pct = (ys['hatched_chicks'] / ys['egg_set'] * 100) if ys['egg_set'] > 0 else 0
-
-            iso_data['yearly'].append({
-                'period': y_key,
-                'avg_female_stock': int(avg_hen),
-                'total_eggs': ys['eggs_collected'],
-                'total_chicks': ys['hatched_chicks'],
-                'mortality_pct': mortality_pct,
-                'hatchability_pct': hatchability_pct,
-                'egg_production_pct': egg_prod_pct
-            })
+        # Farm totals come straight from SQL for every flock with logs in the year,
+        # including closed flocks, so past years stay reportable
+        iso_data = get_iso_aggregated_data(selected_year)
 
         # Monthly Inventory Usage Calculation
         current_month_start = today.replace(day=1)
@@ -714,21 +631,15 @@ def register_production_routes(app):
         inventory_items = InventoryItem.query.all()
         inventory_usage = []
 
-        # We will get logs for current and last month
-        logs_this_month = InventoryTransaction.query.filter(
-            InventoryTransaction.transaction_date >= current_month_start,
-            InventoryTransaction.transaction_type.in_(['Usage', 'Waste'])
-        ).all()
-
-        logs_last_month = InventoryTransaction.query.filter(
-            InventoryTransaction.transaction_date >= last_month_start,
-            InventoryTransaction.transaction_date < current_month_start,
-            InventoryTransaction.transaction_type.in_(['Usage', 'Waste'])
-        ).all()
+        # Usage + waste per item for this and last month, grouped in SQL from the ledger snapshots
+        this_key = (current_month_start.year, current_month_start.month)
+        last_key = (last_month_start.year, last_month_start.month)
+        usage_by_item = get_usage_by_month([this_key, last_key], types=USAGE_TYPES)
 
         for item in inventory_items:
-            used_this = sum(log.quantity for log in logs_this_month if log.inventory_item_id == item.id)
-            used_last = sum(log.quantity for log in logs_last_month if log.inventory_item_id == item.id)
+            item_usage = usage_by_item.get(item.id, {})
+            used_this = item_usage.get(this_key, 0.0)
+            used_last = item_usage.get(last_key, 0.0)
 
             inventory_usage.append({
                 'name': item.name,
@@ -739,8 +650,17 @@ def register_production_routes(app):
                 'used_last_month': round(used_last, 2)
             })
 
+        # Farm-wide health event feed, scored across all active flocks in one pass
+        health_feed = detect_farm_health_events(
+            [(f, f.enriched_data) for f in active_flocks],
+            since=today - timedelta(days=HEALTH_FEED_DAYS),
+            limit=HEALTH_FEED_LIMIT
+        )
+
         return render_template('executive_dashboard.html',
                                active_flocks=active_flocks,
+                               health_feed=health_feed,
+                               health_feed_days=HEALTH_FEED_DAYS,
                                last_hatch=last_hatch,
                                next_hatch=next_hatch,
                                current_month=today.strftime('%B %Y'),
@@ -1089,27 +1009,16 @@ def register_production_routes(app):
 
         # Monthly Summary
         today = date.today()
-        start_of_month = date(today.year, today.month, 1)
-
-        month_txs = InventoryTransaction.query.filter(InventoryTransaction.transaction_date >= start_of_month).all()
-
-        summary_map = {}
-        for t in month_txs:
-            if t.inventory_item_id not in summary_map:
-                summary_map[t.inventory_item_id] = {'purchase': 0, 'usage': 0, 'waste': 0}
-
-            type_key = t.transaction_type.lower()
-            if type_key in summary_map[t.inventory_item_id]:
-                summary_map[t.inventory_item_id][type_key] += t.quantity
+        summary_map = get_month_summary(today.year, today.month)
 
         summary_list = []
         for item in items:
-            s = summary_map.get(item.id, {'purchase': 0, 'usage': 0, 'waste': 0})
+            s = summary_map.get(item.id, {})
             summary_list.append({
                 'name': item.name,
-                'purchase': round(s['purchase'], 2),
-                'usage': round(s['usage'], 2),
-                'waste': round(s['waste'], 2)
+                'purchase': round(s.get('purchase', 0), 2),
+                'usage': round(s.get('usage', 0), 2),
+                'waste': round(s.get('waste', 0), 2)
             })
 
         return render_template('inventory.html', items=items, transactions=transactions, summary=summary_list, current_month=today.strftime('%B %Y'), today=today)
@@ -1232,7 +1141,7 @@ def register_production_routes(app):
 
             try:
                 safe_commit()
-                recalculate_flock_inventory(log.flock_id)
+                recalculate_flock_inventory(log.flock_id, from_date=log.date)
                 if request.headers.get('Accept') == 'application/json':
                     house_status = check_daily_log_completion(log.flock.farm_id, log.date)
                     return jsonify({
@@ -1463,18 +1372,17 @@ def register_production_routes(app):
 
             try:
                 safe_commit()
-                recalculate_flock_inventory(flock.id)
-
-                # Send push alert to admins
-                from app.utils import send_push_alert
-                admins = User.query.filter_by(role='Admin').all()
-                for admin in admins:
-                    send_push_alert(
-                        admin.id,
-                        "Daily Log Updated",
-                        f"House {flock.house.name} has been updated for {date_str}.",
-                        url=url_for('admin_daily_reports_review')
-                    )
+                recalculate_flock_inventory(flock.id, from_date=log_date)
+
+                # Queue push alert to admins, delivered by the background dispatcher
+                admin_ids = [uid for (uid,) in db.session.query(User.id).filter_by(role='Admin').all()]
+                queue_push_alert(
+                    admin_ids,
+                    "Daily Log Updated",
+                    f"House {flock.house.name} has been updated for {date_str}.",
+                    url=url_for('admin_daily_reports_review')
+                )
+                safe_commit()
 
                 if request.headers.get('Accept') == 'application/json':
                     house_status = check_daily_log_completion(flock.farm_id, log_date)
@@ -1613,10 +1521,6 @@ def register_production_routes(app):
                 active_flocks.sort(key=lambda x: natural_sort_key(x.house.name if x.house else ''))
 
         flock = Flock.query.options(joinedload(Flock.house)).filter_by(id=id).first_or_404()
-        logs = DailyLog.query.options(joinedload(DailyLog.partition_weights), joinedload(DailyLog.photos), joinedload(DailyLog.clinical_notes_list)).filter_by(flock_id=id).order_by(DailyLog.date.asc()).all()
-
-        # --- Health Analytics ---
-        health_events = analyze_health_events(logs)
 
         gs = GlobalStandard.query.first()
         if not gs:
@@ -1624,481 +1528,72 @@ def register_production_routes(app):
             db.session.add(gs)
             safe_commit()
 
-        # --- Standards Setup ---
-        all_standards = Standard.query.all()
-        std_map = {getattr(s, 'week'): s for s in all_standards if hasattr(s, 'week')} # Biological Age Map
-        prod_std_map = {getattr(s, 'production_week'): s for s in all_standards if hasattr(s, 'production_week') and getattr(s, 'production_week')} # Production Week Map
-
-        std_hatch_map = get_std_hatch_map(all_standards)
-
-        # --- Fetch Hatch Data ---
-        hatch_records = Hatchability.query.filter_by(flock_id=id).order_by(Hatchability.setting_date.desc()).all()
-
-        # --- Metrics Engine ---
-        daily_stats = enrich_flock_data(flock, logs, hatch_records, all_standards=all_standards)
-
-        # --- Calculate Summary Tab Data ---
-        summary_dashboard, summary_table = calculate_flock_summary(flock, daily_stats)
-
-        weekly_stats = aggregate_weekly_metrics(daily_stats)
-
-        medications = Medication.query.filter_by(flock_id=id).all()
-        vacs = Vaccine.query.filter_by(flock_id=id).filter(Vaccine.actual_date != None).all()
+        # Only the header is rendered here, the KPIs and every tab load on demand
+        return render_template('flock_detail_modern.html', flock=flock, global_std=gs, active_flocks=active_flocks)
 
-        # 1. Enriched Logs (For Table)
-        enriched_logs = []
-
-        def scale_pct(val):
-            if val is None: return None
-            if 0 < val <= 1.0: return val * 100.0
-            return val
-
-        for d in daily_stats:
-            log = d['log']
-
-            # View Specific: Lighting
-            lighting_hours = 0
-            if log.light_on_time and log.light_off_time:
-                try:
-                    fmt = '%H:%M'
-                    t1 = datetime.strptime(log.light_on_time, fmt)
-                    t2 = datetime.strptime(log.light_off_time, fmt)
-                    diff = (t2 - t1).total_seconds() / 3600
-                    if diff < 0: diff += 24
-                    lighting_hours = round(diff, 1)
-                except: pass
-
-            # View Specific: Meds
-            active_meds = []
-            for m in medications:
-                if m.start_date <= log.date:
-                    if m.end_date is None or m.end_date >= log.date:
-                        active_meds.append(m.drug_name)
-            meds_str = ", ".join(active_meds)
-
-            feed_cleanup_hours = d.get('feed_cleanup_hours')
-
-            enriched_logs.append({
-                'log': log,
-                'stock_male': d.get('stock_male_prod_end', 0) + d.get('stock_male_hosp_end', 0),
-                'stock_female': d.get('stock_female_prod_end', 0) + d.get('stock_female_hosp_end', 0),
-                'lighting_hours': lighting_hours,
-                'medications': meds_str,
-                'egg_prod_pct': d['egg_prod_pct'],
-                'total_feed': d['feed_total_kg'],
-                'feed_cleanup_hours': feed_cleanup_hours,
-                'egg_data': {
-                    'jumbo': d['cull_eggs_jumbo'],
-                    'jumbo_pct': d['cull_eggs_jumbo_pct'],
-                    'small': d['cull_eggs_small'],
-                    'small_pct': d['cull_eggs_small_pct'],
-                    'crack': d['cull_eggs_crack'],
-                    'crack_pct': d['cull_eggs_crack_pct'],
-                    'abnormal': d['cull_eggs_abnormal'],
-                    'abnormal_pct': d['cull_eggs_abnormal_pct'],
-                    'hatching': d['hatch_eggs'],
-                    'hatching_pct': d['hatch_egg_pct'] if d.get('hatch_egg_pct') is not None else None,
-                    'total_culls': d['cull_eggs_total'],
-                    'total_culls_pct': d['cull_eggs_pct']
-                }
-            })
-
-        # 2. Weekly Data (For Table)
-        weekly_data = []
-        for ws in weekly_stats:
-            # Notes formatting
-            note_str = " | ".join(ws['notes'])
-
-            w_item = {
-                'week': ws['week'],
-                'mortality_male': ws['mortality_male'],
-                'mortality_female': ws['mortality_female'],
-                'culls_male': ws['culls_male'],
-                'culls_female': ws['culls_female'],
-                'eggs': ws['eggs_collected'],
-                'hatch_eggs_sum': ws['hatch_eggs'],
-                'cull_eggs_total': ws['cull_eggs_total'],
-                'cull_eggs_pct': ws.get('cull_eggs_pct', 0),
-
-                # Derived
-                'mort_pct_m': ws['mortality_male_pct'],
-                'mort_pct_f': ws['mortality_female_pct'],
-                'cull_pct_m': ws['culls_male_pct'],
-                'cull_pct_f': ws['culls_female_pct'],
-                'egg_prod_pct': ws['egg_prod_pct'],
-                'hatching_egg_pct': ws['hatch_egg_pct'] if ws.get('hatch_egg_pct') is not None else None,
-                'cull_eggs_jumbo': ws['cull_eggs_jumbo'],
-                'cull_eggs_jumbo_pct': ws['cull_eggs_jumbo_pct'] if ws.get('cull_eggs_jumbo_pct') else 0,
-                'cull_eggs_small': ws['cull_eggs_small'],
-                'cull_eggs_small_pct': ws['cull_eggs_small_pct'] if ws.get('cull_eggs_small_pct') else 0,
-                'cull_eggs_crack': ws['cull_eggs_crack'],
-                'cull_eggs_crack_pct': ws['cull_eggs_crack_pct'] if ws.get('cull_eggs_crack_pct') else 0,
-                'cull_eggs_abnormal': ws['cull_eggs_abnormal'],
-                'cull_eggs_abnormal_pct': ws['cull_eggs_abnormal_pct'] if ws.get('cull_eggs_abnormal_pct') else 0,
-                'avg_egg_weight': ws['avg_egg_weight'],
-
-                'avg_bw_male': round_to_whole(ws['body_weight_male']),
-                'avg_bw_female': round_to_whole(ws['body_weight_female']),
-
-                # Additional for Charts
-                'avg_bw_male_std': 0, # Placeholder if needed, or calc
-                'avg_bw_female_std': 0,
-                'avg_unif_male': ws['uniformity_male'],
-                'avg_unif_female': ws['uniformity_female'],
-                'partition_avgs': {}, # Not strictly used in table unless drilled down
-
-                'notes': ws['notes'],
-                'photos': ws['photos']
-            }
-            weekly_data.append(w_item)
-
-        # 3. Chart Data (Daily)
-        chart_data = {
-            'dates': [d['date'].strftime('%Y-%m-%d') for d in daily_stats],
-            'ages': [d['log'].age_week_day for d in daily_stats],
-            'mortality_cum_male': [round(d['mortality_cum_male_pct'], 2) for d in daily_stats],
-            'mortality_cum_female': [round(d['mortality_cum_female_pct'], 2) for d in daily_stats],
-            'mortality_daily_male': [round(d['mortality_male_pct'], 2) for d in daily_stats],
-            'mortality_daily_female': [round(d['mortality_female_pct'], 2) for d in daily_stats],
-            'culls_daily_male': [round(d['culls_male_pct'], 2) for d in daily_stats],
-            'culls_daily_female': [round(d['culls_female_pct'], 2) for d in daily_stats],
-            'egg_prod': [round(d['egg_prod_pct'], 2) for d in daily_stats],
-            'std_egg_prod': [round(d['std_egg_prod'], 2) if d.get('std_egg_prod') is not None else None for d in daily_stats],
-            'hatch_egg_pct': [round(d['hatch_egg_pct'], 2) if d.get('hatch_egg_pct') is not None else None for d in daily_stats],
-            'std_hatching_egg_pct': [round(d['std_hatching_egg_pct'], 2) if d.get('std_hatching_egg_pct') is not None else None for d in daily_stats],
-            'cull_eggs_jumbo_pct': [round(d['cull_eggs_jumbo_pct'], 2) for d in daily_stats],
-            'cull_eggs_small_pct': [round(d['cull_eggs_small_pct'], 2) for d in daily_stats],
-            'cull_eggs_crack_pct': [round(d['cull_eggs_crack_pct'], 2) for d in daily_stats],
-            'cull_eggs_abnormal_pct': [round(d['cull_eggs_abnormal_pct'], 2) for d in daily_stats],
-            'male_ratio': [round(d['male_ratio_stock'], 2) if d['male_ratio_stock'] else 0 for d in daily_stats],
-            'bw_male_std': [d['log'].standard_bw_male if d['log'].standard_bw_male is not None and d['log'].standard_bw_male > 0 else None for d in daily_stats],
-            'bw_female_std': [d['log'].standard_bw_female if d['log'].standard_bw_female is not None and d['log'].standard_bw_female > 0 else None for d in daily_stats],
-            'unif_male': [scale_pct(d['uniformity_male']) if d['uniformity_male'] is not None and d['uniformity_male'] > 0 else None for d in daily_stats],
-            'unif_female': [scale_pct(d['uniformity_female']) if d['uniformity_female'] is not None and d['uniformity_female'] > 0 else None for d in daily_stats],
-
-            # Raw BW for charts (None if 0)
-            'bw_f': [d['body_weight_female'] if d['body_weight_female'] is not None and d['body_weight_female'] > 0 else None for d in daily_stats],
-            'bw_m': [d['body_weight_male'] if d['body_weight_male'] is not None and d['body_weight_male'] > 0 else None for d in daily_stats],
-
-            'water_per_bird': [round(d['water_per_bird'], 1) if d['water_per_bird'] >= 0 else None for d in daily_stats],
-            'water_feed_ratio': [round(d.get('water_feed_ratio'), 2) if d.get('water_feed_ratio') is not None and d.get('water_feed_ratio') >= 0 else None for d in daily_stats],
-            'feed_male_gp_bird': [round(d['feed_male_gp_bird'], 1) for d in daily_stats],
-            'feed_female_gp_bird': [round(d['feed_female_gp_bird'], 1) for d in daily_stats],
-            'flushing': [d['log'].flushing for d in daily_stats],
-
-            # Legacy Partitions from Log
-            'bw_male_p1': [d['log'].bw_male_p1 if d['log'].bw_male_p1 is not None and d['log'].bw_male_p1 > 0 else None for d in daily_stats],
-            'bw_male_p2': [d['log'].bw_male_p2 if d['log'].bw_male_p2 is not None and d['log'].bw_male_p2 > 0 else None for d in daily_stats],
-            'bw_female_p1': [d['log'].bw_female_p1 if d['log'].bw_female_p1 is not None and d['log'].bw_female_p1 > 0 else None for d in daily_stats],
-            'bw_female_p2': [d['log'].bw_female_p2 if d['log'].bw_female_p2 is not None and d['log'].bw_female_p2 > 0 else None for d in daily_stats],
-            'bw_female_p3': [d['log'].bw_female_p3 if d['log'].bw_female_p3 is not None and d['log'].bw_female_p3 > 0 else None for d in daily_stats],
-            'bw_female_p4': [d['log'].bw_female_p4 if d['log'].bw_female_p4 is not None and d['log'].bw_female_p4 > 0 else None for d in daily_stats],
-
-            'notes': [],
-            'medication_active': [],
-            'medication_names': []
-        }
-
-        # Fill dynamic partitions and notes
-        for i in range(1, 9):
-            chart_data[f'bw_M{i}'] = []
-            chart_data[f'bw_F{i}'] = []
-
-        for d in daily_stats:
-            log = d['log']
-            p_map = {pw.partition_name: pw.body_weight for pw in log.partition_weights}
-
-            for i in range(1, 9):
-                val_m = p_map.get(f'M{i}', 0)
-                if val_m == 0 and i <= 2: val_m = getattr(log, f'bw_male_p{i}', 0)
-                chart_data[f'bw_M{i}'].append(val_m if val_m is not None and val_m > 0 else None)
-
-                val_f = p_map.get(f'F{i}', 0)
-                if val_f == 0 and i <= 4: val_f = getattr(log, f'bw_female_p{i}', 0)
-                chart_data[f'bw_F{i}'].append(val_f if val_f is not None and val_f > 0 else None)
-
-            note_obj = None
-
-            # Construct Note
-            note_parts = []
-            if log.flushing: note_parts.append("[FLUSHING]")
-            if log.clinical_notes: note_parts.append(log.clinical_notes)
-
-            # Meds
-            active_meds = [m.drug_name for m in medications if m.start_date <= log.date and (m.end_date is None or m.end_date >= log.date)]
-            chart_data['medication_active'].append(len(active_meds) > 0)
-            chart_data['medication_names'].append(", ".join(active_meds) if active_meds else "")
-
-            # User requested to remove medication from notes, so we don't append to note_parts
-            # if active_meds: note_parts.append("Meds: " + ", ".join(active_meds))
-
-            # Vacs
-            done_vacs = [v.vaccine_name for v in vacs if v.actual_date == log.date]
-            if done_vacs: note_parts.append("Vac: " + ", ".join(done_vacs))
-
-            # Main Photos (note_id is None)
-            main_photos = [p for p in log.photos if p.note_id is None]
-
-            # Extra Notes
-            extra_notes = []
-            if log.clinical_notes_list:
-                for n in log.clinical_notes_list:
-                    n_photos = []
-                    for p in n.photos:
-                        n_photos.append({
-                            'url': url_for('uploaded_file', filename=os.path.basename(p.file_path)),
-                            'name': p.original_filename or 'Photo'
-                        })
-                    extra_notes.append({
-                        'caption': n.caption,
-                        'photos': n_photos
-                    })
-
-            has_any_data = (note_parts or main_photos or extra_notes)
-
-            if has_any_data:
-                main_photo_list = []
-                for p in main_photos:
-                    main_photo_list.append({
-                        'url': url_for('uploaded_file', filename=os.path.basename(p.file_path)),
-                        'name': p.original_filename or 'Photo'
-                    })
-
-                note_obj = {
-                    'note': " | ".join(note_parts), # Kept for backward compat in tooltips
-                    'main_note': " | ".join(note_parts),
-                    'main_photos': main_photo_list,
-                    'extra_notes': extra_notes,
-                    'photos': main_photo_list # Fallback for legacy views
-                }
-
-            chart_data['notes'].append(note_obj)
-
-        # 4. Chart Data (Weekly)
-        # Calculate Cumulative Mortality for Weekly points manually as metrics.py aggregates per week (independent sums)
-        cum_mort_m_agg = 0
-        cum_mort_f_agg = 0
-        start_m = flock.intake_male or 1
-        start_f = flock.intake_female or 1
-
-        # Check if we are in production phase to use prod start?
-        # metrics.py handles this per week if we query it right, but here we just iterate
-        # Actually metrics.py `enrich` resets cum sum on phase switch.
-        # We should grab the last cumulative value of the week from daily stats?
-        # Yes, much safer. But daily stats are flattened.
-        # Let's just sum up the weekly deaths.
-        # NOTE: If phase switch happened mid-week, the cumulative logic is tricky.
-        # But for charts, we usually want % of START stock.
-        # Let's rely on standard logic: Cumulative deaths / Intake.
-        # If Production, Cumulative deaths (since prod start) / Prod Start Stock.
-        # This matches the behavior of daily charts.
-
-        # We will assume Start Stock is global intake unless we detect phase shift logic?
-        # metrics.py's enrich logic is best.
-        # Let's just pick the last day of the week from daily_stats and take its cumulative %?
-        # Yes! That's the most accurate representation of "End of Week Cumulative %".
-
-        weekly_map = {ws['week']: ws for ws in weekly_stats}
-
-        chart_data_weekly = {
-            'dates': [],
-            'mortality_cum_male': [], 'mortality_cum_female': [],
-            'mortality_weekly_male': [], 'mortality_weekly_female': [],
-            'culls_weekly_male': [], 'culls_weekly_female': [],
-            'avg_bw_male': [], 'avg_bw_female': [],
-            'egg_prod': [], 'avg_egg_weight': [],
-            'bw_male_std': [], 'bw_female_std': [],
-            'unif_male': [], 'unif_female': [],
-            'notes': []
-        }
-        for i in range(1, 9):
-            chart_data_weekly[f'bw_M{i}'] = []
-            chart_data_weekly[f'bw_F{i}'] = []
-
-        # Group daily_stats by week to get end-of-week cum values
-        daily_by_week = {}
-        for d in daily_stats:
-            if d['week'] not in daily_by_week: daily_by_week[d['week']] = []
-            daily_by_week[d['week']].append(d)
-
-        for w in sorted(weekly_map.keys()):
-            ws = weekly_map[w]
-            last_day = daily_by_week[w][-1]
-
-            chart_data_weekly['dates'].append(f"Week {w}")
-            chart_data_weekly['mortality_cum_male'].append(round(last_day['mortality_cum_male_pct'], 2))
-            chart_data_weekly['mortality_cum_female'].append(round(last_day['mortality_cum_female_pct'], 2))
-
-            chart_data_weekly['mortality_weekly_male'].append(round(ws['mortality_male_pct'], 2))
-            chart_data_weekly['mortality_weekly_female'].append(round(ws['mortality_female_pct'], 2))
-            chart_data_weekly['culls_weekly_male'].append(round(ws['culls_male_pct'], 2))
-            chart_data_weekly['culls_weekly_female'].append(round(ws['culls_female_pct'], 2))
-
-            chart_data_weekly['avg_bw_male'].append(round_to_whole(ws['body_weight_male']) if ws['body_weight_male'] is not None and ws['body_weight_male'] > 0 else None)
-            chart_data_weekly['avg_bw_female'].append(round_to_whole(ws['body_weight_female']) if ws['body_weight_female'] is not None and ws['body_weight_female'] > 0 else None)
-
-            chart_data_weekly['egg_prod'].append(round(ws['egg_prod_pct'], 2))
-            chart_data_weekly['avg_egg_weight'] = chart_data_weekly.get('avg_egg_weight', [])
-            chart_data_weekly['avg_egg_weight'].append(round(ws.get('avg_egg_weight', 0.0), 2))
-            chart_data_weekly['std_egg_prod'] = chart_data_weekly.get('std_egg_prod', [])
-            chart_data_weekly['std_egg_prod'].append(round(ws['std_egg_prod'], 2) if ws.get('std_egg_prod') is not None else None)
-
-            chart_data_weekly['hatch_egg_pct'] = chart_data_weekly.get('hatch_egg_pct', [])
-            chart_data_weekly['hatch_egg_pct'].append(round(ws['hatch_egg_pct'], 2) if ws.get('hatch_egg_pct') is not None else None)
-
-            chart_data_weekly['std_hatching_egg_pct'] = chart_data_weekly.get('std_hatching_egg_pct', [])
-            chart_data_weekly['std_hatching_egg_pct'].append(round(ws['std_hatching_egg_pct'], 2) if ws.get('std_hatching_egg_pct') is not None else None)
-
-            chart_data_weekly['cull_eggs_jumbo_pct'] = chart_data_weekly.get('cull_eggs_jumbo_pct', [])
-            chart_data_weekly['cull_eggs_jumbo_pct'].append(round(ws['cull_eggs_jumbo_pct'], 2))
-
-            chart_data_weekly['cull_eggs_small_pct'] = chart_data_weekly.get('cull_eggs_small_pct', [])
-            chart_data_weekly['cull_eggs_small_pct'].append(round(ws['cull_eggs_small_pct'], 2))
-
-            chart_data_weekly['cull_eggs_crack_pct'] = chart_data_weekly.get('cull_eggs_crack_pct', [])
-            chart_data_weekly['cull_eggs_crack_pct'].append(round(ws['cull_eggs_crack_pct'], 2))
-
-            chart_data_weekly['cull_eggs_abnormal_pct'] = chart_data_weekly.get('cull_eggs_abnormal_pct', [])
-            chart_data_weekly['cull_eggs_abnormal_pct'].append(round(ws['cull_eggs_abnormal_pct'], 2))
-
-            # Standard BW - Use Biological Age (w)
-            std_bio = std_map.get(w)
-            chart_data_weekly['bw_male_std'].append(std_bio.std_bw_male if std_bio and std_bio.std_bw_male is not None and std_bio.std_bw_male > 0 else None)
-            chart_data_weekly['bw_female_std'].append(std_bio.std_bw_female if std_bio and std_bio.std_bw_female is not None and std_bio.std_bw_female > 0 else None)
-
-            chart_data_weekly['unif_male'].append(scale_pct(ws['uniformity_male']) if ws['uniformity_male'] is not None and ws['uniformity_male'] > 0 else None)
-            chart_data_weekly['unif_female'].append(scale_pct(ws['uniformity_female']) if ws['uniformity_female'] is not None and ws['uniformity_female'] > 0 else None)
-
-            chart_data_weekly['water_per_bird'] = chart_data_weekly.get('water_per_bird', [])
-            chart_data_weekly['water_per_bird'].append(round(ws['water_per_bird'], 1) if ws.get('water_per_bird', 0) >= 0 else None)
-            chart_data_weekly['water_feed_ratio'] = chart_data_weekly.get('water_feed_ratio', [])
-            chart_data_weekly['water_feed_ratio'].append(round(ws.get('water_feed_ratio'), 2) if ws.get('water_feed_ratio') is not None and ws.get('water_feed_ratio') >= 0 else None)
-
-            chart_data_weekly['feed_male_gp_bird'] = chart_data_weekly.get('feed_male_gp_bird', [])
-            chart_data_weekly['feed_male_gp_bird'].append(round(ws['feed_male_gp_bird'], 1))
-
-            chart_data_weekly['feed_female_gp_bird_majority'] = chart_data_weekly.get('feed_female_gp_bird_majority', [])
-            chart_data_weekly['feed_female_gp_bird_majority'].append(round(ws.get('feed_female_gp_bird_majority', 0.0), 1))
-
-            chart_data_weekly['feed_female_gp_bird'] = chart_data_weekly.get('feed_female_gp_bird', [])
-            chart_data_weekly['feed_female_gp_bird'].append(round(ws['feed_female_gp_bird'], 1))
-
-            # Aggregate Partitions for Weekly View
-            def get_p_val(log, p_name, is_male, index):
-                 p_map = {pw.partition_name: pw.body_weight for pw in log.partition_weights}
-                 val = p_map.get(p_name, 0)
-                 if val == 0:
-                     attr = f'bw_male_p{index}' if is_male else f'bw_female_p{index}'
-                     if hasattr(log, attr):
-                         val = getattr(log, attr, 0)
-                 return val
-
-            for i in range(1, 9):
-                m_key = f'M{i}'
-                f_key = f'F{i}'
-                m_vals = []
-                f_vals = []
-
-                for d in daily_by_week[w]:
-                    log = d['log']
-                    vm = get_p_val(log, m_key, True, i)
-                    if vm and vm > 0: m_vals.append(vm)
-                    vf = get_p_val(log, f_key, False, i)
-                    if vf and vf > 0: f_vals.append(vf)
-
-                val_m = round(sum(m_vals)/len(m_vals)) if m_vals else None
-                val_f = round(sum(f_vals)/len(f_vals)) if f_vals else None
-
-                chart_data_weekly[f'bw_M{i}'].append(val_m)
-                chart_data_weekly[f'bw_F{i}'].append(val_f)
-
-            # Aggregate Weekly Notes/Photos
-            week_notes = []
-            week_photos = []
-
-            # From Daily Logs
-            if w in daily_by_week:
-                week_logs_data = daily_by_week[w]
-                if week_logs_data:
-                    w_start = week_logs_data[0]['date']
-                    w_end = week_logs_data[-1]['date']
-
-                    for d in week_logs_data:
-                        log = d['log']
-                        if log.clinical_notes:
-                            week_notes.append(f"{log.date.strftime('%d/%m')}: {log.clinical_notes}")
-
-                        for p in log.photos:
-                            week_photos.append({
-                                'url': url_for('uploaded_file', filename=os.path.basename(p.file_path)),
-                                'name': f"{log.date.strftime('%d/%m')} {p.original_filename or 'Photo'}"
-                            })
-
-                    # Meds
-                    w_meds = set()
-                    for m in medications:
-                        if m.start_date <= w_end and (m.end_date is None or m.end_date >= w_start):
-                            w_meds.add(m.drug_name)
-                    if w_meds: week_notes.append("Meds: " + ", ".join(w_meds))
-
-                    # Vacs
-                    w_vacs = set()
-                    for v in vacs:
-                        if v.actual_date and w_start <= v.actual_date <= w_end:
-                            w_vacs.add(v.vaccine_name)
-                    if w_vacs: week_notes.append("Vac: " + ", ".join(w_vacs))
-
-            if week_notes or week_photos:
-                chart_data_weekly['notes'].append({
-                    'note': " | ".join(week_notes),
-                    'photos': week_photos
-                })
-            else:
-                chart_data_weekly['notes'].append(None)
-
-        # Legacy keys for weekly
-        chart_data_weekly['bw_male_p1'] = chart_data_weekly['bw_M1']
-        chart_data_weekly['bw_male_p2'] = chart_data_weekly['bw_M2']
-        chart_data_weekly['bw_female_p1'] = chart_data_weekly['bw_F1']
-        chart_data_weekly['bw_female_p2'] = chart_data_weekly['bw_F2']
-        chart_data_weekly['bw_female_p3'] = chart_data_weekly['bw_F3']
-        chart_data_weekly['bw_female_p4'] = chart_data_weekly['bw_F4']
+    def _flock_view_response(flock, build):
+        # Browsers revalidate with the data version, an unchanged flock answers 304 without building anything
+        etag = f"flock-{flock.id}-{flock.data_version or 0}-{flock.intake_date}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(build())
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
 
-        # 5. Current Stats (Stock at end of last processed log)
-        if daily_stats:
-            last = daily_stats[-1]
+    @app.route('/flock/<int:id>/kpis')
+    @login_required
+    @dept_required('Farm')
+    def flock_kpis(id):
+        flock = Flock.query.get_or_404(id)
 
-            current_stats = {
-                'male_prod': last.get('stock_male_prod_end', 0),
-                'female_prod': last.get('stock_female_prod_end', 0),
-                'male_hosp': last.get('stock_male_hosp_end', 0),
-                'female_hosp': last.get('stock_female_hosp_end', 0),
-                'male_ratio': last['male_ratio_stock'] if last.get('male_ratio_stock') else 0
-            }
-        else:
-            current_stats = {
-                'male_prod': flock.intake_male,
-                'female_prod': flock.intake_female,
-                'male_hosp': 0,
-                'female_hosp': 0,
-                'male_ratio': (flock.intake_male / flock.intake_female * 100) if flock.intake_female > 0 else 0
-            }
+        def build():
+            view = get_flock_view(flock)
+            return {'data_version': view['data_version'], 'phase': view['phase'], 'current_stats': view['current_stats']}
+        return _flock_view_response(flock, build)
 
-        weekly_data.reverse()
+    @app.route('/flock/<int:id>/chart_data')
+    @login_required
+    @dept_required('Farm')
+    def flock_chart_data(id):
+        flock = Flock.query.get_or_404(id)
 
-        # Pre-check available reports for this flock
-        from werkzeug.utils import secure_filename
-        reports_dir = os.path.join(app.root_path, 'static', 'reports')
-        available_reports = set()
-        if os.path.exists(reports_dir):
-            # We need a quick way to know which dates have reports
-            prefix_to_match = f"_{secure_filename(flock.house.name)}_"
-            for f in os.listdir(reports_dir):
-                if prefix_to_match in f and f.endswith(".jpg"):
-                    date_str = f.split("_")[0]
-                    available_reports.add(date_str)
+        def build():
+            view = get_flock_view(flock)
+            return dict(view['charts'], data_version=view['data_version'], phase=view['phase'])
+        return _flock_view_response(flock, build)
 
-        return render_template('flock_detail_modern.html', flock=flock, logs=list(reversed(enriched_logs)), weekly_data=weekly_data, chart_data=chart_data, chart_data_weekly=chart_data_weekly, current_stats=current_stats, global_std=gs, active_flocks=active_flocks, summary_dashboard=summary_dashboard, summary_table=summary_table, health_events=health_events, available_reports=available_reports, hatch_records=hatch_records, std_hatch_map=std_hatch_map)
+    @app.route('/flock/<int:id>/tab/<tab>')
+    @login_required
+    @dept_required('Farm')
+    def flock_tab(id, tab):
+        if tab not in FLOCK_TABS:
+            abort(404)
+        flock = Flock.query.options(joinedload(Flock.house)).filter_by(id=id).first_or_404()
+        template = f'partials/flock_tab_{tab}.html'
+
+        if tab == 'hatchability':
+            hatch_records = Hatchability.query.filter_by(flock_id=id).order_by(Hatchability.setting_date.desc()).all()
+            return render_template(template, flock=flock, hatch_records=hatch_records)
+
+        view = get_flock_view(flock)
+        if tab == 'daily':
+            # Pre-check available reports for this flock
+            reports_dir = os.path.join(app.root_path, 'static', 'reports')
+            available_reports = set()
+            if os.path.exists(reports_dir):
+                prefix_to_match = f"_{secure_filename(flock.house.name)}_"
+                for f in os.listdir(reports_dir):
+                    if prefix_to_match in f and f.endswith(".jpg"):
+                        available_reports.add(f.split("_")[0])
+            return render_template(template, flock=flock, logs=view['daily'], available_reports=available_reports)
+        if tab == 'weekly':
+            return render_template(template, flock=flock, weekly_data=view['weekly'], global_std=GlobalStandard.query.first())
+        if tab == 'summary':
+            summary = view['summary']
+            return render_template(template, flock=flock, summary_dashboard=summary['dashboard'], summary_table=summary['table'], start_of_lay_date=summary['start_of_lay_date'])
+        return render_template(template, flock=flock, health_events=view['health'])
 
     @app.route('/flock/<int:id>/toggle_phase', methods=['POST'])
     @login_required
@@ -2159,12 +1654,8 @@ def register_production_routes(app):
         photo = DailyLogPhoto.query.get_or_404(photo_id)
         # Check ownership/permissions if strict, but @dept_required('Farm') is enough for now.
 
-        # Delete file from disk
-        if photo.file_path and os.path.exists(photo.file_path):
-            try:
-                os.remove(photo.file_path)
-            except OSError:
-                pass # Ignore if file missing
+        # Delete file and its variants from disk, unless another photo shares the file
+        remove_photo_files(photo)
 
         db.session.delete(photo)
         safe_commit()
@@ -2204,7 +1695,10 @@ def register_production_routes(app):
         flock = Flock.query.get_or_404(id)
         flock.status = 'Inactive'
         flock.end_date = date.today()
-        safe_commit()
+        if safe_commit():
+            # Freeze the closed flock's analytics so read-only views stop re-enriching it
+            build_flock_archive(flock)
+            safe_commit()
         flash(f'Flock {flock.flock_id} closed.', 'info')
         return redirect(get_dashboard_url(current_user))
 
@@ -0,0 +1,187 @@
+import threading
+from datetime import timedelta
+
+from sqlalchemy.orm import joinedload
+
+from metrics import calculate_bio_week
+from app.database import db
+from app.models.models import DailyLog, Flock, FlockGrading, Standard
+from app.services.flock_archive_service import flocks_stamp
+
+# Weighing days shown per page when the history is not filtered to one flock
+BODYWEIGHT_PAGE_SIZE = 50
+
+# The previous bio-week's weighing is at most 13 days before a log
+_PREV_LOOKBACK_DAYS = 14
+
+_std_lock = threading.Lock()
+_std_cache = {'key': None, 'map': None}
+
+
+def get_standard_bw_map():
+    """
+    {week: (std_bw_male, std_bw_female)} from the Standard table. A standard write bumps
+    every flock's data_version, so the map is kept until flocks_stamp() moves on in any worker.
+    """
+    key = flocks_stamp()
+    with _std_lock:
+        if _std_cache['key'] != key:
+            rows = db.session.query(Standard.week, Standard.std_bw_male, Standard.std_bw_female).all()
+            _std_cache['map'] = {week: (male, female) for week, male, female in rows}
+            _std_cache['key'] = key
+        return _std_cache['map']
+
+
+def invalidate_standards(*args):
+    _std_cache['key'] = None
+    _std_cache['map'] = None
+
+
+def _pct(val):
+    return (val * 100) if (val and val <= 1.0) else (val or 0)
+
+
+def _signed(value, fmt, unit):
+    return f"{'+' if value > 0 else ''}{value:{fmt}}{unit}"
+
+
+def _age_week(log):
+    return calculate_bio_week(log.flock.intake_date, log.date)
+
+
+def build_week_index(logs):
+    """
+    (house_id, flock_id, age_week) -> weighing log, built in one pass.
+    Logs must come newest first; the latest weighing of a week wins.
+    """
+    index = {}
+    for log in logs:
+        index.setdefault((log.flock.house_id, log.flock_id, _age_week(log)), log)
+    return index
+
+
+def _partitions(log, prev_log, prefix, std):
+    current = {pw.partition_name: pw for pw in log.partition_weights}
+    previous = {pw.partition_name: pw for pw in prev_log.partition_weights} if prev_log else {}
+    parts = []
+    for i in range(1, 9):
+        name = f'{prefix}{i}'
+        cur = current.get(name)
+        if not cur or not cur.body_weight > 0:
+            continue
+        diff_g = "N/A"
+        diff_u = "N/A"
+        cur_unif = _pct(cur.uniformity)
+
+        prev = previous.get(name)
+        if prev and prev.body_weight > 0:
+            diff_g = _signed(cur.body_weight - prev.body_weight, '.0f', 'g')
+            diff_u = _signed(cur_unif - _pct(prev.uniformity), '.1f', '%')
+
+        parts.append({
+            'name': name,
+            'bw': cur.body_weight,
+            'unif': cur_unif,
+            'diff_g': diff_g,
+            'diff_u': diff_u,
+            'var_pct': ((cur.body_weight - std) / std) * 100 if std and std > 0 else 0
+        })
+    return parts
+
+
+def bodyweight_row(log, age_weeks, prev_log, std_map, has_report):
+    std_m = log.standard_bw_male
+    std_f = log.standard_bw_female
+
+    # Fallback to the standard curve if not saved in log or is 0
+    if not std_m or not std_f:
+        std_record = std_map.get(age_weeks)
+        if std_record:
+            if not std_m: std_m = std_record[0]
+            if not std_f: std_f = std_record[1]
+
+    avg_m_diff = "N/A"
+    if prev_log and log.body_weight_male is not None and prev_log.body_weight_male is not None:
+        avg_m_diff = _signed(log.body_weight_male - prev_log.body_weight_male, '.0f', 'g')
+
+    avg_f_diff = "N/A"
+    if prev_log and log.body_weight_female is not None and prev_log.body_weight_female is not None:
+        avg_f_diff = _signed(log.body_weight_female - prev_log.body_weight_female, '.0f', 'g')
+
+    avg_m_var = ((log.body_weight_male - std_m) / std_m) * 100 if log.body_weight_male and std_m else 0
+    avg_f_var = ((log.body_weight_female - std_f) / std_f) * 100 if log.body_weight_female and std_f else 0
+
+    return {
+        'log_id': log.id,
+        'flock_id': log.flock_id,
+        'house_name': log.flock.house.name,
+        'house_id': log.flock.house_id,
+        'age_weeks': age_weeks,
+        'date': log.date,
+        'std_m': std_m or 0,
+        'std_f': std_f or 0,
+        'avg_m': log.body_weight_male or 0,
+        'avg_f': log.body_weight_female or 0,
+        'avg_m_diff': avg_m_diff,
+        'avg_f_diff': avg_f_diff,
+        'avg_m_var': avg_m_var,
+        'avg_f_var': avg_f_var,
+        'm_parts': _partitions(log, prev_log, 'M', std_m),
+        'f_parts': _partitions(log, prev_log, 'F', std_f),
+        'has_report': has_report,
+        'uni_m': _pct(log.uniformity_male),
+        'uni_f': _pct(log.uniformity_female)
+    }
+
+
+def _weighing_query():
+    return DailyLog.query.options(
+        joinedload(DailyLog.partition_weights),
+        joinedload(DailyLog.flock).joinedload(Flock.house)
+    ).filter(DailyLog.is_weighing_day == True)
+
+
+def get_bodyweight_history(flock_id=None, date_from=None, date_to=None, page=1, per_page=BODYWEIGHT_PAGE_SIZE):
+    """
+    Weighing-day logs newest first, each with its week-on-week gains and variance to standard.
+    Filtered by flock and/or date range on the server; one flock's history is returned whole,
+    otherwise a page of per_page logs.
+    Returns (rows, pagination) where pagination is None for a single flock.
+    """
+    query = _weighing_query()
+    if flock_id:
+        query = query.filter(DailyLog.flock_id == flock_id)
+    if date_from:
+        query = query.filter(DailyLog.date >= date_from)
+    if date_to:
+        query = query.filter(DailyLog.date <= date_to)
+    query = query.order_by(DailyLog.date.desc(), DailyLog.id.desc())
+
+    pagination = None
+    if flock_id:
+        logs = query.all()
+    else:
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        logs = pagination.items
+    if not logs:
+        return [], pagination
+
+    # Previous weighings may sit on the next page or before date_from: fetch just that window
+    flock_ids = {log.flock_id for log in logs}
+    earlier = _weighing_query().filter(
+        DailyLog.flock_id.in_(flock_ids),
+        DailyLog.date >= min(log.date for log in logs) - timedelta(days=_PREV_LOOKBACK_DAYS),
+        DailyLog.date < min(log.date for log in logs)
+    ).order_by(DailyLog.date.desc(), DailyLog.id.desc()).all()
+    index = build_week_index(logs + earlier)
+
+    house_ids = {log.flock.house_id for log in logs}
+    reports = set(db.session.query(FlockGrading.house_id, FlockGrading.age_week).filter(FlockGrading.house_id.in_(house_ids)).all())
+    std_map = get_standard_bw_map()
+
+    rows = []
+    for log in logs:
+        age_weeks = _age_week(log)
+        prev_log = index.get((log.flock.house_id, log.flock_id, age_weeks - 1))
+        rows.append(bodyweight_row(log, age_weeks, prev_log, std_map, (log.flock.house_id, age_weeks) in reports))
+    return rows, pagination
@@ -0,0 +1,187 @@
+import json
+import os
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, update
+
+from app.database import db
+from app.models.models import BroilerFlock, BroilerDailyLog
+from app.services.broiler_metrics_service import invalidate_standard_fcr_curve
+
+# Metadata rows: value in the first filled cell after the label column
+META_ROWS = {'farm_name': 1, 'house_name': 2, 'source': 3, 'breed': 4,
+             'intake_birds': 5, 'intake_date': 6, 'arrival_weight_g': 7}
+
+# Daily records start on this row (0-indexed), one day per row
+FIRST_LOG_ROW = 11
+
+# Sheet column -> BroilerDailyLog field
+LOG_COLUMNS = {0: 'date', 1: 'day_number', 2: 'death_count', 5: 'feed_receive', 6: 'feed_type',
+               7: 'feed_daily_use_kg', 9: 'body_weight_g', 13: 'standard_fcr', 14: 'remarks'}
+LOG_TEXT_FIELDS = ('feed_receive', 'feed_type', 'remarks')
+LOG_FLOAT_FIELDS = ('feed_daily_use_kg', 'body_weight_g', 'standard_fcr')
+LOG_FIELDS = [f for f in LOG_COLUMNS.values() if f != 'date']
+
+# Parsed frames waiting for confirmation, under UPLOAD_FOLDER
+PENDING_IMPORT_DIR = 'temp'
+
+
+def _meta_value(df, row_idx):
+    """First non-empty cell after the label column of a metadata row."""
+    if row_idx >= len(df):
+        return None
+    values = df.iloc[row_idx, 1:]
+    values = values[values.notna() & (values != '')]
+    return values.iloc[0] if len(values) else None
+
+
+def _number(value, cast, default):
+    try:
+        return cast(float(value)) if pd.notna(value) else default
+    except (ValueError, TypeError):
+        return default
+
+
+def _text_column(col):
+    return col.map(str).where(col.notna(), None)
+
+
+def _numeric_column(col):
+    return pd.to_numeric(col, errors='coerce')
+
+
+def parse_metadata(df):
+    """Flock details from the header rows, blanks and unreadable values defaulted as before."""
+    raw = {field: _meta_value(df, row) for field, row in META_ROWS.items()}
+    intake_date = pd.to_datetime(raw['intake_date'], errors='coerce')
+    return {
+        'farm_name': str(raw['farm_name']) if pd.notna(raw['farm_name']) else "",
+        'house_name': str(raw['house_name']) if pd.notna(raw['house_name']) else "",
+        'source': str(raw['source']) if pd.notna(raw['source']) else "",
+        'breed': str(raw['breed']) if pd.notna(raw['breed']) else "",
+        'intake_birds': _number(raw['intake_birds'], int, 0),
+        'intake_date': intake_date.date() if pd.notna(intake_date) else datetime.utcnow().date(),
+        'arrival_weight_g': _number(raw['arrival_weight_g'], float, 0.0),
+    }
+
+
+def parse_log_frame(df, intake_date):
+    """
+    Daily records as one typed frame, coerced column by column: rows without a readable
+    date are dropped, a missing day number counts from the intake date and unreadable
+    numbers become 0. When a date repeats the last row wins.
+    """
+    logs = df.iloc[FIRST_LOG_ROW:].reindex(columns=range(max(LOG_COLUMNS) + 1))
+    logs = logs[list(LOG_COLUMNS)].rename(columns=LOG_COLUMNS)
+
+    dates = pd.to_datetime(logs['date'], errors='coerce', format='mixed')
+    logs = logs[dates.notna()].assign(date=dates[dates.notna()].dt.date)
+
+    frame = pd.DataFrame({'date': logs['date']})
+    days_from_intake = (pd.to_datetime(frame['date']) - pd.Timestamp(intake_date)).dt.days + 1
+    frame['day_number'] = np.trunc(_numeric_column(logs['day_number'])).fillna(days_from_intake).astype(int)
+    frame['death_count'] = np.trunc(_numeric_column(logs['death_count'])).fillna(0).astype(int)
+    for field in LOG_FLOAT_FIELDS:
+        frame[field] = _numeric_column(logs[field]).fillna(0.0).astype(float)
+    for field in LOG_TEXT_FIELDS:
+        frame[field] = _text_column(logs[field])
+
+    return frame.drop_duplicates('date', keep='last').reset_index(drop=True)[['date'] + LOG_FIELDS]
+
+
+def parse_broiler_sheet(file):
+    """(metadata, log frame) of a broiler template workbook."""
+    df = pd.read_excel(file, header=None)
+    meta = parse_metadata(df)
+    return meta, parse_log_frame(df, meta['intake_date'])
+
+
+def _find_flock(meta):
+    return BroilerFlock.query.filter_by(
+        farm_name=meta['farm_name'],
+        house_name=meta['house_name'],
+        intake_date=meta['intake_date']
+    ).first()
+
+
+def _existing_log_ids(flock, frame):
+    """{date: log id} of the flock's logs on the frame's dates, from one query."""
+    if flock is None or frame.empty:
+        return {}
+    rows = db.session.query(BroilerDailyLog.date, BroilerDailyLog.id).filter(
+        BroilerDailyLog.flock_id == flock.id,
+        BroilerDailyLog.date.in_(frame['date'].tolist())
+    ).order_by(BroilerDailyLog.id).all()
+    return {d: log_id for d, log_id in rows}
+
+
+def preview_broiler_import(meta, frame):
+    """Dry run: the flock the file belongs to (None when it would be created) and each row marked New or Update."""
+    flock = _find_flock(meta)
+    existing = _existing_log_ids(flock, frame)
+    rows = frame.to_dict('records')
+    for row in rows:
+        row['type'] = 'Update' if row['date'] in existing else 'New'
+    return flock, rows
+
+
+def apply_broiler_import(meta, frame):
+    """
+    Creates the flock if needed, then inserts new days and updates existing ones with
+    one executemany each, all in the caller's transaction. Returns (flock, new, updated).
+    """
+    flock = _find_flock(meta)
+    if not flock:
+        flock = BroilerFlock(**meta)
+        db.session.add(flock)
+        db.session.flush()
+
+    existing = _existing_log_ids(flock, frame)
+    new_rows = []
+    updates = []
+    for row in frame.to_dict('records'):
+        values = {f: row[f] for f in LOG_FIELDS}
+        if row['date'] in existing:
+            updates.append(dict(values, id=existing[row['date']]))
+        else:
+            new_rows.append(dict(values, flock_id=flock.id, date=row['date']))
+
+    if new_rows:
+        db.session.execute(insert(BroilerDailyLog), new_rows)
+    if updates:
+        db.session.execute(update(BroilerDailyLog), updates)
+    # Bulk statements skip the mapper events
+    invalidate_standard_fcr_curve()
+    return flock, len(new_rows), len(updates)
+
+
+def save_pending_import(upload_folder, meta, frame):
+    """Keeps a parsed file for confirmation; returns the token naming it."""
+    token = uuid.uuid4().hex
+    pending_dir = os.path.join(upload_folder, PENDING_IMPORT_DIR)
+    os.makedirs(pending_dir, exist_ok=True)
+    payload = {'meta': meta, 'rows': frame.to_dict('records')}
+    with open(os.path.join(pending_dir, f"broiler_{token}.json"), 'w') as fh:
+        json.dump(payload, fh, default=lambda d: d.isoformat())
+    return token
+
+
+def load_pending_import(upload_folder, token):
+    """(metadata, log frame) saved by save_pending_import, removed once read; None if it is gone."""
+    if not token or not token.isalnum():
+        return None
+    path = os.path.join(upload_folder, PENDING_IMPORT_DIR, f"broiler_{token}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        payload = json.load(fh)
+    os.remove(path)
+
+    meta = payload['meta']
+    meta['intake_date'] = datetime.strptime(meta['intake_date'], '%Y-%m-%d').date()
+    frame = pd.DataFrame(payload['rows'], columns=['date'] + LOG_FIELDS)
+    frame['date'] = [datetime.strptime(d, '%Y-%m-%d').date() for d in frame['date']]
+    return meta, frame
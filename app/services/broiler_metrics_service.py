@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from app.database import db
+from app.models.models import BroilerDailyLog
+from app.services.cache_service import CommitCache
+
+
+def _broiler_logs_stamp(connection):
+    """Count, max id and standard totals of the broiler logs; moves on with any import or edit of a standard."""
+    return tuple(connection.execute(select(
+        func.count(BroilerDailyLog.id), func.max(BroilerDailyLog.id),
+        func.coalesce(func.sum(BroilerDailyLog.standard_fcr), 0),
+        func.coalesce(func.sum(BroilerDailyLog.standard_fcr * BroilerDailyLog.day_number), 0)
+    )).one())
+
+
+_curve = CommitCache(BroilerDailyLog, stamp=_broiler_logs_stamp)
+
+
+def _build_standard_fcr_curve(connection):
+    rows = connection.execute(select(BroilerDailyLog.day_number, func.avg(BroilerDailyLog.standard_fcr)).where(
+        BroilerDailyLog.standard_fcr > 0
+    ).group_by(BroilerDailyLog.day_number)).all()
+    return {day: std for day, std in rows}
+
+
+def get_standard_fcr_curve():
+    """
+    {day_number: standard FCR} averaged over every imported log that carries a standard,
+    kept until a broiler log change commits in any worker. Flocks entered by hand have
+    no standard of their own and are compared against this curve.
+    """
+    return _curve.get(_build_standard_fcr_curve)
+
+
+def invalidate_standard_fcr_curve():
+    """Drops the curve when the current session commits, for bulk writes that skip the mapper."""
+    _curve.mark(db.session)
+
+
+def register_broiler_events():
+    """Drops the standard FCR curve once a commit that wrote a broiler log lands; other workers follow the stamp."""
+    _curve.register()
+
+
+def _ratio(num, den):
+    return np.divide(num, den, out=np.zeros(len(num)), where=den > 0)
+
+
+def broiler_metrics_for_flocks(flocks):
+    """
+    {flock.id: daily stats} for many broiler flocks from one query of their logs ordered
+    by flock and date. Balance, death %, g/bird, weight gain and cumulative FCR are
+    cumulative sums per flock over the whole frame.
+    """
+    result = {f.id: [] for f in flocks}
+    if not result:
+        return result
+
+    logs = BroilerDailyLog.query.filter(BroilerDailyLog.flock_id.in_(list(result))).order_by(
+        BroilerDailyLog.flock_id, BroilerDailyLog.date, BroilerDailyLog.id
+    ).all()
+    if not logs:
+        return result
+
+    flock_by_id = {f.id: f for f in flocks}
+    df = pd.DataFrame({
+        'flock_id': [l.flock_id for l in logs],
+        'death': [l.death_count or 0 for l in logs],
+        'feed': [l.feed_daily_use_kg or 0.0 for l in logs],
+        'bw': [l.body_weight_g or 0.0 for l in logs],
+    })
+    by_flock = df['flock_id']
+    intake = by_flock.map({f_id: f.intake_birds or 0 for f_id, f in flock_by_id.items()})
+    arrival = by_flock.map({f_id: f.arrival_weight_g or 0.0 for f_id, f in flock_by_id.items()})
+
+    # Balance never goes below 0: lift each day by the deepest shortfall seen so far
+    stock = intake - df['death'].groupby(by_flock).cumsum()
+    balance = stock - np.minimum(stock.groupby(by_flock).cummin(), 0)
+    prev_balance = balance.groupby(by_flock).shift(1).fillna(intake)
+
+    death_pct = _ratio(df['death'].to_numpy(float), prev_balance.to_numpy(float)) * 100
+    gram_per_bird = pd.Series(_ratio(df['feed'].to_numpy() * 1000, balance.to_numpy(float)))
+    feed_per_bird = gram_per_bird.groupby(by_flock).cumsum()
+    weight_gain = df['bw'] - df['bw'].groupby(by_flock).shift(1).fillna(arrival)
+    cumulative_fcr = _ratio(feed_per_bird.to_numpy(), (df['bw'] - arrival).to_numpy())
+
+    curve = get_standard_fcr_curve()
+    columns = zip(logs, balance.tolist(), death_pct.tolist(), gram_per_bird.tolist(), weight_gain.tolist(), cumulative_fcr.tolist())
+    for log, bal, d_pct, gpb, gain, fcr in columns:
+        standard_curve = log.standard_fcr or curve.get(log.day_number)
+        result[log.flock_id].append({
+            'log': log,
+            'date': log.date,
+            'day_number': log.day_number,
+            'death_count': log.death_count or 0,
+            'balance': int(bal),
+            'death_percentage': d_pct,
+            'feed_daily_use_kg': log.feed_daily_use_kg or 0.0,
+            'gram_per_bird': gpb,
+            'body_weight_g': log.body_weight_g or 0.0,
+            'weight_gain': gain,
+            'cumulative_fcr': fcr,
+            'standard_fcr': log.standard_fcr,
+            'standard_fcr_curve': standard_curve,
+            'fcr_gap': (fcr - standard_curve) if (fcr and standard_curve) else None,
+            'remarks': log.remarks
+        })
+    return result
+
+
+def calculate_broiler_metrics(flock):
+    """Daily stats of one broiler flock, see broiler_metrics_for_flocks."""
+    return broiler_metrics_for_flocks([flock])[flock.id]
+
+
+def broiler_summaries(flocks):
+    """
+    Latest KPIs of each flock for the dashboard: age, balance, total mortality %, body
+    weight and cumulative FCR against the standard, plus the FCR comparison curve.
+    """
+    metrics = broiler_metrics_for_flocks(flocks)
+    summaries = []
+    for flock in flocks:
+        stats = metrics[flock.id]
+        last = stats[-1] if stats else None
+        intake = flock.intake_birds or 0
+        deaths = sum(m['death_count'] for m in stats)
+        summaries.append({
+            'flock_id': flock.id,
+            'name': f"{flock.farm_name} - {flock.house_name}",
+            'intake_date': flock.intake_date.isoformat() if flock.intake_date else None,
+            'intake_birds': intake,
+            'last_date': last['date'].isoformat() if last else None,
+            'day_number': last['day_number'] if last else None,
+            'balance': last['balance'] if last else intake,
+            'mortality_pct': (deaths / intake * 100) if intake > 0 else 0.0,
+            'body_weight_g': last['body_weight_g'] if last else None,
+            'cumulative_fcr': last['cumulative_fcr'] if last else None,
+            'standard_fcr': last['standard_fcr_curve'] if last else None,
+            'fcr_gap': last['fcr_gap'] if last else None,
+            'fcr_curve': {
+                'days': [m['day_number'] for m in stats],
+                'actual_fcr': [m['cumulative_fcr'] for m in stats],
+                'standard_fcr': [m['standard_fcr_curve'] for m in stats],
+            },
+        })
+    return summaries
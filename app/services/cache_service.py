@@ -0,0 +1,76 @@
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database import db
+
+_DIRTY_KEY = 'commit_cache_dirty'
+
+_caches = []
+
+
+class CommitCache(object):
+    """
+    A value derived from the rows of `models`, kept in memory per worker. A commit that
+    wrote one of the models drops it in this worker; with a stamp, other workers rebuild
+    it once stamp(connection), a cheap read of those tables, moves on. Flushed or rolled
+    back writes leave it alone. Builds run on a connection of their own, so only
+    committed rows are cached.
+    """
+
+    def __init__(self, *models, stamp=None):
+        self.models = models
+        self.stamp = stamp
+        self._lock = threading.Lock()
+        self._key = None
+        self._value = None
+
+    def get(self, build):
+        """The cached value, else build(connection) on a fresh connection."""
+        if self.stamp is None and self._value is not None:
+            return self._value
+        with db.engine.connect() as connection:
+            # Read before the build: a commit in between only costs one more rebuild
+            key = self.stamp(connection) if self.stamp is not None else None
+            with self._lock:
+                if self._value is None or self._key != key:
+                    self._value = build(connection)
+                    self._key = key
+                return self._value
+
+    def clear(self):
+        # Waits for a build in progress, it may have read the rows before the commit
+        with self._lock:
+            self._value = None
+
+    def mark(self, session):
+        """Drops the value when `session` commits, for writes that skip the mapper (bulk statements)."""
+        session.info.setdefault(_DIRTY_KEY, set()).add(self)
+
+    def register(self):
+        """Tracks the session writes to the models; call once at app start."""
+        if self not in _caches:
+            _caches.append(self)
+        for evt, fn in (('after_flush', _after_flush), ('after_commit', _after_commit),
+                        ('after_soft_rollback', _after_rollback)):
+            if not event.contains(Session, evt, fn):
+                event.listen(Session, evt, fn)
+
+
+def _after_flush(session, flush_context):
+    written = list(session.new) + list(session.dirty) + list(session.deleted)
+    for cache in _caches:
+        if any(isinstance(obj, cache.models) for obj in written):
+            cache.mark(session)
+
+
+def _after_commit(session):
+    for cache in session.info.pop(_DIRTY_KEY, ()):
+        cache.clear()
+
+
+def _after_rollback(session, previous_transaction):
+    # A savepoint rollback keeps the outer transaction's writes
+    if not session.in_transaction():
+        session.info.pop(_DIRTY_KEY, None)
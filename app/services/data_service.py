@@ -3,7 +3,6 @@ import os
 import csv
 import io
 import json
-import math
 import warnings
 import pandas as pd
 from datetime import datetime, date, timedelta
@@ -15,8 +14,12 @@ from flask_login import current_user
 from werkzeug.utils import secure_filename
 
 from app.database import db
-from app.models.models import Flock, DailyLog, Standard, Hatchability, ClinicalNote, UserActivityLog, User, House, ImportedWeeklyBenchmark, PartitionWeight, NotificationRule, GlobalStandard, Hatchability, DailyLogPhoto
-from app.utils import round_to_whole, safe_commit, natural_sort_key, log_user_activity, save_note_photos, send_push_alert
+from app.models.models import Flock, DailyLog, Standard, Hatchability, ClinicalNote, UserActivityLog, User, House, ImportedWeeklyBenchmark, PartitionWeight, NotificationRule, GlobalStandard, Hatchability, DailyLogPhoto, FeedCode, FlockWeeklyRollup, FlockMonthlyRollup
+from app.utils import round_to_whole, safe_commit, natural_sort_key, log_user_activity, save_note_photos
+from app.services.rule_engine import evaluate_log, queue_rule_alerts
+from app.services.male_ratio_service import male_ratios_for_flocks
+from app.services.photo_service import store_photo
+from app.services.rollup_service import ensure_rollups
 from metrics import enrich_flock_data, calculate_bio_week
 
 def get_flock_stock_history(flock_id):
@@ -90,122 +93,6 @@ def get_flock_stock_history_bulk(flocks):
 
     return result_map
 
-def calculate_male_ratio(flock_id, setting_date, flock_obj=None, logs=None, last_hatch_date=None, hatchery_records=None):
-    flock = flock_obj or db.session.get(Flock, flock_id)
-    if not flock: return None, False
-
-    weekday = setting_date.weekday() # Mon=0, Tue=1 ... Fri=4
-
-    start_date = None
-    end_date = setting_date - timedelta(days=1)
-
-    large_window = False
-
-    if weekday == 1: # Tuesday -> Fri, Sat, Sun, Mon (4 days)
-        start_date = setting_date - timedelta(days=4)
-    elif weekday == 4: # Friday -> Tue, Wed, Thu (3 days)
-        start_date = setting_date - timedelta(days=3)
-    else:
-        # Non-Standard
-        if last_hatch_date:
-            start_date = last_hatch_date
-        else:
-            if hatchery_records is not None:
-                # Use cached hatchery_records (assumed sorted or at least we can just find the latest one before setting_date)
-                last_hatch = None
-                # Sort descending to find the first one before setting_date
-                sorted_records = sorted(hatchery_records, key=lambda x: x.setting_date, reverse=True)
-                for rec in sorted_records:
-                    if rec.setting_date < setting_date:
-                        last_hatch = rec
-                        break
-            else:
-                # Find LAST setting date for this flock BEFORE current setting_date from DB
-                last_hatch = Hatchability.query.filter_by(flock_id=flock_id)\
-                    .filter(Hatchability.setting_date < setting_date)\
-                    .order_by(Hatchability.setting_date.desc()).first()
-
-            if last_hatch:
-                start_date = last_hatch.setting_date
-            else:
-                # First time catch
-                start_date = setting_date - timedelta(days=7)
-
-    days_count = (end_date - start_date).days + 1
-    if days_count > 10:
-        large_window = True
-
-    # Calculate ratios daily
-    if logs is None:
-        logs = DailyLog.query.filter_by(flock_id=flock_id).order_by(DailyLog.date).all()
-
-    # Init stocks (Production)
-    curr_m_prod = flock.intake_male or 0
-    curr_f_prod = flock.intake_female or 0
-    curr_m_hosp = 0
-    curr_f_hosp = 0
-
-    prod_start_date = flock.production_start_date
-    in_prod = False
-
-    ratios = []
-
-    for log in logs:
-        # Check Phase Switch (Reset Baseline)
-        if not in_prod:
-             if prod_start_date and log.date >= prod_start_date:
-                 in_prod = True
-                 if (flock.prod_start_male or 0) > 0 or (flock.prod_start_female or 0) > 0:
-                     curr_m_prod = flock.prod_start_male or 0
-                     curr_f_prod = flock.prod_start_female or 0
-                     curr_m_hosp = flock.prod_start_male_hosp or 0
-                     curr_f_hosp = flock.prod_start_female_hosp or 0
-
-        # Determine Ratio for this date (Start of Day)
-        # Use Prod Stocks
-        if start_date <= log.date <= end_date:
-             if curr_f_prod > 0:
-                 r = (curr_m_prod / curr_f_prod) * 100
-                 ratios.append(r)
-
-        # Update Stocks (End of Day)
-        # Male
-        mort_m_prod = log.mortality_male or 0
-        mort_m_hosp = log.mortality_male_hosp or 0
-        cull_m_prod = log.culls_male or 0
-        cull_m_hosp = log.culls_male_hosp or 0
-        moved_to_hosp_m = log.males_moved_to_hosp or 0
-        moved_to_prod_m = log.males_moved_to_prod or 0
-        in_flock_m = getattr(log, 'males_in_flock', 0) or 0
-        out_flock_m = getattr(log, 'males_out_flock', 0) or 0
-
-        curr_m_prod = curr_m_prod - mort_m_prod - cull_m_prod - moved_to_hosp_m + moved_to_prod_m + in_flock_m - out_flock_m
-        curr_m_hosp = curr_m_hosp - mort_m_hosp - cull_m_hosp + moved_to_hosp_m - moved_to_prod_m
-
-        # Female
-        mort_f_prod = log.mortality_female or 0
-        mort_f_hosp = log.mortality_female_hosp or 0
-        cull_f_prod = log.culls_female or 0
-        cull_f_hosp = log.culls_female_hosp or 0
-        moved_to_hosp_f = log.females_moved_to_hosp or 0
-        moved_to_prod_f = log.females_moved_to_prod or 0
-        in_flock_f = getattr(log, 'females_in_flock', 0) or 0
-        out_flock_f = getattr(log, 'females_out_flock', 0) or 0
-
-        curr_f_prod = curr_f_prod - mort_f_prod - cull_f_prod - moved_to_hosp_f + moved_to_prod_f + in_flock_f - out_flock_f
-        curr_f_hosp = curr_f_hosp - mort_f_hosp - cull_f_hosp + moved_to_hosp_f - moved_to_prod_f
-
-        if curr_m_prod < 0: curr_m_prod = 0
-        if curr_f_prod < 0: curr_f_prod = 0
-        if curr_m_hosp < 0: curr_m_hosp = 0
-        if curr_f_hosp < 0: curr_f_hosp = 0
-
-    if not ratios:
-        return None, large_window
-
-    avg = sum(ratios) / len(ratios)
-    return avg, large_window
-
 def calculate_flock_summary(flock, daily_stats):
     """
     Calculates the 'Summary' tab data:
@@ -354,7 +241,7 @@ def calculate_flock_summary(flock, daily_stats):
 
 def generate_spreadsheet_data(flock, logs, standards_by_week, standards_by_prod_week):
     spreadsheet_data = []
-    from metrics import enrich_flock_data, calculate_bio_week
+    from metrics import enrich_flock_data, calculate_bio_week, format_time_of_day
     from app.models.models import FeedCode, Standard
     flock_logs = [l for l in logs]
     all_standards = Standard.query.all()
@@ -411,8 +298,8 @@ def generate_spreadsheet_data(flock, logs, standards_by_week, standards_by_prod_
             feed_code_map.get(log.feed_code_female_id, ''),
             log.feed_male_gp_bird,
             log.feed_female_gp_bird,
-            log.feed_cleanup_start,
-            log.feed_cleanup_end,
+            format_time_of_day(log.feed_cleanup_start),
+            format_time_of_day(log.feed_cleanup_end),
             log.water_reading_1,
             log.water_reading_2,
             log.water_reading_3,
@@ -441,8 +328,8 @@ def generate_spreadsheet_data(flock, logs, standards_by_week, standards_by_prod_
             row_data.append(p_uni_map.get(f'F{i}', getattr(log, f'unif_female_p{i}', None) if i <= 4 else None))
 
         row_data.extend([
-            log.light_on_time,
-            log.light_off_time,
+            format_time_of_day(log.light_on_time),
+            format_time_of_day(log.light_off_time),
             bio_std.std_mortality_female if bio_std else 0, # Benchmark Female Mort
             item.get('std_egg_prod', 0.0),                  # Benchmark Egg Prod
             bio_std.std_bw_male if bio_std else 0,          # Benchmark
@@ -548,13 +435,8 @@ def process_hatchability_import(file):
             flocks_by_house[f.house_id] = []
         flocks_by_house[f.house_id].append(f)
 
-    # Caches for performance optimization (N+1 query resolution)
-    logs_cache = {} # flock_id -> list of DailyLog
-    hatch_cache = {} # flock_id -> list of Hatchability (sorted by setting_date)
-
-    created_count = 0
-    updated_count = 0
-
+    # First pass: parse and route every row, so the batch needs one log and one record query
+    parsed_rows = []
     for index, row in df.iterrows():
         # Validations
         s_date = get_val(row, 'setting_date', parse_date)
@@ -573,68 +455,53 @@ def process_hatchability_import(file):
 
         # 2. Match Flock in House by Date
         # Find first flock where intake_date <= s_date
-        target_flock = None
-        target_flock_id = None
-        candidates = flocks_by_house.get(house_id, [])
-
-        for f in candidates:
-            if f.intake_date <= s_date:
-                target_flock = f
-                target_flock_id = f.id
-                break
-
-        if not target_flock_id:
+        target_flock = next((f for f in flocks_by_house.get(house_id, []) if f.intake_date <= s_date), None)
+        if not target_flock:
             # No valid flock found for this date
             continue
 
-        # Populate caches for this flock if needed
-        if target_flock_id not in logs_cache:
-            logs_cache[target_flock_id] = DailyLog.query.filter_by(flock_id=target_flock_id).order_by(DailyLog.date).all()
-        if target_flock_id not in hatch_cache:
-            hatch_cache[target_flock_id] = Hatchability.query.filter_by(flock_id=target_flock_id).order_by(Hatchability.setting_date).all()
-
         # Extract values (None if blank)
-        c_date = get_val(row, 'candling_date', parse_date)
-        h_date = get_val(row, 'hatching_date', parse_date)
-        e_set = get_val(row, 'egg_set', int)
-        c_eggs = get_val(row, 'clear_eggs', int)
-        r_eggs = get_val(row, 'rotten_eggs', int)
-        h_chicks = get_val(row, 'hatched_chicks', int)
-
-        # Determine last_hatch_date from cache for male ratio calculation
-        last_hatch_date = None
-        for h_rec in reversed(hatch_cache[target_flock_id]):
-            if h_rec.setting_date < s_date:
-                last_hatch_date = h_rec.setting_date
-                break
-
-        # Always fetch Male Ratio from Farm Database (using optimized call)
-        m_ratio, _ = calculate_male_ratio(target_flock_id, s_date,
-                                          flock_obj=target_flock,
-                                          logs=logs_cache[target_flock_id],
-                                          last_hatch_date=last_hatch_date,
-                                          hatchery_records=hatch_cache[target_flock_id])
-
-        # Check existing record in cache
-        existing = next((h_rec for h_rec in hatch_cache[target_flock_id] if h_rec.setting_date == s_date), None)
+        parsed_rows.append((target_flock, s_date, {
+            'candling_date': get_val(row, 'candling_date', parse_date),
+            'hatching_date': get_val(row, 'hatching_date', parse_date),
+            'egg_set': get_val(row, 'egg_set', int),
+            'clear_eggs': get_val(row, 'clear_eggs', int),
+            'rotten_eggs': get_val(row, 'rotten_eggs', int),
+            'hatched_chicks': get_val(row, 'hatched_chicks', int),
+        }))
+
+    target_flocks = list({f.id: f for f, _, _ in parsed_rows}.values())
+    ratios = male_ratios_for_flocks(target_flocks)
+
+    # flock_id -> {setting_date: Hatchability}, the first record of a date wins
+    records_by_flock = {f.id: {} for f in target_flocks}
+    if target_flocks:
+        existing_records = Hatchability.query.filter(Hatchability.flock_id.in_(records_by_flock)).order_by(Hatchability.id).all()
+        for h_rec in existing_records:
+            records_by_flock[h_rec.flock_id].setdefault(h_rec.setting_date, h_rec)
+
+    field_labels = {
+        'candling_date': 'Candling Date', 'hatching_date': 'Hatching Date', 'egg_set': 'Egg Set',
+        'clear_eggs': 'Clear Eggs', 'rotten_eggs': 'Rotten Eggs', 'hatched_chicks': 'Hatched Chicks'
+    }
+
+    created_count = 0
+    updated_count = 0
+
+    for target_flock, s_date, values in parsed_rows:
+        target_flock_id = target_flock.id
+
+        # Always fetch Male Ratio from Farm Database
+        m_ratio, _ = ratios[target_flock_id].ratio(s_date)
+
+        existing = records_by_flock[target_flock_id].get(s_date)
         if existing:
-            # Smart Patch Update
+            # Smart Patch Update: only fields present in the sheet
             updated_fields = []
-
-            # Helper to update only if not None
-            def update_if_present(obj, attr, val, field_name):
-                if val is not None:
-                    old_val = getattr(obj, attr)
-                    if old_val != val:
-                        setattr(obj, attr, val)
-                        updated_fields.append(field_name)
-
-            update_if_present(existing, 'candling_date', c_date, 'Candling Date')
-            update_if_present(existing, 'hatching_date', h_date, 'Hatching Date')
-            update_if_present(existing, 'egg_set', e_set, 'Egg Set')
-            update_if_present(existing, 'clear_eggs', c_eggs, 'Clear Eggs')
-            update_if_present(existing, 'rotten_eggs', r_eggs, 'Rotten Eggs')
-            update_if_present(existing, 'hatched_chicks', h_chicks, 'Hatched Chicks')
+            for attr, val in values.items():
+                if val is not None and getattr(existing, attr) != val:
+                    setattr(existing, attr, val)
+                    updated_fields.append(field_labels[attr])
 
             # Implicit update of Male Ratio
             if existing.male_ratio_pct != m_ratio:
@@ -648,23 +515,20 @@ def process_hatchability_import(file):
         else:
             # Insert Record
             # Default dates if missing
-            final_c_date = c_date or (s_date + timedelta(days=18))
-            final_h_date = h_date or (s_date + timedelta(days=21))
-
             h = Hatchability(
                 flock_id=target_flock_id,
                 setting_date=s_date,
-                candling_date=final_c_date,
-                hatching_date=final_h_date,
-                egg_set=e_set or 0,
-                clear_eggs=c_eggs or 0,
-                rotten_eggs=r_eggs or 0,
-                hatched_chicks=h_chicks or 0,
+                candling_date=values['candling_date'] or (s_date + timedelta(days=18)),
+                hatching_date=values['hatching_date'] or (s_date + timedelta(days=21)),
+                egg_set=values['egg_set'] or 0,
+                clear_eggs=values['clear_eggs'] or 0,
+                rotten_eggs=values['rotten_eggs'] or 0,
+                hatched_chicks=values['hatched_chicks'] or 0,
                 male_ratio_pct=m_ratio
             )
             db.session.add(h)
-            hatch_cache[target_flock_id].append(h)
-            hatch_cache[target_flock_id].sort(key=lambda x: x.setting_date)
+            records_by_flock[target_flock_id][s_date] = h
+            ratios[target_flock_id].add_setting(s_date)
             created_count += 1
 
     safe_commit()
@@ -1124,57 +988,100 @@ def process_import(file, commit=True, preview=False):
         db.session.rollback()
         return changes, all_warnings
 
-def recalculate_flock_inventory(flock_id):
+def recalculate_flock_inventory(flock_id, from_date=None, to_date=None):
     """
-    Recalculates males_at_start, females_at_start, and recalculates feed requirements
-    by iterating chronologically from the start of the flock to avoid repetitive
-    summation queries.
+    Recalculates males_at_start, females_at_start and water intake by iterating
+    chronologically, writing only the rows whose values actually change.
+
+    from_date: incremental mode. Opening stock is carried over from the previous
+    day's stored start-of-day stock minus its losses, and that day is re-checked
+    for water intake. Once past the last edited day (to_date, defaults to
+    from_date) the walk stops as soon as the stored stock matches again, since
+    everything after that is unaffected.
+    Returns the number of logs that were modified.
     """
     flock = Flock.query.get(flock_id)
     if not flock:
-        return
-
-    # Fetch all logs in order
-    logs = DailyLog.query.filter_by(flock_id=flock_id).order_by(DailyLog.date.asc()).all()
+        return 0
 
     curr_males = flock.intake_male or 0
     curr_females = flock.intake_female or 0
     prev_log = None
 
+    def _chains(prev, log):
+        return prev is not None and (log.date - prev.date).days == 1 and log.water_reading_1 is not None and prev.water_reading_1 is not None
+
+    # (log, fallback intake) waiting for tomorrow's reading to settle its water intake
+    awaiting_next = None
+
+    if from_date:
+        # The day before carries the stock over; the one before that tells us its own water fallback
+        previous = DailyLog.query.filter(DailyLog.flock_id == flock_id, DailyLog.date < from_date).order_by(DailyLog.date.desc()).limit(2).all()
+        if previous:
+            prev_log = previous[0]
+            if prev_log.males_at_start is not None and prev_log.females_at_start is not None:
+                # Carry over from the previous day instead of summing the whole history
+                curr_males = prev_log.males_at_start - ((prev_log.mortality_male or 0) + (prev_log.culls_male or 0))
+                curr_females = prev_log.females_at_start - ((prev_log.mortality_female or 0) + (prev_log.culls_female or 0))
+            else:
+                losses = db.session.query(
+                    func.coalesce(func.sum(func.coalesce(DailyLog.mortality_male, 0) + func.coalesce(DailyLog.culls_male, 0)), 0),
+                    func.coalesce(func.sum(func.coalesce(DailyLog.mortality_female, 0) + func.coalesce(DailyLog.culls_female, 0)), 0)
+                ).filter(DailyLog.flock_id == flock_id, DailyLog.date < from_date).first()
+                curr_males -= int(losses[0] or 0)
+                curr_females -= int(losses[1] or 0)
+
+            prev_prev = previous[1] if len(previous) > 1 else None
+            awaiting_next = (prev_log, 0.0 if _chains(prev_prev, prev_log) else (prev_log.water_intake_calculated or 0.0))
+
+        logs = DailyLog.query.filter(DailyLog.flock_id == flock_id, DailyLog.date >= from_date).order_by(DailyLog.date.asc()).all()
+        stop_after = (to_date or from_date) + timedelta(days=1)
+    else:
+        # Fetch all logs in order
+        logs = DailyLog.query.filter_by(flock_id=flock_id).order_by(DailyLog.date.asc()).all()
+        stop_after = None
+
+    changed = set()
+
+    def _set(obj, attr, value):
+        # Skip no-op writes so VersionedMixin does not bump untouched rows
+        if getattr(obj, attr) != value:
+            setattr(obj, attr, value)
+            changed.add(obj.id)
+
     for log in logs:
-        # Update start of day columns
-        log.males_at_start = curr_males
-        log.females_at_start = curr_females
-
-        # Recalculate water intake
-        if prev_log and (log.date - prev_log.date).days == 1 and log.water_reading_1 is not None and prev_log.water_reading_1 is not None:
-            r1_today = log.water_reading_1 / 100.0
-            r1_prev = prev_log.water_reading_1 / 100.0
-            # Save the calculated intake on the previous day since the 24h consumption belongs to it
-            prev_log.water_intake_calculated = (r1_today - r1_prev) * 1000.0
-
-            # Reset current day's intake until tomorrow's reading is available
-            log.water_intake_calculated = 0.0
-        else:
-            if not log.water_intake_calculated:
-                log.water_intake_calculated = 0.0
+        if awaiting_next is not None:
+            waiting, fallback = awaiting_next
+            if _chains(waiting, log):
+                # Save the calculated intake on the previous day since the 24h consumption belongs to it
+                _set(waiting, 'water_intake_calculated', (log.water_reading_1 / 100.0 - waiting.water_reading_1 / 100.0) * 1000.0)
+            else:
+                _set(waiting, 'water_intake_calculated', fallback)
+            awaiting_next = None
 
-        prev_log = log
+        if stop_after and log.date > stop_after and log.males_at_start == curr_males and log.females_at_start == curr_females:
+            # Past the edited days and the stock agrees again: the rest of the flock is already consistent
+            break
 
-        # Feed Multiplier Logic
-        multiplier = 1.0
-        if log.feed_program == 'Skip-a-day':
-            multiplier = 2.0
-        elif log.feed_program == '2/1':
-            multiplier = 1.5
+        # Update start of day columns
+        _set(log, 'males_at_start', curr_males)
+        _set(log, 'females_at_start', curr_females)
 
+        # Intake is zero until tomorrow's reading is available when today chains to yesterday
+        awaiting_next = (log, 0.0 if _chains(prev_log, log) else (log.water_intake_calculated or 0.0))
+        prev_log = log
 
         # Update stock for the next day
         # Only mortality and culls affect total house stock.
         curr_males -= ((log.mortality_male or 0) + (log.culls_male or 0))
         curr_females -= ((log.mortality_female or 0) + (log.culls_female or 0))
 
-    safe_commit()
+    if awaiting_next is not None:
+        _set(awaiting_next[0], 'water_intake_calculated', awaiting_next[1])
+
+    if changed:
+        safe_commit()
+    return len(changed)
 
 def check_daily_log_completion(farm_id, selected_date):
     """
@@ -1307,7 +1214,6 @@ def update_log_from_request(log, req):
     alert_triggered = False
     mort_pct_m = 0.0
     mort_pct_f = 0.0
-    egg_prod_pct = 0.0
 
     if current_stock_m > 0:
         mort_pct_m = (log.mortality_male / current_stock_m) * 100
@@ -1321,59 +1227,14 @@ def update_log_from_request(log, req):
             flash(f"ALERT: High Female Mortality Spike ({mort_pct_f:.2f}%) detected!", "danger")
             alert_triggered = True
 
-    if current_stock_f > 0 and getattr(log, 'eggs_collected', 0) > 0:
-        egg_prod_pct = (log.eggs_collected / current_stock_f) * 100
-
     if alert_triggered:
         # Simulate sending email
         app.logger.warning(f"Mortality Alert Triggered for Flock {log.flock_id}")
 
     # Phase 5: Dynamic Push Alerts
-    active_rules = NotificationRule.query.filter_by(is_active=True).all()
-    triggered_rules = []
-
-    metric_values = {
-        'mortality_female_pct': mort_pct_f,
-        'mortality_male_pct': mort_pct_m,
-        'egg_production_pct': egg_prod_pct
-    }
-
-    for rule in active_rules:
-        val = metric_values.get(rule.metric)
-        if val is not None:
-            # Evaluate operator
-            if rule.operator == '>':
-                is_triggered = val > rule.threshold
-            elif rule.operator == '<':
-                is_triggered = val < rule.threshold
-            elif rule.operator == '>=':
-                is_triggered = val >= rule.threshold
-            elif rule.operator == '<=':
-                is_triggered = val <= rule.threshold
-            elif rule.operator == '==':
-                is_triggered = val == rule.threshold
-            else:
-                is_triggered = False
-
-            if is_triggered:
-                triggered_rules.append(rule)
-
-    if triggered_rules:
-        house_name = log.flock.house.name if log.flock and log.flock.house else "Unknown House"
-        for rule in triggered_rules:
-            title = f"Alert: {rule.name}"
-            metric_label = METRIC_LABELS.get(rule.metric, rule.metric)
-            body = f"{house_name}: {rule.name} Alert! {metric_label} is {metric_values.get(rule.metric):.2f}% (Threshold: {rule.operator} {rule.threshold}%)"
-
-            # Notify all users
-            all_users = User.query.all()
-            for user in all_users:
-                try:
-                    # Provide a URL to deep link to the flock detail
-                    alert_url = url_for('view_flock', id=log.flock.id) if log.flock else '/'
-                    send_push_alert(user.id, title, body, url=alert_url)
-                except Exception as e:
-                    app.logger.error(f"Failed to send push alert to {user.username}: {str(e)}")
+    # Compiled active rules are checked against this day's enriched metrics;
+    # the alerts commit with the log and are pushed in the background
+    queue_rule_alerts(evaluate_log(log))
 
     # Feed Guardian Validation
     override = req.form.get('override_validation') == 'true'
@@ -1494,11 +1355,7 @@ def update_log_from_request(log, req):
         files = req.files.getlist('photo')
         for file in files:
             if file and file.filename != '':
-                date_str = log.date.strftime('%y%m%d')
-                raw_name = f"{log.flock.flock_id}_{date_str}_{file.filename}"
-                filename = secure_filename(raw_name)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filepath = store_photo(file, app.config['UPLOAD_FOLDER'])
 
                 new_photo = DailyLogPhoto(
                     log_id=log.id,
@@ -1636,780 +1493,164 @@ def get_projected_start_of_lay(flock):
 
 def get_weekly_data_aggregated(flocks):
     """
-    Aggregates data for the given flocks by ISO Week.
-    Returns a dictionary structure:
-    {
-        '2025-W40': {
-            'week_str': '2025-W40',
+    Per ISO week metrics of the given flocks, read from the weekly rollups.
+    Returns a list, newest week first:
+    [
+        {
+            'week': '2025-W40',
             'start_date': date_obj,
             'end_date': date_obj,
-            'flock_data': {
-                flock_id: { ... metrics ... }
-            }
+            'flocks': [{ ... metrics ... }, ...]   # in the order of `flocks`
         }
-    }
+    ]
     """
     if not flocks:
-        return {}
+        return []
 
-    flock_ids = [f.id for f in flocks]
+    flock_objs = {f.id: f for f in flocks}
+    flock_order = {f.id: i for i, f in enumerate(flocks)}
+    ensure_rollups(list(flock_objs))
+    rollups = FlockWeeklyRollup.query.filter(FlockWeeklyRollup.flock_id.in_(list(flock_objs))).all()
+    rollups.sort(key=lambda r: flock_order[r.flock_id])
 
-    # 1. Fetch all Daily Logs
-    logs = DailyLog.query.filter(DailyLog.flock_id.in_(flock_ids))\
-        .order_by(DailyLog.date.desc()).all()
+    feed_codes = dict(db.session.query(FeedCode.id, FeedCode.code).all())
 
-    # 2. Fetch all Hatchability Data
-    hatch_records = Hatchability.query.filter(Hatchability.flock_id.in_(flock_ids))\
-        .order_by(Hatchability.setting_date.desc()).all()
+    # First egg per flock, without loading every flock's logs for start_of_lay_date
+    lay_dates = dict(db.session.query(DailyLog.flock_id, func.min(DailyLog.date)).filter(
+        DailyLog.flock_id.in_(list(flock_objs)), DailyLog.eggs_collected > 0
+    ).group_by(DailyLog.flock_id).all())
 
-    # 3. Fetch Standards
     standards = Standard.query.all()
     std_map = {getattr(s, 'week'): s for s in standards if hasattr(s, 'week')}
     prod_std_map = {getattr(s, 'production_week'): s for s in standards if hasattr(s, 'production_week') and getattr(s, 'production_week')}
 
-    weekly_agg = {}
-
-    # Helper to init week entry
-    def init_week(key, start_d, end_d):
-        if key not in weekly_agg:
-            weekly_agg[key] = {
-                'week_str': key,
-                'start_date': start_d,
-                'end_date': end_d,
-                'flock_data': {}
-            }
-        return weekly_agg[key]
-
-    # Process Logs
-    for log in logs:
-        # Determine ISO Week
-        isocal = log.date.isocalendar() # (Year, Week, Weekday)
-        year, week, _ = isocal
-        week_key = f"{year}-W{week:02d}"
-
-        # Start/End of that week
-        # ISO week starts on Monday
-        # Python's isocalendar usage
-        monday = log.date - timedelta(days=log.date.weekday())
-        sunday = monday + timedelta(days=6)
-
-        entry = init_week(week_key, monday, sunday)
-
-        f_id = log.flock_id
-        if f_id not in entry['flock_data']:
-            entry['flock_data'][f_id] = {
-                'mort_m': 0, 'mort_f': 0,
-                'cull_m': 0, 'cull_f': 0,
-                'eggs': 0,
-                'feed_total_kg': 0,
-                'feed_g_bird_sum_f': 0, 'feed_g_bird_count': 0,
-                'bw_f_sum': 0, 'bw_f_count': 0,
-                'unif_f_sum': 0, 'unif_f_count': 0,
-                'stock_f_start': 0, # Need to estimate
-                'log_count': 0,
-                'logs': [] # Keep references for sparklines if needed
-            }
-
-        fd = entry['flock_data'][f_id]
-        fd['mort_m'] += (log.mortality_male or 0)
-        fd['mort_f'] += (log.mortality_female or 0)
-        fd['cull_m'] += (log.culls_male or 0)
-        fd['cull_f'] += (log.culls_female or 0)
-        fd['eggs'] += (log.eggs_collected or 0)
-        # We don't have stock for this day immediately accessible here without calculating it
-        # But for 'feed_total_kg' we can just set it to 0 and rely on `enrich_flock_data` for accurate metrics later
-        fd['feed_total_kg'] += 0 # Removed explicit reference to log.feed_male
-
-        if log.feed_female_gp_bird > 0:
-            fd['feed_g_bird_sum_f'] += log.feed_female_gp_bird
-            fd['feed_g_bird_count'] += 1
-
-        if log.body_weight_female > 0:
-            fd['bw_f_sum'] += log.body_weight_female
-            fd['bw_f_count'] += 1
-
-        if log.uniformity_female > 0:
-            fd['unif_f_sum'] += log.uniformity_female
-            fd['unif_f_count'] += 1
-
-        fd['log_count'] += 1
-        fd['logs'].append(log)
-
-    # Process Hatch Data
-    # Link Hatch Data to Week of SETTING or HATCHING?
-    # Usually Hatchability is reported on Hatch Date week.
-    for h in hatch_records:
-        isocal = h.hatching_date.isocalendar()
-        year, week, _ = isocal
-        week_key = f"{year}-W{week:02d}"
-
-        monday = h.hatching_date - timedelta(days=h.hatching_date.weekday())
-        sunday = monday + timedelta(days=6)
-
-        entry = init_week(week_key, monday, sunday)
-        f_id = h.flock_id
-
-        if f_id not in entry['flock_data']:
-            entry['flock_data'][f_id] = {
-                # Init zeros for farm metrics if no logs exist this week
-                'mort_m': 0, 'mort_f': 0, 'cull_m': 0, 'cull_f': 0, 'eggs': 0,
-                'feed_total_kg': 0, 'feed_g_bird_sum_f': 0, 'feed_g_bird_count': 0,
-                'bw_f_sum': 0, 'bw_f_count': 0, 'unif_f_sum': 0, 'unif_f_count': 0,
-                'log_count': 0, 'logs': [],
-                # Hatch Metrics
-                'hatched': 0, 'set': 0
-            }
-
-        fd = entry['flock_data'][f_id]
-        if 'hatched' not in fd:
-            fd['hatched'] = 0
-            fd['set'] = 0
-
-        fd['hatched'] += (h.hatched_chicks or 0)
-        fd['set'] += (h.egg_set or 0)
-
-    # Calculate Rates and Standard Deviations
-    # Need Stock history for Mortality %
-    stock_history_bulk = get_flock_stock_history_bulk(flocks)
-
-    flock_objs = {f.id: f for f in flocks}
-
-    # Sort weeks descending
-    sorted_weeks = sorted(weekly_agg.keys(), reverse=True)
-
-    final_data = []
-
-    for w_key in sorted_weeks:
-        w_data = weekly_agg[w_key]
-        row = {
-            'week': w_key,
-            'start_date': w_data['start_date'],
-            'end_date': w_data['end_date'],
+    weeks = {}
+    for r in rollups:
+        flock = flock_objs[r.flock_id]
+        week_key = f"{r.iso_year}-W{r.iso_week:02d}"
+        end_date = r.period_start + timedelta(days=6)
+        row = weeks.setdefault(week_key, {
+            'week': week_key,
+            'start_date': r.period_start,
+            'end_date': end_date,
             'flocks': []
-        }
-
-        for f_id, data in w_data['flock_data'].items():
-            flock = flock_objs.get(f_id)
-            if not flock: continue
-
-            # Age Calculation (at end of week)
-            age_week = calculate_bio_week(flock.intake_date, w_data['end_date'])
-            if age_week < 0: age_week = 0
-
-            # Standards
-            std_bio = std_map.get(age_week) # Biological Standard (BW)
-
-            # Production Standard Lookup
-            std_prod = None
-            if flock.start_of_lay_date:
-                start_bio_week = calculate_bio_week(flock.intake_date, flock.start_of_lay_date)
-                if age_week >= start_bio_week:
-                    current_prod_week = age_week - start_bio_week + 1
-                    std_prod = prod_std_map.get(int(current_prod_week))
-
-            # Stock Calculation
-            # Use stock at start of week
-            stock_hist = stock_history_bulk.get(f_id, {})
-            # Find closest date <= start_date
-            start_stock_f = flock.intake_female # Default
-
-            # We can use the stock_history keys.
-            # stock_history map has date -> stock at start of that day.
-            # So start_stock_f should be stock at w_data['start_date']
-
-            # Use linear search on sorted keys as optimization
-            hist_dates = sorted([d for d in stock_hist.keys() if isinstance(d, date)])
-            best_date = None
-            for d in hist_dates:
-                if d <= w_data['start_date']:
-                    best_date = d
-                else:
-                    break
-
-            if best_date:
-                start_stock_f = stock_hist[best_date]
-
-            # Calculations
-            mort_f_pct = (data['mort_f'] / start_stock_f * 100) if start_stock_f > 0 else 0
-
-            hen_days = start_stock_f * 7 # Approximate
-            # Precise hen days = sum daily stock?
-            # If we have logs, we can sum daily stock.
-            # But we aggregated logs manually.
-            # Let's use simple approximation for Executive view speed.
-
-            egg_prod_pct = (data['eggs'] / hen_days * 100) if hen_days > 0 else 0
-
-            hatch_pct = (data.get('hatched', 0) / data.get('set', 0) * 100) if data.get('set', 0) > 0 else 0
-
-            avg_bw_f = (data['bw_f_sum'] / data['bw_f_count']) if data['bw_f_count'] > 0 else 0
-            avg_unif_f = (data['unif_f_sum'] / data['unif_f_count']) if data['unif_f_count'] > 0 else 0
-            avg_feed_f = (data['feed_g_bird_sum_f'] / data['feed_g_bird_count']) if data['feed_g_bird_count'] > 0 else 0
-
-            # Generate Sparkline Data (Daily within this week)
-            # data['logs'] contains daily logs.
-            # We need to sort them.
-            daily_logs = sorted(data['logs'], key=lambda x: x.date)
-            spark_bw = [l.body_weight_female for l in daily_logs if l.body_weight_female > 0]
-            spark_eggs = [((l.eggs_collected or 0)/(start_stock_f or 1)*100) for l in daily_logs] # Approx %
-
-            # Feed Code (Take last used)
-            feed_code = "N/A"
-            if daily_logs:
-                last_log = daily_logs[-1]
-                if last_log.feed_code_female:
-                    feed_code = last_log.feed_code_female.code
-                elif last_log.feed_code_male:
-                    feed_code = last_log.feed_code_male.code
-
-            flock_metrics = {
-                'flock_obj': flock,
-                'age_week': age_week,
-                'total_eggs': data['eggs'],
-                'mort_f_pct': round(mort_f_pct, 2),
-                'egg_prod_pct': round(egg_prod_pct, 2),
-                'hatch_pct': round(hatch_pct, 2),
-                'avg_bw_f': int(avg_bw_f),
-                'avg_unif_f': round(avg_unif_f, 1),
-                'avg_feed_f': int(avg_feed_f),
-                'feed_code': feed_code,
-                'std_bw_f': std_bio.std_bw_female if std_bio else None,
-                'std_egg_prod': std_prod.std_egg_prod if std_prod else None,
-                'spark_bw': spark_bw,
-                'spark_eggs': spark_eggs
-            }
-
-            row['flocks'].append(flock_metrics)
-
-        final_data.append(row)
-
-    return final_data
-
-def calculate_grading_stats(weights):
-    if not weights:
-        return None
-
-    count = len(weights)
-    avg_weight = sum(weights) / count
-    lower_limit = avg_weight * 0.9
-    upper_limit = avg_weight * 1.1
-
-    in_range = sum(1 for w in weights if lower_limit <= w <= upper_limit)
-    uniformity = (in_range / count) * 100 if count > 0 else 0.0
-
-    lowest = min(weights)
-    highest = max(weights)
-
-    # Bins: Floor lowest to 100, ceil highest to 100
-    bin_min = int(math.floor(lowest / 100.0)) * 100
-    bin_max = int(math.ceil(highest / 100.0)) * 100
-
-    # Initialize bins with zero counts to ensure they're ordered
-    bins = {}
-    for b in range(bin_min, bin_max + 100, 100):
-        bins[str(b)] = 0
-
-    # Populate bins
-    for w in weights:
-        # Find which bin it belongs to
-        # Normally, a bin like 1500 means [1450, 1550) or [1500, 1600)?
-        # Looking at standard distributions, usually round to nearest 100
-        # If w = 1530, round(1530/100)*100 = 1500. Let's use standard rounding.
-        b_key = str(int(round(w / 100.0)) * 100)
-        if b_key in bins:
-            bins[b_key] += 1
-        else:
-            # Fallback if outside somehow
-            bins[b_key] = 1
-
-    return {
-        'count': count,
-        'average_weight': round(avg_weight, 2),
-        'uniformity': round(uniformity, 2),
-        'lowest_weight': lowest,
-        'highest_weight': highest,
-        'grading_bins': json.dumps(bins)
-    }
+        })
 
-def get_iso_aggregated_data_sql(flock_ids, target_year):
-    """
-    Aggregates data by ISO week using raw SQL for performance.
-    Handles stock calculation (Intake - Cumulative Loss) dynamically.
-    Returns:
-    {
-        'weekly': [...],
-        'monthly': [...],
-        'yearly': [...]
-    }
-    """
-    if not flock_ids:
-        return {'weekly': [], 'monthly': [], 'yearly': []}
+        # Age Calculation (at end of week)
+        age_week = calculate_bio_week(flock.intake_date, end_date)
+        if age_week < 0: age_week = 0
+
+        # Standards
+        std_bio = std_map.get(age_week) # Biological Standard (BW)
+
+        # Production Standard Lookup
+        std_prod = None
+        lay_date = lay_dates.get(r.flock_id)
+        if lay_date:
+            start_bio_week = calculate_bio_week(flock.intake_date, lay_date)
+            if age_week >= start_bio_week:
+                current_prod_week = age_week - start_bio_week + 1
+                std_prod = prod_std_map.get(int(current_prod_week))
+
+        # Mortality against the opening stock of the week, egg production against hen-days
+        mort_f_pct = (r.mortality_female / r.opening_stock_female * 100) if r.opening_stock_female > 0 else 0
+        egg_prod_pct = (r.eggs_collected / r.stock_days_female * 100) if r.stock_days_female > 0 else 0
+        hatch_pct = (r.hatched_chicks / r.egg_set * 100) if r.egg_set > 0 else 0
+
+        avg_bw_f = (r.bw_female_sum / r.bw_female_days) if r.bw_female_days > 0 else 0
+        avg_unif_f = (r.uniformity_female_sum / r.uniformity_female_days) if r.uniformity_female_days > 0 else 0
+        avg_feed_f = (r.feed_female_gp_sum / r.feed_female_gp_days) if r.feed_female_gp_days > 0 else 0
+
+        spark = json.loads(r.spark_json) if r.spark_json else {}
+
+        row['flocks'].append({
+            'flock_obj': flock,
+            'age_week': age_week,
+            'total_eggs': r.eggs_collected,
+            'mort_f_pct': round(mort_f_pct, 2),
+            'egg_prod_pct': round(egg_prod_pct, 2),
+            'hatch_pct': round(hatch_pct, 2),
+            'avg_bw_f': int(avg_bw_f),
+            'avg_unif_f': round(avg_unif_f, 1),
+            'avg_feed_f': int(avg_feed_f),
+            'feed_code': feed_codes.get(r.feed_code_id, "N/A"),
+            'std_bw_f': std_bio.std_bw_female if std_bio else None,
+            'std_egg_prod': std_prod.std_egg_prod if std_prod else None,
+            'spark_bw': spark.get('bw_female', []),
+            'spark_eggs': spark.get('egg_pct', [])
+        })
 
-    ids_tuple = tuple(flock_ids)
-    if len(ids_tuple) == 1:
-        ids_tuple = f"({ids_tuple[0]})"
-    else:
-        ids_tuple = str(ids_tuple)
-
-    # Common CTE for calculating daily metrics
-    # Determine the database dialect
-    dialect = db.engine.name
-
-    if dialect == 'sqlite':
-        week_fmt = "strftime('%Y-%W', l.date)"
-        month_fmt = "strftime('%Y-%m', l.date)"
-        year_fmt = "strftime('%Y', l.date)"
-    else:  # postgresql
-        week_fmt = "to_char(l.date, 'IYYY-IW')"
-        month_fmt = "to_char(l.date, 'YYYY-MM')"
-        year_fmt = "to_char(l.date, 'YYYY')"
-
-# Fetch dynamic start_of_lay_dates
-    flocks_data = Flock.query.filter(Flock.id.in_(flock_ids)).all()
-    start_date_cases = []
-    for f in flocks_data:
-        prod_start = f.start_of_lay_date
-        if prod_start:
-            start_date_cases.append(f"WHEN l.flock_id = {f.id} THEN '{prod_start.strftime('%Y-%m-%d')}'")
-
-    start_date_sql = "NULL"
-    if start_date_cases:
-        start_date_sql = f"CASE {' '.join(start_date_cases)} ELSE NULL END"
-
-    cte_sql = f"""
-    WITH DailyStock AS (
-        SELECT
-            l.date,
-            l.flock_id,
-            {week_fmt} as iso_week,
-            {month_fmt} as iso_month,
-            {year_fmt} as iso_year,
-            l.mortality_male + l.mortality_female + l.culls_male + l.culls_female as daily_loss,
-            l.mortality_female as mort_f,
-            l.eggs_collected,
-            0 as total_feed,
-            f.intake_female + f.intake_male as intake_total,
-            f.intake_female,
-            {start_date_sql} as start_of_lay_date,
-            SUM(l.mortality_male + l.mortality_female + l.culls_male + l.culls_female)
-                OVER (PARTITION BY l.flock_id ORDER BY l.date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) as cum_loss,
-            SUM(l.mortality_female + l.culls_female)
-                OVER (PARTITION BY l.flock_id ORDER BY l.date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) as cum_loss_f
-        FROM daily_log l
-        JOIN flock f ON l.flock_id = f.id
-        WHERE l.flock_id IN {ids_tuple}
-    ),
-    EnrichedDaily AS (
-        SELECT
-            *,
-            (intake_female - cum_loss_f) as stock_f_end,
-            -- Stock Start of Day is End of Prev Day (approx by adding back daily loss? No, simpler: Intake - (Cum - Daily))
-            (intake_female - (cum_loss_f - (mort_f + 0))) as stock_f_start
-        FROM DailyStock
-    )
-    """
+    return [weeks[k] for k in sorted(weeks, reverse=True)]
 
-    results = {}
-
-    # Define aggregation queries with UNION ALL to reduce db calls from 6 to 2
-    # Filter by Year AND Start of Lay in the Final Step to allow cum_loss to be accurate
-    combined_cte_sql = f"""
-        {cte_sql},
-        WeeklyLogs AS (
-            SELECT
-                'weekly' as type,
-                iso_week as period,
-                SUM(eggs_collected) as total_eggs,
-                SUM(mort_f) as total_mort_f,
-                SUM(stock_f_start) as total_hen_days,
-                COUNT(DISTINCT date) as days_in_period
-            FROM EnrichedDaily
-            WHERE iso_year = :year
-              AND start_of_lay_date IS NOT NULL
-              AND date >= start_of_lay_date
-            GROUP BY iso_week
-        ),
-        MonthlyLogs AS (
-            SELECT
-                'monthly' as type,
-                iso_month as period,
-                SUM(eggs_collected) as total_eggs,
-                SUM(mort_f) as total_mort_f,
-                SUM(stock_f_start) as total_hen_days,
-                COUNT(DISTINCT date) as days_in_period
-            FROM EnrichedDaily
-            WHERE iso_year = :year
-              AND start_of_lay_date IS NOT NULL
-              AND date >= start_of_lay_date
-            GROUP BY iso_month
-        ),
-        YearlyLogs AS (
-            SELECT
-                'yearly' as type,
-                iso_year as period,
-                SUM(eggs_collected) as total_eggs,
-                SUM(mort_f) as total_mort_f,
-                SUM(stock_f_start) as total_hen_days,
-                COUNT(DISTINCT date) as days_in_period
-            FROM EnrichedDaily
-            WHERE iso_year = :year
-              AND start_of_lay_date IS NOT NULL
-              AND date >= start_of_lay_date
-            GROUP BY iso_year
-        )
-        SELECT * FROM WeeklyLogs
-        UNION ALL
-        SELECT * FROM MonthlyLogs
-        UNION ALL
-        SELECT * FROM YearlyLogs
+def _iso_rows(model, period_cols, label, *criteria):
     """
-
-    # Define Hatchery Queries based on dialect
-    if dialect == 'sqlite':
-        hatch_week_fmt = "strftime('%Y-%W', hatching_date)"
-        hatch_month_fmt = "strftime('%Y-%m', hatching_date)"
-        hatch_year_fmt = "strftime('%Y', hatching_date)"
-    else: # postgresql
-        hatch_week_fmt = "to_char(hatching_date, 'IYYY-IW')"
-        hatch_month_fmt = "to_char(hatching_date, 'YYYY-MM')"
-        hatch_year_fmt = "to_char(hatching_date, 'YYYY')"
-
-    combined_hatch_sql = f"""
-        WITH WeeklyHatch AS (
-            SELECT
-                'weekly' as type,
-                {hatch_week_fmt} as period,
-                SUM(hatched_chicks) as hatched,
-                SUM(egg_set) as egg_set
-            FROM hatchability
-            WHERE flock_id IN {ids_tuple} AND {hatch_year_fmt} = :year
-            GROUP BY period
-        ),
-        MonthlyHatch AS (
-            SELECT
-                'monthly' as type,
-                {hatch_month_fmt} as period,
-                SUM(hatched_chicks) as hatched,
-                SUM(egg_set) as egg_set
-            FROM hatchability
-            WHERE flock_id IN {ids_tuple} AND {hatch_year_fmt} = :year
-            GROUP BY period
-        ),
-        YearlyHatch AS (
-            SELECT
-                'yearly' as type,
-                {hatch_year_fmt} as period,
-                SUM(hatched_chicks) as hatched,
-                SUM(egg_set) as egg_set
-            FROM hatchability
-            WHERE flock_id IN {ids_tuple} AND {hatch_year_fmt} = :year
-            GROUP BY period
-        )
-        SELECT * FROM WeeklyHatch
-        UNION ALL
-        SELECT * FROM MonthlyHatch
-        UNION ALL
-        SELECT * FROM YearlyHatch
+    Farm ISO rows from per-flock rollups grouped by period_cols, newest first.
+    Average stock adds up each flock's average laying hens over its own laying days.
     """
-
-    # Fetch all data at once to avoid multiple db calls
-    all_logs = db.session.execute(text(combined_cte_sql), {'year': str(target_year)}).fetchall()
-    all_hatch = db.session.execute(text(combined_hatch_sql), {'year': str(target_year)}).fetchall()
-
-    # Process results into typed dictionaries
-    hatch_map = {'weekly': {}, 'monthly': {}, 'yearly': {}}
-    for row in all_hatch:
-        # Expected tuple: (type, period, hatched, egg_set)
-        type_key = row[0]
-        period = row[1]
-        hatched = row[2]
-        egg_set = row[3]
-        if period:
-            hatch_map[type_key][period] = (hatched, egg_set)
-
-    logs_by_type = {'weekly': [], 'monthly': [], 'yearly': []}
-    for row in all_logs:
-        # Expected tuple: (type, period, total_eggs, total_mort_f, total_hen_days, days_in_period)
-        type_key = row[0]
-        period = row[1]
-        if period:
-            logs_by_type[type_key].append({
-                'period': period,
-                'total_eggs': row[2] or 0,
-                'total_mort_f': row[3] or 0,
-                'total_hen_days': row[4] or 0,
-                'days_in_period': row[5] or 0
-            })
-
-    for key in ['weekly', 'monthly', 'yearly']:
-        # The frontend expects periods to be descending ordered, which is not guaranteed by UNION ALL
-        sorted_logs = sorted(logs_by_type[key], key=lambda x: x['period'], reverse=True)
-
-        processed_list = []
-        for log in sorted_logs:
-            period = log['period']
-            total_eggs = log['total_eggs']
-            total_mort = log['total_mort_f']
-            total_hen_days = log['total_hen_days']
-            days_in_period = log['days_in_period']
-
-            # Hatchery
-            h_data = hatch_map[key].get(period)
-            hatched = h_data[0] if h_data else 0
-            set_cnt = h_data[1] if h_data else 0
-
-            # Avg Prod Females = Total Hen Days / Days in Period
-            # This represents the average number of birds present on any given day in the period
-            avg_stock = (total_hen_days / days_in_period) if days_in_period > 0 else 0
-
-            # Metrics
-            mort_pct = (total_mort / avg_stock * 100) if avg_stock > 0 else 0
-
-            # Egg Prod % = Total Eggs / Total Hen Days * 100
-            egg_prod_pct = (total_eggs / total_hen_days * 100) if total_hen_days > 0 else 0
-
-            hatch_pct = (hatched / set_cnt * 100) if set_cnt > 0 else 0
-
-            processed_list.append({
-                'period': period,
-                'avg_prod_females': int(avg_stock), # Renamed for clarity in template usage, but legacy template uses avg_female_stock
-                'avg_female_stock': int(avg_stock), # Legacy support
-                'total_eggs': total_eggs,
-                'total_chicks': hatched,
-                'mortality_pct': round(mort_pct, 2),
-                'hatchability_pct': round(hatch_pct, 2),
-                'overall_egg_prod_pct': round(egg_prod_pct, 2), # Explicit Key
-                'egg_production_pct': round(egg_prod_pct, 2) # Legacy Key
-            })
-
-        results[key] = processed_list
-
+    query = db.session.query(
+        model.flock_id, *period_cols,
+        func.sum(model.eggs_collected), func.sum(model.laying_mortality_female),
+        func.sum(model.hen_days), func.sum(model.laying_days),
+        func.sum(model.egg_set), func.sum(model.hatched_chicks)
+    ).filter(*criteria).group_by(model.flock_id, *period_cols)
+
+    n = len(period_cols)
+    buckets = {}
+    for row in query.all():
+        period = label(*row[1:1 + n])
+        eggs, mort_f, hen_days, laying_days, egg_set, chicks = (v or 0 for v in row[1 + n:])
+        b = buckets.setdefault(period, {'eggs': 0, 'mort_f': 0, 'hen_days': 0, 'avg_stock': 0.0, 'egg_set': 0, 'chicks': 0})
+        b['eggs'] += eggs
+        b['mort_f'] += mort_f
+        b['hen_days'] += hen_days
+        b['egg_set'] += egg_set
+        b['chicks'] += chicks
+        if laying_days > 0:
+            b['avg_stock'] += hen_days / laying_days
+
+    results = []
+    for period in sorted(buckets, reverse=True):
+        b = buckets[period]
+        avg_stock = b['avg_stock']
+        mort_pct = (b['mort_f'] / avg_stock * 100) if avg_stock > 0 else 0
+        egg_prod_pct = (b['eggs'] / b['hen_days'] * 100) if b['hen_days'] > 0 else 0
+        hatch_pct = (b['chicks'] / b['egg_set'] * 100) if b['egg_set'] > 0 else 0
+
+        results.append({
+            'period': period,
+            'avg_female_stock': int(avg_stock),
+            'total_eggs': b['eggs'],
+            'total_chicks': b['chicks'],
+            'mortality_pct': round(mort_pct, 2),
+            'hatchability_pct': round(hatch_pct, 2),
+            'egg_production_pct': round(egg_prod_pct, 2)
+        })
     return results
 
-def get_iso_aggregated_data(flocks, target_year=None):
+def get_iso_aggregated_data(target_year, flock_ids=None):
     """
-    Aggregates data across all given flocks into Weekly, Monthly, and Yearly ISO buckets.
+    Farm-wide ISO report read from the flock rollups, for every flock (active or not)
+    unless flock_ids narrows it down.
+    Stock, mortality and egg production only count laying days (from each flock's first egg).
     Returns:
     {
-        'weekly': [{period, avg_female_stock, total_eggs, total_chicks, mortality_pct, hatchability_pct, egg_prod_pct}, ...],
+        'weekly': [{period, avg_female_stock, total_eggs, total_chicks, mortality_pct, hatchability_pct, egg_production_pct}, ...],
         'monthly': [...],
         'yearly': [...]
     }
+    Weekly ('YYYY-Www') covers the ISO weeks of target_year and monthly ('YYYY-MM') its months;
+    yearly ('YYYY') lists every year on record for year-over-year comparison. Newest first.
     """
-    if not flocks:
-        return {'weekly': [], 'monthly': [], 'yearly': []}
-
-    global_daily = {}
-
-    # Default to current year if None, or handle differently?
-    # Requirement: Filter by year.
-    filter_year = target_year if target_year else date.today().year
-
-    # Optimization: Bulk fetch Logs and Hatchability to avoid N+1 queries
-    flock_ids = [f.id for f in flocks]
-
-    # 1. Bulk Fetch Hatchability
-    all_hatch_records = Hatchability.query.filter(Hatchability.flock_id.in_(flock_ids)).all()
-    hatch_by_flock = {}
-    for h in all_hatch_records:
-        if h.flock_id not in hatch_by_flock:
-            hatch_by_flock[h.flock_id] = []
-        hatch_by_flock[h.flock_id].append(h)
-
-    # 2. Bulk Fetch Logs (Optimized to use existing relationships if available)
-    logs_by_flock = {}
-
-    # Check if flocks already have logs loaded (e.g. from joinedload)
-    # If the first flock has logs loaded, assume all do to avoid N+1 checks or partial loads
-    has_eager_logs = len(flocks) > 0 and 'logs' in db.inspect(flocks[0]).attrs and db.inspect(flocks[0]).attrs.logs.history.has_changes() is False
-
-    # Actually, we can just check if f.logs is populated without triggering lazy load?
-    # But accessing f.logs triggers it if not loaded.
-    # We can rely on the caller ensuring efficient loading.
-
-    # Logic: If we rely on passed flocks having logs, we skip the query.
-    # But get_iso_aggregated_data is a utility.
-    # Let's check if we should query.
-
-    # For now, let's optimize specifically for when we know we have logs (from executive_dashboard)
-    # We can iterate and see.
-
-    # Safe approach: Collect logs from flocks. If empty, query DB?
-    # But querying DB is what we want to avoid if they ARE loaded.
-
-    # Let's assume for this specific performance task that we want to avoid the redundant query.
-    # We will build logs_by_flock from flock.logs.
-
-    for f in flocks:
-        # We access f.logs. If it was eager loaded, good. If not, it triggers a query (N+1).
-        # But since we optimized executive_dashboard to use joinedload, this is fast.
-        logs_by_flock[f.id] = f.logs
-
-    for flock in flocks:
-        logs = logs_by_flock.get(flock.id, [])
-        hatch_records = hatch_by_flock.get(flock.id, [])
-
-        daily_stats = enrich_flock_data(flock, logs, hatch_records)
-
-        for d in daily_stats:
-            d_date = d['date']
-            # Strict Year Filter
-            if d_date.year != filter_year:
-                continue
-
-            if d_date not in global_daily:
-                global_daily[d_date] = {
-                    'stock_f': 0, 'eggs': 0, 'mort_f': 0,
-                    'chicks': 0, 'egg_set': 0,
-                    'active_flocks': 0
-                }
-
-            # Check for Production Phase Logic
-            is_prod = False
-            if flock.production_start_date and d_date >= flock.production_start_date:
-                is_prod = True
-            elif flock.phase == 'Production':
-                # Fallback: if no date set, assume phase is valid for all fetched logs?
-                # No, historical logs might be rearing.
-                # If eggs collected > 0, assume prod.
-                if d['eggs_collected'] > 0: is_prod = True
-
-            # Stock summation (Only if in production)
-            if is_prod:
-                global_daily[d_date]['stock_f'] += d['stock_female_start']
-                global_daily[d_date]['mort_f'] += d['mortality_female']
-
-            global_daily[d_date]['eggs'] += d['eggs_collected']
-
-            if d.get('hatched_chicks'):
-                global_daily[d_date]['chicks'] += d['hatched_chicks']
-            if d.get('egg_set'):
-                global_daily[d_date]['egg_set'] += d['egg_set']
-
-            global_daily[d_date]['active_flocks'] += 1
-
-    buckets = {'weekly': {}, 'monthly': {}, 'yearly': {}}
-    sorted_dates = sorted(global_daily.keys())
-
-    for d_date in sorted_dates:
-        day_data = global_daily[d_date]
-
-        isocal = d_date.isocalendar()
-        week_key = f"{isocal[0]}-W{isocal[1]:02d}"
-        month_key = d_date.strftime('%Y-%m')
-        year_key = str(d_date.year)
-
-        for p_type, p_key in [('weekly', week_key), ('monthly', month_key), ('yearly', year_key)]:
-            if p_key not in buckets[p_type]:
-                buckets[p_type][p_key] = {
-                    'period': p_key,
-                    'sum_stock_f': 0, 'days_with_stock': 0,
-                    'total_eggs': 0, 'total_mort_f': 0,
-                    'total_chicks': 0, 'total_set': 0,
-                    'data_days': 0
-                }
-
-            b = buckets[p_type][p_key]
-            b['total_eggs'] += day_data['eggs']
-            b['total_mort_f'] += day_data['mort_f']
-            b['total_chicks'] += day_data['chicks']
-            b['total_set'] += day_data['egg_set']
-            b['data_days'] += 1
-            b['sum_stock_f'] += day_data['stock_f']
-
-    results = {'weekly': [], 'monthly': [], 'yearly': []}
-
-    for p_type in ['weekly', 'monthly', 'yearly']:
-        sorted_keys = sorted(buckets[p_type].keys(), reverse=True)
-
-        for k in sorted_keys:
-            b = buckets[p_type][k]
-
-            avg_stock = b['sum_stock_f'] / b['data_days'] if b['data_days'] > 0 else 0
-            egg_prod_pct = (b['total_eggs'] / b['sum_stock_f'] * 100) if b['sum_stock_f'] > 0 else 0
-            mort_pct = (b['total_mort_f'] / avg_stock * 100) if avg_stock > 0 else 0
-            hatch_pct = (b['total_chicks'] / b['total_set'] * 100) if b['total_set'] > 0 else 0
-
-            results[p_type].append({
-                'period': b['period'],
-                'avg_female_stock': int(avg_stock),
-                'total_eggs': b['total_eggs'],
-                'total_chicks': b['total_chicks'],
-                'mortality_pct': round(mort_pct, 2),
-                'hatchability_pct': round(hatch_pct, 2),
-                'egg_production_pct': round(egg_prod_pct, 2)
-            })
-
-    return results
-
-def get_hatchery_analytics():
-    today = date.today()
-
-    # Common filter for Active Production Flocks
-    flock_filter = and_(Flock.status == 'Active', Flock.phase == 'Production')
-
-    # Previous Hatch
-    # Max date <= today with hatched_chicks > 0
-    last_hatch_date_query = db.session.query(func.max(Hatchability.hatching_date)).join(Flock).filter(
-        Hatchability.hatching_date <= today,
-        Hatchability.hatched_chicks > 0,
-        flock_filter
-    ).scalar()
-
-    last_hatch = None
-    if last_hatch_date_query:
-        last_records = Hatchability.query.join(Flock).filter(
-            Hatchability.hatching_date == last_hatch_date_query,
-            flock_filter
-        ).all()
-
-        total_h = sum(r.hatched_chicks for r in last_records)
-        total_s = sum(r.egg_set for r in last_records)
-        h_pct = (total_h / total_s * 100) if total_s > 0 else 0.0
-        last_hatch = {
-            'date': last_hatch_date_query,
-            'total_hatched': total_h,
-            'hatch_pct': h_pct
-        }
-
-    # Next Hatch
-    # Min date >= today (or > last_hatch_date if today was processed as Previous)
-    next_filter_condition = Hatchability.hatching_date >= today
-    if last_hatch and last_hatch['date'] == today:
-        next_filter_condition = Hatchability.hatching_date > today
-
-    next_hatch_date_query = db.session.query(func.min(Hatchability.hatching_date)).join(Flock).filter(
-        next_filter_condition,
-        Hatchability.egg_set > 0,
-        flock_filter
-    ).scalar()
-
-    next_hatch = None
-    if next_hatch_date_query:
-        next_records = Hatchability.query.join(Flock).filter(
-            Hatchability.hatching_date == next_hatch_date_query,
-            flock_filter
-        ).all()
-
-        # Calculate Forecast
-        all_standards = Standard.query.all()
-        std_map = {getattr(s, 'week'): getattr(s, 'std_hatchability', 0.0) for s in all_standards if hasattr(s, 'week')}
-
-        total_forecast = 0
-        for r in next_records:
-            age_week = calculate_bio_week(r.flock.intake_date, next_hatch_date_query)
-            std_hatch = std_map.get(age_week)
-            if std_hatch is None: std_hatch = 0.0
-            forecast = r.egg_set * (std_hatch / 100.0)
-            total_forecast += forecast
-
-        next_hatch = {
-            'date': next_hatch_date_query,
-            'forecast': int(total_forecast)
-        }
-
-    return last_hatch, next_hatch
+    ensure_rollups(flock_ids)
+    W, M = FlockWeeklyRollup, FlockMonthlyRollup
+    w_filter = [W.flock_id.in_(flock_ids)] if flock_ids is not None else []
+    m_filter = [M.flock_id.in_(flock_ids)] if flock_ids is not None else []
 
+    return {
+        'weekly': _iso_rows(W, (W.iso_year, W.iso_week), lambda y, w: f"{y}-W{w:02d}", W.iso_year == target_year, *w_filter),
+        'monthly': _iso_rows(M, (M.year, M.month), lambda y, m: f"{y}-{m:02d}", M.year == target_year, *m_filter),
+        'yearly': _iso_rows(M, (M.year,), str, *m_filter),
+    }
 
 # Add constants missing
 EMPTY_NOTE_VALUES = frozenset(['none', 'nan'])
@@ -0,0 +1,234 @@
+import io
+import csv
+from datetime import date, datetime
+
+import pandas as pd
+from sqlalchemy.orm import joinedload
+
+from app.database import db
+from app.models.models import Flock, DailyLog, Standard, Hatchability
+from metrics import enrich_flock_data
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional dependency, only needed for columnar exports
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'parquet', 'arrow')
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+
+
+class ExportError(Exception):
+    """Raised when an export format cannot be produced (e.g. missing pyarrow)."""
+    pass
+
+
+def get_flock_export_headers():
+    headers = [
+        "ID", "Date", "Age (Days)", "Clinical Signs",
+        "Mortality (M)", "Mortality (F)", "Hosp Mort (M)", "Hosp Mort (F)",
+        "Culls (M)", "Culls (F)", "Hosp Culls (M)", "Hosp Culls (F)",
+        "Moved to Hosp (M)", "Moved to Hosp (F)", "Moved to Prod (M)", "Moved to Prod (F)",
+        "Males In", "Males Out", "Females In", "Females Out",
+        "Feed Program", "Feed Code (M)", "Feed Code (F)",
+        "Feed (g/bird M)", "Feed (g/bird F)", "Feed Cleanup Start", "Feed Cleanup End",
+        "Water 1", "Water 2", "Water 3", "Flushing",
+        "Eggs Collected", "Egg Weight", "Eggs Jumbo", "Eggs Small", "Eggs Abnormal", "Eggs Crack",
+        "Weighing Day", "Avg BW (M)", "Avg BW (F)", "Avg Unif (M)", "Avg Unif (F)", "Std BW (M)", "Std BW (F)"
+    ]
+
+    for i in range(1, 9):
+        headers.extend([f"M{i} BW", f"M{i} Unif"])
+    for i in range(1, 9):
+        headers.extend([f"F{i} BW", f"F{i} Unif"])
+
+    headers.extend([
+        "Light On", "Light Off",
+        "Std Mort %", "Std Egg Prod %", "Std BW (M) Bench", "Std BW (F) Bench"
+    ])
+    return headers
+
+
+def get_flock_export_rows(flock):
+    """Raw spreadsheet rows for a flock, in the same column order as get_flock_export_headers()."""
+    from app.services.data_service import generate_spreadsheet_data
+
+    logs = DailyLog.query.options(
+        joinedload(DailyLog.partition_weights),
+        joinedload(DailyLog.photos),
+        joinedload(DailyLog.clinical_notes_list)
+    ).filter_by(flock_id=flock.id).order_by(DailyLog.date.asc()).all()
+
+    standards_list = Standard.query.all()
+    standards_by_week = {getattr(s, 'week'): s for s in standards_list if hasattr(s, 'week')}
+    standards_by_prod_week = {s.production_week: s for s in standards_list}
+
+    return generate_spreadsheet_data(flock, logs, standards_by_week, standards_by_prod_week)
+
+
+def rows_to_csv(headers, rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+    return output.getvalue()
+
+
+def rows_to_xlsx(headers, rows, sheet_title='Data'):
+    """
+    Streams rows into a write-only openpyxl workbook.
+    Dates stay real Excel dates and numbers stay numeric, so no re-typing after opening.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title[:31])
+    # Must be set before the first row is appended in write-only mode
+    ws.freeze_panes = 'A2'
+
+    bold = Font(bold=True)
+    header_cells = []
+    for h in headers:
+        c = WriteOnlyCell(ws, value=h)
+        c.font = bold
+        header_cells.append(c)
+    ws.append(header_cells)
+
+    for row in rows:
+        ws.append([_xlsx_value(v) for v in row])
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _xlsx_value(val):
+    if isinstance(val, float) and val != val:
+        return None  # NaN from pandas frames
+    if isinstance(val, str) and len(val) == 10 and val[4:5] == '-' and val[7:8] == '-':
+        # Spreadsheet rows carry dates as 'YYYY-MM-DD' strings
+        try:
+            return datetime.strptime(val, '%Y-%m-%d').date()
+        except ValueError:
+            return val
+    return val
+
+
+def build_enriched_metrics_frame(flocks, year=None):
+    """
+    One row per flock per day with every scalar metric from enrich_flock_data.
+    Enrichment always runs over the full flock history so stock and cumulative
+    figures stay correct, then rows are trimmed to the requested year.
+    """
+    flocks = list(flocks)
+    if not flocks:
+        return pd.DataFrame()
+
+    flock_ids = [f.id for f in flocks]
+    all_standards = Standard.query.all()
+
+    logs_by_flock = {fid: [] for fid in flock_ids}
+    for log in DailyLog.query.filter(DailyLog.flock_id.in_(flock_ids)).order_by(DailyLog.date.asc()).all():
+        logs_by_flock[log.flock_id].append(log)
+
+    hatch_by_flock = {fid: [] for fid in flock_ids}
+    for h in Hatchability.query.filter(Hatchability.flock_id.in_(flock_ids)).all():
+        hatch_by_flock[h.flock_id].append(h)
+
+    records = []
+    for flock in flocks:
+        enriched = enrich_flock_data(flock, logs_by_flock[flock.id], hatch_by_flock[flock.id], all_standards=all_standards)
+        for d in enriched:
+            if year is not None and d['date'].year != year:
+                continue
+            rec = {
+                'flock_id': flock.flock_id,
+                'house': flock.house.name if flock.house else None,
+            }
+            for k, v in d.items():
+                if v is None or isinstance(v, (int, float, bool, str, date)):
+                    rec[k] = v
+            records.append(rec)
+
+    df = pd.DataFrame.from_records(records)
+    if not df.empty:
+        df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def get_year_export_flocks(year):
+    """Flocks with at least one daily log in the given calendar year."""
+    flock_ids = db.session.query(DailyLog.flock_id).filter(
+        DailyLog.date >= date(year, 1, 1),
+        DailyLog.date <= date(year, 12, 31)
+    ).distinct()
+    return Flock.query.options(joinedload(Flock.house)).filter(Flock.id.in_(flock_ids)).order_by(Flock.flock_id).all()
+
+
+def frame_to_parquet(df):
+    if pq is None:
+        raise ExportError("Parquet export requires the 'pyarrow' package.")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    output = io.BytesIO()
+    pq.write_table(table, output, compression='zstd')
+    return output.getvalue()
+
+
+def frame_to_arrow(df):
+    if pa is None:
+        raise ExportError("Arrow export requires the 'pyarrow' package.")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    output = io.BytesIO()
+    with pa.ipc.new_file(output, table.schema) as writer:
+        writer.write_table(table)
+    return output.getvalue()
+
+
+def export_flock(flock, fmt):
+    """Returns (payload, mimetype, filename) for a single flock export."""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format: {fmt}")
+
+    if fmt in ('csv', 'xlsx'):
+        headers = get_flock_export_headers()
+        rows = get_flock_export_rows(flock)
+        if fmt == 'csv':
+            payload = rows_to_csv(headers, rows)
+        else:
+            payload = rows_to_xlsx(headers, rows, sheet_title=flock.flock_id)
+        return payload, EXPORT_MIMETYPES[fmt], f"flock_{flock.id}_raw_data.{fmt}"
+
+    df = build_enriched_metrics_frame([flock])
+    payload = frame_to_parquet(df) if fmt == 'parquet' else frame_to_arrow(df)
+    return payload, EXPORT_MIMETYPES[fmt], f"flock_{flock.id}_metrics.{fmt}"
+
+
+def export_year(year, fmt):
+    """Returns (payload, mimetype, filename) with the enriched daily metrics of every flock active in `year`."""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format: {fmt}")
+
+    df = build_enriched_metrics_frame(get_year_export_flocks(year), year=year)
+    filename = f"metrics_{year}.{fmt}"
+
+    if fmt == 'parquet':
+        return frame_to_parquet(df), EXPORT_MIMETYPES[fmt], filename
+    if fmt == 'arrow':
+        return frame_to_arrow(df), EXPORT_MIMETYPES[fmt], filename
+
+    headers = list(df.columns)
+    rows = df.itertuples(index=False, name=None)
+    if fmt == 'csv':
+        return rows_to_csv(headers, rows), EXPORT_MIMETYPES[fmt], filename
+    return rows_to_xlsx(headers, rows, sheet_title=str(year)), EXPORT_MIMETYPES[fmt], filename
@@ -0,0 +1,259 @@
+import json
+import zlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from metrics import enrich_flock_data, aggregate_periods
+from app.database import db
+from app.models.models import (
+    Flock, DailyLog, Hatchability, Standard, GlobalStandard, FlockAnalyticsArchive,
+    Medication, Vaccine, ClinicalNote, DailyLogPhoto, PartitionWeight
+)
+
+# Bumped whenever the payload layout changes, older archives are rebuilt on read
+ARCHIVE_FORMAT = 1
+
+_DATE_KEYS = ('date', 'date_start', 'date_end')
+
+# Any change to these reaches every flock's enrichment or summary
+_GLOBAL_MODELS = (Standard, GlobalStandard)
+
+# Shown on the flock page but not part of the archived analytics: they only bump data_version
+_FLOCK_DETAIL_MODELS = (Medication, Vaccine)
+_LOG_DETAIL_MODELS = (ClinicalNote, DailyLogPhoto, PartitionWeight)
+
+# Flock summaries kept in memory per worker, least recently used dropped first
+SUMMARY_CACHE_SIZE = 256
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+
+def _restore_dates(rows):
+    for row in rows:
+        for k in _DATE_KEYS:
+            if row.get(k):
+                row[k] = date.fromisoformat(row[k])
+    return rows
+
+
+def _frozen_day(d):
+    day = {k: v for k, v in d.items() if k != 'log'}
+    day['log_id'] = d['log'].id
+    return day
+
+
+def _log_versions(logs):
+    return sorted([log.id, log.version] for log in logs)
+
+
+def build_flock_archive(flock, logs=None, hatch_records=None, all_standards=None):
+    """
+    Enriches the flock once and stores the daily series, weekly/monthly aggregates
+    and calculate_flock_summary output as a compressed archive row. The caller commits.
+    Returns the payload with the daily rows still holding their logs.
+    """
+    from app.services.data_service import calculate_flock_summary
+
+    if logs is None:
+        logs = DailyLog.query.filter_by(flock_id=flock.id).order_by(DailyLog.date.asc()).all()
+    if hatch_records is None:
+        hatch_records = Hatchability.query.filter_by(flock_id=flock.id).all()
+    if all_standards is None:
+        all_standards = Standard.query.all()
+
+    daily_stats = enrich_flock_data(flock, logs, hatch_records, all_standards=all_standards)
+    summary_dashboard, summary_table = calculate_flock_summary(flock, daily_stats)
+    periods = aggregate_periods(daily_stats, ('week', 'month'))
+
+    payload = {
+        'format': ARCHIVE_FORMAT,
+        'logs': _log_versions(logs),
+        'calculated_phase': getattr(flock, 'calculated_phase', None),
+        'daily': [_frozen_day(d) for d in daily_stats],
+        'week': periods['week'],
+        'month': periods['month'],
+        'summary': {'dashboard': summary_dashboard, 'table': summary_table},
+    }
+    blob = zlib.compress(json.dumps(payload, default=_json_default).encode('utf-8'))
+
+    archive = FlockAnalyticsArchive.query.filter_by(flock_id=flock.id).first()
+    if archive is None:
+        archive = FlockAnalyticsArchive(flock_id=flock.id)
+        db.session.add(archive)
+    archive.payload = blob
+    archive.built_at = datetime.utcnow()
+
+    payload['daily'] = daily_stats
+    return payload
+
+
+def _load(archive, logs):
+    payload = json.loads(zlib.decompress(archive.payload).decode('utf-8'))
+    # Logs written around the ORM (bulk updates, raw SQL) still show up as a version change
+    if payload.get('format') != ARCHIVE_FORMAT or payload['logs'] != _log_versions(logs):
+        return None
+    by_id = {log.id: log for log in logs}
+    for d in payload['daily']:
+        d['log'] = by_id[d.pop('log_id')]
+    for key in ('daily', 'week', 'month'):
+        _restore_dates(payload[key])
+    return payload
+
+
+def get_frozen_analytics(flock, logs, hatch_records=None, all_standards=None):
+    """
+    Analytics of an inactive flock from its archive, built (and committed) on first use or
+    after the flock was edited. Daily rows get their DailyLog back under 'log'.
+    Returns {'daily', 'week', 'month', 'summary': {'dashboard', 'table'}}, or None for active flocks.
+    """
+    if flock.status != 'Inactive':
+        return None
+
+    archive = FlockAnalyticsArchive.query.filter_by(flock_id=flock.id).first()
+    payload = _load(archive, logs) if archive is not None else None
+    if payload is None:
+        payload = build_flock_archive(flock, logs, hatch_records, all_standards)
+        db.session.commit()
+    elif payload['calculated_phase'] is not None:
+        flock.calculated_phase = payload['calculated_phase']
+    return payload
+
+
+def _parent_ids(obj, attr='flock_id', parent='flock'):
+    """Current and pre-flush values of a foreign key, e.g. the flock ids of a log or hatch record."""
+    ids = set(inspect(obj).attrs[attr].history.deleted)
+    current = getattr(obj, attr)
+    if current is None and getattr(obj, parent, None) is not None:
+        current = getattr(obj, parent).id
+    ids.add(current)
+    return ids
+
+
+def _before_flush(session, flush_context, instances):
+    changed = set()
+    touched = set()
+    log_ids = set()
+    everything = False
+    dirty = [o for o in session.dirty if session.is_modified(o, include_collections=False)]
+    for obj in list(session.new) + dirty + list(session.deleted):
+        if isinstance(obj, (DailyLog, Hatchability)):
+            changed |= _parent_ids(obj)
+        elif isinstance(obj, Flock):
+            changed.add(obj.id)
+        elif isinstance(obj, _FLOCK_DETAIL_MODELS):
+            touched |= _parent_ids(obj)
+        elif isinstance(obj, _LOG_DETAIL_MODELS):
+            log_ids |= _parent_ids(obj, 'log_id', 'log')
+        elif isinstance(obj, _GLOBAL_MODELS):
+            everything = True
+    log_ids.discard(None)
+    if log_ids:
+        touched.update(session.connection().execute(select(DailyLog.flock_id).where(DailyLog.id.in_(log_ids))).scalars())
+    changed.discard(None)
+    touched.discard(None)
+    if not changed and not touched and not everything:
+        return
+
+    # The new data_version invalidates every per-flock cache, in this worker or any other
+    archive = FlockAnalyticsArchive.__table__
+    flock = Flock.__table__
+    drop = archive.delete()
+    bump = flock.update().values(data_version=flock.c.data_version + 1)
+    if not everything:
+        drop = drop.where(archive.c.flock_id.in_(changed))
+        bump = bump.where(flock.c.id.in_(changed | touched))
+    connection = session.connection()
+    if changed or everything:
+        connection.execute(drop)
+    connection.execute(bump)
+
+
+def register_archive_events():
+    """
+    Drops a flock's archive and bumps its data_version on any change to the flock,
+    its logs or hatch records, or the standards. Medications, vaccines and the notes,
+    photos and partition weights of its logs only bump the data_version.
+    """
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+
+
+def flocks_stamp(connection=None):
+    """
+    (flock count, sum of data_version, max flock id). Every Hatchability, Flock or
+    Standard write bumps a data_version, so the stamp moves on in any worker.
+    Read on the session unless a connection is given.
+    """
+    return tuple((connection or db.session).execute(select(
+        func.count(Flock.id), func.coalesce(func.sum(Flock.data_version), 0), func.max(Flock.id)
+    )).one())
+
+
+class FlockCache(object):
+    """
+    Values derived from one flock, kept in memory per worker and rebuilt once the flock's
+    data_version moves on. The least recently used flocks are dropped first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, flock, build):
+        # The name guards against a deleted flock's id being reused by a new one
+        key = (flock.flock_id, flock.data_version or 0)
+        with self._lock:
+            cached = self._entries.get(flock.id)
+            if cached is not None and cached['key'] == key:
+                self._entries.move_to_end(flock.id)
+                return cached['value']
+
+        value = build()
+        with self._lock:
+            self._entries[flock.id] = {'key': key, 'value': value}
+            self._entries.move_to_end(flock.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+
+_summaries = FlockCache(SUMMARY_CACHE_SIZE)
+
+
+def get_flock_summary(flock, daily_stats=None):
+    """
+    calculate_flock_summary output and the weekly aggregates (without notes) of a flock,
+    cached per flock.data_version. On a miss daily_stats is used when given, otherwise the
+    flock's archive (inactive flocks) or a fresh enrichment.
+    Returns {'data_version', 'dashboard', 'table', 'weekly'}; treat it as read-only.
+    """
+    return _summaries.get(flock, lambda: _build_summary(flock, daily_stats))
+
+
+def _build_summary(flock, daily_stats):
+    from app.services.data_service import calculate_flock_summary
+
+    frozen = None
+    if daily_stats is None:
+        logs = DailyLog.query.filter_by(flock_id=flock.id).order_by(DailyLog.date.asc()).all()
+        frozen = get_frozen_analytics(flock, logs)
+        if frozen is None:
+            hatch_records = Hatchability.query.filter_by(flock_id=flock.id).all()
+            daily_stats = enrich_flock_data(flock, logs, hatch_records, all_standards=Standard.query.all())
+
+    if frozen is not None:
+        dashboard, table, weekly = frozen['summary']['dashboard'], frozen['summary']['table'], frozen['week']
+    else:
+        dashboard, table = calculate_flock_summary(flock, daily_stats)
+        weekly = aggregate_periods(daily_stats, ('week',))['week']
+
+    return {'data_version': flock.data_version or 0, 'dashboard': dashboard, 'table': table, 'weekly': weekly}
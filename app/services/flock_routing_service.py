@@ -0,0 +1,140 @@
+from bisect import bisect_right
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from app.models.models import Farm, House, Flock, HouseFlockMapping, HatcheryEggReceipt
+from app.services.cache_service import CommitCache
+from app.services.flock_archive_service import flocks_stamp
+
+RECEIPT_CULL_FIELDS = ('jumbo_cull', 'small_cull', 'abnormal_cull', 'crack_cull')
+RECEIPT_QTY_FIELDS = ('farm_declared_qty', 'actual_received_qty') + RECEIPT_CULL_FIELDS
+
+FlockRoute = namedtuple('FlockRoute', ['farm_id', 'house_id', 'flock_id', 'start_date', 'end_date'])
+
+
+def _routing_stamp(connection):
+    """
+    flocks_stamp() plus the count, max id and latest dates of the routings and the
+    count and max id of houses and farms. Assigning a flock adds a routing, so the
+    stamp moves on in every worker.
+    """
+    m = HouseFlockMapping
+    return flocks_stamp(connection) + tuple(connection.execute(select(
+        select(func.count(m.id)).scalar_subquery(),
+        select(func.max(m.id)).scalar_subquery(),
+        select(func.max(m.start_date)).scalar_subquery(),
+        select(func.max(m.end_date)).scalar_subquery(),
+        select(func.count(House.id)).scalar_subquery(),
+        select(func.max(House.id)).scalar_subquery(),
+        select(func.count(Farm.id)).scalar_subquery(),
+        select(func.max(Farm.id)).scalar_subquery(),
+    )).one())
+
+
+_routes = CommitCache(HouseFlockMapping, Flock, House, Farm, stamp=_routing_stamp)
+_farms = CommitCache(HouseFlockMapping, Flock, House, Farm, stamp=_routing_stamp)
+
+
+def register_routing_events():
+    """
+    Drops the routing index and the farm -> houses map once a commit that wrote a
+    flock routing, flock, house or farm lands; other workers follow _routing_stamp().
+    """
+    _routes.register()
+    _farms.register()
+
+
+def _build_routing_index(connection):
+    rows = connection.execute(select(
+        HouseFlockMapping.farm_id, HouseFlockMapping.house_id, HouseFlockMapping.flock_id,
+        HouseFlockMapping.start_date, HouseFlockMapping.end_date
+    ).order_by(HouseFlockMapping.house_id, HouseFlockMapping.start_date, HouseFlockMapping.id)).all()
+    index = {}
+    for row in rows:
+        starts, routes = index.setdefault(row.house_id, ([], []))
+        starts.append(row.start_date)
+        routes.append(FlockRoute(*row))
+    return index
+
+
+def _routing_index():
+    """{house_id: (start dates, FlockRoute list)}, both sorted by start_date."""
+    return _routes.get(_build_routing_index)
+
+
+def resolve_flock(house_id, on_date):
+    """
+    FlockRoute of the flock routed to a house on a date, or None. Routings of a house
+    never overlap (a new one closes the previous), so the latest start on or before
+    the date is the only candidate.
+    """
+    starts, routes = _routing_index().get(house_id, ((), ()))
+    i = bisect_right(starts, on_date) - 1
+    if i < 0:
+        return None
+    route = routes[i]
+    if route.end_date is not None and route.end_date < on_date:
+        return None
+    return route
+
+
+def get_houses_by_farm():
+    """
+    {farm_id: [{'id', 'name'}]} for the farm -> house dropdowns. Houses come from the
+    farm's flocks, else from its routings, else every house is offered so an
+    assignment is never blocked.
+    """
+    return _farms.get(_build_houses_by_farm)
+
+
+def _build_houses_by_farm(connection):
+    houses = connection.execute(select(House.id, House.name).order_by(House.name)).all()
+    from_flocks = set(connection.execute(select(Flock.farm_id, Flock.house_id).distinct()).all())
+    from_routings = set(connection.execute(select(HouseFlockMapping.farm_id, HouseFlockMapping.house_id).distinct()).all())
+
+    farms = {}
+    for farm_id in connection.execute(select(Farm.id)).scalars():
+        farm_houses = [h for h in houses if (farm_id, h.id) in from_flocks]
+        if not farm_houses:
+            farm_houses = [h for h in houses if (farm_id, h.id) in from_routings]
+        if not farm_houses:
+            farm_houses = houses
+        farms[farm_id] = [{'id': h.id, 'name': h.name} for h in farm_houses]
+    return farms
+
+
+def build_receipt(values, arrival_date):
+    """
+    (HatcheryEggReceipt, None) for one batch routed to the flock in its house on the
+    arrival date, or (None, error message). values holds house_id, batch_number and
+    the RECEIPT_QTY_FIELDS; missing quantities count as 0.
+    """
+    try:
+        house_id = int(values.get('house_id'))
+        batch_number = int(values.get('batch_number'))
+        qty = {field: int(values.get(field) or 0) for field in RECEIPT_QTY_FIELDS}
+    except (TypeError, ValueError):
+        return None, 'Missing required fields.'
+
+    if any(v < 0 for v in qty.values()):
+        return None, 'Quantities cannot be negative.'
+
+    total_culls = sum(qty[field] for field in RECEIPT_CULL_FIELDS)
+    if total_culls > qty['actual_received_qty']:
+        return None, 'Total culls cannot exceed actual received quantity.'
+
+    route = resolve_flock(house_id, arrival_date)
+    if route is None:
+        return None, 'No active flock found in this house for the selected date. Please contact the Manager.'
+
+    receipt = HatcheryEggReceipt(
+        farm_id=route.farm_id,
+        house_id=route.house_id,
+        flock_id=route.flock_id,
+        arrival_date=arrival_date,
+        batch_number=batch_number,
+        settable_eggs=qty['actual_received_qty'] - total_culls,
+        **qty
+    )
+    return receipt, None
@@ -0,0 +1,425 @@
+from sqlalchemy.orm import joinedload
+
+from analytics import analyze_health_events
+from metrics import enrich_flock_data, get_std_hatch_map
+from app.models.models import DailyLog, Hatchability, Standard, Medication, Vaccine
+from app.services.flock_archive_service import FlockCache, get_frozen_analytics, get_flock_summary
+from app.services.photo_service import photo_urls
+from app.utils import round_to_whole
+
+# A view holds every daily chart series of the flock, so far fewer are kept than summaries
+FLOCK_VIEW_CACHE_SIZE = 32
+
+# Tabs of the flock page served as partials, the charts tab is served as JSON
+FLOCK_TABS = ('daily', 'weekly', 'hatchability', 'summary', 'health')
+
+# DailyLog fields the daily tab shows, copied so cached rows hold no ORM objects
+_DAILY_LOG_FIELDS = (
+    'id', 'date', 'age_week_day', 'mortality_male', 'mortality_female', 'culls_male', 'culls_female',
+    'feed_male_gp_bird', 'feed_female_gp_bird', 'water_intake_calculated', 'eggs_collected', 'egg_weight'
+)
+
+_HATCH_CHART_FIELDS = ('fertile_egg_pct', 'clear_egg_pct', 'rotten_egg_pct', 'hatchability_pct', 'male_ratio_pct')
+
+_views = FlockCache(FLOCK_VIEW_CACHE_SIZE)
+
+
+def get_flock_view(flock):
+    """
+    Everything the flock detail tabs show, built by build_flock_view and cached per
+    flock.data_version. Returns plain data only; treat it as read-only.
+    """
+    return _views.get(flock, lambda: build_flock_view(flock))
+
+
+def scale_pct(val):
+    if val is None: return None
+    if 0 < val <= 1.0: return val * 100.0
+    return val
+
+
+def _active_meds(medications, day):
+    return [m.drug_name for m in medications if m.start_date <= day and (m.end_date is None or m.end_date >= day)]
+
+
+def _photo(p, name=None):
+    return {
+        **photo_urls(p.file_path),
+        'name': name or p.original_filename or 'Photo'
+    }
+
+
+def _partition_value(log, p_map, name, index, is_male):
+    val = p_map.get(name, 0)
+    if val == 0:
+        attr = f'bw_male_p{index}' if is_male else f'bw_female_p{index}'
+        if hasattr(log, attr):
+            val = getattr(log, attr, 0)
+    return val
+
+
+def build_flock_view(flock):
+    """
+    Runs the metrics engine once for the flock (closed flocks read their frozen archive)
+    and derives the header KPIs, the daily and weekly tables, the chart series,
+    the production summary and the health events from it.
+    """
+    logs = DailyLog.query.options(joinedload(DailyLog.partition_weights), joinedload(DailyLog.photos), joinedload(DailyLog.clinical_notes_list)).filter_by(flock_id=flock.id).order_by(DailyLog.date.asc()).all()
+
+    # --- Standards Setup ---
+    all_standards = Standard.query.all()
+    std_map = {getattr(s, 'week'): s for s in all_standards if hasattr(s, 'week')} # Biological Age Map
+
+    hatch_records = Hatchability.query.filter_by(flock_id=flock.id).order_by(Hatchability.setting_date.desc()).all()
+
+    # --- Metrics Engine ---
+    frozen = get_frozen_analytics(flock, logs, hatch_records, all_standards)
+    daily_stats = frozen['daily'] if frozen else enrich_flock_data(flock, logs, hatch_records, all_standards=all_standards)
+
+    flock_summary = get_flock_summary(flock, daily_stats)
+
+    medications = Medication.query.filter_by(flock_id=flock.id).all()
+    vacs = Vaccine.query.filter_by(flock_id=flock.id).filter(Vaccine.actual_date != None).all()
+
+    return {
+        'data_version': flock.data_version or 0,
+        'phase': getattr(flock, 'calculated_phase', flock.phase),
+        'current_stats': _current_stats(flock, daily_stats),
+        'daily': _daily_rows(daily_stats, medications)[::-1],
+        'weekly': _weekly_rows(flock_summary['weekly'])[::-1],
+        'charts': {
+            'daily': _chart_data_daily(daily_stats, medications, vacs),
+            'weekly': _chart_data_weekly(daily_stats, flock_summary['weekly'], std_map, medications, vacs),
+            'hatch_records': [
+                dict({'setting_date': r.setting_date.strftime('%Y-%m-%d') if r.setting_date else ''},
+                     **{k: getattr(r, k) for k in _HATCH_CHART_FIELDS})
+                for r in hatch_records
+            ],
+            'std_hatch_map': get_std_hatch_map(all_standards),
+        },
+        'summary': {
+            'dashboard': flock_summary['dashboard'],
+            'table': flock_summary['table'],
+            'start_of_lay_date': next((d['date'] for d in daily_stats if (d['log'].eggs_collected or 0) > 0), None),
+        },
+        'health': analyze_health_events(logs, daily_stats),
+    }
+
+
+def _current_stats(flock, daily_stats):
+    """Stock at end of last processed log."""
+    if daily_stats:
+        last = daily_stats[-1]
+        return {
+            'male_prod': last.get('stock_male_prod_end', 0),
+            'female_prod': last.get('stock_female_prod_end', 0),
+            'male_hosp': last.get('stock_male_hosp_end', 0),
+            'female_hosp': last.get('stock_female_hosp_end', 0),
+            'male_ratio': last['male_ratio_stock'] if last.get('male_ratio_stock') else 0
+        }
+    return {
+        'male_prod': flock.intake_male,
+        'female_prod': flock.intake_female,
+        'male_hosp': 0,
+        'female_hosp': 0,
+        'male_ratio': (flock.intake_male / flock.intake_female * 100) if flock.intake_female > 0 else 0
+    }
+
+
+def _daily_rows(daily_stats, medications):
+    rows = []
+    for d in daily_stats:
+        log = d['log']
+        rows.append({
+            'log': {k: getattr(log, k) for k in _DAILY_LOG_FIELDS},
+            'stock_male': d.get('stock_male_prod_end', 0) + d.get('stock_male_hosp_end', 0),
+            'stock_female': d.get('stock_female_prod_end', 0) + d.get('stock_female_hosp_end', 0),
+            'lighting_hours': d['lighting_hours'] or 0,
+            'medications': ", ".join(_active_meds(medications, log.date)),
+            'egg_prod_pct': d['egg_prod_pct'],
+            'total_feed': d['feed_total_kg'],
+            'feed_cleanup_hours': d.get('feed_cleanup_hours'),
+            'egg_data': {
+                'jumbo': d['cull_eggs_jumbo'],
+                'jumbo_pct': d['cull_eggs_jumbo_pct'],
+                'small': d['cull_eggs_small'],
+                'small_pct': d['cull_eggs_small_pct'],
+                'crack': d['cull_eggs_crack'],
+                'crack_pct': d['cull_eggs_crack_pct'],
+                'abnormal': d['cull_eggs_abnormal'],
+                'abnormal_pct': d['cull_eggs_abnormal_pct'],
+                'hatching': d['hatch_eggs'],
+                'hatching_pct': d['hatch_egg_pct'] if d.get('hatch_egg_pct') is not None else None,
+                'total_culls': d['cull_eggs_total'],
+                'total_culls_pct': d['cull_eggs_pct']
+            }
+        })
+    return rows
+
+
+def _weekly_rows(weekly_stats):
+    rows = []
+    for ws in weekly_stats:
+        rows.append({
+            'week': ws['week'],
+            'mortality_male': ws['mortality_male'],
+            'mortality_female': ws['mortality_female'],
+            'culls_male': ws['culls_male'],
+            'culls_female': ws['culls_female'],
+            'eggs': ws['eggs_collected'],
+            'hatch_eggs_sum': ws['hatch_eggs'],
+            'cull_eggs_total': ws['cull_eggs_total'],
+            'cull_eggs_pct': ws.get('cull_eggs_pct', 0),
+
+            # Derived
+            'mort_pct_m': ws['mortality_male_pct'],
+            'mort_pct_f': ws['mortality_female_pct'],
+            'cull_pct_m': ws['culls_male_pct'],
+            'cull_pct_f': ws['culls_female_pct'],
+            'egg_prod_pct': ws['egg_prod_pct'],
+            'hatching_egg_pct': ws['hatch_egg_pct'] if ws.get('hatch_egg_pct') is not None else None,
+            'cull_eggs_jumbo': ws['cull_eggs_jumbo'],
+            'cull_eggs_jumbo_pct': ws['cull_eggs_jumbo_pct'] if ws.get('cull_eggs_jumbo_pct') else 0,
+            'cull_eggs_small': ws['cull_eggs_small'],
+            'cull_eggs_small_pct': ws['cull_eggs_small_pct'] if ws.get('cull_eggs_small_pct') else 0,
+            'cull_eggs_crack': ws['cull_eggs_crack'],
+            'cull_eggs_crack_pct': ws['cull_eggs_crack_pct'] if ws.get('cull_eggs_crack_pct') else 0,
+            'cull_eggs_abnormal': ws['cull_eggs_abnormal'],
+            'cull_eggs_abnormal_pct': ws['cull_eggs_abnormal_pct'] if ws.get('cull_eggs_abnormal_pct') else 0,
+            'avg_egg_weight': ws['avg_egg_weight'],
+
+            'avg_bw_male': round_to_whole(ws['body_weight_male']),
+            'avg_bw_female': round_to_whole(ws['body_weight_female']),
+        })
+    return rows
+
+
+def _chart_data_daily(daily_stats, medications, vacs):
+    chart_data = {
+        'dates': [d['date'].strftime('%Y-%m-%d') for d in daily_stats],
+        'ages': [d['log'].age_week_day for d in daily_stats],
+        'mortality_cum_male': [round(d['mortality_cum_male_pct'], 2) for d in daily_stats],
+        'mortality_cum_female': [round(d['mortality_cum_female_pct'], 2) for d in daily_stats],
+        'mortality_daily_male': [round(d['mortality_male_pct'], 2) for d in daily_stats],
+        'mortality_daily_female': [round(d['mortality_female_pct'], 2) for d in daily_stats],
+        'culls_daily_male': [round(d['culls_male_pct'], 2) for d in daily_stats],
+        'culls_daily_female': [round(d['culls_female_pct'], 2) for d in daily_stats],
+        'egg_prod': [round(d['egg_prod_pct'], 2) for d in daily_stats],
+        'std_egg_prod': [round(d['std_egg_prod'], 2) if d.get('std_egg_prod') is not None else None for d in daily_stats],
+        'hatch_egg_pct': [round(d['hatch_egg_pct'], 2) if d.get('hatch_egg_pct') is not None else None for d in daily_stats],
+        'std_hatching_egg_pct': [round(d['std_hatching_egg_pct'], 2) if d.get('std_hatching_egg_pct') is not None else None for d in daily_stats],
+        'cull_eggs_jumbo_pct': [round(d['cull_eggs_jumbo_pct'], 2) for d in daily_stats],
+        'cull_eggs_small_pct': [round(d['cull_eggs_small_pct'], 2) for d in daily_stats],
+        'cull_eggs_crack_pct': [round(d['cull_eggs_crack_pct'], 2) for d in daily_stats],
+        'cull_eggs_abnormal_pct': [round(d['cull_eggs_abnormal_pct'], 2) for d in daily_stats],
+        'male_ratio': [round(d['male_ratio_stock'], 2) if d['male_ratio_stock'] else 0 for d in daily_stats],
+        'bw_male_std': [d['log'].standard_bw_male if d['log'].standard_bw_male is not None and d['log'].standard_bw_male > 0 else None for d in daily_stats],
+        'bw_female_std': [d['log'].standard_bw_female if d['log'].standard_bw_female is not None and d['log'].standard_bw_female > 0 else None for d in daily_stats],
+        'unif_male': [scale_pct(d['uniformity_male']) if d['uniformity_male'] is not None and d['uniformity_male'] > 0 else None for d in daily_stats],
+        'unif_female': [scale_pct(d['uniformity_female']) if d['uniformity_female'] is not None and d['uniformity_female'] > 0 else None for d in daily_stats],
+
+        # Raw BW for charts (None if 0)
+        'bw_f': [d['body_weight_female'] if d['body_weight_female'] is not None and d['body_weight_female'] > 0 else None for d in daily_stats],
+        'bw_m': [d['body_weight_male'] if d['body_weight_male'] is not None and d['body_weight_male'] > 0 else None for d in daily_stats],
+
+        'water_per_bird': [round(d['water_per_bird'], 1) if d['water_per_bird'] >= 0 else None for d in daily_stats],
+        'water_feed_ratio': [round(d.get('water_feed_ratio'), 2) if d.get('water_feed_ratio') is not None and d.get('water_feed_ratio') >= 0 else None for d in daily_stats],
+        'feed_male_gp_bird': [round(d['feed_male_gp_bird'], 1) for d in daily_stats],
+        'feed_female_gp_bird': [round(d['feed_female_gp_bird'], 1) for d in daily_stats],
+        'flushing': [d['log'].flushing for d in daily_stats],
+
+        # Legacy Partitions from Log
+        'bw_male_p1': [d['log'].bw_male_p1 if d['log'].bw_male_p1 is not None and d['log'].bw_male_p1 > 0 else None for d in daily_stats],
+        'bw_male_p2': [d['log'].bw_male_p2 if d['log'].bw_male_p2 is not None and d['log'].bw_male_p2 > 0 else None for d in daily_stats],
+        'bw_female_p1': [d['log'].bw_female_p1 if d['log'].bw_female_p1 is not None and d['log'].bw_female_p1 > 0 else None for d in daily_stats],
+        'bw_female_p2': [d['log'].bw_female_p2 if d['log'].bw_female_p2 is not None and d['log'].bw_female_p2 > 0 else None for d in daily_stats],
+        'bw_female_p3': [d['log'].bw_female_p3 if d['log'].bw_female_p3 is not None and d['log'].bw_female_p3 > 0 else None for d in daily_stats],
+        'bw_female_p4': [d['log'].bw_female_p4 if d['log'].bw_female_p4 is not None and d['log'].bw_female_p4 > 0 else None for d in daily_stats],
+
+        'notes': [],
+        'medication_active': [],
+        'medication_names': []
+    }
+
+    # Fill dynamic partitions and notes
+    for i in range(1, 9):
+        chart_data[f'bw_M{i}'] = []
+        chart_data[f'bw_F{i}'] = []
+
+    for d in daily_stats:
+        log = d['log']
+        p_map = {pw.partition_name: pw.body_weight for pw in log.partition_weights}
+
+        for i in range(1, 9):
+            val_m = p_map.get(f'M{i}', 0)
+            if val_m == 0 and i <= 2: val_m = getattr(log, f'bw_male_p{i}', 0)
+            chart_data[f'bw_M{i}'].append(val_m if val_m is not None and val_m > 0 else None)
+
+            val_f = p_map.get(f'F{i}', 0)
+            if val_f == 0 and i <= 4: val_f = getattr(log, f'bw_female_p{i}', 0)
+            chart_data[f'bw_F{i}'].append(val_f if val_f is not None and val_f > 0 else None)
+
+        note_obj = None
+
+        # Construct Note
+        note_parts = []
+        if log.flushing: note_parts.append("[FLUSHING]")
+        if log.clinical_notes: note_parts.append(log.clinical_notes)
+
+        # Meds are shown as their own series rather than in the notes
+        active_meds = _active_meds(medications, log.date)
+        chart_data['medication_active'].append(len(active_meds) > 0)
+        chart_data['medication_names'].append(", ".join(active_meds) if active_meds else "")
+
+        # Vacs
+        done_vacs = [v.vaccine_name for v in vacs if v.actual_date == log.date]
+        if done_vacs: note_parts.append("Vac: " + ", ".join(done_vacs))
+
+        # Main Photos (note_id is None)
+        main_photos = [p for p in log.photos if p.note_id is None]
+
+        # Extra Notes
+        extra_notes = []
+        for n in log.clinical_notes_list or []:
+            extra_notes.append({
+                'caption': n.caption,
+                'photos': [_photo(p) for p in n.photos]
+            })
+
+        if note_parts or main_photos or extra_notes:
+            main_photo_list = [_photo(p) for p in main_photos]
+            note_obj = {
+                'note': " | ".join(note_parts), # Kept for backward compat in tooltips
+                'main_note': " | ".join(note_parts),
+                'main_photos': main_photo_list,
+                'extra_notes': extra_notes,
+                'photos': main_photo_list # Fallback for legacy views
+            }
+
+        chart_data['notes'].append(note_obj)
+
+    return chart_data
+
+
+def _chart_data_weekly(daily_stats, weekly_stats, std_map, medications, vacs):
+    # Cumulative mortality of a week is the cumulative % of its last day, which already
+    # follows the phase switch of the metrics engine like the daily charts do
+    weekly_map = {ws['week']: ws for ws in weekly_stats}
+
+    chart_data_weekly = {
+        'dates': [],
+        'mortality_cum_male': [], 'mortality_cum_female': [],
+        'mortality_weekly_male': [], 'mortality_weekly_female': [],
+        'culls_weekly_male': [], 'culls_weekly_female': [],
+        'avg_bw_male': [], 'avg_bw_female': [],
+        'egg_prod': [], 'avg_egg_weight': [], 'std_egg_prod': [],
+        'hatch_egg_pct': [], 'std_hatching_egg_pct': [],
+        'cull_eggs_jumbo_pct': [], 'cull_eggs_small_pct': [], 'cull_eggs_crack_pct': [], 'cull_eggs_abnormal_pct': [],
+        'bw_male_std': [], 'bw_female_std': [],
+        'unif_male': [], 'unif_female': [],
+        'water_per_bird': [], 'water_feed_ratio': [],
+        'feed_male_gp_bird': [], 'feed_female_gp_bird_majority': [], 'feed_female_gp_bird': [],
+        'notes': []
+    }
+    for i in range(1, 9):
+        chart_data_weekly[f'bw_M{i}'] = []
+        chart_data_weekly[f'bw_F{i}'] = []
+
+    # Group daily_stats by week to get end-of-week cum values
+    daily_by_week = {}
+    for d in daily_stats:
+        daily_by_week.setdefault(d['week'], []).append(d)
+
+    for w in sorted(weekly_map.keys()):
+        ws = weekly_map[w]
+        week_days = daily_by_week[w]
+        last_day = week_days[-1]
+
+        chart_data_weekly['dates'].append(f"Week {w}")
+        chart_data_weekly['mortality_cum_male'].append(round(last_day['mortality_cum_male_pct'], 2))
+        chart_data_weekly['mortality_cum_female'].append(round(last_day['mortality_cum_female_pct'], 2))
+
+        chart_data_weekly['mortality_weekly_male'].append(round(ws['mortality_male_pct'], 2))
+        chart_data_weekly['mortality_weekly_female'].append(round(ws['mortality_female_pct'], 2))
+        chart_data_weekly['culls_weekly_male'].append(round(ws['culls_male_pct'], 2))
+        chart_data_weekly['culls_weekly_female'].append(round(ws['culls_female_pct'], 2))
+
+        chart_data_weekly['avg_bw_male'].append(round_to_whole(ws['body_weight_male']) if ws['body_weight_male'] is not None and ws['body_weight_male'] > 0 else None)
+        chart_data_weekly['avg_bw_female'].append(round_to_whole(ws['body_weight_female']) if ws['body_weight_female'] is not None and ws['body_weight_female'] > 0 else None)
+
+        chart_data_weekly['egg_prod'].append(round(ws['egg_prod_pct'], 2))
+        chart_data_weekly['avg_egg_weight'].append(round(ws.get('avg_egg_weight', 0.0), 2))
+        chart_data_weekly['std_egg_prod'].append(round(ws['std_egg_prod'], 2) if ws.get('std_egg_prod') is not None else None)
+        chart_data_weekly['hatch_egg_pct'].append(round(ws['hatch_egg_pct'], 2) if ws.get('hatch_egg_pct') is not None else None)
+        chart_data_weekly['std_hatching_egg_pct'].append(round(ws['std_hatching_egg_pct'], 2) if ws.get('std_hatching_egg_pct') is not None else None)
+
+        chart_data_weekly['cull_eggs_jumbo_pct'].append(round(ws['cull_eggs_jumbo_pct'], 2))
+        chart_data_weekly['cull_eggs_small_pct'].append(round(ws['cull_eggs_small_pct'], 2))
+        chart_data_weekly['cull_eggs_crack_pct'].append(round(ws['cull_eggs_crack_pct'], 2))
+        chart_data_weekly['cull_eggs_abnormal_pct'].append(round(ws['cull_eggs_abnormal_pct'], 2))
+
+        # Standard BW - Use Biological Age (w)
+        std_bio = std_map.get(w)
+        chart_data_weekly['bw_male_std'].append(std_bio.std_bw_male if std_bio and std_bio.std_bw_male is not None and std_bio.std_bw_male > 0 else None)
+        chart_data_weekly['bw_female_std'].append(std_bio.std_bw_female if std_bio and std_bio.std_bw_female is not None and std_bio.std_bw_female > 0 else None)
+
+        chart_data_weekly['unif_male'].append(scale_pct(ws['uniformity_male']) if ws['uniformity_male'] is not None and ws['uniformity_male'] > 0 else None)
+        chart_data_weekly['unif_female'].append(scale_pct(ws['uniformity_female']) if ws['uniformity_female'] is not None and ws['uniformity_female'] > 0 else None)
+
+        chart_data_weekly['water_per_bird'].append(round(ws['water_per_bird'], 1) if ws.get('water_per_bird', 0) >= 0 else None)
+        chart_data_weekly['water_feed_ratio'].append(round(ws.get('water_feed_ratio'), 2) if ws.get('water_feed_ratio') is not None and ws.get('water_feed_ratio') >= 0 else None)
+
+        chart_data_weekly['feed_male_gp_bird'].append(round(ws['feed_male_gp_bird'], 1))
+        chart_data_weekly['feed_female_gp_bird_majority'].append(round(ws.get('feed_female_gp_bird_majority', 0.0), 1))
+        chart_data_weekly['feed_female_gp_bird'].append(round(ws['feed_female_gp_bird'], 1))
+
+        # Aggregate Partitions for Weekly View
+        p_maps = [(d['log'], {pw.partition_name: pw.body_weight for pw in d['log'].partition_weights}) for d in week_days]
+        for i in range(1, 9):
+            m_vals = []
+            f_vals = []
+            for log, p_map in p_maps:
+                vm = _partition_value(log, p_map, f'M{i}', i, True)
+                if vm and vm > 0: m_vals.append(vm)
+                vf = _partition_value(log, p_map, f'F{i}', i, False)
+                if vf and vf > 0: f_vals.append(vf)
+
+            chart_data_weekly[f'bw_M{i}'].append(round(sum(m_vals)/len(m_vals)) if m_vals else None)
+            chart_data_weekly[f'bw_F{i}'].append(round(sum(f_vals)/len(f_vals)) if f_vals else None)
+
+        # Aggregate Weekly Notes/Photos
+        week_notes = []
+        week_photos = []
+        w_start = week_days[0]['date']
+        w_end = last_day['date']
+
+        for d in week_days:
+            log = d['log']
+            if log.clinical_notes:
+                week_notes.append(f"{log.date.strftime('%d/%m')}: {log.clinical_notes}")
+            for p in log.photos:
+                week_photos.append(_photo(p, f"{log.date.strftime('%d/%m')} {p.original_filename or 'Photo'}"))
+
+        w_meds = {m.drug_name for m in medications if m.start_date <= w_end and (m.end_date is None or m.end_date >= w_start)}
+        if w_meds: week_notes.append("Meds: " + ", ".join(w_meds))
+
+        w_vacs = {v.vaccine_name for v in vacs if v.actual_date and w_start <= v.actual_date <= w_end}
+        if w_vacs: week_notes.append("Vac: " + ", ".join(w_vacs))
+
+        if week_notes or week_photos:
+            chart_data_weekly['notes'].append({
+                'note': " | ".join(week_notes),
+                'photos': week_photos
+            })
+        else:
+            chart_data_weekly['notes'].append(None)
+
+    # Legacy keys for weekly
+    chart_data_weekly['bw_male_p1'] = chart_data_weekly['bw_M1']
+    chart_data_weekly['bw_male_p2'] = chart_data_weekly['bw_M2']
+    chart_data_weekly['bw_female_p1'] = chart_data_weekly['bw_F1']
+    chart_data_weekly['bw_female_p2'] = chart_data_weekly['bw_F2']
+    chart_data_weekly['bw_female_p3'] = chart_data_weekly['bw_F3']
+    chart_data_weekly['bw_female_p4'] = chart_data_weekly['bw_F4']
+
+    return chart_data_weekly
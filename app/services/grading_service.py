@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+
+# Bin widths offered for the selection report, in grams
+GRADING_BIN_WIDTHS = (50, 100, 200)
+DEFAULT_BIN_WIDTH = 100
+
+# Birds within ±10% of the average count towards uniformity
+UNIFORMITY_BAND = 0.10
+
+GRADING_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def to_weights(values):
+    """Bird weights as a float array, blanks, NaN and non-positive readings dropped."""
+    weights = np.asarray(values, dtype=float).ravel()
+    return weights[np.isfinite(weights) & (weights > 0)]
+
+
+def grading_bins(weights, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    {bin: birds} with each bird in the bin nearest its weight, every bin from the floor
+    of the lightest to the ceiling of the heaviest bird listed in order, empty ones as 0.
+    """
+    lo = int(np.floor(weights.min() / bin_width))
+    hi = int(np.ceil(weights.max() / bin_width))
+    counts = np.bincount(np.rint(weights / bin_width).astype(np.int64) - lo, minlength=hi - lo + 1)
+    return {str((lo + i) * bin_width): int(n) for i, n in enumerate(counts)}
+
+
+def grading_stats(values, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    Grading report of one pen or sex: count, average, ±10% uniformity, CV%, range,
+    percentile bands and the weight distribution in bin_width grams.
+    Bins and percentiles come back as JSON text, ready for FlockGrading. None without weights.
+    """
+    weights = to_weights(values)
+    count = weights.size
+    if not count:
+        return None
+
+    avg_weight = float(weights.mean())
+    in_range = np.count_nonzero((weights >= avg_weight * (1 - UNIFORMITY_BAND)) & (weights <= avg_weight * (1 + UNIFORMITY_BAND)))
+    cv = float(weights.std(ddof=1) / avg_weight * 100) if count > 1 else 0.0
+    bands = np.percentile(weights, GRADING_PERCENTILES)
+
+    return {
+        'count': int(count),
+        'average_weight': round(avg_weight, 2),
+        'uniformity': round(in_range / count * 100, 2),
+        'cv': round(cv, 2),
+        'lowest_weight': float(weights.min()),
+        'highest_weight': float(weights.max()),
+        'percentiles': json.dumps({f'P{p}': round(float(v), 1) for p, v in zip(GRADING_PERCENTILES, bands)}),
+        'bin_width': bin_width,
+        'grading_bins': json.dumps(grading_bins(weights, bin_width))
+    }
+
+
+def grade_groups(weights_by_group, bin_width=DEFAULT_BIN_WIDTH):
+    """{group: weights} (e.g. per sex or pen) to {group: grading_stats}, empty groups left out."""
+    results = {}
+    for group, values in weights_by_group.items():
+        stats = grading_stats(values, bin_width)
+        if stats:
+            results[group] = stats
+    return results
+
+
+def apply_grading(grading, stats):
+    """Copies grading_stats output onto a FlockGrading row."""
+    for key, value in stats.items():
+        setattr(grading, key, value)
+    return grading
@@ -0,0 +1,106 @@
+import threading
+from datetime import date
+
+from sqlalchemy import and_, case, func, or_, select
+
+from metrics import calculate_bio_week
+from app.database import db
+from app.models.models import Flock, Hatchability, Standard
+from app.services.flock_archive_service import flocks_stamp
+
+_lock = threading.Lock()
+_cached = {'key': None, 'value': None}
+
+
+def _active_production():
+    return and_(Flock.status == 'Active', Flock.phase == 'Production')
+
+
+def get_hatchery_analytics(today=None):
+    """
+    Last hatch, next hatch forecast and month-to-date hatchability, built by
+    build_hatchery_analytics and cached until the next hatch record, flock or standard change.
+    Returns {'last_hatch', 'next_hatch', 'month'}; treat it as read-only.
+    """
+    today = today or date.today()
+    key = (today,) + flocks_stamp()
+    with _lock:
+        if _cached['key'] == key:
+            return _cached['value']
+
+    value = build_hatchery_analytics(today)
+    with _lock:
+        _cached['key'] = key
+        _cached['value'] = value
+    return value
+
+
+def build_hatchery_analytics(today):
+    """
+    One statement groups the hatch records of the last hatch date and of the current
+    month by hatching date and flock, with the flock's intake date and whether it is an
+    active production flock. Last and next hatch only count active production flocks,
+    the month covers every flock.
+    """
+    month_start = date(today.year, today.month, 1)
+    active = _active_production()
+
+    last_date = select(func.max(Hatchability.hatching_date)).join(Flock).where(
+        Hatchability.hatching_date <= today,
+        Hatchability.hatched_chicks > 0,
+        active
+    ).scalar_subquery()
+
+    # Next hatch candidates fall on or after today, so inside the month window
+    groups = db.session.execute(
+        select(
+            Hatchability.hatching_date,
+            Flock.intake_date,
+            case((active, 1), else_=0),
+            func.coalesce(func.sum(Hatchability.hatched_chicks), 0),
+            func.coalesce(func.sum(Hatchability.egg_set), 0),
+            func.coalesce(func.max(Hatchability.egg_set), 0)
+        ).join(Flock).where(
+            or_(Hatchability.hatching_date == last_date, Hatchability.hatching_date >= month_start)
+        ).group_by(Hatchability.hatching_date, Flock.id)
+    ).all()
+
+    last_hatch_date = max((g[0] for g in groups if g[2] and g[0] <= today and g[3] > 0), default=None)
+
+    last_hatch = None
+    if last_hatch_date:
+        total_h = sum(g[3] for g in groups if g[2] and g[0] == last_hatch_date)
+        total_s = sum(g[4] for g in groups if g[2] and g[0] == last_hatch_date)
+        last_hatch = {
+            'date': last_hatch_date,
+            'total_hatched': total_h,
+            'hatch_pct': (total_h / total_s * 100) if total_s > 0 else 0.0
+        }
+
+    # Min date >= today (or > today if today was processed as Previous)
+    after_today = last_hatch_date == today
+    next_hatch_date = min((g[0] for g in groups if g[2] and g[5] > 0 and (g[0] > today if after_today else g[0] >= today)),
+                          default=None)
+
+    next_hatch = None
+    if next_hatch_date:
+        std_map = {week: std for week, std in db.session.query(Standard.week, Standard.std_hatchability)}
+        total_forecast = 0
+        for g in groups:
+            if g[2] and g[0] == next_hatch_date:
+                std_hatch = std_map.get(calculate_bio_week(g[1], next_hatch_date)) or 0.0
+                total_forecast += g[4] * (std_hatch / 100.0)
+        next_hatch = {
+            'date': next_hatch_date,
+            'forecast': int(total_forecast)
+        }
+
+    month_hatched = sum(g[3] for g in groups if g[0] >= month_start)
+    month_set = sum(g[4] for g in groups if g[0] >= month_start)
+    month = {
+        'total_hatched': month_hatched,
+        'total_set': month_set,
+        'hatch_pct': (month_hatched / month_set * 100) if month_set > 0 else 0.0
+    }
+
+    return {'last_hatch': last_hatch, 'next_hatch': next_hatch, 'month': month}
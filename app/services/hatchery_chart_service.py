@@ -0,0 +1,112 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from metrics import calculate_bio_week
+from app.database import db
+from app.models.models import DailyLog, Hatchability, Standard, Medication
+from app.services.flock_archive_service import FlockCache
+
+HATCHERY_CHART_CACHE_SIZE = 64
+
+_charts = FlockCache(HATCHERY_CHART_CACHE_SIZE)
+
+
+def get_hatchery_chart(flock):
+    """Weekly hatchery chart series of a flock, built by build_hatchery_chart and cached per flock.data_version."""
+    return _charts.get(flock, lambda: build_hatchery_chart(flock))
+
+
+def week_bounds(intake_date, week):
+    """First and last day of a bio week; week 0 is the intake day, negative weeks fall before intake."""
+    if week == 0:
+        return intake_date, intake_date
+    if week > 0:
+        return intake_date + timedelta(days=((week - 1) * 7) + 1), intake_date + timedelta(days=(week * 7))
+    return intake_date + timedelta(days=(week * 7)), intake_date + timedelta(days=((week + 1) * 7) - 1)
+
+
+class _NoteSweep(object):
+    """Clinical notes and medications of one flock, looked up per date range with bisect."""
+
+    def __init__(self, logs, meds):
+        self.logs = logs
+        self.log_dates = [l.date for l in logs]
+        self.meds = sorted(meds, key=lambda m: (m.start_date, m.id))
+        self.med_starts = [m.start_date for m in self.meds]
+
+    def notes(self, start_date, end_date):
+        logs = self.logs[bisect_left(self.log_dates, start_date):bisect_right(self.log_dates, end_date)]
+        # Only medications started by the end of the range can overlap it
+        meds = [m for m in self.meds[:bisect_right(self.med_starts, end_date)]
+                if m.end_date is None or m.end_date >= start_date]
+
+        notes_parts = []
+        if logs:
+            notes_str = "; ".join([f"{l.date.strftime('%d/%m')}: {l.clinical_notes}" for l in logs])
+            notes_parts.append(f"Notes: {notes_str}")
+        if meds:
+            meds_str = ", ".join([m.drug_name for m in meds]) # Just names to save space
+            notes_parts.append(f"Meds: {meds_str}")
+        return " | ".join(notes_parts) if notes_parts else None
+
+
+def build_hatchery_chart(flock):
+    """
+    Fertile, clear, rotten, hatch and male ratio % per setting week against the standard
+    hatchability, with each week's clinical notes and medications. Notes and medications
+    are read once for the flock and assigned to weeks in memory.
+    """
+    records = Hatchability.query.filter_by(flock_id=flock.id).order_by(Hatchability.setting_date.asc()).all()
+    std_map = {week: (std or 0.0) for week, std in db.session.query(Standard.week, Standard.std_hatchability)}
+
+    data = {
+        'weeks': [],
+        'fertile_pct': [],
+        'clear_pct': [],
+        'rotten_pct': [],
+        'hatch_pct': [],
+        'std_hatch_pct': [],
+        'male_ratio_pct': [],
+        'notes': []
+    }
+
+    # Aggregate by week
+    weekly_agg = {}
+    for r in records:
+        week = calculate_bio_week(flock.intake_date, r.setting_date)
+        agg = weekly_agg.setdefault(week, {'egg_set': 0, 'clear_eggs': 0, 'rotten_eggs': 0, 'hatched_chicks': 0, 'male_ratios': []})
+        agg['egg_set'] += (r.egg_set or 0)
+        agg['clear_eggs'] += (r.clear_eggs or 0)
+        agg['rotten_eggs'] += (r.rotten_eggs or 0)
+        agg['hatched_chicks'] += (r.hatched_chicks or 0)
+        if r.male_ratio_pct is not None:
+            agg['male_ratios'].append(r.male_ratio_pct)
+
+    if not weekly_agg:
+        return data
+
+    logs = DailyLog.query.filter(
+        DailyLog.flock_id == flock.id,
+        DailyLog.clinical_notes != None,
+        DailyLog.clinical_notes != ''
+    ).order_by(DailyLog.date.asc(), DailyLog.id.asc()).all()
+    meds = Medication.query.filter_by(flock_id=flock.id).order_by(Medication.id.asc()).all()
+    sweep = _NoteSweep(logs, meds)
+
+    for week in sorted(weekly_agg):
+        agg = weekly_agg[week]
+
+        data['std_hatch_pct'].append(round(std_map.get(week, 0.0), 2))
+        data['weeks'].append(f"Week {week}")
+
+        e_set = agg['egg_set'] or 1
+        avg_male = sum(agg['male_ratios']) / len(agg['male_ratios']) if agg['male_ratios'] else 0
+
+        data['clear_pct'].append(round((agg['clear_eggs'] / e_set) * 100, 2))
+        data['rotten_pct'].append(round((agg['rotten_eggs'] / e_set) * 100, 2))
+        data['fertile_pct'].append(round(((agg['egg_set'] - agg['clear_eggs'] - agg['rotten_eggs']) / e_set) * 100, 2))
+        data['hatch_pct'].append(round((agg['hatched_chicks'] / e_set) * 100, 2))
+        data['male_ratio_pct'].append(round(avg_male, 2))
+        data['notes'].append(sweep.notes(*week_bounds(flock.intake_date, week)))
+
+    return data
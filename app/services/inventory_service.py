@@ -0,0 +1,245 @@
+from sqlalchemy import event, func, inspect, and_, case
+from sqlalchemy.orm import Session
+
+from app.database import db
+from app.models.models import InventoryItem, InventoryTransaction, InventoryBalanceSnapshot
+
+# Ledger movement types that count as stock coming in / going out.
+# Farm uses Purchase/Usage/Waste, Hatchery uses In/Out.
+LEDGER_IN_TYPES = ('Purchase', 'In')
+LEDGER_OUT_TYPES = ('Usage', 'Waste', 'Out')
+
+# Farm movements reported as consumption (usage + waste), without hatchery stock going out
+USAGE_TYPES = ('Usage', 'Waste')
+
+_TX_KEY_ATTRS = ('inventory_item_id', 'location', 'transaction_date', 'transaction_type', 'classification', 'quantity')
+
+
+def _snapshot_key(item_id, location, tx_date, tx_type, classification):
+    return (item_id, location or 'Farm', tx_date.year, tx_date.month, tx_type, classification or '')
+
+
+def _tx_values(tx, committed=False):
+    """Current (or pre-flush committed) ledger attributes of a transaction."""
+    state = inspect(tx)
+    values = {}
+    for attr in _TX_KEY_ATTRS:
+        if committed:
+            hist = state.attrs[attr].history
+            if hist.deleted:
+                values[attr] = hist.deleted[0]
+                continue
+        values[attr] = getattr(tx, attr)
+    return values
+
+
+def _add_delta(deltas, values, sign):
+    if values['inventory_item_id'] is None or values['transaction_date'] is None or not values['transaction_type']:
+        return
+    # Form handlers sometimes pass the item id straight from request.form
+    key = _snapshot_key(int(values['inventory_item_id']), values['location'], values['transaction_date'], values['transaction_type'],
+                        values['classification'])
+    qty, count = deltas.get(key, (0.0, 0))
+    deltas[key] = (qty + sign * (values['quantity'] or 0.0), count + sign)
+
+
+def _collect_deltas(session):
+    deltas = {}
+    deleted_items = {o.id for o in session.deleted if isinstance(o, InventoryItem)}
+
+    for obj in session.new:
+        if isinstance(obj, InventoryTransaction):
+            _add_delta(deltas, _tx_values(obj), 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, InventoryTransaction):
+            _add_delta(deltas, _tx_values(obj, committed=True), -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, InventoryTransaction) and session.is_modified(obj, include_collections=False):
+            old = _tx_values(obj, committed=True)
+            new = _tx_values(obj)
+            if old != new:
+                _add_delta(deltas, old, -1)
+                _add_delta(deltas, new, 1)
+
+    return {k: v for k, v in deltas.items() if k[0] not in deleted_items and (v[0] != 0 or v[1] != 0)}
+
+
+def _apply_deltas(connection, deltas):
+    table = InventoryBalanceSnapshot.__table__
+    for (item_id, location, year, month, tx_type, classification), (qty, count) in deltas.items():
+        where = and_(
+            table.c.inventory_item_id == item_id,
+            table.c.location == location,
+            table.c.period_year == year,
+            table.c.period_month == month,
+            table.c.transaction_type == tx_type,
+            table.c.classification == classification
+        )
+        result = connection.execute(
+            table.update().where(where).values(quantity=table.c.quantity + qty, tx_count=table.c.tx_count + count)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                inventory_item_id=item_id, location=location, period_year=year, period_month=month,
+                transaction_type=tx_type, classification=classification, quantity=qty, tx_count=count
+            ))
+
+
+def _before_flush(session, flush_context, instances):
+    # Snapshots reference the item, so they have to go before the item row does
+    item_ids = [o.id for o in session.deleted if isinstance(o, InventoryItem) and o.id is not None]
+    if item_ids:
+        table = InventoryBalanceSnapshot.__table__
+        session.connection().execute(table.delete().where(table.c.inventory_item_id.in_(item_ids)))
+
+
+def _after_flush(session, flush_context):
+    # new/dirty/deleted and attribute history still reflect the pre-flush state here,
+    # and new transactions now have their foreign keys populated.
+    deltas = _collect_deltas(session)
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+
+def _track_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_ledger_events():
+    """Keep InventoryBalanceSnapshot in step with every InventoryTransaction insert/update/delete."""
+    # active_history loads the previous value even when the attribute was expired by a commit,
+    # so an edit can be taken out of the old snapshot bucket
+    for attr in _TX_KEY_ATTRS:
+        col = getattr(InventoryTransaction, attr)
+        if not event.contains(col, 'set', _track_old_value):
+            event.listen(col, 'set', _track_old_value, active_history=True, retval=True)
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+
+
+def _month_index(year, month):
+    return year * 12 + month
+
+
+def get_usage_by_month(months, item_ids=None, types=LEDGER_OUT_TYPES):
+    """
+    months: list of (year, month) tuples.
+    Returns {item_id: {(year, month): quantity}} of the given movement types (every
+    outgoing type by default) from the snapshots.
+    """
+    if not months:
+        return {}
+    q = db.session.query(
+        InventoryBalanceSnapshot.inventory_item_id,
+        InventoryBalanceSnapshot.period_year,
+        InventoryBalanceSnapshot.period_month,
+        func.sum(InventoryBalanceSnapshot.quantity)
+    ).filter(
+        InventoryBalanceSnapshot.transaction_type.in_(types),
+        (InventoryBalanceSnapshot.period_year * 12 + InventoryBalanceSnapshot.period_month).in_([_month_index(y, m) for y, m in months])
+    )
+    if item_ids is not None:
+        q = q.filter(InventoryBalanceSnapshot.inventory_item_id.in_(item_ids))
+
+    usage = {}
+    for item_id, year, month, qty in q.group_by(
+        InventoryBalanceSnapshot.inventory_item_id,
+        InventoryBalanceSnapshot.period_year,
+        InventoryBalanceSnapshot.period_month
+    ).all():
+        usage.setdefault(item_id, {})[(year, month)] = qty or 0.0
+    return usage
+
+
+def get_month_summary(year, month, location=None, classified=False):
+    """
+    Returns {item_id: {transaction_type.lower(): quantity}} for one month, only for items
+    that moved in it. With classified, a movement's classification (e.g. the hatchery's
+    Purchase / Usage / Transfer) is used in place of its type when it has one.
+    """
+    key = InventoryBalanceSnapshot.transaction_type
+    if classified:
+        key = case((InventoryBalanceSnapshot.classification != '', InventoryBalanceSnapshot.classification), else_=key)
+    q = db.session.query(
+        InventoryBalanceSnapshot.inventory_item_id,
+        key,
+        func.sum(InventoryBalanceSnapshot.quantity)
+    ).filter(
+        InventoryBalanceSnapshot.period_year == year,
+        InventoryBalanceSnapshot.period_month == month,
+        InventoryBalanceSnapshot.tx_count > 0
+    )
+    if location:
+        q = q.filter(InventoryBalanceSnapshot.location == location)
+
+    summary = {}
+    for item_id, tx_type, qty in q.group_by(InventoryBalanceSnapshot.inventory_item_id, key).all():
+        summary.setdefault(item_id, {})[tx_type.lower()] = qty or 0.0
+    return summary
+
+
+def get_item_balance(item_id, location=None):
+    """Net ledger balance (in - out) for an item, optionally at one location."""
+    signed = func.sum(
+        case(
+            (InventoryBalanceSnapshot.transaction_type.in_(LEDGER_IN_TYPES), InventoryBalanceSnapshot.quantity),
+            (InventoryBalanceSnapshot.transaction_type.in_(LEDGER_OUT_TYPES), -InventoryBalanceSnapshot.quantity),
+            else_=0.0
+        )
+    )
+    q = db.session.query(signed).filter(InventoryBalanceSnapshot.inventory_item_id == item_id)
+    if location:
+        q = q.filter(InventoryBalanceSnapshot.location == location)
+    return float(q.scalar() or 0.0)
+
+
+def _ledger_totals():
+    """Raw ledger grouped the same way as the snapshots, straight from InventoryTransaction."""
+    location = func.coalesce(InventoryTransaction.location, 'Farm')
+    year = func.extract('year', InventoryTransaction.transaction_date)
+    month = func.extract('month', InventoryTransaction.transaction_date)
+    classification = func.coalesce(InventoryTransaction.classification, '')
+    rows = db.session.query(
+        InventoryTransaction.inventory_item_id, location, year, month,
+        InventoryTransaction.transaction_type, classification,
+        func.sum(InventoryTransaction.quantity), func.count(InventoryTransaction.id)
+    ).group_by(InventoryTransaction.inventory_item_id, location, year, month, InventoryTransaction.transaction_type, classification).all()
+    return {(r[0], r[1], int(r[2]), int(r[3]), r[4], r[5]): (r[6] or 0.0, r[7]) for r in rows}
+
+
+def reconcile_snapshots(fix=False, tolerance=1e-6):
+    """
+    Compares every snapshot against the raw ledger.
+    Returns a list of (key, snapshot (qty, count), ledger (qty, count)) mismatches.
+    With fix=True the snapshots are rebuilt from the ledger and committed.
+    """
+    ledger = _ledger_totals()
+    snapshots = {
+        (s.inventory_item_id, s.location, s.period_year, s.period_month, s.transaction_type, s.classification): (s.quantity, s.tx_count)
+        for s in InventoryBalanceSnapshot.query.all()
+    }
+
+    mismatches = []
+    for key in set(ledger) | set(snapshots):
+        snap = snapshots.get(key, (0.0, 0))
+        real = ledger.get(key, (0.0, 0))
+        if abs((snap[0] or 0.0) - real[0]) > tolerance or snap[1] != real[1]:
+            mismatches.append((key, snap, real))
+
+    if fix and mismatches:
+        table = InventoryBalanceSnapshot.__table__
+        conn = db.session.connection()
+        conn.execute(table.delete())
+        if ledger:
+            conn.execute(table.insert(), [
+                {'inventory_item_id': k[0], 'location': k[1], 'period_year': k[2], 'period_month': k[3],
+                 'transaction_type': k[4], 'classification': k[5], 'quantity': v[0], 'tx_count': v[1]}
+                for k, v in ledger.items()
+            ])
+        db.session.commit()
+
+    return sorted(mismatches, key=lambda m: m[0])
@@ -0,0 +1,130 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+from itertools import accumulate
+
+from app.database import db
+from app.models.models import DailyLog, Hatchability
+
+# Collection windows longer than this are flagged, the average may hide a stock change
+LARGE_WINDOW_DAYS = 10
+
+
+def ratio_window(setting_date, last_setting_date=None):
+    """
+    (start, end, large_window) of the days whose eggs go into a setting. Tuesday settings
+    take Fri-Mon, Friday settings Tue-Thu, any other day everything since the previous
+    setting (or the past week for a flock's first setting).
+    """
+    weekday = setting_date.weekday() # Mon=0, Tue=1 ... Fri=4
+    end_date = setting_date - timedelta(days=1)
+
+    if weekday == 1:
+        start_date = setting_date - timedelta(days=4)
+    elif weekday == 4:
+        start_date = setting_date - timedelta(days=3)
+    elif last_setting_date:
+        start_date = last_setting_date
+    else:
+        start_date = setting_date - timedelta(days=7)
+
+    return start_date, end_date, (end_date - start_date).days + 1 > LARGE_WINDOW_DAYS
+
+
+def production_stock(flock, logs):
+    """
+    (date, male, female) production stock at the start of each log's day, from all the flock's
+    logs sorted by date. The stock restarts from the flock's production start counts on the
+    first day with eggs (Flock.production_start_date, read from these logs).
+    """
+    curr_m_prod = flock.intake_male or 0
+    curr_f_prod = flock.intake_female or 0
+    prod_start_date = next((log.date for log in logs if (log.eggs_collected or 0) > 0), None)
+    in_prod = False
+
+    for log in logs:
+        if not in_prod and prod_start_date and log.date >= prod_start_date:
+            in_prod = True
+            if (flock.prod_start_male or 0) > 0 or (flock.prod_start_female or 0) > 0:
+                curr_m_prod = flock.prod_start_male or 0
+                curr_f_prod = flock.prod_start_female or 0
+
+        yield log.date, curr_m_prod, curr_f_prod
+
+        curr_m_prod += (- (log.mortality_male or 0) - (log.culls_male or 0)
+                        - (log.males_moved_to_hosp or 0) + (log.males_moved_to_prod or 0)
+                        + (getattr(log, 'males_in_flock', 0) or 0) - (getattr(log, 'males_out_flock', 0) or 0))
+        curr_f_prod += (- (log.mortality_female or 0) - (log.culls_female or 0)
+                        - (log.females_moved_to_hosp or 0) + (log.females_moved_to_prod or 0)
+                        + (getattr(log, 'females_in_flock', 0) or 0) - (getattr(log, 'females_out_flock', 0) or 0))
+        curr_m_prod = max(curr_m_prod, 0)
+        curr_f_prod = max(curr_f_prod, 0)
+
+
+class MaleRatioSeries(object):
+    """
+    Daily production male:female ratio (%) of one flock as prefix sums, so the average
+    over any date window costs two bisects. Days without production females are left out.
+    """
+
+    def __init__(self, flock, logs):
+        self.dates = []
+        ratios = []
+        counted = []
+        for day, males, females in production_stock(flock, logs):
+            self.dates.append(day)
+            ratios.append((males / females) * 100 if females > 0 else 0.0)
+            counted.append(1 if females > 0 else 0)
+        self._sums = [0.0] + list(accumulate(ratios))
+        self._counts = [0] + list(accumulate(counted))
+
+    def average(self, start_date, end_date):
+        lo = bisect_left(self.dates, start_date)
+        hi = bisect_right(self.dates, end_date)
+        days = self._counts[hi] - self._counts[lo]
+        if not days:
+            return None
+        return (self._sums[hi] - self._sums[lo]) / days
+
+
+class FlockMaleRatios(object):
+    """
+    Male ratios for any number of settings of one flock: the stock series is built once
+    and the flock's setting dates are kept sorted to find each setting's predecessor.
+    """
+
+    def __init__(self, flock, logs=None, setting_dates=None):
+        if logs is None:
+            logs = DailyLog.query.filter_by(flock_id=flock.id).order_by(DailyLog.date).all()
+        if setting_dates is None:
+            setting_dates = [d for (d,) in db.session.query(Hatchability.setting_date).filter_by(flock_id=flock.id)]
+        self.series = MaleRatioSeries(flock, sorted(logs, key=lambda l: l.date))
+        self.setting_dates = sorted(set(setting_dates))
+
+    def add_setting(self, setting_date):
+        i = bisect_left(self.setting_dates, setting_date)
+        if i == len(self.setting_dates) or self.setting_dates[i] != setting_date:
+            insort(self.setting_dates, setting_date)
+
+    def ratio(self, setting_date):
+        """(average male ratio % or None, large_window) for a setting on setting_date."""
+        i = bisect_left(self.setting_dates, setting_date)
+        last_setting_date = self.setting_dates[i - 1] if i else None
+        start_date, end_date, large_window = ratio_window(setting_date, last_setting_date)
+        return self.series.average(start_date, end_date), large_window
+
+
+def male_ratios_for_flocks(flocks):
+    """{flock.id: FlockMaleRatios} for many flocks from one DailyLog and one Hatchability query."""
+    flock_ids = [f.id for f in flocks]
+    if not flock_ids:
+        return {}
+
+    logs_by_flock = {f_id: [] for f_id in flock_ids}
+    for log in DailyLog.query.filter(DailyLog.flock_id.in_(flock_ids)).order_by(DailyLog.flock_id, DailyLog.date):
+        logs_by_flock[log.flock_id].append(log)
+
+    settings_by_flock = {f_id: [] for f_id in flock_ids}
+    for f_id, setting_date in db.session.query(Hatchability.flock_id, Hatchability.setting_date).filter(Hatchability.flock_id.in_(flock_ids)):
+        settings_by_flock[f_id].append(setting_date)
+
+    return {f.id: FlockMaleRatios(f, logs_by_flock[f.id], settings_by_flock[f.id]) for f in flocks}
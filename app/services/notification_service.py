@@ -0,0 +1,293 @@
+import os
+import json
+import uuid
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app as app
+from pywebpush import webpush, WebPushException
+from requests.exceptions import RequestException
+from sqlalchemy import event, insert, or_, and_
+from sqlalchemy.orm import Session
+
+from app.database import db
+from app.models.models import NotificationHistory, PushOutbox, PushSubscription
+
+# Defaults, each can be overridden through app.config
+PUSH_BATCH_SIZE = 100
+PUSH_MAX_WORKERS = 8
+PUSH_MAX_ATTEMPTS = 5
+PUSH_RETRY_BASE_SECONDS = 30
+PUSH_POLL_SECONDS = 15
+PUSH_CLAIM_TIMEOUT_SECONDS = 600
+PUSH_RETENTION_DAYS = 30
+PUSH_PRUNE_INTERVAL_SECONDS = 3600
+
+# Push services answer these when the subscription no longer exists
+_GONE_STATUS = (403, 404, 410)
+
+_PENDING_KEY = 'push_outbox_pending'
+
+_prune_lock = threading.Lock()
+_last_prune = {'at': None}
+
+
+def _config(name, default):
+    return app.config.get(name, default)
+
+
+def queue_push_alert(user_ids, title, body, url=None, record_history=True):
+    """
+    Adds the alert to NotificationHistory and the push outbox for every user in one batch.
+    Nothing is sent here: the rows commit with the caller's transaction and the
+    background dispatcher delivers them afterwards.
+    Returns the number of queued messages.
+    """
+    user_ids = list(dict.fromkeys(int(uid) for uid in user_ids))
+    if not user_ids:
+        return 0
+
+    now = datetime.utcnow()
+    if record_history:
+        db.session.execute(insert(NotificationHistory), [
+            {'user_id': uid, 'title': title, 'body': body, 'url': url, 'created_at': now, 'is_read': False}
+            for uid in user_ids
+        ])
+    db.session.execute(insert(PushOutbox), [
+        {'user_id': uid, 'title': title, 'body': body, 'url': url, 'status': 'pending',
+         'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+        for uid in user_ids
+    ])
+    db.session.info[_PENDING_KEY] = True
+    return len(user_ids)
+
+
+def deliver_push(subscription_json, payload, vapid_private_key, vapid_claim_email):
+    """
+    One webpush call. Touches no database state so it can run on a worker thread.
+    Returns (outcome, error) where outcome is 'sent', 'gone', 'retry' or 'error'.
+    """
+    try:
+        webpush(
+            subscription_info=json.loads(subscription_json),
+            data=payload,
+            vapid_private_key=vapid_private_key,
+            vapid_claims={"sub": vapid_claim_email}
+        )
+        return 'sent', None
+    except WebPushException as ex:
+        status = ex.response.status_code if getattr(ex, 'response', None) is not None else None
+        ex_str = str(ex)
+        if status in _GONE_STATUS or (status is None and any(str(code) in ex_str for code in _GONE_STATUS)):
+            return 'gone', ex_str
+        if status is None or status >= 500 or status == 429:
+            return 'retry', ex_str
+        return 'error', ex_str
+    except RequestException as e:
+        return 'retry', str(e)
+    except Exception as e:
+        return 'error', str(e)
+
+
+def _claim_batch(batch_size):
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=_config('PUSH_CLAIM_TIMEOUT_SECONDS', PUSH_CLAIM_TIMEOUT_SECONDS))
+    # 'sending' rows older than the claim timeout belong to a worker that died mid-batch
+    due = or_(
+        and_(PushOutbox.status == 'pending', PushOutbox.next_attempt_at <= now),
+        and_(PushOutbox.status == 'sending', PushOutbox.claimed_at < stale)
+    )
+    ids = [r[0] for r in db.session.query(PushOutbox.id).filter(due).order_by(PushOutbox.next_attempt_at, PushOutbox.id).limit(batch_size).all()]
+    if not ids:
+        return []
+
+    token = str(uuid.uuid4())
+    # Re-checking the due condition in the UPDATE keeps two dispatchers from claiming the same row
+    db.session.query(PushOutbox).filter(PushOutbox.id.in_(ids), due).update(
+        {'status': 'sending', 'claim_token': token, 'claimed_at': now}, synchronize_session=False
+    )
+    db.session.commit()
+    return PushOutbox.query.filter_by(claim_token=token).all()
+
+
+def _finish(item, outcomes, now, max_attempts, retry_base):
+    results = [o for o, _ in outcomes]
+    errors = [e for _, e in outcomes if e]
+    item.claim_token = None
+    item.claimed_at = None
+
+    if 'sent' in results:
+        item.status = 'sent'
+        item.sent_at = now
+        item.last_error = None
+        return 'sent'
+
+    item.attempts = (item.attempts or 0) + 1
+    item.last_error = errors[-1] if errors else 'No push subscriptions'
+    if 'retry' in results and item.attempts < max_attempts:
+        item.status = 'pending'
+        item.next_attempt_at = now + timedelta(seconds=retry_base * (2 ** (item.attempts - 1)))
+        return 'retry'
+
+    item.status = 'failed'
+    return 'failed'
+
+
+def process_outbox(batch_size=None):
+    """
+    Claims one batch of due outbox rows and fans the pushes out over a bounded thread pool.
+    Expired subscriptions are removed; transient failures are retried with exponential backoff.
+    Returns {'claimed', 'sent', 'retry', 'failed'} counts.
+    """
+    stats = {'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0}
+    items = _claim_batch(batch_size or _config('PUSH_BATCH_SIZE', PUSH_BATCH_SIZE))
+    if not items:
+        return stats
+    stats['claimed'] = len(items)
+
+    now = datetime.utcnow()
+    max_attempts = _config('PUSH_MAX_ATTEMPTS', PUSH_MAX_ATTEMPTS)
+    retry_base = _config('PUSH_RETRY_BASE_SECONDS', PUSH_RETRY_BASE_SECONDS)
+
+    vapid_private_key = os.getenv('VAPID_PRIVATE_KEY')
+    vapid_claim_email = os.getenv('VAPID_CLAIM_EMAIL')
+    if not vapid_private_key or not vapid_claim_email:
+        app.logger.warning("VAPID keys not configured. Cannot send push notification.")
+        for item in items:
+            stats[_finish(item, [('error', 'VAPID keys not configured')], now, max_attempts, retry_base)] += 1
+        db.session.commit()
+        return stats
+
+    subs_by_user = {}
+    for sub in PushSubscription.query.filter(PushSubscription.user_id.in_({i.user_id for i in items})).all():
+        subs_by_user.setdefault(sub.user_id, []).append((sub.id, sub.subscription_json))
+
+    jobs = []
+    for item in items:
+        payload = json.dumps({"title": item.title, "body": item.body, "url": item.url or '/'})
+        for sub_id, sub_json in subs_by_user.get(item.user_id, []):
+            jobs.append((item.id, sub_id, sub_json, payload))
+
+    results = []
+    if jobs:
+        workers = max(1, min(_config('PUSH_MAX_WORKERS', PUSH_MAX_WORKERS), len(jobs)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda job: deliver_push(job[2], job[3], vapid_private_key, vapid_claim_email), jobs))
+
+    outcomes = {item.id: [] for item in items}
+    gone_subs = set()
+    for (item_id, sub_id, _, _), (outcome, error) in zip(jobs, results):
+        outcomes[item_id].append((outcome, error))
+        if outcome == 'gone':
+            gone_subs.add(sub_id)
+        elif outcome in ('retry', 'error'):
+            app.logger.error(f"WebPush Error for outbox {item_id}: {error}")
+
+    for item in items:
+        stats[_finish(item, outcomes[item.id], now, max_attempts, retry_base)] += 1
+
+    if gone_subs:
+        app.logger.debug(f"Cleaning up {len(gone_subs)} invalid push subscriptions.")
+        PushSubscription.query.filter(PushSubscription.id.in_(gone_subs)).delete(synchronize_session=False)
+    db.session.commit()
+    return stats
+
+
+def prune_outbox(retention_days=None):
+    """
+    Deletes sent and permanently failed outbox rows queued more than PUSH_RETENTION_DAYS
+    ago; pending rows are kept whatever their age. Returns the number of rows removed.
+    """
+    if retention_days is None:
+        retention_days = _config('PUSH_RETENTION_DAYS', PUSH_RETENTION_DAYS)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    removed = PushOutbox.query.filter(
+        PushOutbox.status.in_(('sent', 'failed')),
+        PushOutbox.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def _prune_if_due():
+    now = datetime.utcnow()
+    interval = timedelta(seconds=_config('PUSH_PRUNE_INTERVAL_SECONDS', PUSH_PRUNE_INTERVAL_SECONDS))
+    with _prune_lock:
+        if _last_prune['at'] is not None and now - _last_prune['at'] < interval:
+            return
+        _last_prune['at'] = now
+    prune_outbox()
+
+
+def drain_outbox():
+    """
+    Runs process_outbox until no due rows are left, then prunes delivered and failed
+    rows at most once per PUSH_PRUNE_INTERVAL_SECONDS. Returns the totals.
+    """
+    totals = {'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0}
+    while True:
+        stats = process_outbox()
+        if not stats['claimed']:
+            _prune_if_due()
+            return totals
+        for k, v in stats.items():
+            totals[k] += v
+
+
+class PushDispatcher(object):
+    """
+    Daemon thread that drains the outbox whenever a commit queued new alerts,
+    and polls every PUSH_POLL_SECONDS for retries that have come due.
+    The thread starts lazily on the first wake-up so CLI commands, migrations
+    and tests never spawn it.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self, flask_app):
+        if flask_app.config.get('TESTING') or not flask_app.config.get('PUSH_DISPATCHER_ENABLED', True):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.app = flask_app
+                self._thread = threading.Thread(target=self._run, name='push-dispatcher', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait(self.app.config.get('PUSH_POLL_SECONDS', PUSH_POLL_SECONDS))
+            self._event.clear()
+            with self.app.app_context():
+                try:
+                    drain_outbox()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Push dispatcher error: {e}")
+                finally:
+                    db.session.remove()
+
+
+dispatcher = PushDispatcher()
+
+
+def _after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        dispatcher.wake(app._get_current_object())
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_push_events():
+    """Wakes the dispatcher after any commit that queued push alerts."""
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+    if not event.contains(Session, 'after_soft_rollback', _after_rollback):
+        event.listen(Session, 'after_soft_rollback', _after_rollback)
@@ -0,0 +1,224 @@
+import glob
+import hashlib
+import os
+import queue
+import re
+import shutil
+import threading
+
+from flask import current_app as app, url_for
+
+from app.database import db
+from app.models.models import DailyLogPhoto
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional dependency, without it photos are served at full size only
+    Image = None
+    ImageOps = None
+
+# Variant -> longest side in pixels, smallest first
+PHOTO_VARIANTS = {'thumb': 320, 'web': 1280}
+PHOTO_JPEG_QUALITY = 82
+
+# Content-addressed files never change, browsers may keep them for a year
+PHOTO_CACHE_SECONDS = 365 * 24 * 3600
+
+_HASH_LENGTH = 32
+_IMMUTABLE_NAME = re.compile(r'^([0-9a-f]{%d}\.[a-z0-9]+|.+_(%s)\.jpg)$' % (_HASH_LENGTH, '|'.join(PHOTO_VARIANTS)))
+
+
+def content_filename(raw, original_filename):
+    """Name of an upload taken from a hash of its bytes, the same photo uploaded twice maps to one file."""
+    ext = os.path.splitext(original_filename or '')[1].lower()
+    if not re.match(r'^\.[a-z0-9]{1,5}$', ext):
+        ext = '.jpg'
+    return hashlib.sha256(raw).hexdigest()[:_HASH_LENGTH] + ext
+
+
+def is_immutable(filename):
+    """True for content-hash names and their variants, which are never rewritten."""
+    return bool(_IMMUTABLE_NAME.match(filename))
+
+
+def variant_path(path, variant):
+    return f"{os.path.splitext(path)[0]}_{variant}.jpg"
+
+
+def store_photo(file, upload_folder):
+    """
+    Saves an uploaded photo under its content-hash name (once, duplicates reuse the
+    file) and queues its resized variants. Returns the stored path.
+    """
+    raw = file.read()
+    path = os.path.join(upload_folder, content_filename(raw, file.filename))
+    if not os.path.exists(path):
+        with open(path, 'wb') as fh:
+            fh.write(raw)
+    variant_worker.submit(app._get_current_object(), path)
+    return path
+
+
+def build_variants(path):
+    """
+    Writes the JPEG variants of a photo that are missing, each fitted within its
+    PHOTO_VARIANTS size. Returns the variants written; nothing without Pillow or
+    when the file is not a readable image.
+    """
+    if Image is None or not os.path.exists(path):
+        return []
+    missing = [v for v in PHOTO_VARIANTS if not os.path.exists(variant_path(path, v))]
+    if not missing:
+        return []
+
+    try:
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            written = []
+            for variant in missing:
+                size = PHOTO_VARIANTS[variant]
+                resized = img.copy()
+                resized.thumbnail((size, size), Image.LANCZOS)
+                target = variant_path(path, variant)
+                # Written aside and renamed so a reader never sees half a file
+                resized.save(target + '.tmp', 'JPEG', quality=PHOTO_JPEG_QUALITY, optimize=True, progressive=True)
+                os.replace(target + '.tmp', target)
+                written.append(variant)
+            return written
+    except (OSError, ValueError) as e:
+        app.logger.warning(f"Photo variants skipped for {os.path.basename(path)}: {e}")
+        return []
+
+
+class PhotoVariantWorker(object):
+    """
+    Daemon thread that resizes uploaded photos off the request. It starts lazily on
+    the first upload; tests, or PHOTO_VARIANTS_ASYNC = False, resize inline instead.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, flask_app, path):
+        if Image is None:
+            return
+        if flask_app.config.get('TESTING') or not flask_app.config.get('PHOTO_VARIANTS_ASYNC', True):
+            build_variants(path)
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.app = flask_app
+                self._thread = threading.Thread(target=self._run, name='photo-variants', daemon=True)
+                self._thread.start()
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            with self.app.app_context():
+                try:
+                    build_variants(path)
+                except Exception as e:
+                    self.app.logger.error(f"Photo variant worker error: {e}")
+
+
+variant_worker = PhotoVariantWorker()
+
+
+def photo_url(file_path, variant=None):
+    """
+    URL of a photo's variant, or of the original upload without Pillow. The variant
+    URL is stable, so cached pages can name it before the worker has built it.
+    """
+    path = variant_path(file_path, variant) if (variant and Image is not None) else file_path
+    return url_for('uploaded_file', filename=os.path.basename(str(path).replace('\\', '/')))
+
+
+def photo_srcset(file_path):
+    """srcset listing the variants by width, empty without Pillow."""
+    if Image is None:
+        return ''
+    return ', '.join(f"{photo_url(file_path, v)} {size}w" for v, size in PHOTO_VARIANTS.items())
+
+
+def photo_urls(file_path):
+    """{'url' (web size), 'thumb_url', 'full_url', 'srcset'} of a stored photo for JSON payloads."""
+    return {
+        'url': photo_url(file_path, 'web'),
+        'thumb_url': photo_url(file_path, 'thumb'),
+        'full_url': photo_url(file_path),
+        'srcset': photo_srcset(file_path),
+    }
+
+
+def resolve_upload(upload_folder, filename):
+    """
+    (name to send, long-lived) for a request to /uploads. A variant not built yet is
+    answered with its original, which must not be cached under the variant's name.
+    """
+    if os.path.exists(os.path.join(upload_folder, filename)):
+        return filename, is_immutable(filename)
+    match = re.match(r'^(.+)_(%s)\.jpg$' % '|'.join(PHOTO_VARIANTS), filename)
+    if match:
+        for original in glob.glob(os.path.join(glob.escape(upload_folder), glob.escape(match.group(1)) + '.*')):
+            return os.path.basename(original), False
+    return filename, False
+
+
+def remove_photo_files(photo):
+    """
+    Deletes a photo's file and variants from disk unless another photo row still
+    points at the same (deduplicated) file. Call before deleting the row.
+    """
+    if not photo.file_path:
+        return
+    shared = DailyLogPhoto.query.filter(DailyLogPhoto.file_path == photo.file_path, DailyLogPhoto.id != photo.id).count()
+    if shared:
+        return
+    for path in [photo.file_path] + [variant_path(photo.file_path, v) for v in PHOTO_VARIANTS]:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass # Ignore if file missing
+
+
+def backfill_photos(rehash=False):
+    """
+    Builds the missing variants of every stored photo. With rehash, files saved under
+    their upload names are first moved to content-hash names, duplicates collapsed
+    onto one file. Returns {'photos', 'missing', 'renamed', 'variants'}.
+    """
+    stats = {'photos': 0, 'missing': 0, 'renamed': 0, 'variants': 0}
+    by_path = {}
+    for photo in DailyLogPhoto.query.order_by(DailyLogPhoto.id):
+        by_path.setdefault(photo.file_path, []).append(photo)
+
+    for path, photos in by_path.items():
+        stats['photos'] += len(photos)
+        if not path or not os.path.exists(path):
+            stats['missing'] += len(photos)
+            continue
+
+        if rehash and not is_immutable(os.path.basename(path)):
+            with open(path, 'rb') as fh:
+                target = os.path.join(os.path.dirname(path), content_filename(fh.read(), path))
+            # Copy, commit, then delete: a crash never leaves a row on a missing file
+            if not os.path.exists(target):
+                shutil.copyfile(path, target + '.tmp')
+                os.replace(target + '.tmp', target)
+            for photo in photos:
+                photo.file_path = target
+            db.session.commit()
+            for old_file in [path] + [variant_path(path, v) for v in PHOTO_VARIANTS]:
+                if os.path.exists(old_file):
+                    os.remove(old_file)
+            stats['renamed'] += len(photos)
+            path = target
+
+        stats['variants'] += len(build_variants(path))
+
+    return stats
@@ -0,0 +1,326 @@
+import json
+from datetime import date, timedelta
+
+from sqlalchemy import event, func, case, and_, select, inspect
+from sqlalchemy.orm import Session
+
+from app.database import db
+from app.models.models import Flock, DailyLog, Hatchability, FlockWeeklyRollup, FlockMonthlyRollup
+
+_PENDING_KEY = 'rollup_pending'
+_DROPPED_KEY = 'rollup_dropped'
+
+# Changing any of these moves rows between periods or flocks
+_LOG_KEY_ATTRS = ('flock_id', 'date')
+_HATCH_KEY_ATTRS = ('flock_id', 'hatching_date')
+# Baselines of the stock calculation, a change rebuilds the whole flock
+_FLOCK_STOCK_ATTRS = ('intake_female', 'prod_start_female', 'prod_start_female_hosp')
+
+_SUM_FIELDS = ('days', 'laying_days', 'mortality_male', 'mortality_female', 'culls_male', 'culls_female',
+               'eggs_collected', 'cull_eggs', 'stock_days_female', 'hen_days', 'laying_mortality_female',
+               'feed_female_gp_sum', 'feed_female_gp_days', 'bw_female_sum', 'bw_female_days',
+               'uniformity_female_sum', 'uniformity_female_days', 'egg_set', 'hatched_chicks')
+
+
+def flock_day_stock_select(*criteria):
+    """
+    Select of one row per daily log matching `criteria`, with the opening female stock
+    rebuilt by window functions over each flock's whole history: intake (or the manual
+    production-start count from the first egg on) minus prior losses and transfers out.
+    Columns: flock_id, date, eggs, mort_m, mort_f, culls_m, culls_f, cull_eggs, feed_f, bw_f,
+    unif_f, feed_code_id, laying, stock_f.
+    """
+    loss_f = (DailyLog.mortality_female + DailyLog.mortality_female_hosp + DailyLog.culls_female
+              + DailyLog.culls_female_hosp + DailyLog.females_out_flock - DailyLog.females_in_flock)
+    flock_days = select(
+        DailyLog.flock_id,
+        DailyLog.date,
+        DailyLog.eggs_collected.label('eggs'),
+        (DailyLog.mortality_male + DailyLog.mortality_male_hosp).label('mort_m'),
+        (DailyLog.mortality_female + DailyLog.mortality_female_hosp).label('mort_f'),
+        (DailyLog.culls_male + DailyLog.culls_male_hosp).label('culls_m'),
+        (DailyLog.culls_female + DailyLog.culls_female_hosp).label('culls_f'),
+        (DailyLog.cull_eggs_jumbo + DailyLog.cull_eggs_small + DailyLog.cull_eggs_abnormal + DailyLog.cull_eggs_crack).label('cull_eggs'),
+        DailyLog.feed_female_gp_bird.label('feed_f'),
+        DailyLog.body_weight_female.label('bw_f'),
+        DailyLog.uniformity_female.label('unif_f'),
+        func.coalesce(DailyLog.feed_code_female_id, DailyLog.feed_code_male_id).label('feed_code_id'),
+        loss_f.label('loss_f'),
+        func.coalesce(func.sum(loss_f).over(partition_by=DailyLog.flock_id, order_by=DailyLog.date, rows=(None, -1)), 0).label('loss_before'),
+        func.min(case((DailyLog.eggs_collected > 0, DailyLog.date))).over(partition_by=DailyLog.flock_id).label('first_egg'),
+        Flock.intake_female,
+        Flock.prod_start_female,
+        Flock.prod_start_female_hosp,
+    ).join(Flock, Flock.id == DailyLog.flock_id).where(*criteria).cte('flock_days')
+
+    d = flock_days.c
+    laying = and_(d.first_egg.isnot(None), d.date >= d.first_egg)
+    loss_before_lay = func.sum(case((d.date < d.first_egg, d.loss_f), else_=0)).over(partition_by=d.flock_id)
+    stock_f = case(
+        (and_(laying, d.prod_start_female > 0), d.prod_start_female + d.prod_start_female_hosp - (d.loss_before - loss_before_lay)),
+        else_=d.intake_female - d.loss_before
+    )
+    return select(
+        d.flock_id, d.date, d.eggs, d.mort_m, d.mort_f, d.culls_m, d.culls_f, d.cull_eggs,
+        d.feed_f, d.bw_f, d.unif_f, d.feed_code_id,
+        laying.label('laying'), stock_f.label('stock_f')
+    )
+
+
+def _new_bucket(period_start):
+    bucket = dict.fromkeys(_SUM_FIELDS, 0)
+    bucket.update({'period_start': period_start, 'opening_stock_female': None,
+                   'feed_code_id': None, 'spark_egg_pct': [], 'spark_bw_female': []})
+    return bucket
+
+
+def _add_day(b, row):
+    stock_f = row.stock_f or 0
+    if b['opening_stock_female'] is None:
+        b['opening_stock_female'] = stock_f
+    b['days'] += 1
+    b['mortality_male'] += row.mort_m or 0
+    b['mortality_female'] += row.mort_f or 0
+    b['culls_male'] += row.culls_m or 0
+    b['culls_female'] += row.culls_f or 0
+    b['eggs_collected'] += row.eggs or 0
+    b['cull_eggs'] += row.cull_eggs or 0
+    b['stock_days_female'] += stock_f
+    if row.laying:
+        b['laying_days'] += 1
+        b['hen_days'] += stock_f
+        b['laying_mortality_female'] += row.mort_f or 0
+    if (row.feed_f or 0) > 0:
+        b['feed_female_gp_sum'] += row.feed_f
+        b['feed_female_gp_days'] += 1
+    if (row.bw_f or 0) > 0:
+        b['bw_female_sum'] += row.bw_f
+        b['bw_female_days'] += 1
+    if (row.unif_f or 0) > 0:
+        b['uniformity_female_sum'] += row.unif_f
+        b['uniformity_female_days'] += 1
+
+
+def _build_buckets(connection, flock_id, start):
+    """Weekly and monthly buckets of one flock for every day from `start` (None for all)."""
+    # Filtered outside the window functions, which still need the days before `start`
+    days = flock_day_stock_select(DailyLog.flock_id == flock_id).subquery()
+    days = select(days).where(days.c.date >= start) if start is not None else select(days)
+    weekly, monthly = {}, {}
+
+    def buckets_for(day):
+        iso = day.isocalendar()
+        wk = weekly.get((iso[0], iso[1]))
+        if wk is None:
+            wk = weekly[(iso[0], iso[1])] = _new_bucket(day - timedelta(days=day.weekday()))
+        mo = monthly.get((day.year, day.month))
+        if mo is None:
+            mo = monthly[(day.year, day.month)] = _new_bucket(day.replace(day=1))
+        return wk, mo
+
+    for row in connection.execute(days.order_by(days.selected_columns.date)):
+        wk, mo = buckets_for(row.date)
+        _add_day(wk, row)
+        _add_day(mo, row)
+        wk['spark_egg_pct'].append(round(row.eggs / row.stock_f * 100, 2) if row.stock_f and row.stock_f > 0 else 0)
+        if (row.bw_f or 0) > 0:
+            wk['spark_bw_female'].append(row.bw_f)
+        if row.feed_code_id:
+            wk['feed_code_id'] = row.feed_code_id
+
+    hatch = select(Hatchability.hatching_date, Hatchability.egg_set, Hatchability.hatched_chicks).where(Hatchability.flock_id == flock_id)
+    if start is not None:
+        hatch = hatch.where(Hatchability.hatching_date >= start)
+    for hatching_date, egg_set, hatched in connection.execute(hatch):
+        for b in buckets_for(hatching_date):
+            b['egg_set'] += egg_set or 0
+            b['hatched_chicks'] += hatched or 0
+
+    return weekly, monthly
+
+
+def refresh_flock_rollups(flock_id, from_date=None, connection=None):
+    """
+    Recomputes a flock's weekly and monthly rollups from the period holding from_date onwards
+    (the whole flock when from_date is None). Stock carries forward, so every later period
+    is rebuilt too. Runs on the given connection; the caller commits.
+    """
+    connection = connection or db.session.connection()
+    weekly_t = FlockWeeklyRollup.__table__
+    monthly_t = FlockMonthlyRollup.__table__
+
+    week_start = month_start = start = None
+    if from_date is not None:
+        week_start = from_date - timedelta(days=from_date.weekday())
+        month_start = from_date.replace(day=1)
+        start = min(week_start, month_start)
+
+    weekly, monthly = _build_buckets(connection, flock_id, start)
+
+    del_weekly = weekly_t.delete().where(weekly_t.c.flock_id == flock_id)
+    del_monthly = monthly_t.delete().where(monthly_t.c.flock_id == flock_id)
+    if from_date is not None:
+        del_weekly = del_weekly.where(weekly_t.c.period_start >= week_start)
+        del_monthly = del_monthly.where(monthly_t.c.period_start >= month_start)
+    connection.execute(del_weekly)
+    connection.execute(del_monthly)
+
+    weekly_rows = []
+    for (iso_year, iso_week), b in weekly.items():
+        if week_start is None or b['period_start'] >= week_start:
+            row = _row(flock_id, b)
+            row.update({'iso_year': iso_year, 'iso_week': iso_week, 'feed_code_id': b['feed_code_id'],
+                        'spark_json': json.dumps({'egg_pct': b['spark_egg_pct'], 'bw_female': b['spark_bw_female']})})
+            weekly_rows.append(row)
+    monthly_rows = []
+    for (year, month), b in monthly.items():
+        if month_start is None or b['period_start'] >= month_start:
+            row = _row(flock_id, b)
+            row.update({'year': year, 'month': month})
+            monthly_rows.append(row)
+
+    if weekly_rows:
+        connection.execute(weekly_t.insert(), weekly_rows)
+    if monthly_rows:
+        connection.execute(monthly_t.insert(), monthly_rows)
+    return len(weekly_rows), len(monthly_rows)
+
+
+def _row(flock_id, b):
+    row = {f: b[f] for f in _SUM_FIELDS}
+    row.update({'flock_id': flock_id, 'period_start': b['period_start'], 'opening_stock_female': b['opening_stock_female'] or 0})
+    return row
+
+
+def rebuild_rollups(flock_ids=None):
+    """Rebuilds the rollups of the given flocks (all flocks by default) and commits."""
+    if flock_ids is None:
+        flock_ids = [fid for (fid,) in db.session.query(Flock.id).all()]
+    connection = db.session.connection()
+    for fid in flock_ids:
+        refresh_flock_rollups(fid, connection=connection)
+    db.session.commit()
+    return len(flock_ids)
+
+
+def ensure_rollups(flock_ids=None):
+    """
+    Builds the rollups of flocks (all by default) that have history but no rollup rows yet,
+    e.g. right after the rollup tables were added, and commits. Returns how many were built.
+    """
+    has_history = DailyLog.query.filter(DailyLog.flock_id == Flock.id).exists()
+    rolled_up = FlockWeeklyRollup.query.filter(FlockWeeklyRollup.flock_id == Flock.id).exists()
+    query = db.session.query(Flock.id).filter(has_history, ~rolled_up)
+    if flock_ids is not None:
+        if not flock_ids:
+            return 0
+        query = query.filter(Flock.id.in_(list(flock_ids)))
+    missing = [fid for (fid,) in query.all()]
+    if missing:
+        rebuild_rollups(missing)
+    return len(missing)
+
+
+def _old_values(obj, attrs):
+    """Committed values of attrs that changed in this flush (needs active_history)."""
+    state = inspect(obj)
+    old = {}
+    for attr in attrs:
+        hist = state.attrs[attr].history
+        old[attr] = hist.deleted[0] if hist.deleted else getattr(obj, attr)
+    return old
+
+
+def _mark(pending, flock_id, day):
+    if flock_id is None:
+        return
+    flock_id = int(flock_id)
+    day = day or date.min
+    if flock_id not in pending or day < pending[flock_id]:
+        pending[flock_id] = day
+
+
+def _before_flush(session, flush_context, instances):
+    # Deleted rows are read here, while their attributes can still be loaded
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in session.deleted:
+        if isinstance(obj, DailyLog):
+            old = _old_values(obj, _LOG_KEY_ATTRS)
+            _mark(pending, old['flock_id'], old['date'])
+        elif isinstance(obj, Hatchability):
+            old = _old_values(obj, _HATCH_KEY_ATTRS)
+            _mark(pending, old['flock_id'], old['hatching_date'])
+
+    # Rollups reference the flock, so they have to go before the flock row does
+    flock_ids = [o.id for o in session.deleted if isinstance(o, Flock) and o.id is not None]
+    if flock_ids:
+        conn = session.connection()
+        for table in (FlockWeeklyRollup.__table__, FlockMonthlyRollup.__table__):
+            conn.execute(table.delete().where(table.c.flock_id.in_(flock_ids)))
+        session.info.setdefault(_DROPPED_KEY, set()).update(flock_ids)
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in session.new:
+        if isinstance(obj, DailyLog):
+            _mark(pending, obj.flock_id, obj.date)
+        elif isinstance(obj, Hatchability):
+            _mark(pending, obj.flock_id, obj.hatching_date)
+
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, DailyLog):
+            old = _old_values(obj, _LOG_KEY_ATTRS)
+            _mark(pending, old['flock_id'], old['date'])
+            _mark(pending, obj.flock_id, obj.date)
+        elif isinstance(obj, Hatchability):
+            old = _old_values(obj, _HATCH_KEY_ATTRS)
+            _mark(pending, old['flock_id'], old['hatching_date'])
+            _mark(pending, obj.flock_id, obj.hatching_date)
+        elif isinstance(obj, Flock):
+            state = inspect(obj)
+            if any(state.attrs[a].history.has_changes() for a in _FLOCK_STOCK_ATTRS):
+                _mark(pending, obj.id, None)
+
+    if not pending:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def _before_commit(session):
+    # The commit's own flush comes after this hook, so flush here to see every change
+    session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    dropped = session.info.pop(_DROPPED_KEY, set())
+    if not pending:
+        return
+    connection = session.connection()
+    for flock_id, day in pending.items():
+        if flock_id in dropped:
+            continue
+        refresh_flock_rollups(flock_id, None if day == date.min else day, connection=connection)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_DROPPED_KEY, None)
+
+
+def _track_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_rollup_events():
+    """Keep the weekly / monthly flock rollups in step with DailyLog and Hatchability writes."""
+    # active_history keeps the previous period / flock even after a commit expired them,
+    # so a moved row is taken out of its old rollup as well
+    for model, attrs in ((DailyLog, _LOG_KEY_ATTRS), (Hatchability, _HATCH_KEY_ATTRS)):
+        for attr in attrs:
+            col = getattr(model, attr)
+            if not event.contains(col, 'set', _track_old_value):
+                event.listen(col, 'set', _track_old_value, active_history=True, retval=True)
+    for name, fn in (('before_flush', _before_flush), ('after_flush', _after_flush),
+                     ('before_commit', _before_commit), ('after_soft_rollback', _after_rollback)):
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
@@ -0,0 +1,322 @@
+import time
+import operator
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+from flask import url_for
+from sqlalchemy import event, func, case, and_, false, select
+from sqlalchemy.orm import joinedload
+
+from metrics import METRICS_REGISTRY, enrich_flock_data
+from app.database import db
+from app.models.models import NotificationRule, Flock, DailyLog, Hatchability, User
+
+RULE_OPERATORS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+}
+
+# Rules saved before the registry was used for rule metrics
+METRIC_ALIASES = {
+    'egg_production_pct': 'egg_prod_pct',
+}
+
+# Hatchability figures only come through enrichment when the records are passed in
+_HATCH_METRICS = {'hatchability_pct', 'fertile_egg_pct', 'clear_egg_pct', 'rotten_egg_pct', 'egg_set', 'hatched_chicks', 'male_ratio_pct'}
+
+# Compiled rules are reused for this long even without a local invalidation,
+# so edits made by another worker process are picked up too
+RULE_CACHE_SECONDS = 60
+
+CompiledRule = namedtuple('CompiledRule', ['id', 'name', 'metric', 'operator', 'threshold', 'window_days', 'compare'])
+
+RuleHit = namedtuple('RuleHit', ['flock', 'date', 'rule', 'value'])
+
+
+def resolve_metric(metric):
+    return METRIC_ALIASES.get(metric, metric)
+
+
+class RuleEvaluator(object):
+    """Active rules compiled once and grouped by metric."""
+
+    def __init__(self, rules):
+        self.rules_by_metric = {}
+        for rule in rules:
+            metric = resolve_metric(rule.metric)
+            compare = RULE_OPERATORS.get(rule.operator)
+            if compare is None or metric not in METRICS_REGISTRY:
+                continue
+            window = rule.window_days if rule.window_days and rule.window_days > 1 else None
+            self.rules_by_metric.setdefault(metric, []).append(
+                CompiledRule(rule.id, rule.name, metric, rule.operator, rule.threshold, window, compare)
+            )
+        self.needs_hatchability = bool(_HATCH_METRICS & set(self.rules_by_metric))
+        # Days of logs, ending on the evaluated day, that the widest rule looks at
+        self.lookback_days = max([r.window_days or 1 for rules in self.rules_by_metric.values() for r in rules] or [1])
+
+    def __bool__(self):
+        return bool(self.rules_by_metric)
+
+    def evaluate(self, daily_stats, idx):
+        """
+        Checks every rule against day `idx` of an enrich_flock_data result.
+        Windowed rules compare the mean of the metric over the last window_days days.
+        Returns [(CompiledRule, value)] for the rules that fire.
+        """
+        day = daily_stats[idx]['date']
+        hits = []
+        for metric, rules in self.rules_by_metric.items():
+            current = daily_stats[idx].get(metric)
+            for rule in rules:
+                if rule.window_days:
+                    start = day - timedelta(days=rule.window_days - 1)
+                    values = []
+                    j = idx
+                    while j >= 0 and daily_stats[j]['date'] >= start:
+                        v = daily_stats[j].get(metric)
+                        if v is not None:
+                            values.append(v)
+                        j -= 1
+                    value = sum(values) / len(values) if values else None
+                else:
+                    value = current
+                if value is not None and rule.compare(value, rule.threshold):
+                    hits.append((rule, value))
+        return hits
+
+
+_cache_lock = threading.Lock()
+_cached = {'evaluator': None, 'expires': 0.0}
+
+
+def get_rule_evaluator():
+    """Returns the compiled evaluator for the active rules, rebuilding it when stale."""
+    now = time.monotonic()
+    evaluator = _cached['evaluator']
+    if evaluator is not None and now < _cached['expires']:
+        return evaluator
+    with _cache_lock:
+        if _cached['evaluator'] is None or time.monotonic() >= _cached['expires']:
+            with db.session.no_autoflush:
+                _cached['evaluator'] = RuleEvaluator(NotificationRule.query.filter_by(is_active=True).all())
+            _cached['expires'] = time.monotonic() + RULE_CACHE_SECONDS
+        return _cached['evaluator']
+
+
+def invalidate_rules(*args):
+    _cached['evaluator'] = None
+    _cached['expires'] = 0.0
+
+
+def register_rule_events():
+    """Drops the compiled rules whenever a NotificationRule is inserted, updated or deleted."""
+    for evt in ('after_insert', 'after_update', 'after_delete'):
+        if not event.contains(NotificationRule, evt, invalidate_rules):
+            event.listen(NotificationRule, evt, invalidate_rules)
+
+
+def _production_start(log):
+    """The flock's first egg date (Flock.production_start_date) with `log` as it is in memory, without loading every log."""
+    q = db.session.query(func.min(DailyLog.date)).filter(DailyLog.flock_id == log.flock.id, DailyLog.eggs_collected > 0)
+    if log.id is not None:
+        q = q.filter(DailyLog.id != log.id)
+    dates = [d for d in (q.scalar(), log.date if (log.eggs_collected or 0) > 0 else None) if d]
+    return min(dates) if dates else None
+
+
+def _opening_state(flock, before, production_start):
+    """
+    custom_start_stock for enrich_flock_data continuing from every log of the flock dated
+    before `before`: stock, phase, phase baseline and cumulative mortality, summed in SQL
+    on either side of the first egg instead of walking the logs. None when there is no
+    earlier log, or when a stock would have gone below zero on some day, which the
+    day-by-day walk clamps.
+    """
+    earlier = and_(DailyLog.flock_id == flock.id, DailyLog.date < before)
+    first_egg = db.session.query(func.min(DailyLog.date)).filter(earlier, DailyLog.eggs_collected > 0).scalar()
+    laying = DailyLog.date >= first_egg if first_egg else false()
+
+    def col(name):
+        return func.coalesce(getattr(DailyLog, name), 0)
+
+    # Per day change of each stock (production / hospital) and the day's mortality
+    deltas = {}
+    for sex, birds in (('male', 'males'), ('female', 'females')):
+        moved = col(f'{birds}_moved_to_prod') - col(f'{birds}_moved_to_hosp')
+        deltas[f'{sex}_prod'] = moved + col(f'{birds}_in_flock') - col(f'{birds}_out_flock') - col(f'mortality_{sex}') - col(f'culls_{sex}')
+        deltas[f'{sex}_hosp'] = -moved - col(f'mortality_{sex}_hosp') - col(f'culls_{sex}_hosp')
+        deltas[f'{sex}_mort'] = col(f'mortality_{sex}') + col(f'mortality_{sex}_hosp')
+    stocks = [name for name in deltas if not name.endswith('_mort')]
+    cull_eggs = col('cull_eggs_jumbo') + col('cull_eggs_small') + col('cull_eggs_crack') + col('cull_eggs_abnormal')
+
+    # Each stock's running change, per side of the first egg, gives its end-of-day lows
+    days = select(
+        DailyLog.date,
+        laying.label('laying'),
+        case((DailyLog.feed_program == 'Skip-a-day', 1), else_=0).label('skipped'),
+        case((cull_eggs > 0, 1), else_=0).label('cull_eggs'),
+        *[expr.label(name) for name, expr in deltas.items()],
+        *[func.sum(deltas[name]).over(partition_by=laying, order_by=(DailyLog.date, DailyLog.id)).label(f'{name}_run') for name in stocks]
+    ).where(earlier).subquery()
+    c = days.c
+    rows = db.session.execute(select(
+        c.laying, func.max(c.date), func.max(c.skipped), func.max(c.cull_eggs),
+        *[func.sum(c[name]) for name in deltas],
+        *[func.min(c[f'{name}_run']) for name in stocks]
+    ).group_by(c.laying)).all()
+    if not rows:
+        return None
+
+    sides = {}
+    for row in rows:
+        sides[bool(row[0])] = {
+            'last_date': row[1], 'skipped': row[2], 'cull_eggs': row[3],
+            'sum': dict(zip(deltas, row[4:4 + len(deltas)])),
+            'low': dict(zip(stocks, row[4 + len(deltas):])),
+        }
+    empty = {'sum': dict.fromkeys(deltas, 0), 'low': dict.fromkeys(stocks, 0)}
+    before_lay = sides.get(False, empty)
+    after_lay = sides.get(True, empty)
+
+    state = {
+        'in_prod': first_egg is not None,
+        'has_cull_eggs': any(side['cull_eggs'] for side in sides.values()),
+        'production_start_date': production_start,
+    }
+    sexes = (('male', flock.intake_male, flock.prod_start_male, flock.prod_start_male_hosp),
+             ('female', flock.intake_female, flock.prod_start_female, flock.prod_start_female_hosp))
+    for sex, intake, prod_start, prod_start_hosp in sexes:
+        stock = {f'{sex}_prod': intake or 0, f'{sex}_hosp': 0}
+        for name in stock:
+            if stock[name] + before_lay['low'][name] < 0:
+                return None
+            stock[name] += before_lay['sum'][name]
+        phase_start = intake or 0
+        cum_mort = before_lay['sum'][f'{sex}_mort']
+
+        if first_egg is not None:
+            # The first egg restarts the baseline, from the manual production-start count if given
+            if (prod_start or 0) > 0:
+                stock = {f'{sex}_prod': prod_start, f'{sex}_hosp': prod_start_hosp or 0}
+            phase_start = sum(stock.values())
+            for name in stock:
+                if stock[name] + after_lay['low'][name] < 0:
+                    return None
+                stock[name] += after_lay['sum'][name]
+            cum_mort = after_lay['sum'][f'{sex}_mort']
+
+        state.update(stock)
+        state.update({f'phase_start_{sex}': phase_start, f'cum_mort_{sex}': cum_mort})
+
+    last_date = max(side['last_date'] for side in sides.values())
+    if first_egg is not None:
+        state['phase'] = 'Production'
+    elif production_start and last_date >= production_start:
+        state['phase'] = 'Pre-lay'
+    elif before_lay['skipped']:
+        state['phase'] = 'Growing'
+    return state
+
+
+def evaluate_log(log, evaluator=None):
+    """
+    Evaluates the active rules for one (possibly unsaved) daily log.
+    Only the logs inside the widest rule window are loaded; the state left by older
+    ones comes from _opening_state, so a save does not replay the flock's whole history.
+    Everything runs without autoflush so the pending log is not written early.
+    Returns a list of RuleHit.
+    """
+    evaluator = evaluator or get_rule_evaluator()
+    flock = log.flock
+    if not evaluator or flock is None:
+        return []
+
+    window_start = log.date - timedelta(days=evaluator.lookback_days - 1)
+    with db.session.no_autoflush:
+        opening = _opening_state(flock, window_start, _production_start(log))
+        q = DailyLog.query.filter(DailyLog.flock_id == flock.id, DailyLog.date < log.date)
+        if opening is not None:
+            q = q.filter(DailyLog.date >= window_start)
+        logs = q.order_by(DailyLog.date.asc()).all()
+        hatch = None
+        if evaluator.needs_hatchability:
+            hatch = Hatchability.query.filter(Hatchability.flock_id == flock.id, Hatchability.setting_date >= window_start).all()
+        # Enrichment touches lazy relationships of the log, which would flush it too
+        daily_stats = enrich_flock_data(flock, logs + [log], hatch, custom_start_stock=opening)
+
+    return [RuleHit(flock, log.date, rule, value) for rule, value in evaluator.evaluate(daily_stats, len(daily_stats) - 1)]
+
+
+def evaluate_flocks_for_date(target_date, flocks=None, evaluator=None):
+    """
+    Batch mode: evaluates every active flock that has a log on target_date.
+    Logs (and hatchability, when a rule needs it) are fetched in one query each.
+    Returns a list of RuleHit.
+    """
+    evaluator = evaluator or get_rule_evaluator()
+    if not evaluator:
+        return []
+
+    if flocks is None:
+        flocks = Flock.query.options(joinedload(Flock.house)).filter_by(status='Active').all()
+    flocks = [f for f in flocks if f.intake_date and f.intake_date <= target_date]
+    if not flocks:
+        return []
+    flock_ids = [f.id for f in flocks]
+
+    logs_by_flock = {fid: [] for fid in flock_ids}
+    for log in DailyLog.query.filter(DailyLog.flock_id.in_(flock_ids), DailyLog.date <= target_date).order_by(DailyLog.date.asc()).all():
+        logs_by_flock[log.flock_id].append(log)
+
+    hatch_by_flock = {fid: [] for fid in flock_ids}
+    if evaluator.needs_hatchability:
+        for h in Hatchability.query.filter(Hatchability.flock_id.in_(flock_ids)).all():
+            hatch_by_flock[h.flock_id].append(h)
+
+    hits = []
+    for flock in flocks:
+        logs = logs_by_flock[flock.id]
+        if not logs or logs[-1].date != target_date:
+            continue
+        daily_stats = enrich_flock_data(flock, logs, hatch_by_flock[flock.id])
+        hits.extend(RuleHit(flock, target_date, rule, value) for rule, value in evaluator.evaluate(daily_stats, len(daily_stats) - 1))
+    return hits
+
+
+def format_rule_alert(hit):
+    meta = METRICS_REGISTRY.get(hit.rule.metric, {})
+    label = meta.get('label', hit.rule.metric)
+    unit = meta.get('unit', '')
+    house_name = hit.flock.house.name if hit.flock.house else "Unknown House"
+    window = f" ({hit.rule.window_days}-day avg)" if hit.rule.window_days else ""
+    title = f"Alert: {hit.rule.name}"
+    body = f"{house_name}: {hit.rule.name} Alert! {label}{window} is {hit.value:.2f}{unit} (Threshold: {hit.rule.operator} {hit.rule.threshold}{unit})"
+    return title, body
+
+
+def queue_rule_alerts(hits, user_ids=None):
+    """Queues one push per rule hit to every user. The caller commits."""
+    from app.services.notification_service import queue_push_alert
+
+    if not hits:
+        return 0
+    if user_ids is None:
+        user_ids = [uid for (uid,) in db.session.query(User.id).all()]
+    queued = 0
+    for hit in hits:
+        title, body = format_rule_alert(hit)
+        queued += queue_push_alert(user_ids, title, body, url=_flock_url(hit.flock))
+    return queued
+
+
+def _flock_url(flock):
+    try:
+        return url_for('view_flock', id=flock.id)
+    except RuntimeError:
+        # Scheduled runs have an app context but no request to build URLs from
+        return f"/flock/{flock.id}"
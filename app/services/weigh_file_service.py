@@ -0,0 +1,173 @@
+import io
+import os
+import codecs
+
+import numpy as np
+import pandas as pd
+
+# Tried in order on text exports without a UTF-16 byte order mark
+TEXT_ENCODINGS = ('utf-8-sig', 'cp1252')
+
+# Rows searched for the header line / header row
+HEADER_SCAN_LINES = 15
+HEADER_SCAN_ROWS = 10
+
+# Matches the sex marker in a 'File' cell or pen label, e.g. 'VC1-M P2'
+SEX_PATTERN = r'\b(M|F)\b'
+SEXES = {'M': 'Male', 'F': 'Female'}
+
+# Extension -> reader(raw bytes) returning {sheet name: DataFrame read without a header}
+WEIGH_FILE_READERS = {}
+
+
+class WeighFileError(Exception):
+    """Raised when a weigh file cannot be read (unsupported format or unknown encoding)."""
+    pass
+
+
+def weigh_file_reader(*extensions):
+    """Registers a reader for the given file extensions, e.g. @weigh_file_reader('.csv')."""
+    def register(reader):
+        for ext in extensions:
+            WEIGH_FILE_READERS[ext.lower()] = reader
+        return reader
+    return register
+
+
+def decode_text(raw):
+    """Decodes a text export once: UTF-16 when it has a byte order mark or NUL bytes, else TEXT_ENCODINGS."""
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)) or b'\x00' in raw[:1024]:
+        encodings = ('utf-16',)
+    else:
+        encodings = TEXT_ENCODINGS
+    for enc in encodings:
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    raise WeighFileError("Unable to read the file due to unknown encoding.")
+
+
+@weigh_file_reader('.csv', '.txt', '.tsv')
+def read_delimited(raw):
+    """
+    Comma, tab or semicolon separated scale exports. Lines above the 'Date ... Weight'
+    header line (scale name, batch info) are skipped.
+    """
+    text = decode_text(raw)
+    skip_index = 0
+    sep = ','
+    for i, line in enumerate(text.splitlines()[:HEADER_SCAN_LINES]):
+        lower = line.lower()
+        if 'weight' in lower and 'date' in lower:
+            skip_index = i
+            if '\t' in line:
+                sep = '\t'
+            elif ';' in line and ',' not in line:
+                sep = ';'
+            break
+    df = pd.read_csv(io.StringIO(text), sep=sep, skiprows=skip_index, on_bad_lines='skip', header=None, dtype=str)
+    return {'Sheet1': df}
+
+
+@weigh_file_reader('.xlsx')
+def read_workbook(raw):
+    return pd.read_excel(io.BytesIO(raw), sheet_name=None, header=None)
+
+
+def _weights(values):
+    """Readings as floats, NaN where blank or not a number; '1,250' style thousands are accepted."""
+    numbers = pd.to_numeric(values, errors='coerce')
+    retry = numbers.isna() & values.notna()
+    if retry.any():
+        numbers[retry] = pd.to_numeric(values[retry].astype(str).str.strip().str.replace(',', '', regex=False), errors='coerce')
+    return numbers
+
+
+def _sex(values):
+    """'Male'/'Female' per cell from its sex marker, None without one. Each distinct label is matched once."""
+    codes, labels = pd.factorize(values)
+    sexes = pd.Series(labels).astype(str).str.strip().str.upper().str.extract(SEX_PATTERN, expand=False).map(SEXES)
+    # Blank cells have code -1 and pick the trailing None
+    return pd.Series(np.append(sexes.to_numpy(dtype=object), None)[codes], index=values.index)
+
+
+def find_columns(df):
+    """
+    (header row, 'File' column, weight column) from the first HEADER_SCAN_ROWS rows, or None.
+    A weight column labelled in grams ('[g]') wins over other weight columns.
+    """
+    cells = df.head(HEADER_SCAN_ROWS).stack().dropna()
+    if cells.empty:
+        return None
+    text = cells.astype(str).str.strip().str.lower()
+    is_file = text.str.contains('file', regex=False)
+    is_weight = text.str.contains('weight', regex=False) & ~is_file
+    is_grams = is_weight & text.str.contains('[g]', regex=False)
+
+    for row in text[is_weight].index.get_level_values(0).unique():
+        files = is_file[row]
+        if not files.any():
+            continue
+        grams = is_grams[row]
+        weight_col = grams[grams].index[-1] if grams.any() else is_weight[row][is_weight[row]].index[0]
+        return row, files[files].index[-1], weight_col
+    return None
+
+
+def _mapped_weights(df, columns):
+    header_row, file_col, weight_col = columns
+    body = df.loc[df.index > header_row, [file_col, weight_col]]
+    weights = _weights(body[weight_col])
+    sex = _sex(body[file_col])
+    keep = (weights > 0) & sex.notna()
+    return pd.DataFrame({'sex': sex[keep], 'weight': weights[keep]})
+
+
+def _block_weights(df):
+    """
+    Layout without a header row: a sex marker in column B opens a block, a 'Weight [g]'
+    cell in column D starts its readings, and the first blank or non-numeric cell ends them.
+    """
+    if df.shape[1] < 4:
+        return pd.DataFrame({'sex': [], 'weight': []})
+    col_b = df.iloc[:, 1]
+    col_d = df.iloc[:, 3]
+    marker = _sex(col_b)
+    active_sex = marker.ffill()
+    d_value = _weights(col_d)
+
+    start = col_d.notna() & col_d.astype(str).str.lower().str.contains('weight [g]', regex=False) & active_sex.notna()
+    stop = marker.notna() | col_d.isna() | (d_value.isna() & ~start)
+    # Collecting state after each row: a start switches it on, a stop off, other rows carry it
+    state = pd.Series(np.where(start, 1.0, np.where(stop, 0.0, np.nan)), index=df.index).ffill().fillna(0)
+    collecting = state.shift(1, fill_value=0).astype(bool)
+
+    keep = collecting & ~stop & ~start & (d_value > 0)
+    return pd.DataFrame({'sex': active_sex[keep], 'weight': d_value[keep]})
+
+
+def read_weigh_file(filename, raw):
+    """{sheet name: DataFrame} from the reader registered for the file's extension."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    reader = WEIGH_FILE_READERS.get(ext)
+    if reader is None:
+        raise WeighFileError(f"Invalid file format. Please upload {', '.join(sorted(WEIGH_FILE_READERS))}")
+    return reader(raw)
+
+
+def parse_weigh_file(filename, raw):
+    """
+    Bird weights of a weigh file, every sheet at once, as {'Male': array, 'Female': array}
+    ready for grading_service.grade_groups. Sheets with 'File' and weight columns are read
+    by column, others by their sex-marked blocks.
+    """
+    frames = []
+    for df in read_weigh_file(filename, raw).values():
+        if df.empty:
+            continue
+        columns = find_columns(df)
+        frames.append(_mapped_weights(df, columns) if columns else _block_weights(df))
+
+    parsed = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({'sex': [], 'weight': []})
+    return {sex: parsed.loc[parsed['sex'] == sex, 'weight'].to_numpy(dtype=float) for sex in SEXES.values()}
@@ -6,7 +6,6 @@ from functools import wraps
 from flask import request, session, flash, redirect, url_for, current_app as app
 from flask_login import current_user
 from werkzeug.utils import secure_filename
-from pywebpush import webpush, WebPushException
 
 from app.database import db
 from app.models.models import UserActivityLog, NotificationHistory, PushSubscription, DailyLogPhoto
@@ -141,6 +140,13 @@ def log_user_activity(user_id, action, resource_type, resource_id=None, details=
         app.logger.warning(f"Failed to create UserActivityLog: {e}")
 
 def send_push_alert(user_id, title, body, url=None, transient=False):
+    """
+    Sends a push to every device of one user right away and reports whether any succeeded.
+    Only meant for interactive checks (test buttons) where the caller shows the result;
+    alerts fanned out to many users go through queue_push_alert and the background dispatcher.
+    """
+    from app.services.notification_service import deliver_push
+
     # Log the notification history for the user
     if not transient:
         try:
@@ -175,41 +181,26 @@ def send_push_alert(user_id, title, body, url=None, transient=False):
 
     success_count = 0
     for sub in subscriptions:
-        try:
-            sub_info = json.loads(sub.subscription_json)
-            webpush(
-                subscription_info=sub_info,
-                data=payload,
-                vapid_private_key=vapid_private_key,
-                vapid_claims={"sub": vapid_claim_email}
-            )
+        outcome, error = deliver_push(sub.subscription_json, payload, vapid_private_key, vapid_claim_email)
+        if outcome == 'sent':
             success_count += 1
-        except WebPushException as ex:
+        elif outcome == 'gone':
             # If subscription is no longer valid, remove it
-            ex_str = str(ex)
-            if '403' in ex_str or '404' in ex_str or '410' in ex_str:
-                app.logger.debug(f"Cleaning up invalid push subscription. Exception: {ex_str}")
-                db.session.delete(sub)
-                db.session.commit()
-            elif hasattr(ex, 'response') and ex.response and ex.response.status_code >= 500:
-                app.logger.error(f"WebPush Critical Error: {repr(ex)}")
-            else:
-                app.logger.error(f"WebPush Error: {repr(ex)}")
-        except Exception as e:
-            app.logger.error(f"Push Error: {str(e)}")
+            app.logger.debug(f"Cleaning up invalid push subscription. Exception: {error}")
+            db.session.delete(sub)
+            db.session.commit()
+        else:
+            app.logger.error(f"WebPush Error: {error}")
 
     return success_count > 0
 
 def save_note_photos(log, note, files):
+    from app.services.photo_service import store_photo
+
     for file in files:
         if file and file.filename != '':
-            date_str = log.date.strftime('%y%m%d')
-            # Ensure safe filename
-            safe_orig = secure_filename(file.filename)
-            raw_name = f"{log.flock.flock_id}_{date_str}_Note{note.id}_{safe_orig}"
-            filename = secure_filename(raw_name)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            # Content-hash name; web and thumbnail sizes are built in the background
+            filepath = store_photo(file, app.config['UPLOAD_FOLDER'])
 
             new_photo = DailyLogPhoto(
                 log_id=log.id,
@@ -1,6 +1,41 @@
 from datetime import datetime, date, timedelta
+from functools import lru_cache
 import math
 
+import pandas as pd
+
+@lru_cache(maxsize=2048)
+def parse_time_of_day(value):
+    """
+    'HH:MM' or 'HH:MM:SS' -> minutes since midnight (seconds are dropped).
+    Returns None for empty or invalid values. Cached: logs repeat the same few times.
+    """
+    if not value:
+        return None
+    parts = value.strip().split(':')
+    if len(parts) not in (2, 3) or not all(p.isdigit() and 1 <= len(p) <= 2 for p in parts):
+        return None
+    hours, minutes = int(parts[0]), int(parts[1])
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+def time_span_minutes(start, end):
+    """Minutes from start to end (HH:MM strings), wrapping past midnight. None if either is invalid."""
+    t1 = parse_time_of_day(start)
+    t2 = parse_time_of_day(end)
+    if t1 is None or t2 is None:
+        return None
+    diff = t2 - t1
+    return diff + 1440 if diff < 0 else diff
+
+def format_time_of_day(value):
+    """Normalises a stored time to 'HH:MM', leaving unparseable values untouched."""
+    minutes = parse_time_of_day(value)
+    if minutes is None:
+        return value
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
 def calculate_bio_week(intake_date, target_date):
     bio_days = (target_date - intake_date).days
     return 0 if bio_days == 0 else ((bio_days - 1) // 7) + 1 if bio_days > 0 else (bio_days // 7)
@@ -32,6 +67,10 @@ METRICS_REGISTRY = {
     'water_total': {'label': 'Water Total (L)', 'unit': 'L', 'type': 'raw', 'field': 'water_intake_calculated'},
     'water_per_bird': {'label': 'Water per Bird (ml)', 'unit': 'ml', 'type': 'derived'},
 
+    # --- Management ---
+    'lighting_hours': {'label': 'Lighting (Hours)', 'unit': 'h', 'type': 'derived'},
+    'feed_cleanup_hours': {'label': 'Feed Cleanup (Hours)', 'unit': 'h', 'type': 'derived'},
+
     # --- Production ---
     'eggs_collected': {'label': 'Total Eggs', 'unit': '', 'type': 'raw'},
     'egg_prod_pct': {'label': 'Egg Production (%)', 'unit': '%', 'type': 'derived'},
@@ -116,6 +155,9 @@ def enrich_flock_data(flock, logs, hatchability_data=None, custom_start_stock=No
 
     custom_start_stock: dict with keys 'male_prod', 'female_prod', 'male_hosp', 'female_hosp'
                         Used to initialize stock if calculating for a subset of logs.
+                        Optional 'in_prod', 'cum_mort_male/female', 'phase_start_male/female',
+                        'phase' and 'has_cull_eggs' carry the rest of the earlier logs' state,
+                        and 'production_start_date' saves loading every log of the flock.
     """
 
     # 1. Setup Hatchability Map
@@ -198,15 +240,21 @@ def enrich_flock_data(flock, logs, hatchability_data=None, custom_start_stock=No
     # Ensure logs are sorted
     sorted_logs = sorted(logs, key=lambda x: x.date)
 
-    current_phase = 'Brooding'
-    has_cull_eggs = False
+    # Read once, the Flock property walks every log of the flock
+    if custom_start_stock and 'production_start_date' in custom_start_stock:
+        production_start_date = custom_start_stock['production_start_date']
+    else:
+        production_start_date = flock.production_start_date
+
+    current_phase = (custom_start_stock or {}).get('phase', 'Brooding')
+    has_cull_eggs = (custom_start_stock or {}).get('has_cull_eggs', False)
 
     for log in sorted_logs:
         # --- A. Phase Switch Logic ---
         if current_phase == 'Brooding' and log.feed_program == 'Skip-a-day':
             current_phase = 'Growing'
 
-        if current_phase in ['Brooding', 'Growing'] and flock.production_start_date and log.date >= flock.production_start_date:
+        if current_phase in ['Brooding', 'Growing'] and production_start_date and log.date >= production_start_date:
             current_phase = 'Pre-lay'
 
         # --- B. Snapshot Stock (Start of Day) ---
@@ -279,14 +327,13 @@ def enrich_flock_data(flock, logs, hatchability_data=None, custom_start_stock=No
         if log.feed_program in ['Skip-a-day', '2/1'] and (log.feed_male_gp_bird or 0) == 0 and (log.feed_female_gp_bird or 0) == 0:
             feed_cleanup_hours = 0.0
         else:
-            if log.feed_cleanup_start and log.feed_cleanup_end:
-                try:
-                    from analytics import calculate_feed_cleanup_duration
-                    mins = calculate_feed_cleanup_duration(log.feed_cleanup_start, log.feed_cleanup_end)
-                    if mins is not None:
-                        feed_cleanup_hours = round(mins / 60.0, 1)
-                except:
-                    pass
+            mins = time_span_minutes(log.feed_cleanup_start, log.feed_cleanup_end)
+            if mins is not None:
+                feed_cleanup_hours = round(mins / 60.0, 1)
+
+        # Lighting Hours (Light On -> Light Off, may run past midnight)
+        light_mins = time_span_minutes(log.light_on_time, log.light_off_time)
+        lighting_hours = round(light_mins / 60.0, 1) if light_mins is not None else None
 
         # Cumulatives (Add today's loss)
         cum_mort_m += mort_m
@@ -297,9 +344,9 @@ def enrich_flock_data(flock, logs, hatchability_data=None, custom_start_stock=No
         bio_week = calculate_bio_week(flock.intake_date, log.date)
         prod_week = None
         prod_days = None
-        if flock.production_start_date:
-            if log.date >= flock.production_start_date:
-                prod_days = (log.date - flock.production_start_date).days
+        if production_start_date:
+            if log.date >= production_start_date:
+                prod_days = (log.date - production_start_date).days
                 prod_week = (prod_days // 7) + 1
 
         # Daily Standards Injection
@@ -340,6 +387,7 @@ def enrich_flock_data(flock, logs, hatchability_data=None, custom_start_stock=No
 
             # Feed Cleanup Hours (SSOT Calculation)
             'feed_cleanup_hours': feed_cleanup_hours,
+            'lighting_hours': lighting_hours,
             # Raw
             'mortality_male': mort_m,
             'mortality_female': mort_f,
@@ -468,399 +516,217 @@ def enrich_flock_data(flock, logs, hatchability_data=None, custom_start_stock=No
 
         # If the latest log is still in Rearing but the production start date has arrived/passed today,
         # the dashboard should reflect the *current* state ('Pre-lay') rather than the past log's state.
-        if last_phase in ['Brooding', 'Growing'] and flock.production_start_date and date.today() >= flock.production_start_date:
+        if last_phase in ['Brooding', 'Growing'] and production_start_date and date.today() >= production_start_date:
             flock.calculated_phase = 'Pre-lay'
         else:
             flock.calculated_phase = last_phase
     else:
-        if flock.production_start_date and flock.production_start_date <= date.today():
+        if production_start_date and production_start_date <= date.today():
             flock.calculated_phase = 'Pre-lay'
         else:
             flock.calculated_phase = 'Brooding'
 
     return daily_stats
 
-def aggregate_weekly_metrics(daily_stats):
-    """
-    Aggregates daily stats into weekly summaries.
-    """
-    weekly_stats = {}
-
-    for d in daily_stats:
-        w = d['week']
-        if w not in weekly_stats:
-            weekly_stats[w] = {
-                'week': w,
-                'production_week': d.get('production_week'),
-                'count': 0,
-                'stock_male_start': d['stock_male_start'], # Take start of week
-                'stock_female_start': d['stock_female_start'],
-
-                # Sums
-                'mortality_male': 0, 'mortality_female': 0,
-                'culls_male': 0, 'culls_female': 0,
-                'eggs_collected': 0, 'hatch_eggs': 0,
-                'cull_eggs_jumbo': 0, 'cull_eggs_small': 0,
-                'cull_eggs_crack': 0, 'cull_eggs_abnormal': 0,
-                'feed_total_kg': 0,
-                'feed_sum_m_kg': 0, 'feed_sum_f_kg': 0,
-                'water_total_vol': 0,
-                'stock_sum_male': 0, 'stock_sum_female': 0, # For weighted avgs
-
-                # Averages (Sum then divide)
-                'bw_male_sum': 0, 'bw_male_count': 0,
-                'bw_female_sum': 0, 'bw_female_count': 0,
-                'unif_male_sum': 0, 'unif_male_count': 0,
-                'unif_female_sum': 0, 'unif_female_count': 0,
-                'egg_weight_sum': 0, 'egg_weight_count': 0,
-                'feed_female_raw_list': [],
-
-                # Hatchery (Sum)
-                'egg_set': 0, 'hatched_chicks': 0,
-                'has_cull_eggs': False,
-
-                # Notes
-                'notes': [],
-                'photos': []
-            }
-
-        ws = weekly_stats[w]
-        if d.get('has_cull_eggs'):
-            ws['has_cull_eggs'] = True
-        ws['count'] += 1
-        ws['mortality_male'] += d['mortality_male']
-        ws['mortality_female'] += d['mortality_female']
-        ws['culls_male'] += d['culls_male']
-        ws['culls_female'] += d['culls_female']
-        ws['eggs_collected'] += d['eggs_collected']
-        ws['hatch_eggs'] += d['hatch_eggs']
-        ws['cull_eggs_jumbo'] += d['cull_eggs_jumbo']
-        ws['cull_eggs_small'] += d['cull_eggs_small']
-        ws['cull_eggs_crack'] += d['cull_eggs_crack']
-        ws['cull_eggs_abnormal'] += d['cull_eggs_abnormal']
-        ws['feed_total_kg'] += d['feed_total_kg']
-        ws['feed_sum_m_kg'] += d['feed_m_kg']
-        ws['feed_sum_f_kg'] += d['feed_f_kg']
-
-        # Keep the latest standard available for the week
-        if d.get('std_egg_prod') is not None:
-            ws['std_egg_prod'] = d['std_egg_prod']
-        if d.get('std_hatching_egg_pct') is not None:
-            ws['std_hatching_egg_pct'] = d['std_hatching_egg_pct']
-        if d.get('feed_female_gp_bird') is not None and d.get('feed_female_gp_bird') > 0:
-            ws['feed_female_raw_list'].append(d['feed_female_gp_bird'])
-        ws['water_total_vol'] += (d['water_total'] or 0)
-        ws['stock_sum_male'] += d['stock_male_start']
-        ws['stock_sum_female'] += d['stock_female_start']
-
-        # Optimize dict lookups
-        bw_m = d['body_weight_male']
-        bw_f = d['body_weight_female']
-        unif_m = d['uniformity_male']
-        unif_f = d['uniformity_female']
-        egg_wt = d.get('egg_weight')
-        egg_set = d['egg_set']
-        hatched = d['hatched_chicks']
-        log = d['log']
-
-        if bw_m and bw_m > 0:
-            ws['bw_male_sum'] += bw_m
-            ws['bw_male_count'] += 1
-
-        if bw_f and bw_f > 0:
-            ws['bw_female_sum'] += bw_f
-            ws['bw_female_count'] += 1
-
-        if unif_m and unif_m > 0:
-            ws['unif_male_sum'] += unif_m
-            ws['unif_male_count'] += 1
-
-        if unif_f and unif_f > 0:
-            ws['unif_female_sum'] += unif_f
-            ws['unif_female_count'] += 1
-
-        if egg_wt and egg_wt > 0:
-            ws['egg_weight_sum'] += egg_wt
-            ws['egg_weight_count'] += 1
+# Buckets understood by aggregate_periods
+AGGREGATION_PERIODS = ('week', 'production_week', 'iso_week', 'month', 'year')
+
+_AGG_INT_SUMS = ['mortality_male', 'mortality_female', 'culls_male', 'culls_female',
+                 'eggs_collected', 'hatch_eggs', 'cull_eggs_jumbo', 'cull_eggs_small',
+                 'cull_eggs_crack', 'cull_eggs_abnormal', 'egg_set', 'hatched_chicks',
+                 'stock_male_start', 'stock_female_start']
+_AGG_FLOAT_SUMS = ['feed_total_kg', 'feed_m_kg', 'feed_f_kg', 'water_total']
+# Averaged over the days that have a reading (> 0)
+_AGG_POSITIVE_MEANS = ['body_weight_male', 'body_weight_female', 'uniformity_male', 'uniformity_female', 'egg_weight']
+# Latest standard available in the bucket
+_AGG_LATEST = ['std_egg_prod', 'std_hatching_egg_pct']
+
+_AGG_RENAMES = {
+    'feed_m_kg': 'feed_sum_m_kg', 'feed_f_kg': 'feed_sum_f_kg',
+    'water_total': 'water_total_vol', 'egg_weight': 'avg_egg_weight',
+    'stock_male_start': 'stock_sum_male', 'stock_female_start': 'stock_sum_female',
+}
 
-        if egg_set: ws['egg_set'] += egg_set
-        if hatched: ws['hatched_chicks'] += hatched
 
-        if log.clinical_notes:
-            ws['notes'].append(log.clinical_notes)
-        for p in log.photos:
-            ws['photos'].append(p.file_path)
+def _daily_frame(daily_stats):
+    """Columnar view of enrich_flock_data output (one or many flocks), sorted by date."""
+    columns = ['date', 'week', 'production_week', 'feed_female_gp_bird', 'has_cull_eggs'] + \
+        _AGG_INT_SUMS + _AGG_FLOAT_SUMS + _AGG_POSITIVE_MEANS + _AGG_LATEST
+    frame = pd.DataFrame([[d.get(c) for c in columns] for d in daily_stats], columns=columns)
+    for c in columns[1:]:
+        if c != 'has_cull_eggs':
+            frame[c] = pd.to_numeric(frame[c], errors='coerce')
+    frame[_AGG_INT_SUMS + _AGG_FLOAT_SUMS] = frame[_AGG_INT_SUMS + _AGG_FLOAT_SUMS].fillna(0)
+    frame['has_cull_eggs'] = frame['has_cull_eggs'].fillna(False).astype(bool)
+    frame['flock_key'] = [getattr(d['log'], 'flock_id', None) or 0 for d in daily_stats]
+    frame['day'] = pd.to_datetime(frame['date'])
+    frame['lost_female'] = frame['mortality_female'] + frame['culls_female']
+    return frame.sort_values('day', kind='mergesort')
+
+
+def _period_keys(frame, period):
+    """(sortable key Series, {key: label}) for one bucket type. Rows without a key are dropped."""
+    day = frame['day'].dt
+    if period == 'week':
+        keys = frame['week'].astype('int64')
+        return keys, None
+    if period == 'production_week':
+        keys = frame['production_week'].dropna().astype('int64')
+        return keys, None
+    if period == 'iso_week':
+        iso = day.isocalendar()
+        keys = iso['year'].astype('int64') * 100 + iso['week'].astype('int64')
+        return keys, {k: f"{k // 100}-W{k % 100:02d}" for k in keys.unique()}
+    if period == 'month':
+        keys = day.year * 100 + day.month
+        return keys, {k: f"{k // 100}-{k % 100:02d}" for k in keys.unique()}
+    if period == 'year':
+        return day.year, None
+    raise ValueError(f"Unknown aggregation period: {period}")
+
+
+def _ratio(num, den, multiplier=100.0):
+    """Vectorized safe_div: 0.0 wherever the denominator is not positive."""
+    den = den.astype(float)
+    return (num / den.where(den > 0)).mul(multiplier).fillna(0.0)
+
+
+def _majority(values, keys):
+    """Most frequent value per bucket after rounding to 0.1; ties go to the larger value."""
+    valid = values > 0
+    counts = values[valid].round(1).groupby([keys[valid], values[valid].round(1)]).size()
+    if counts.empty:
+        return pd.Series(dtype=float)
+    counts = counts.rename('n').reset_index()
+    counts.columns = ['bucket', 'value', 'n']
+    counts = counts.sort_values(['n', 'value'], ascending=False).drop_duplicates('bucket')
+    return counts.set_index('bucket')['value']
+
+
+def _aggregate(frame, period, daily_stats, with_notes):
+    keys, labels = _period_keys(frame, period)
+    sub = frame.loc[keys.index]
+    keys = keys.rename('bucket')
+    if sub.empty:
+        return []
+    grouped = sub.groupby(keys, sort=True)
+
+    b = grouped[_AGG_INT_SUMS + _AGG_FLOAT_SUMS].sum().rename(columns=_AGG_RENAMES)
+    b['count'] = grouped.size()
+    b['date_start'] = grouped['day'].min().dt.date
+    b['date_end'] = grouped['day'].max().dt.date
+    # Labels of the bucket's first day (production_week may still be empty then)
+    first = sub.loc[keys.groupby(keys).head(1).index]
+    b[['week', 'production_week']] = first.set_index(keys.loc[first.index])[['week', 'production_week']]
+    b['has_cull_eggs'] = grouped['has_cull_eggs'].any()
+    b[_AGG_LATEST] = grouped[_AGG_LATEST].last()
+    means = sub[_AGG_POSITIVE_MEANS]
+    b[[_AGG_RENAMES.get(c, c) for c in _AGG_POSITIVE_MEANS]] = means.where(means > 0).groupby(keys).mean().fillna(0.0).to_numpy()
+
+    # Opening stock and hen-days are taken per flock and then summed,
+    # so farm-wide buckets weight every flock by its own days in the bucket
+    per_flock = sub.groupby([keys, sub['flock_key']], sort=False).agg(
+        days=('day', 'size'),
+        stock_male_start=('stock_male_start', 'first'),
+        stock_female_start=('stock_female_start', 'first'),
+        lost_female=('lost_female', 'sum'),
+    )
+    per_flock['avg_female_stock'] = per_flock['stock_female_start'] - per_flock['lost_female'] / 2
+    per_flock['hen_days'] = per_flock['avg_female_stock'] * per_flock['days']
+    opening = per_flock.groupby(level=0)[['stock_male_start', 'stock_female_start', 'avg_female_stock', 'hen_days']].sum()
+    b = b.join(opening)
+
+    b['mortality_male_pct'] = _ratio(b['mortality_male'], b['stock_male_start'])
+    b['mortality_female_pct'] = _ratio(b['mortality_female'], b['stock_female_start'])
+    b['culls_male_pct'] = _ratio(b['culls_male'], b['stock_male_start'])
+    b['culls_female_pct'] = _ratio(b['culls_female'], b['stock_female_start'])
+    b['egg_prod_pct'] = _ratio(b['eggs_collected'], b['hen_days'])
+
+    b['cull_eggs_total'] = b['cull_eggs_jumbo'] + b['cull_eggs_small'] + b['cull_eggs_crack'] + b['cull_eggs_abnormal']
+    b['cull_eggs_pct'] = _ratio(b['cull_eggs_total'], b['eggs_collected'])
+    b['hatch_egg_pct'] = _ratio(b['hatch_eggs'], b['eggs_collected'])
+    for c in ('jumbo', 'small', 'crack', 'abnormal'):
+        b[f'cull_eggs_{c}_pct'] = _ratio(b[f'cull_eggs_{c}'], b['eggs_collected'])
+    b['hatchability_pct'] = _ratio(b['hatched_chicks'], b['egg_set'])
+
+    b['water_per_bird'] = _ratio(b['water_total_vol'] * 1000, b['stock_sum_male'] + b['stock_sum_female'], multiplier=1.0)
+    b['water_feed_ratio'] = _ratio(b['water_total_vol'], b['feed_total_kg'], multiplier=1.0)
+    b['feed_male_gp_bird'] = _ratio(b['feed_sum_m_kg'] * 1000, b['stock_sum_male'], multiplier=1.0)
+    b['feed_female_gp_bird'] = _ratio(b['feed_sum_f_kg'] * 1000, b['stock_sum_female'], multiplier=1.0)
+    b['feed_female_gp_bird_majority'] = _majority(sub['feed_female_gp_bird'], keys).reindex(b.index).fillna(0.0)
+
+    int_cols = [_AGG_RENAMES.get(c, c) for c in _AGG_INT_SUMS] + ['stock_male_start', 'stock_female_start', 'cull_eggs_total', 'count']
+    b[int_cols] = b[int_cols].round().astype('int64')
+
+    notes, photos = {}, {}
+    if with_notes:
+        for i, k in zip(sub.index, keys):
+            log = daily_stats[i]['log']
+            if log.clinical_notes:
+                notes.setdefault(k, []).append(log.clinical_notes)
+            photos.setdefault(k, []).extend(p.file_path for p in log.photos)
 
-    # Finalize Averages
     result = []
-    for w in sorted(weekly_stats.keys()):
-        ws = weekly_stats[w]
-
-        # Calculate Derived Weekly Metrics
-        ws['mortality_male_pct'] = safe_div(ws['mortality_male'], ws['stock_male_start'])
-        ws['mortality_female_pct'] = safe_div(ws['mortality_female'], ws['stock_female_start'])
-        ws['culls_male_pct'] = safe_div(ws['culls_male'], ws['stock_male_start'])
-        ws['culls_female_pct'] = safe_div(ws['culls_female'], ws['stock_female_start'])
-
-        # Hen Days for Egg Prod % (Average Stock * Days) OR Sum of daily stocks?
-        # Typically Egg Prod % = Total Eggs / (Avg Hen Stock * 7)
-        # Avg Hen Stock = Start - (Mort/2).
-        avg_hen = ws['stock_female_start'] - ((ws['mortality_female'] + ws['culls_female']) / 2)
-        ws['egg_prod_pct'] = safe_div(ws['eggs_collected'], avg_hen * ws['count'])
-
-        ws['cull_eggs_total'] = ws['cull_eggs_jumbo'] + ws['cull_eggs_small'] + ws['cull_eggs_crack'] + ws['cull_eggs_abnormal']
-        ws['cull_eggs_pct'] = safe_div(ws['cull_eggs_total'], ws['eggs_collected'])
-
-        ws['hatch_egg_pct'] = safe_div(ws['hatch_eggs'], ws['eggs_collected']) if ws['has_cull_eggs'] else None
-        ws['cull_eggs_jumbo_pct'] = safe_div(ws['cull_eggs_jumbo'], ws['eggs_collected'])
-        ws['cull_eggs_small_pct'] = safe_div(ws['cull_eggs_small'], ws['eggs_collected'])
-        ws['cull_eggs_crack_pct'] = safe_div(ws['cull_eggs_crack'], ws['eggs_collected'])
-        ws['cull_eggs_abnormal_pct'] = safe_div(ws['cull_eggs_abnormal'], ws['eggs_collected'])
-
-        ws['hatchability_pct'] = safe_div(ws['hatched_chicks'], ws['egg_set'])
-
-        ws['avg_egg_weight'] = ws['egg_weight_sum'] / ws['egg_weight_count'] if ws['egg_weight_count'] > 0 else 0
-
-        ws['body_weight_male'] = ws['bw_male_sum'] / ws['bw_male_count'] if ws['bw_male_count'] > 0 else 0
-        ws['body_weight_female'] = ws['bw_female_sum'] / ws['bw_female_count'] if ws['bw_female_count'] > 0 else 0
-
-        ws['uniformity_male'] = ws['unif_male_sum'] / ws['unif_male_count'] if ws['unif_male_count'] > 0 else 0
-        ws['uniformity_female'] = ws['unif_female_sum'] / ws['unif_female_count'] if ws['unif_female_count'] > 0 else 0
-
-
-        # Feed/Water per bird (Weighted Avg)
-
-        # Calculate Majority Female Feed (Mode)
-        if ws.get('feed_female_raw_list'):
-            # Rounding to 1 decimal place to group similar values like 156.0 and 156.04
-            rounded_feeds = [round(val, 1) for val in ws['feed_female_raw_list']]
-            from collections import Counter
-            counts = Counter(rounded_feeds)
-            # Find the most common value
-            most_common = counts.most_common()
-            if most_common:
-                # Get max count
-                max_count = most_common[0][1]
-                # Filter all items that have max_count
-                modes = [item[0] for item in most_common if item[1] == max_count]
-                # If there's a tie, take the max value as majority
-                ws['feed_female_gp_bird_majority'] = max(modes)
-            else:
-                ws['feed_female_gp_bird_majority'] = 0.0
-        else:
-            ws['feed_female_gp_bird_majority'] = 0.0
-
-        # Note: Feed Kg includes both M+F? No, usually separate lines.
-        # But here 'feed_total_kg' is combined.
-        # However, for charts we usually want 'g/bird'.
-        # Since we lost the split Kg in aggregation (my bad), I can't reconstruct M vs F feed g/bird accurately without tracking Sum(FeedM_Kg) and Sum(FeedF_Kg).
-        # I'll calculate Water per bird.
-        ws['water_per_bird'] = safe_div(ws['water_total_vol'] * 1000, ws['stock_sum_male'] + ws['stock_sum_female'], multiplier=1.0)
+    for k, row in zip(b.index, b.to_dict('records')):
+        k = int(k)
+        row['period'] = labels[k] if labels else k
+        row[period] = row['period']
+        if row['production_week'] != row['production_week']:
+            row['production_week'] = None
+        elif period != 'production_week' and row['production_week'] is not None:
+            row['production_week'] = int(row['production_week'])
+        row['week'] = int(row['week']) if period != 'week' else k
+        for c in _AGG_LATEST:
+            # Keys stay absent when the bucket has no standard, as callers .get() them
+            if row[c] != row[c] or row[c] is None:
+                del row[c]
+        if not row['has_cull_eggs']:
+            row['hatch_egg_pct'] = None
+        if with_notes:
+            row['notes'] = notes.get(k, [])
+            row['photos'] = photos.get(k, [])
+        result.append(row)
+    return result
 
-        ws['feed_male_gp_bird'] = safe_div(ws['feed_sum_m_kg'] * 1000, ws['stock_sum_male'], multiplier=1.0)
-        ws['feed_female_gp_bird'] = safe_div(ws['feed_sum_f_kg'] * 1000, ws['stock_sum_female'], multiplier=1.0)
 
-        result.append(ws)
+def aggregate_periods(daily_stats, periods=('week', 'month'), with_notes=False):
+    """
+    Aggregates enrich_flock_data output into every requested bucket type
+    (see AGGREGATION_PERIODS) from a single columnar frame.
+    daily_stats may mix several flocks: opening stock is summed across flocks
+    and egg production uses hen-days, so single-flock results match the daily figures.
+    with_notes adds each bucket's clinical notes and photo paths.
+    Returns {period: [bucket dict, ...]} in ascending period order.
+    """
+    if not daily_stats:
+        return {p: [] for p in periods}
+    frame = _daily_frame(daily_stats)
+    return {p: _aggregate(frame, p, daily_stats, with_notes) for p in periods}
 
-    return result
+def aggregate_weekly_metrics(daily_stats):
+    """
+    Aggregates daily stats into weekly (bio week) summaries.
+    """
+    return aggregate_periods(daily_stats, ('week',), with_notes=True)['week']
 
 def aggregate_monthly_metrics(daily_stats):
     """
     Aggregates daily stats into monthly summaries.
     """
-    monthly_stats = {}
+    return aggregate_periods(daily_stats, ('month',), with_notes=True)['month']
 
+def with_week_notes(weekly, daily_stats):
+    """
+    Copies of cached weekly buckets (aggregate_periods without notes) with the clinical
+    notes and photo paths of each week's logs, as aggregate_weekly_metrics returns them.
+    """
+    notes, photos = {}, {}
     for d in daily_stats:
-        # Group by YYYY-MM
-        m_key = d['date'].strftime('%Y-%m')
-
-        if m_key not in monthly_stats:
-            monthly_stats[m_key] = {
-                'month': m_key,
-                'count': 0,
-                'stock_male_start': d['stock_male_start'], # Take start of month
-                'stock_female_start': d['stock_female_start'],
-                'date_start': d['date'],
-                'date_end': d['date'],
-
-                # Sums
-                'mortality_male': 0, 'mortality_female': 0,
-                'culls_male': 0, 'culls_female': 0,
-                'eggs_collected': 0, 'hatch_eggs': 0,
-                'feed_total_kg': 0,
-                'feed_sum_m_kg': 0, 'feed_sum_f_kg': 0,
-                'water_total_vol': 0,
-                'stock_sum_male': 0, 'stock_sum_female': 0,
-
-                # Averages (Sum then divide)
-                'bw_male_sum': 0, 'bw_male_count': 0,
-                'bw_female_sum': 0, 'bw_female_count': 0,
-                'unif_male_sum': 0, 'unif_male_count': 0,
-                'unif_female_sum': 0, 'unif_female_count': 0,
-
-                # Hatchery (Sum)
-                'egg_set': 0, 'hatched_chicks': 0,
-                'has_cull_eggs': False,
-
-                'notes': [],
-                'photos': []
-            }
-
-        ms = monthly_stats[m_key]
-        if d.get('has_cull_eggs'):
-            ms['has_cull_eggs'] = True
-        ms['count'] += 1
-        ms['date_end'] = d['date']
-        ms['mortality_male'] += d['mortality_male']
-        ms['mortality_female'] += d['mortality_female']
-        ms['culls_male'] += d['culls_male']
-        ms['culls_female'] += d['culls_female']
-        ms['eggs_collected'] += d['eggs_collected']
-        ms['hatch_eggs'] += d['hatch_eggs']
-        ms['feed_total_kg'] += d['feed_total_kg']
-        ms['feed_sum_m_kg'] += d['feed_m_kg']
-        ms['feed_sum_f_kg'] += d['feed_f_kg']
-
-        # Keep the latest standard available for the month
-        if d.get('std_egg_prod') is not None:
-            ms['std_egg_prod'] = d['std_egg_prod']
-        if d.get('std_hatching_egg_pct') is not None:
-            ms['std_hatching_egg_pct'] = d['std_hatching_egg_pct']
-
-        ms['water_total_vol'] += (d['water_total'] or 0)
-        ms['stock_sum_male'] += d['stock_male_start']
-        ms['stock_sum_female'] += d['stock_female_start']
-
-        # Optimize dict lookups
-        bw_m = d['body_weight_male']
-        bw_f = d['body_weight_female']
-        unif_m = d['uniformity_male']
-        unif_f = d['uniformity_female']
-        egg_set = d['egg_set']
-        hatched = d['hatched_chicks']
         log = d['log']
-
-        if bw_m and bw_m > 0:
-            ms['bw_male_sum'] += bw_m
-            ms['bw_male_count'] += 1
-
-        if bw_f and bw_f > 0:
-            ms['bw_female_sum'] += bw_f
-            ms['bw_female_count'] += 1
-
-        if unif_m and unif_m > 0:
-            ms['unif_male_sum'] += unif_m
-            ms['unif_male_count'] += 1
-
-        if unif_f and unif_f > 0:
-            ms['unif_female_sum'] += unif_f
-            ms['unif_female_count'] += 1
-
-        if egg_set: ms['egg_set'] += egg_set
-        if hatched: ms['hatched_chicks'] += hatched
-
         if log.clinical_notes:
-            ms['notes'].append(log.clinical_notes)
-        for p in log.photos:
-            ms['photos'].append(p.file_path)
-
-    # Finalize Averages
-    result = []
-    for k in sorted(monthly_stats.keys()):
-        ms = monthly_stats[k]
-
-        # Calculate Derived
-        ms['mortality_male_pct'] = safe_div(ms['mortality_male'], ms['stock_male_start'])
-        ms['mortality_female_pct'] = safe_div(ms['mortality_female'], ms['stock_female_start'])
-        ms['culls_male_pct'] = safe_div(ms['culls_male'], ms['stock_male_start'])
-        ms['culls_female_pct'] = safe_div(ms['culls_female'], ms['stock_female_start'])
-
-        avg_hen = ms['stock_female_start'] - ((ms['mortality_female'] + ms['culls_female']) / 2)
-        ms['egg_prod_pct'] = safe_div(ms['eggs_collected'], avg_hen * ms['count'])
-
-        ms['hatch_egg_pct'] = safe_div(ms['hatch_eggs'], ms['eggs_collected']) if ms['has_cull_eggs'] else None
-        ms['hatchability_pct'] = safe_div(ms['hatched_chicks'], ms['egg_set'])
-
-        ms['body_weight_male'] = ms['bw_male_sum'] / ms['bw_male_count'] if ms['bw_male_count'] > 0 else 0
-        ms['body_weight_female'] = ms['bw_female_sum'] / ms['bw_female_count'] if ms['bw_female_count'] > 0 else 0
-
-        ms['uniformity_male'] = ms['unif_male_sum'] / ms['unif_male_count'] if ms['unif_male_count'] > 0 else 0
-        ms['uniformity_female'] = ms['unif_female_sum'] / ms['unif_female_count'] if ms['unif_female_count'] > 0 else 0
-
-        ms['water_per_bird'] = safe_div(ms['water_total_vol'] * 1000, ms['stock_sum_male'] + ms['stock_sum_female'], multiplier=1.0)
-        ms['feed_male_gp_bird'] = safe_div(ms['feed_sum_m_kg'] * 1000, ms['stock_sum_male'], multiplier=1.0)
-        ms['feed_female_gp_bird'] = safe_div(ms['feed_sum_f_kg'] * 1000, ms['stock_sum_female'], multiplier=1.0)
-
-        result.append(ms)
-
-    return result
-
-def calculate_broiler_metrics(flock_id):
-    """
-    Core function to process a broiler flock's logs and calculate dynamic metrics.
-    """
-    from app.models.models import BroilerFlock
-
-    flock = BroilerFlock.query.get(flock_id)
-    if not flock:
-        return []
-
-    logs = flock.logs
-    sorted_logs = sorted(logs, key=lambda x: x.date)
-
-    daily_stats = []
-
-    # Starting values
-    current_balance = flock.intake_birds or 0
-    cumulative_feed_per_bird = 0.0
-
-    for i, log in enumerate(sorted_logs):
-        # 1. Balance
-        death = log.death_count or 0
-        current_balance -= death
-        if current_balance < 0: current_balance = 0
-
-        # 2. Death Percentage
-        prev_balance = flock.intake_birds if i == 0 else daily_stats[i-1]['balance']
-        death_percentage = (death / prev_balance * 100) if prev_balance > 0 else 0.0
-
-        # 3. Gram per bird
-        feed_daily_kg = log.feed_daily_use_kg or 0.0
-        gram_per_bird = (feed_daily_kg * 1000) / current_balance if current_balance > 0 else 0.0
-
-        cumulative_feed_per_bird += gram_per_bird
-
-        # 4. Weight Gain
-        current_bw = log.body_weight_g or 0.0
-        if i == 0:
-            prev_bw = flock.arrival_weight_g or 0.0
-        else:
-            prev_bw = daily_stats[i-1]['body_weight_g'] or 0.0
-        weight_gain = current_bw - prev_bw
-
-        # 5. Cumulative FCR
-        arrival_bw = flock.arrival_weight_g or 0.0
-        bw_diff = current_bw - arrival_bw
-        cumulative_fcr = cumulative_feed_per_bird / bw_diff if bw_diff > 0 else 0.0
-
-        daily_stats.append({
-            'log': log,
-            'date': log.date,
-            'day_number': log.day_number,
-            'death_count': death,
-            'balance': current_balance,
-            'death_percentage': death_percentage,
-            'feed_daily_use_kg': feed_daily_kg,
-            'gram_per_bird': gram_per_bird,
-            'body_weight_g': current_bw,
-            'weight_gain': weight_gain,
-            'cumulative_fcr': cumulative_fcr,
-            'standard_fcr': log.standard_fcr,
-            'remarks': log.remarks
-        })
-
-    return daily_stats
-
+            notes.setdefault(d['week'], []).append(log.clinical_notes)
+        photos.setdefault(d['week'], []).extend(p.file_path for p in log.photos)
+    return [dict(w, notes=notes.get(w['week'], []), photos=photos.get(w['week'], [])) for w in weekly]
 
 def calculate_metrics(logs, flock, requested_metrics, hatchability_data=None, start_date=None, end_date=None):
     """
@@ -0,0 +1,59 @@
+"""Add inventory balance snapshot
+
+Revision ID: 3f9c2a7d4b10
+Revises: c5517872a7f7
+Create Date: 2026-10-19 09:12:41.220913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d4b10'
+down_revision = 'c5517872a7f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inventory_balance_snapshot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('inventory_item_id', sa.Integer(), nullable=False),
+    sa.Column('location', sa.String(length=50), nullable=False),
+    sa.Column('period_year', sa.Integer(), nullable=False),
+    sa.Column('period_month', sa.Integer(), nullable=False),
+    sa.Column('transaction_type', sa.String(length=20), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('tx_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['inventory_item_id'], ['inventory_item.id'], name=op.f('fk_inventory_balance_snapshot_inventory_item_id_inventory_item')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_inventory_balance_snapshot')),
+    sa.UniqueConstraint('inventory_item_id', 'location', 'period_year', 'period_month', 'transaction_type', name='uq_inventory_balance_snapshot_key')
+    )
+    with op.batch_alter_table('inventory_balance_snapshot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_inventory_balance_snapshot_inventory_item_id'), ['inventory_item_id'], unique=False)
+        batch_op.create_index('ix_inventory_balance_snapshot_period', ['period_year', 'period_month'], unique=False)
+
+    # Seed the snapshots from the existing ledger
+    if op.get_bind().dialect.name == 'sqlite':
+        year_expr = "CAST(strftime('%Y', transaction_date) AS INTEGER)"
+        month_expr = "CAST(strftime('%m', transaction_date) AS INTEGER)"
+    else:
+        year_expr = "CAST(EXTRACT(YEAR FROM transaction_date) AS INTEGER)"
+        month_expr = "CAST(EXTRACT(MONTH FROM transaction_date) AS INTEGER)"
+
+    op.execute(f"""
+        INSERT INTO inventory_balance_snapshot (inventory_item_id, location, period_year, period_month, transaction_type, quantity, tx_count)
+        SELECT inventory_item_id, COALESCE(location, 'Farm'), {year_expr}, {month_expr},
+               transaction_type, SUM(quantity), COUNT(id)
+        FROM inventory_transaction
+        GROUP BY inventory_item_id, COALESCE(location, 'Farm'), {year_expr}, {month_expr}, transaction_type
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_balance_snapshot', schema=None) as batch_op:
+        batch_op.drop_index('ix_inventory_balance_snapshot_period')
+        batch_op.drop_index(batch_op.f('ix_inventory_balance_snapshot_inventory_item_id'))
+
+    op.drop_table('inventory_balance_snapshot')
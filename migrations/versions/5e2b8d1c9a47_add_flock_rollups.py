@@ -0,0 +1,104 @@
+"""Add flock weekly and monthly rollups
+
+Revision ID: 5e2b8d1c9a47
+Revises: d4a8e61f0b27
+Create Date: 2026-10-19 16:05:27.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2b8d1c9a47'
+down_revision = 'd4a8e61f0b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('flock_weekly_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('flock_id', sa.Integer(), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('days', sa.Integer(), nullable=False),
+    sa.Column('laying_days', sa.Integer(), nullable=False),
+    sa.Column('mortality_male', sa.Integer(), nullable=False),
+    sa.Column('mortality_female', sa.Integer(), nullable=False),
+    sa.Column('culls_male', sa.Integer(), nullable=False),
+    sa.Column('culls_female', sa.Integer(), nullable=False),
+    sa.Column('eggs_collected', sa.Integer(), nullable=False),
+    sa.Column('cull_eggs', sa.Integer(), nullable=False),
+    sa.Column('opening_stock_female', sa.Integer(), nullable=False),
+    sa.Column('stock_days_female', sa.Integer(), nullable=False),
+    sa.Column('hen_days', sa.Integer(), nullable=False),
+    sa.Column('laying_mortality_female', sa.Integer(), nullable=False),
+    sa.Column('feed_female_gp_sum', sa.Float(), nullable=False),
+    sa.Column('feed_female_gp_days', sa.Integer(), nullable=False),
+    sa.Column('bw_female_sum', sa.Float(), nullable=False),
+    sa.Column('bw_female_days', sa.Integer(), nullable=False),
+    sa.Column('uniformity_female_sum', sa.Float(), nullable=False),
+    sa.Column('uniformity_female_days', sa.Integer(), nullable=False),
+    sa.Column('egg_set', sa.Integer(), nullable=False),
+    sa.Column('hatched_chicks', sa.Integer(), nullable=False),
+    sa.Column('iso_year', sa.Integer(), nullable=False),
+    sa.Column('iso_week', sa.Integer(), nullable=False),
+    sa.Column('feed_code_id', sa.Integer(), nullable=True),
+    sa.Column('spark_json', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['feed_code_id'], ['feed_code.id'], name=op.f('fk_flock_weekly_rollup_feed_code_id_feed_code')),
+    sa.ForeignKeyConstraint(['flock_id'], ['flock.id'], name=op.f('fk_flock_weekly_rollup_flock_id_flock')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_flock_weekly_rollup')),
+    sa.UniqueConstraint('flock_id', 'iso_year', 'iso_week', name='uq_flock_weekly_rollup_key')
+    )
+    with op.batch_alter_table('flock_weekly_rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_flock_weekly_rollup_flock_id'), ['flock_id'], unique=False)
+        batch_op.create_index('ix_flock_weekly_rollup_period', ['iso_year', 'iso_week'], unique=False)
+
+    op.create_table('flock_monthly_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('flock_id', sa.Integer(), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('days', sa.Integer(), nullable=False),
+    sa.Column('laying_days', sa.Integer(), nullable=False),
+    sa.Column('mortality_male', sa.Integer(), nullable=False),
+    sa.Column('mortality_female', sa.Integer(), nullable=False),
+    sa.Column('culls_male', sa.Integer(), nullable=False),
+    sa.Column('culls_female', sa.Integer(), nullable=False),
+    sa.Column('eggs_collected', sa.Integer(), nullable=False),
+    sa.Column('cull_eggs', sa.Integer(), nullable=False),
+    sa.Column('opening_stock_female', sa.Integer(), nullable=False),
+    sa.Column('stock_days_female', sa.Integer(), nullable=False),
+    sa.Column('hen_days', sa.Integer(), nullable=False),
+    sa.Column('laying_mortality_female', sa.Integer(), nullable=False),
+    sa.Column('feed_female_gp_sum', sa.Float(), nullable=False),
+    sa.Column('feed_female_gp_days', sa.Integer(), nullable=False),
+    sa.Column('bw_female_sum', sa.Float(), nullable=False),
+    sa.Column('bw_female_days', sa.Integer(), nullable=False),
+    sa.Column('uniformity_female_sum', sa.Float(), nullable=False),
+    sa.Column('uniformity_female_days', sa.Integer(), nullable=False),
+    sa.Column('egg_set', sa.Integer(), nullable=False),
+    sa.Column('hatched_chicks', sa.Integer(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['flock_id'], ['flock.id'], name=op.f('fk_flock_monthly_rollup_flock_id_flock')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_flock_monthly_rollup')),
+    sa.UniqueConstraint('flock_id', 'year', 'month', name='uq_flock_monthly_rollup_key')
+    )
+    with op.batch_alter_table('flock_monthly_rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_flock_monthly_rollup_flock_id'), ['flock_id'], unique=False)
+        batch_op.create_index('ix_flock_monthly_rollup_period', ['year', 'month'], unique=False)
+
+    # Existing history is rolled up on the first report read (or up front with `flask rollup-rebuild`)
+
+
+def downgrade():
+    with op.batch_alter_table('flock_monthly_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_flock_monthly_rollup_period')
+        batch_op.drop_index(batch_op.f('ix_flock_monthly_rollup_flock_id'))
+
+    op.drop_table('flock_monthly_rollup')
+    with op.batch_alter_table('flock_weekly_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_flock_weekly_rollup_period')
+        batch_op.drop_index(batch_op.f('ix_flock_weekly_rollup_flock_id'))
+
+    op.drop_table('flock_weekly_rollup')
@@ -0,0 +1,49 @@
+"""Add push outbox
+
+Revision ID: 7c1e5b9a2d34
+Revises: 3f9c2a7d4b10
+Create Date: 2026-10-19 11:03:17.482105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5b9a2d34'
+down_revision = '3f9c2a7d4b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('push_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('url', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('claim_token', sa.String(length=36), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_push_outbox_user_id_user'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_push_outbox'))
+    )
+    with op.batch_alter_table('push_outbox', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_push_outbox_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_push_outbox_claim_token'), ['claim_token'], unique=False)
+        batch_op.create_index('ix_push_outbox_due', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('push_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_push_outbox_due')
+        batch_op.drop_index(batch_op.f('ix_push_outbox_claim_token'))
+        batch_op.drop_index(batch_op.f('ix_push_outbox_user_id'))
+
+    op.drop_table('push_outbox')
@@ -0,0 +1,33 @@
+"""Add flock analytics archive
+
+Revision ID: 8b3f0c6d2e15
+Revises: 5e2b8d1c9a47
+Create Date: 2026-10-19 17:21:09.442871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3f0c6d2e15'
+down_revision = '5e2b8d1c9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('flock_analytics_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('flock_id', sa.Integer(), nullable=False),
+    sa.Column('built_at', sa.DateTime(), nullable=False),
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['flock_id'], ['flock.id'], name=op.f('fk_flock_analytics_archive_flock_id_flock')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_flock_analytics_archive')),
+    sa.UniqueConstraint('flock_id', name=op.f('uq_flock_analytics_archive_flock_id'))
+    )
+    # Closed flocks are archived on first view
+
+
+def downgrade():
+    op.drop_table('flock_analytics_archive')
@@ -0,0 +1,26 @@
+"""Add flock data version
+
+Revision ID: a6d2c4e8f913
+Revises: 8b3f0c6d2e15
+Create Date: 2026-10-19 18:02:44.915306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2c4e8f913'
+down_revision = '8b3f0c6d2e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flock', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('flock', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
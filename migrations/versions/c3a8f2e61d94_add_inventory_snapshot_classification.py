@@ -0,0 +1,58 @@
+"""Add classification to inventory balance snapshot
+
+Revision ID: c3a8f2e61d94
+Revises: d7e3a1f5c208
+Create Date: 2026-10-19 21:04:37.518240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f2e61d94'
+down_revision = 'd7e3a1f5c208'
+branch_labels = None
+depends_on = None
+
+
+def _seed_snapshots(with_classification):
+    if op.get_bind().dialect.name == 'sqlite':
+        year_expr = "CAST(strftime('%Y', transaction_date) AS INTEGER)"
+        month_expr = "CAST(strftime('%m', transaction_date) AS INTEGER)"
+    else:
+        year_expr = "CAST(EXTRACT(YEAR FROM transaction_date) AS INTEGER)"
+        month_expr = "CAST(EXTRACT(MONTH FROM transaction_date) AS INTEGER)"
+    key = "transaction_type, COALESCE(classification, '')" if with_classification else "transaction_type"
+    columns = "transaction_type, classification" if with_classification else "transaction_type"
+
+    op.execute("DELETE FROM inventory_balance_snapshot")
+    op.execute(f"""
+        INSERT INTO inventory_balance_snapshot (inventory_item_id, location, period_year, period_month, {columns}, quantity, tx_count)
+        SELECT inventory_item_id, COALESCE(location, 'Farm'), {year_expr}, {month_expr},
+               {key}, SUM(quantity), COUNT(id)
+        FROM inventory_transaction
+        GROUP BY inventory_item_id, COALESCE(location, 'Farm'), {year_expr}, {month_expr}, {key}
+    """)
+
+
+def upgrade():
+    with op.batch_alter_table('inventory_balance_snapshot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('classification', sa.String(length=50), server_default='', nullable=False))
+        batch_op.drop_constraint('uq_inventory_balance_snapshot_key', type_='unique')
+        batch_op.create_unique_constraint('uq_inventory_balance_snapshot_key', ['inventory_item_id', 'location', 'period_year', 'period_month', 'transaction_type', 'classification'])
+
+    # Split the existing snapshots by classification
+    _seed_snapshots(with_classification=True)
+
+
+def downgrade():
+    # Merge the classifications back before the wider key goes
+    with op.batch_alter_table('inventory_balance_snapshot', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_inventory_balance_snapshot_key', type_='unique')
+    op.execute("DELETE FROM inventory_balance_snapshot")
+    with op.batch_alter_table('inventory_balance_snapshot', schema=None) as batch_op:
+        batch_op.drop_column('classification')
+        batch_op.create_unique_constraint('uq_inventory_balance_snapshot_key', ['inventory_item_id', 'location', 'period_year', 'period_month', 'transaction_type'])
+
+    _seed_snapshots(with_classification=False)
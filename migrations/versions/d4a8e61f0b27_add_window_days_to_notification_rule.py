@@ -0,0 +1,31 @@
+"""Add window_days to notification rule
+
+Revision ID: d4a8e61f0b27
+Revises: 7c1e5b9a2d34
+Create Date: 2026-10-19 13:40:52.118364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8e61f0b27'
+down_revision = '7c1e5b9a2d34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification_rule', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('window_days', sa.Integer(), nullable=True))
+
+    # Rule metrics now use the METRICS_REGISTRY keys
+    op.execute("UPDATE notification_rule SET metric = 'egg_prod_pct' WHERE metric = 'egg_production_pct'")
+
+
+def downgrade():
+    op.execute("UPDATE notification_rule SET metric = 'egg_production_pct' WHERE metric = 'egg_prod_pct'")
+
+    with op.batch_alter_table('notification_rule', schema=None) as batch_op:
+        batch_op.drop_column('window_days')
@@ -0,0 +1,30 @@
+"""Add grading cv, percentiles and bin width
+
+Revision ID: d7e3a1f5c208
+Revises: a6d2c4e8f913
+Create Date: 2026-10-19 19:26:10.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3a1f5c208'
+down_revision = 'a6d2c4e8f913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flock_grading', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cv', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('percentiles', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('bin_width', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('flock_grading', schema=None) as batch_op:
+        batch_op.drop_column('bin_width')
+        batch_op.drop_column('percentiles')
+        batch_op.drop_column('cv')
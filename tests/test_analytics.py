@@ -0,0 +1,199 @@
+import unittest
+import sys
+import os
+import random
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import parse_time_of_day, time_span_minutes, format_time_of_day, aggregate_periods, aggregate_weekly_metrics
+from analytics import predict_diseases, KeywordAutomaton, DISEASE_KNOWLEDGE_BASE, analyze_health_events, detect_farm_health_events, calculate_feed_cleanup_duration
+
+class TimeOfDayTestCase(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_time_of_day('06:30'), 390)
+        self.assertEqual(parse_time_of_day('6:05'), 365)
+        self.assertEqual(parse_time_of_day('18:45:59'), 1125)
+        for bad in (None, '', '24:00', '12:60', '8am', '08:00 PM', '1:2:3:4'):
+            self.assertIsNone(parse_time_of_day(bad), bad)
+
+    def test_spans_wrap_midnight(self):
+        self.assertEqual(time_span_minutes('06:00', '22:00'), 960)
+        self.assertEqual(time_span_minutes('22:00', '06:00'), 480)
+        self.assertEqual(time_span_minutes('07:00', '07:00'), 0)
+        self.assertIsNone(time_span_minutes('07:00', None))
+        self.assertEqual(calculate_feed_cleanup_duration('23:30', '01:15'), 105)
+        self.assertEqual(format_time_of_day('6:05:00'), '06:05')
+        self.assertEqual(format_time_of_day('n/a'), 'n/a')
+
+
+def _period_stats(flock_id, start, days, stock_f=5000):
+    stats = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        log = SimpleNamespace(flock_id=flock_id, clinical_notes='wet litter' if i == 3 else None, photos=[])
+        stats.append({
+            'log': log, 'date': day, 'week': i // 7 + 1, 'production_week': i // 7 + 1 if i >= 7 else None,
+            'stock_male_start': 500, 'stock_female_start': stock_f - 2 * i,
+            'mortality_male': 0, 'mortality_female': 1, 'culls_male': 0, 'culls_female': 1,
+            'eggs_collected': 4000 + i, 'hatch_eggs': 3900, 'has_cull_eggs': True,
+            'feed_m_kg': 60.0, 'feed_f_kg': 750.0, 'feed_total_kg': 810.0, 'water_total': 1500.0,
+            'feed_female_gp_bird': [150.0, 150.04, 152.0, 152.0, 150.0, 0.0, 0.0][i % 7],
+            'body_weight_female': 3000 if i % 7 == 0 else None, 'egg_set': None, 'hatched_chicks': None,
+            'std_egg_prod': 80.0 + i,
+        })
+    return stats
+
+
+class PeriodAggregationTestCase(unittest.TestCase):
+    def test_weekly_buckets_match_daily_figures(self):
+        stats = _period_stats(1, date(2024, 3, 4), 14)
+        week = aggregate_weekly_metrics(stats)[0]
+        self.assertEqual((week['week'], week['production_week'], week['count']), (1, None, 7))
+        self.assertEqual(week['eggs_collected'], sum(4000 + i for i in range(7)))
+        self.assertEqual(week['stock_female_start'], 5000)
+        self.assertAlmostEqual(week['egg_prod_pct'], week['eggs_collected'] / ((5000 - 7) * 7) * 100)
+        self.assertEqual(week['body_weight_female'], 3000)
+        self.assertEqual(week['std_egg_prod'], 86.0)
+        # 150.0 and 150.04 round together and beat 152.0
+        self.assertEqual(week['feed_female_gp_bird_majority'], 150.0)
+        self.assertEqual(week['notes'], ['wet litter'])
+        self.assertEqual((week['date_start'], week['date_end']), (date(2024, 3, 4), date(2024, 3, 10)))
+
+    def test_farm_buckets_sum_flocks_and_use_hen_days(self):
+        a = _period_stats(1, date(2024, 1, 20), 30)
+        b = _period_stats(2, date(2024, 2, 5), 10, stock_f=8000)
+        periods = aggregate_periods(a + b, ('iso_week', 'month', 'year'))
+
+        self.assertEqual([m['month'] for m in periods['month']], ['2024-01', '2024-02'])
+        self.assertEqual(periods['iso_week'][0]['iso_week'], '2024-W03')
+        year = periods['year'][0]
+        self.assertEqual(year['eggs_collected'], sum(m['eggs_collected'] for m in periods['month']))
+        self.assertEqual(year['stock_female_start'], 5000 + 8000)
+        hen_days = (5000 - 30) * 30 + (8000 - 10) * 10
+        self.assertAlmostEqual(year['egg_prod_pct'], year['eggs_collected'] / hen_days * 100)
+        self.assertEqual(year['count'], 40)
+
+    def test_no_female_feed_leaves_majority_at_zero(self):
+        stats = _period_stats(1, date(2024, 3, 4), 14)
+        for i, d in enumerate(stats):
+            d['feed_female_gp_bird'] = None if i % 2 else 0.0
+        periods = aggregate_periods(stats, ('week', 'month', 'iso_week', 'year'))
+        self.assertEqual(len(periods['week']), 2)
+        self.assertEqual({p['feed_female_gp_bird_majority'] for rows in periods.values() for p in rows}, {0.0})
+
+
+class DiseaseMatcherTestCase(unittest.TestCase):
+    def test_automaton_reports_overlapping_phrases(self):
+        automaton = KeywordAutomaton(['he', 'she', 'his', 'hers'])
+        self.assertEqual(automaton.find_all('ushers'), {'he', 'she', 'hers'})
+        self.assertEqual(automaton.find_all(''), set())
+
+    def test_matches_plain_substring_scan(self):
+        note = "Birds Coughing and SNICKING since Monday, some swollen face and nasal discharge. Bloody droppings in pen 3."
+        expected = []
+        for disease, info in DISEASE_KNOWLEDGE_BASE.items():
+            matched = [k for k in info['keywords'] if k in note.lower()]
+            if matched:
+                expected.append({"name": disease, "severity": info['severity'], "matched_symptoms": matched})
+        expected.sort(key=lambda x: 0 if x['severity'] == 'High' else 1)
+
+        result = predict_diseases(note)
+        self.assertEqual(result, expected)
+        self.assertEqual(result[0]['name'], "Infectious Bronchitis (IB)")
+
+        # Memoized results are handed out as fresh lists
+        result[0]['matched_symptoms'].append('edited')
+        self.assertEqual(predict_diseases(note), expected)
+
+    def test_empty_note(self):
+        self.assertEqual(predict_diseases(None), [])
+        self.assertEqual(predict_diseases("All normal"), [])
+
+def _fake_flock(flock_id, seed, days=60):
+    rng = random.Random(seed)
+    flock = SimpleNamespace(id=flock_id, intake_date=date(2024, 1, 1))
+    stats = []
+    stock_m, stock_f = 1000, 10000
+    for i in range(days):
+        mort_f = rng.choice([2, 3, 4, 30]) if i % 11 else 40
+        start, end = ('08:00', rng.choice(['10:00', '10:15', '11:30'])) if i % 5 else (None, None)
+        log = SimpleNamespace(flock=flock, clinical_notes='coughing in pen 2' if i == 33 else None,
+                              feed_cleanup_start=start, feed_cleanup_end=end)
+        water = 0.0 if i % 9 == 0 else rng.uniform(1500, 2200)
+        stats.append({
+            'log': log, 'date': flock.intake_date + timedelta(days=i),
+            'mortality_male': 1, 'mortality_female': mort_f, 'culls_male': 0, 'culls_female': 1,
+            'stock_male_start': stock_m, 'stock_female_start': stock_f,
+            'water_total': water, 'water_per_bird': water * 1000 / (stock_m + stock_f),
+        })
+        stock_m -= 1
+        stock_f -= mort_f + 1
+    log.flock = flock
+    return flock, stats
+
+
+def _reference_events(daily_stats, window=7):
+    # Plain loop over the same rules, previous `window` valid observations as baseline
+    events = []
+    hist_mort, hist_pct, hist_water, hist_cleanup = [], [], [], []
+    avg = lambda lst: sum(lst[-window:]) / len(lst[-window:]) if lst else 0.0
+    for d in daily_stats:
+        mort = d['mortality_male'] + d['mortality_female'] + d['culls_male'] + d['culls_female']
+        pct = mort / (d['stock_male_start'] + d['stock_female_start']) * 100
+        water = d['water_per_bird']
+        cleanup = calculate_feed_cleanup_duration(d['log'].feed_cleanup_start, d['log'].feed_cleanup_end)
+        flags = []
+        if d['log'].clinical_notes:
+            flags.append('notes')
+        if mort > 5 and (pct > avg(hist_pct) * 1.5 if avg(hist_pct) > 0 else True):
+            flags.append('mortality')
+        if avg(hist_water) > 0 and 0 < water < avg(hist_water) * 0.9:
+            flags.append('water')
+        if avg(hist_cleanup) > 0 and cleanup and cleanup > avg(hist_cleanup) + 30:
+            flags.append('cleanup')
+        if flags:
+            events.append((d['date'], tuple(flags)))
+        hist_mort.append(mort)
+        hist_pct.append(pct)
+        if water > 0:
+            hist_water.append(water)
+        if cleanup is not None:
+            hist_cleanup.append(cleanup)
+    return events[::-1]
+
+
+def _flag_kinds(event):
+    kinds = []
+    for flag in event['flags']:
+        for prefix, kind in (('Clinical', 'notes'), ('Mortality', 'mortality'), ('Water', 'water'), ('Slow', 'cleanup')):
+            if flag.startswith(prefix):
+                kinds.append(kind)
+    return tuple(kinds)
+
+
+class HealthEventDetectorTestCase(unittest.TestCase):
+    def test_matches_rolling_window_reference(self):
+        flock, stats = _fake_flock(1, seed=3)
+        events = analyze_health_events(None, stats)
+        self.assertEqual([(e['date'], _flag_kinds(e)) for e in events], _reference_events(stats))
+        noted = [e for e in events if e['notes']]
+        self.assertEqual(noted[0]['predicted_diseases'][0]['name'], "Infectious Bronchitis (IB)")
+
+    def test_farm_feed_equals_per_flock_results(self):
+        flocks = [_fake_flock(fid, seed=fid) for fid in (1, 2, 3)]
+        since = date(2024, 2, 1)
+        feed = detect_farm_health_events(flocks, since=since)
+
+        expected = []
+        for flock, stats in flocks:
+            expected.extend((e['date'], flock.id, _flag_kinds(e)) for e in analyze_health_events(None, stats) if e['date'] >= since)
+        expected.sort(key=lambda x: (-x[0].toordinal(), x[1]))
+        self.assertEqual([(e['date'], e['flock'].id, _flag_kinds(e)) for e in feed], expected)
+
+        self.assertEqual(len(detect_farm_health_events(flocks, limit=5)), 5)
+        self.assertEqual(detect_farm_health_events([]), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, DailyLog, PartitionWeight, Standard
+from sqlalchemy.orm import Session
+
+from app.services.bodyweight_service import get_bodyweight_history, get_standard_bw_map, invalidate_standards
+
+class BodyweightHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        invalidate_standards()
+
+        farm = Farm(name='BW Farm')
+        house = House(name='BW1')
+        db.session.add_all([farm, house])
+        db.session.flush()
+        self.start = date(2024, 1, 1)
+        self.flock = Flock(house_id=house.id, farm_id=farm.id, flock_id='BW1', intake_date=self.start,
+                           intake_male=500, intake_female=5000, status='Active')
+        db.session.add(self.flock)
+        db.session.flush()
+        for week in range(1, 11):
+            log = DailyLog(flock_id=self.flock.id, date=self.start + timedelta(days=7 * week - 1), is_weighing_day=True,
+                           body_weight_male=100 * week, body_weight_female=90 * week)
+            db.session.add(log)
+            db.session.flush()
+            db.session.add(PartitionWeight(log_id=log.id, partition_name='F1', body_weight=90 * week, uniformity=0.8))
+        db.session.add(Standard(week=5, std_bw_male=600, std_bw_female=400))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_previous_week_found_across_pages(self):
+        rows, pagination = get_bodyweight_history(page=1, per_page=4)
+        self.assertEqual(pagination.total, 10)
+        self.assertEqual([r['age_weeks'] for r in rows], [10, 9, 8, 7])
+        # Week 6 sits on the next page but still feeds week 7's gains
+        self.assertEqual(rows[-1]['avg_m_diff'], '+100g')
+        self.assertEqual(rows[-1]['f_parts'][0]['diff_g'], '+90g')
+
+        rows, _ = get_bodyweight_history(page=3, per_page=4)
+        self.assertEqual([r['age_weeks'] for r in rows], [2, 1])
+        self.assertEqual(rows[-1]['avg_m_diff'], 'N/A')
+
+    def test_filters_and_cached_standards(self):
+        rows, pagination = get_bodyweight_history(flock_id=self.flock.id, date_from=self.start + timedelta(days=30))
+        self.assertIsNone(pagination)
+        self.assertEqual([r['age_weeks'] for r in rows], [10, 9, 8, 7, 6, 5])
+        self.assertEqual(rows[-1]['avg_f_diff'], '+90g')
+        self.assertEqual(rows[-1]['std_m'], 600)
+
+        Standard.query.filter_by(week=5).first().std_bw_male = 650
+        db.session.commit()
+        rows, _ = get_bodyweight_history(date_to=self.start + timedelta(days=34))
+        self.assertEqual(rows[0]['std_m'], 650)
+
+    def test_standards_follow_other_workers(self):
+        self.assertEqual(get_standard_bw_map()[5], (600, 400))
+        db.session.commit()
+
+        with Session(db.engine) as other:
+            other.query(Standard).filter_by(week=5).one().std_bw_male = 700
+            other.flush()
+            # Not committed yet, the map read meanwhile must not outlive the commit
+            self.assertEqual(get_standard_bw_map()[5], (600, 400))
+            db.session.commit()
+            other.commit()
+        self.assertEqual(get_standard_bw_map()[5], (700, 400))
+
+if __name__ == '__main__':
+    unittest.main()
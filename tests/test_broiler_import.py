@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+import importlib.util
+import io
+import re
+import shutil
+import tempfile
+from datetime import date
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import User, BroilerFlock, BroilerDailyLog
+
+def template_workbook(logs):
+    """Broiler template: metadata in rows 1-7, daily records from row 11."""
+    rows = [[None] * 15 for _ in range(11)]
+    meta = ['IF Farm', 'B7', 'Hatchery A', 'Ross', 12000, '2024-05-01', 41.5]
+    for i, value in enumerate(meta, start=1):
+        rows[i][0] = 'label'
+        rows[i][2] = value
+    for log in logs:
+        rows.append(list(log) + [None] * (15 - len(log)))
+    buf = io.BytesIO()
+    pd.DataFrame(rows).to_excel(buf, header=False, index=False)
+    buf.seek(0)
+    return buf
+
+class BroilerImportTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        u = User(username='broiler_import', dept='Farm', role='Admin')
+        u.set_password('pass')
+        db.session.add(u)
+        db.session.commit()
+        self.app.post('/login', data={'username': 'broiler_import', 'password': 'pass'})
+
+    def tearDown(self):
+        shutil.rmtree(app.config['UPLOAD_FOLDER'], ignore_errors=True)
+        app.config['UPLOAD_FOLDER'] = self.upload_folder
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def upload(self, logs, **data):
+        data['file'] = (template_workbook(logs), 'broiler.xlsx')
+        return self.app.post('/broiler/import', data=data, content_type='multipart/form-data')
+
+    def test_dry_run_then_confirm(self):
+        logs = [
+            ['2024-05-01', 1, 12, None, None, 'FR-1', 'Starter', 150.5, None, 55, None, None, None, 0.9, 'ok'],
+            ['2024-05-02', None, 'n/a', None, None, None, 'Starter', '1,200', None, 70],
+            ['not a date', 3, 5],
+            ['2024-05-02', 2, 8, None, None, None, 'Starter', 160.0, None, 72],
+        ]
+        response = self.upload(logs, dry_run='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'2 new, 0 updated', response.data)
+        self.assertEqual(BroilerFlock.query.count(), 0)
+
+        token = re.search(rb'name="confirm_token" value="(\w+)"', response.data).group(1).decode()
+        response = self.app.post('/broiler/import', data={'confirm_token': token})
+        self.assertEqual(response.status_code, 302)
+
+        flock = BroilerFlock.query.one()
+        self.assertEqual((flock.intake_birds, flock.intake_date, flock.arrival_weight_g), (12000, date(2024, 5, 1), 41.5))
+        day1, day2 = BroilerDailyLog.query.order_by(BroilerDailyLog.date).all()
+        self.assertEqual((day1.death_count, day1.feed_receive, day1.standard_fcr, day1.remarks), (12, 'FR-1', 0.9, 'ok'))
+        # The repeated date keeps its last row
+        self.assertEqual((day2.day_number, day2.death_count, day2.feed_daily_use_kg), (2, 8, 160.0))
+
+        # The token is used up
+        response = self.app.post('/broiler/import', data={'confirm_token': token})
+        self.assertEqual(BroilerDailyLog.query.count(), 2)
+
+    def test_reimport_updates_existing_days(self):
+        self.upload([['2024-05-01', 1, 12], ['2024-05-02', 2, 3]])
+        self.upload([['2024-05-02', 2, 4], ['2024-05-03', None, 1]])
+        self.assertEqual(BroilerFlock.query.count(), 1)
+        logs = BroilerDailyLog.query.order_by(BroilerDailyLog.date).all()
+        self.assertEqual([(l.day_number, l.death_count) for l in logs], [(1, 12), (2, 4), (3, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
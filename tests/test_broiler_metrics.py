@@ -0,0 +1,108 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import User, BroilerFlock, BroilerDailyLog
+from app.services.broiler_metrics_service import broiler_metrics_for_flocks, get_standard_fcr_curve, invalidate_standard_fcr_curve
+
+class BroilerMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        u = User(username='broiler_test', dept='Farm', role='Admin')
+        u.set_password('pass')
+        start = date(2024, 5, 1)
+        # Imported flock with its own standard, and a hand-entered one without
+        self.imported = BroilerFlock(farm_name='BF', house_name='H1', intake_birds=1000, arrival_weight_g=40.0, intake_date=start)
+        self.manual = BroilerFlock(farm_name='BF', house_name='H2', intake_birds=10, arrival_weight_g=40.0, intake_date=start)
+        db.session.add_all([u, self.imported, self.manual])
+        db.session.flush()
+        for day, (death, feed, bw) in enumerate([(10, 19.8, 100.0), (0, 29.7, 190.0)], start=1):
+            db.session.add(BroilerDailyLog(flock_id=self.imported.id, date=start + timedelta(days=day - 1), day_number=day,
+                                           death_count=death, feed_daily_use_kg=feed, body_weight_g=bw, standard_fcr=0.5 * day))
+        for day, death in enumerate([4, 8, 1], start=1):
+            db.session.add(BroilerDailyLog(flock_id=self.manual.id, date=start + timedelta(days=day - 1), day_number=day,
+                                           death_count=death, feed_daily_use_kg=0.5, body_weight_g=0.0))
+        db.session.commit()
+        self.app.post('/login', data={'username': 'broiler_test', 'password': 'pass'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_cumulative_metrics_per_flock(self):
+        metrics = broiler_metrics_for_flocks([self.imported, self.manual])
+        day1, day2 = metrics[self.imported.id]
+        self.assertEqual((day1['balance'], day2['balance']), (990, 990))
+        self.assertAlmostEqual(day1['death_percentage'], 1.0)
+        self.assertAlmostEqual(day1['gram_per_bird'], 20.0)
+        self.assertAlmostEqual(day2['weight_gain'], 90.0)
+        self.assertAlmostEqual(day2['cumulative_fcr'], 50.0 / 150.0)
+        self.assertAlmostEqual(day2['fcr_gap'], 50.0 / 150.0 - 1.0)
+
+        # Balance stops at 0 and no feed is spread over an empty house
+        manual = metrics[self.manual.id]
+        self.assertEqual([m['balance'] for m in manual], [6, 0, 0])
+        self.assertEqual(manual[2]['gram_per_bird'], 0.0)
+        # Days without a standard of their own follow the imported standard curve
+        self.assertEqual([m['standard_fcr_curve'] for m in manual], [0.5, 1.0, None])
+
+    def test_summary_endpoint(self):
+        response = self.app.get('/broiler/api/summary')
+        self.assertEqual(response.status_code, 200)
+        flocks = {f['flock_id']: f for f in response.get_json()['flocks']}
+        self.assertEqual(flocks[self.imported.id]['day_number'], 2)
+        self.assertAlmostEqual(flocks[self.imported.id]['mortality_pct'], 1.0)
+        self.assertEqual(flocks[self.manual.id]['fcr_curve']['days'], [1, 2, 3])
+
+        response = self.app.get(f'/broiler/api/summary?flock_id={self.manual.id}')
+        self.assertEqual([f['flock_id'] for f in response.get_json()['flocks']], [self.manual.id])
+
+    def test_curve_follows_commits(self):
+        with Session(db.engine) as other:
+            other.query(BroilerDailyLog).filter_by(flock_id=self.imported.id, day_number=1).one().standard_fcr = 0.6
+            other.flush()
+            # Built from the committed logs while the other session's write is pending
+            self.assertEqual(get_standard_fcr_curve(), {1: 0.5, 2: 1.0})
+            other.commit()
+        self.assertEqual(get_standard_fcr_curve(), {1: 0.6, 2: 1.0})
+
+        # Bulk statements skip the mapper, the import marks the session itself
+        db.session.execute(update(BroilerDailyLog).where(BroilerDailyLog.day_number == 2).values(standard_fcr=1.2))
+        invalidate_standard_fcr_curve()
+        self.assertEqual(get_standard_fcr_curve()[2], 1.0)
+        db.session.commit()
+        self.assertEqual(get_standard_fcr_curve()[2], 1.2)
+
+        # Another worker's import runs no session hook here, only the stamp moves on
+        logs = BroilerDailyLog.__table__
+        with db.engine.begin() as connection:
+            connection.execute(logs.update().where(logs.c.day_number == 2).values(standard_fcr=1.4))
+        self.assertEqual(get_standard_fcr_curve()[2], 1.4)
+
+if __name__ == '__main__':
+    unittest.main()
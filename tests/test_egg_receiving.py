@@ -0,0 +1,108 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date
+
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, User, HouseFlockMapping, HatcheryEggReceipt
+from app.services.flock_routing_service import resolve_flock, get_houses_by_farm
+
+class EggReceivingTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.farm = Farm(name='Receiving Farm')
+        self.house = House(name='ER1')
+        u = User(username='receiving_test', dept='Hatchery', role='Admin')
+        u.set_password('pass')
+        db.session.add_all([self.farm, self.house, u])
+        db.session.flush()
+        self.flocks = [Flock(house_id=self.house.id, farm_id=self.farm.id, flock_id=f'ER1-{i}', intake_date=date(2023 + i, 1, 1),
+                             status='Active') for i in range(2)]
+        db.session.add_all(self.flocks)
+        db.session.flush()
+        db.session.add(HouseFlockMapping(farm_id=self.farm.id, house_id=self.house.id, flock_id=self.flocks[0].id,
+                                         start_date=date(2024, 1, 1)))
+        db.session.commit()
+        self.app.post('/login', data={'username': 'receiving_test', 'password': 'pass'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_routing_write_moves_receipts_to_new_flock(self):
+        self.assertEqual(resolve_flock(self.house.id, date(2024, 6, 1)).flock_id, self.flocks[0].id)
+        self.assertIsNone(resolve_flock(self.house.id, date(2023, 12, 31)))
+        self.assertEqual(get_houses_by_farm()[self.farm.id], [{'id': self.house.id, 'name': 'ER1'}])
+
+        self.app.post('/hatchery_flock_routing', data={'farm_id': self.farm.id, 'house_id': self.house.id,
+                                                       'flock_id': self.flocks[1].id, 'start_date': '2024-06-01'})
+        self.assertEqual(resolve_flock(self.house.id, date(2024, 5, 31)).flock_id, self.flocks[0].id)
+        self.assertEqual(resolve_flock(self.house.id, date(2024, 6, 1)).flock_id, self.flocks[1].id)
+
+    def test_index_built_between_flush_and_commit(self):
+        with Session(db.engine) as other:
+            other.query(HouseFlockMapping).filter_by(house_id=self.house.id).one().end_date = date(2024, 5, 31)
+            other.add(HouseFlockMapping(farm_id=self.farm.id, house_id=self.house.id, flock_id=self.flocks[1].id,
+                                        start_date=date(2024, 6, 1)))
+            other.flush()
+            # Built from the committed routings while the other session's write is pending
+            self.assertEqual(resolve_flock(self.house.id, date(2024, 6, 1)).flock_id, self.flocks[0].id)
+            other.commit()
+        self.assertEqual(resolve_flock(self.house.id, date(2024, 6, 1)).flock_id, self.flocks[1].id)
+
+    def test_index_follows_other_workers(self):
+        self.assertEqual(resolve_flock(self.house.id, date(2024, 6, 1)).flock_id, self.flocks[0].id)
+        self.assertEqual(get_houses_by_farm()[self.farm.id], [{'id': self.house.id, 'name': 'ER1'}])
+
+        # Another worker's commit runs no session hook here, only the stamp moves on
+        mapping = HouseFlockMapping.__table__
+        with db.engine.begin() as connection:
+            connection.execute(mapping.update().where(mapping.c.house_id == self.house.id).values(end_date=date(2024, 5, 31)))
+            connection.execute(mapping.insert().values(farm_id=self.farm.id, house_id=self.house.id, flock_id=self.flocks[1].id,
+                                                       start_date=date(2024, 6, 1)))
+            house_id = connection.execute(House.__table__.insert().values(name='ER0')).inserted_primary_key[0]
+            connection.execute(Flock.__table__.update().where(Flock.__table__.c.id == self.flocks[1].id).values(house_id=house_id))
+        self.assertEqual(resolve_flock(self.house.id, date(2024, 6, 1)).flock_id, self.flocks[1].id)
+        self.assertEqual([h['name'] for h in get_houses_by_farm()[self.farm.id]], ['ER0', 'ER1'])
+
+    def test_bulk_receipts(self):
+        batches = [{'house_id': self.house.id, 'batch_number': n, 'actual_received_qty': 5000, 'crack_cull': 40}
+                   for n in range(1, 25)]
+        response = self.app.post('/hatchery/egg_receiving/bulk', json={'arrival_date': '2024-03-05', 'batches': batches})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['created'], 24)
+        receipts = HatcheryEggReceipt.query.all()
+        self.assertEqual({(r.flock_id, r.settable_eggs) for r in receipts}, {(self.flocks[0].id, 4960)})
+
+        # One bad batch rejects the whole arrival
+        batches = [{'house_id': self.house.id, 'batch_number': 1, 'actual_received_qty': 100},
+                   {'house_id': self.house.id, 'batch_number': 2, 'actual_received_qty': 100, 'arrival_date': '2023-12-01'}]
+        response = self.app.post('/hatchery/egg_receiving/bulk', json={'arrival_date': '2024-03-06', 'batches': batches})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['index'] for e in response.get_json()['errors']], [1])
+        self.assertEqual(HatcheryEggReceipt.query.count(), 24)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import io
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import House, Flock, DailyLog, User, Farm
+from app.services import export_service
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['RATELIMIT_ENABLED'] = False
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Test Farm')
+        house = House(name='VA1')
+        db.session.add_all([farm, house])
+        db.session.commit()
+
+        self.flock = Flock(flock_id='VA1_230101_Batch1', farm_id=farm.id, house_id=house.id,
+                           intake_date=date(2023, 1, 1), intake_male=100, intake_female=1000)
+        db.session.add(self.flock)
+        db.session.commit()
+
+        for i in range(10):
+            db.session.add(DailyLog(flock_id=self.flock.id, date=date(2023, 1, 1) + timedelta(days=i),
+                                    mortality_female=1, light_on_time='06:00', light_off_time='18:00'))
+        db.session.commit()
+
+        u = User(username='admin_test', dept='Farm', role='Admin')
+        u.set_password('pass')
+        db.session.add(u)
+        db.session.commit()
+        self.app.post('/login', data={'username': 'admin_test', 'password': 'pass'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_csv_export_unchanged(self):
+        response = self.app.get(f'/api/flock/{self.flock.id}/export_csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        lines = response.data.decode().strip().splitlines()
+        self.assertTrue(lines[0].startswith('ID,Date,Age (Days)'))
+        self.assertEqual(len(lines), 11)
+
+    def test_xlsx_export_typed_and_frozen(self):
+        from openpyxl import load_workbook
+        response = self.app.get(f'/api/flock/{self.flock.id}/export_csv?format=xlsx')
+        self.assertEqual(response.status_code, 200)
+
+        wb = load_workbook(io.BytesIO(response.data))
+        ws = wb.active
+        self.assertEqual(ws.freeze_panes, 'A2')
+        self.assertEqual(ws['A1'].value, 'ID')
+        self.assertEqual(ws['B2'].value.date(), date(2023, 1, 1))
+        self.assertEqual(ws['F2'].value, 1)
+        self.assertEqual(ws.max_row, 11)
+
+    def test_metrics_frame_year_filter(self):
+        df = export_service.build_enriched_metrics_frame([self.flock], year=2023)
+        self.assertEqual(len(df), 10)
+        self.assertNotIn('log', df.columns)
+        self.assertIn('mortality_female_pct', df.columns)
+        self.assertEqual(len(export_service.build_enriched_metrics_frame([self.flock], year=2022)), 0)
+
+    @unittest.skipIf(export_service.pa is None, 'pyarrow is not installed')
+    def test_columnar_exports_round_trip(self):
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        df = export_service.build_enriched_metrics_frame([self.flock])
+        self.assertEqual(len(df), 10)
+
+        payload, mimetype, _ = export_service.export_flock(self.flock, 'parquet')
+        self.assertEqual(mimetype, 'application/vnd.apache.parquet')
+        # Parquet has no second-resolution timestamps, dates come back in milliseconds
+        pd.testing.assert_frame_equal(pq.read_table(io.BytesIO(payload)).to_pandas(), df.astype({'date': 'datetime64[ms]'}))
+
+        payload, _, _ = export_service.export_flock(self.flock, 'arrow')
+        pd.testing.assert_frame_equal(pa.ipc.open_file(io.BytesIO(payload)).read_all().to_pandas(), df)
+
+    def test_parquet_without_pyarrow(self):
+        if export_service.pa is not None:
+            self.skipTest('pyarrow installed')
+        with self.assertRaises(export_service.ExportError):
+            export_service.export_year(2023, 'parquet')
+
+if __name__ == '__main__':
+    unittest.main()
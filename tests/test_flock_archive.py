@@ -0,0 +1,147 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, DailyLog, Hatchability, FlockAnalyticsArchive, Medication, PartitionWeight
+from app.services.data_service import calculate_flock_summary
+from app.services.flock_archive_service import get_frozen_analytics, get_flock_summary
+from app.services.flock_view_service import get_flock_view
+from metrics import enrich_flock_data, aggregate_weekly_metrics, with_week_notes
+
+class FlockArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Archive Farm')
+        house = House(name='ARC1')
+        db.session.add_all([farm, house])
+        db.session.flush()
+        start = date(2024, 1, 1)
+        self.flock = Flock(house_id=house.id, farm_id=farm.id, flock_id='ARC1', intake_date=start,
+                           intake_male=500, intake_female=5000, status='Active')
+        db.session.add(self.flock)
+        db.session.flush()
+        for i in range(200):
+            db.session.add(DailyLog(flock_id=self.flock.id, date=start + timedelta(days=i),
+                                    mortality_female=i % 4, culls_male=i % 3, body_weight_female=1500 + i if i % 7 == 0 else 0,
+                                    eggs_collected=3000 + i if i >= 150 else 0, feed_female_gp_bird=120.0))
+        db.session.add(Hatchability(flock_id=self.flock.id, setting_date=date(2024, 6, 1), candling_date=date(2024, 6, 10),
+                                    hatching_date=date(2024, 6, 22), egg_set=1000, hatched_chicks=830))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _logs(self):
+        return DailyLog.query.filter_by(flock_id=self.flock.id).order_by(DailyLog.date.asc()).all()
+
+    def test_archive_matches_live_enrichment(self):
+        self.assertIsNone(get_frozen_analytics(self.flock, self._logs()))
+
+        self.flock.status = 'Inactive'
+        db.session.commit()
+        get_frozen_analytics(self.flock, self._logs())
+        self.assertEqual(FlockAnalyticsArchive.query.count(), 1)
+
+        logs = self._logs()
+        hatch = Hatchability.query.filter_by(flock_id=self.flock.id).all()
+        frozen = get_frozen_analytics(self.flock, logs)
+        live = enrich_flock_data(self.flock, logs, hatch)
+        self.assertEqual(frozen['daily'], live)
+        self.assertEqual(frozen['summary']['dashboard'], calculate_flock_summary(self.flock, live)[0])
+        weekly = aggregate_weekly_metrics(live)
+        self.assertEqual([w['egg_prod_pct'] for w in frozen['week']], [w['egg_prod_pct'] for w in weekly])
+        self.assertEqual(frozen['week'][0]['date_start'], date(2024, 1, 1))
+
+    def test_edits_drop_the_archive(self):
+        self.flock.status = 'Inactive'
+        db.session.commit()
+        get_frozen_analytics(self.flock, self._logs())
+
+        log = self._logs()[160]
+        log.eggs_collected += 100
+        db.session.commit()
+        self.assertEqual(FlockAnalyticsArchive.query.count(), 0)
+
+        frozen = get_frozen_analytics(self.flock, self._logs())
+        self.assertEqual(frozen['daily'][160]['eggs_collected'], 3260)
+
+        self.flock.status = 'Active'
+        db.session.commit()
+        self.assertEqual(FlockAnalyticsArchive.query.count(), 0)
+        self.assertIsNone(get_frozen_analytics(self.flock, self._logs()))
+
+    def test_summary_cached_per_data_version(self):
+        logs = self._logs()
+        logs[3].clinical_notes = 'Coughing'
+        db.session.commit()
+        version = self.flock.data_version
+        self.assertGreater(version, 0)
+
+        logs = self._logs()
+        live = enrich_flock_data(self.flock, logs, Hatchability.query.filter_by(flock_id=self.flock.id).all())
+        summary = get_flock_summary(self.flock, live)
+        self.assertEqual(summary['data_version'], version)
+        self.assertEqual(summary['table'], calculate_flock_summary(self.flock, live)[1])
+        self.assertIs(get_flock_summary(self.flock), summary)
+
+        weekly = with_week_notes(summary['weekly'], live)
+        expected = aggregate_weekly_metrics(live)
+        self.assertEqual([w['notes'] for w in weekly], [w['notes'] for w in expected])
+        self.assertEqual([w['egg_prod_pct'] for w in weekly], [w['egg_prod_pct'] for w in expected])
+        self.assertNotIn('notes', summary['weekly'][0])
+
+        logs[170].eggs_collected += 1000
+        db.session.commit()
+        self.assertEqual(self.flock.data_version, version + 1)
+        updated = get_flock_summary(self.flock)
+        self.assertIsNot(updated, summary)
+        self.assertGreater(updated['dashboard']['hha_total'], summary['dashboard']['hha_total'])
+
+    def test_view_details_bump_data_version(self):
+        self.flock.status = 'Inactive'
+        db.session.commit()
+        with app.test_request_context():
+            view = get_flock_view(self.flock)
+            self.assertIs(get_flock_view(self.flock), view)
+            self.assertEqual(FlockAnalyticsArchive.query.count(), 1)
+            version = self.flock.data_version
+
+            db.session.add(Medication(flock_id=self.flock.id, drug_name='Amoxicillin', dosage='1g/L',
+                                      start_date=date(2024, 1, 5), end_date=date(2024, 1, 7)))
+            db.session.commit()
+            self.assertEqual(self.flock.data_version, version + 1)
+            # Medications are not part of the archived analytics
+            self.assertEqual(FlockAnalyticsArchive.query.count(), 1)
+
+            updated = get_flock_view(self.flock)
+            self.assertIsNot(updated, view)
+            days = {row['log']['date']: row for row in updated['daily']}
+            self.assertEqual(days[date(2024, 1, 6)]['medications'], 'Amoxicillin')
+            self.assertEqual(updated['charts']['daily']['medication_names'][5], 'Amoxicillin')
+
+            log = self._logs()[14]
+            log.partition_weights.append(PartitionWeight(partition_name='F1', body_weight=1600))
+            db.session.commit()
+            self.assertEqual(self.flock.data_version, version + 2)
+            self.assertEqual(get_flock_view(self.flock)['charts']['daily']['bw_F1'][14], 1600)
+
+if __name__ == '__main__':
+    unittest.main()
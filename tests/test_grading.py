@@ -0,0 +1,63 @@
+import unittest
+import sys
+import os
+import importlib.util
+import json
+import random
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+from app.services.grading_service import grading_stats, grade_groups
+
+def reference_stats(weights):
+    # The per-bird loop the engine replaced
+    avg = sum(weights) / len(weights)
+    in_range = sum(1 for w in weights if avg * 0.9 <= w <= avg * 1.1)
+    bins = {}
+    for b in range(int(min(weights) // 100) * 100, -(-int(max(weights)) // 100) * 100 + 100, 100):
+        bins[str(b)] = 0
+    for w in weights:
+        bins[str(int(round(w / 100.0)) * 100)] += 1
+    return round(avg, 2), round(in_range / len(weights) * 100, 2), bins
+
+class GradingEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.weights = [round(rng.gauss(1800, 150)) for _ in range(3000)]
+
+    def test_matches_per_bird_loop(self):
+        stats = grading_stats(self.weights)
+        avg, uniformity, bins = reference_stats(self.weights)
+        self.assertEqual(stats['count'], 3000)
+        self.assertEqual(stats['average_weight'], avg)
+        self.assertEqual(stats['uniformity'], uniformity)
+        self.assertEqual(json.loads(stats['grading_bins']), bins)
+        self.assertEqual(list(json.loads(stats['grading_bins'])), list(bins))
+        self.assertAlmostEqual(stats['cv'], 150 / 1800 * 100, delta=0.5)
+        self.assertEqual(list(json.loads(stats['percentiles'])), ['P10', 'P25', 'P50', 'P75', 'P90'])
+
+    def test_bin_width_and_blank_readings(self):
+        stats = grading_stats([1000, 1020, 1030, None, float('nan'), 0, -5, 1090], bin_width=50)
+        self.assertEqual(stats['count'], 4)
+        self.assertEqual(stats['bin_width'], 50)
+        self.assertEqual(json.loads(stats['grading_bins']), {'1000': 2, '1050': 1, '1100': 1})
+        self.assertIsNone(grading_stats([None, 0]))
+
+    def test_many_pens_in_bulk(self):
+        rng = random.Random(7)
+        pens = {f'P{i}': [rng.gauss(2000, 180) for _ in range(5000)] for i in range(16)}
+        start_time = time.time()
+        results = grade_groups(pens, bin_width=50)
+        elapsed = time.time() - start_time
+        print(f"Graded 80000 birds in {elapsed * 1000:.1f} ms")
+        self.assertEqual(len(results), 16)
+        self.assertEqual(sum(r['count'] for r in results.values()), 80000)
+
+if __name__ == '__main__':
+    unittest.main()
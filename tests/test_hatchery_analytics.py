@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, Hatchability, Standard
+from app.services.hatchery_analytics_service import get_hatchery_analytics
+
+class HatcheryAnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Analytics Farm')
+        houses = [House(name='HA1'), House(name='HA2')]
+        db.session.add_all([farm] + houses)
+        db.session.flush()
+        self.today = date(2024, 8, 14)
+        # Week 32 on the next hatch date (Aug 16)
+        self.active = Flock(house_id=houses[0].id, farm_id=farm.id, flock_id='HA1', intake_date=date(2024, 1, 11),
+                            status='Active', phase='Production')
+        self.closed = Flock(house_id=houses[1].id, farm_id=farm.id, flock_id='HA2', intake_date=date(2023, 6, 1),
+                            status='Inactive', phase='Production')
+        db.session.add_all([self.active, self.closed, Standard(week=32, std_hatchability=80.0)])
+        db.session.flush()
+        self.add_hatch(self.active, date(2024, 7, 30), 1000, 850)
+        self.add_hatch(self.active, date(2024, 8, 9), 1000, 820)
+        self.add_hatch(self.active, date(2024, 8, 9), 500, 400)
+        self.add_hatch(self.active, date(2024, 8, 16), 1200, 0)
+        self.add_hatch(self.closed, date(2024, 8, 12), 1000, 600)
+        db.session.commit()
+
+    def add_hatch(self, flock, hatching_date, egg_set, hatched):
+        setting_date = hatching_date - timedelta(days=21)
+        db.session.add(Hatchability(flock_id=flock.id, setting_date=setting_date, candling_date=setting_date + timedelta(days=9),
+                                    hatching_date=hatching_date, egg_set=egg_set, hatched_chicks=hatched))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_last_next_and_month(self):
+        data = get_hatchery_analytics(self.today)
+        # The inactive flock's later hatch is left out of last/next but counted in the month
+        self.assertEqual(data['last_hatch']['date'], date(2024, 8, 9))
+        self.assertEqual(data['last_hatch']['total_hatched'], 1220)
+        self.assertAlmostEqual(data['last_hatch']['hatch_pct'], 1220 / 1500 * 100)
+        self.assertEqual(data['next_hatch'], {'date': date(2024, 8, 16), 'forecast': 960})
+        self.assertEqual(data['month']['total_hatched'], 1820)
+        self.assertEqual(data['month']['total_set'], 3700)
+
+    def test_cached_until_hatch_write(self):
+        first = get_hatchery_analytics(self.today)
+        self.assertIs(get_hatchery_analytics(self.today), first)
+
+        self.add_hatch(self.active, date(2024, 8, 14), 800, 700)
+        db.session.commit()
+        data = get_hatchery_analytics(self.today)
+        self.assertIsNot(data, first)
+        self.assertEqual(data['last_hatch']['date'], self.today)
+        self.assertEqual(data['next_hatch']['date'], date(2024, 8, 16))
+
+if __name__ == '__main__':
+    unittest.main()
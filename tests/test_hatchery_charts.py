@@ -0,0 +1,72 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, DailyLog, Hatchability, Medication
+from app.services.hatchery_chart_service import get_hatchery_chart
+
+class HatcheryChartTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Hatch Farm')
+        house = House(name='HC1')
+        db.session.add_all([farm, house])
+        db.session.flush()
+        self.start = date(2024, 1, 1)
+        self.flock = Flock(house_id=house.id, farm_id=farm.id, flock_id='HC1', intake_date=self.start,
+                           intake_male=500, intake_female=5000, status='Active')
+        db.session.add(self.flock)
+        db.session.flush()
+        # Settings in weeks 25 and 26, two in week 26
+        for days in (170, 176, 178):
+            d = self.start + timedelta(days=days)
+            db.session.add(Hatchability(flock_id=self.flock.id, setting_date=d, candling_date=d + timedelta(days=9),
+                                        hatching_date=d + timedelta(days=21), egg_set=1000, clear_eggs=50,
+                                        rotten_eggs=10, hatched_chicks=850, male_ratio_pct=9.0 + days % 2))
+        db.session.add(DailyLog(flock_id=self.flock.id, date=self.start + timedelta(days=172), clinical_notes='Coughing'))
+        db.session.add(DailyLog(flock_id=self.flock.id, date=self.start + timedelta(days=180), clinical_notes=''))
+        db.session.add(Medication(flock_id=self.flock.id, drug_name='Amoxicillin', dosage='10mg', start_date=self.start + timedelta(days=160),
+                                  end_date=self.start + timedelta(days=171)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_notes_and_meds_by_week(self):
+        data = get_hatchery_chart(self.flock)
+        self.assertEqual(data['weeks'], ['Week 25', 'Week 26'])
+        self.assertEqual(data['hatch_pct'], [85.0, 85.0])
+        self.assertEqual(data['male_ratio_pct'], [9.0, 9.0])
+        self.assertEqual(data['notes'], ['Notes: 21/06: Coughing | Meds: Amoxicillin', None])
+
+    def test_cached_until_flock_data_changes(self):
+        first = get_hatchery_chart(self.flock)
+        self.assertIs(get_hatchery_chart(self.flock), first)
+
+        db.session.add(Medication(flock_id=self.flock.id, drug_name='Vitamin C', dosage='1g', start_date=self.start + timedelta(days=177)))
+        db.session.commit()
+        db.session.refresh(self.flock)
+        data = get_hatchery_chart(self.flock)
+        self.assertIsNot(data, first)
+        self.assertEqual(data['notes'][1], 'Meds: Vitamin C')
+
+if __name__ == '__main__':
+    unittest.main()
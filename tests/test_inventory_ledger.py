@@ -0,0 +1,118 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import InventoryItem, InventoryTransaction, InventoryBalanceSnapshot, User
+from app.services import inventory_service
+
+class InventoryLedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['RATELIMIT_ENABLED'] = False
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.item = InventoryItem(name='Gloves', type='Inventory', location='Hatchery')
+        db.session.add(self.item)
+        db.session.commit()
+
+        u = User(username='admin_test', dept='Admin', role='Admin')
+        u.set_password('pass')
+        db.session.add(u)
+        db.session.commit()
+        self.app.post('/login', data={'username': 'admin_test', 'password': 'pass'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _tx(self, tx_type, qty, tx_date, classification=None):
+        t = InventoryTransaction(inventory_item_id=self.item.id, transaction_type=tx_type, quantity=qty, transaction_date=tx_date,
+                                 location='Hatchery', classification=classification)
+        db.session.add(t)
+        db.session.commit()
+        return t
+
+    def test_snapshots_follow_insert_update_delete(self):
+        self._tx('In', 100, date(2024, 1, 5))
+        out_tx = self._tx('Out', 30, date(2024, 1, 20))
+        self._tx('Out', 10, date(2024, 2, 2))
+
+        self.assertEqual(inventory_service.get_item_balance(self.item.id, 'Hatchery'), 60)
+        self.assertEqual(inventory_service.get_usage_by_month([(2024, 1), (2024, 2)])[self.item.id], {(2024, 1): 30, (2024, 2): 10})
+
+        # Moving a transaction to another month shifts it between snapshots
+        out_tx.quantity = 40
+        out_tx.transaction_date = date(2024, 2, 1)
+        db.session.commit()
+        self.assertEqual(inventory_service.get_usage_by_month([(2024, 1), (2024, 2)])[self.item.id], {(2024, 1): 0, (2024, 2): 50})
+
+        db.session.delete(out_tx)
+        db.session.commit()
+        self.assertEqual(inventory_service.get_item_balance(self.item.id, 'Hatchery'), 90)
+        self.assertEqual(inventory_service.reconcile_snapshots(), [])
+
+        response = self.app.get(f'/hatchery/api/inventory/{self.item.id}/balance')
+        self.assertEqual(response.get_json()['balance'], 90)
+
+    def test_reconcile_detects_and_fixes_drift(self):
+        self._tx('In', 100, date(2024, 1, 5))
+        InventoryBalanceSnapshot.query.update({'quantity': 5})
+        db.session.commit()
+
+        self.assertEqual(len(inventory_service.reconcile_snapshots()), 1)
+        inventory_service.reconcile_snapshots(fix=True)
+        self.assertEqual(inventory_service.reconcile_snapshots(), [])
+        self.assertEqual(inventory_service.get_item_balance(self.item.id), 100)
+
+    def test_hatchery_summary_by_classification(self):
+        self._tx('In', 100, date(2024, 1, 5), 'Purchase')
+        self._tx('In', 20, date(2024, 1, 6), 'Transfer')
+        usage = self._tx('Out', 30, date(2024, 1, 20), 'Usage')
+        self._tx('Out', 5, date(2024, 1, 21))
+
+        summary = inventory_service.get_month_summary(2024, 1, location='Hatchery', classified=True)
+        self.assertEqual(summary[self.item.id], {'purchase': 100, 'transfer': 20, 'usage': 30, 'out': 5})
+        self.assertEqual(inventory_service.get_month_summary(2024, 1)[self.item.id], {'in': 120, 'out': 35})
+
+        # Reclassifying moves the quantity between snapshots
+        usage.classification = 'Dispose'
+        db.session.commit()
+        summary = inventory_service.get_month_summary(2024, 1, location='Hatchery', classified=True)
+        self.assertEqual(summary[self.item.id]['dispose'], 30)
+        self.assertNotIn('usage', summary[self.item.id])
+        self.assertEqual(inventory_service.reconcile_snapshots(), [])
+
+        # Hatchery stock going out is not farm usage
+        self.assertEqual(inventory_service.get_usage_by_month([(2024, 1)], types=inventory_service.USAGE_TYPES), {})
+
+        response = self.app.get('/hatchery/inventory?month=1&year=2024')
+        self.assertEqual(response.status_code, 200)
+
+    def test_item_delete_removes_snapshots(self):
+        self._tx('In', 100, date(2024, 1, 5))
+        db.session.delete(self.item)
+        db.session.commit()
+        self.assertEqual(InventoryBalanceSnapshot.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import sys
+import os
+import random
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, DailyLog, Hatchability, FlockWeeklyRollup, FlockMonthlyRollup
+from app.services.data_service import get_iso_aggregated_data
+from app.services.rollup_service import rebuild_rollups
+from metrics import enrich_flock_data
+
+class IsoReportTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Iso Farm')
+        db.session.add(farm)
+        db.session.flush()
+        rng = random.Random(7)
+        # One closed flock with a manual production-start count, one still running
+        for n, (status, prod_start) in enumerate((('Inactive', 8200), ('Active', 0))):
+            house = House(name=f'ISO{n}')
+            db.session.add(house)
+            db.session.flush()
+            start = date(2023, 8, 1) + timedelta(days=40 * n)
+            flock = Flock(house_id=house.id, farm_id=farm.id, flock_id=f'ISO{n}', intake_date=start,
+                          intake_male=900, intake_female=9000, prod_start_female=prod_start, status=status)
+            db.session.add(flock)
+            db.session.flush()
+            for i in range(260):
+                laying = i >= 120
+                db.session.add(DailyLog(
+                    flock_id=flock.id, date=start + timedelta(days=i),
+                    mortality_female=rng.randint(0, 6), culls_female=rng.randint(0, 2),
+                    females_moved_to_hosp=20 if i == 10 else 0, mortality_female_hosp=1 if 10 < i < 120 and i % 20 == 0 else 0,
+                    females_out_flock=5 if i == 150 else 0,
+                    eggs_collected=rng.randint(5000, 7500) if laying else 0,
+                ))
+            db.session.add(Hatchability(flock_id=flock.id, setting_date=date(2024, 2, 1), candling_date=date(2024, 2, 10),
+                                        hatching_date=date(2024, 2, 22), egg_set=1000, hatched_chicks=850 + n))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _expected(self, year, prefix):
+        eggs = mort = hen_days = 0
+        avg_stock = 0.0
+        for flock in Flock.query.all():
+            flock_hen_days = laying_days = 0
+            for d in enrich_flock_data(flock, flock.logs):
+                if d['date'].year != year or not d['date'].isoformat().startswith(prefix):
+                    continue
+                eggs += d['eggs_collected']
+                if flock.production_start_date and d['date'] >= flock.production_start_date:
+                    mort += d['mortality_female']
+                    flock_hen_days += d['stock_female_start']
+                    laying_days += 1
+            hen_days += flock_hen_days
+            if laying_days:
+                avg_stock += flock_hen_days / laying_days
+        return eggs, mort, hen_days, avg_stock
+
+    def _rollups(self):
+        cols = [c.name for c in FlockWeeklyRollup.__table__.columns if c.name != 'id']
+        weekly = sorted(tuple(getattr(r, c) for c in cols) for r in FlockWeeklyRollup.query.all())
+        cols = [c.name for c in FlockMonthlyRollup.__table__.columns if c.name != 'id']
+        monthly = sorted(tuple(getattr(r, c) for c in cols) for r in FlockMonthlyRollup.query.all())
+        return weekly, monthly
+
+    def test_sql_totals_match_enrichment(self):
+        report = get_iso_aggregated_data(2024)
+        for key, prefix in (('yearly', '2024'), ('monthly', '2024-03')):
+            row = next(r for r in report[key] if r['period'] == prefix)
+            eggs, mort, hen_days, avg_stock = self._expected(2024, prefix)
+            self.assertEqual(row['total_eggs'], eggs)
+            self.assertEqual(row['avg_female_stock'], int(avg_stock))
+            self.assertAlmostEqual(row['egg_production_pct'], round(eggs / hen_days * 100, 2))
+            self.assertAlmostEqual(row['mortality_pct'], round(mort / avg_stock * 100, 2))
+
+        self.assertEqual([r['period'] for r in report['yearly']], ['2024', '2023'])
+        self.assertEqual(report['yearly'][0]['total_chicks'], 1701)
+        self.assertEqual(report['yearly'][0]['hatchability_pct'], 85.05)
+        self.assertEqual(report['weekly'][0]['period'], max(r['period'] for r in report['weekly']))
+        self.assertEqual(report['weekly'][-1]['period'], '2024-W01')
+
+        # Laying started in December only for the first flock
+        dec = get_iso_aggregated_data(2023)['monthly'][0]
+        self.assertEqual(dec['period'], '2023-12')
+        self.assertEqual(dec['total_eggs'], self._expected(2023, '2023-12')[0])
+        self.assertEqual(get_iso_aggregated_data(2024, flock_ids=[])['yearly'], [])
+
+    def test_incremental_refresh_matches_rebuild(self):
+        first, second = Flock.query.order_by(Flock.id).all()
+        log = DailyLog.query.filter_by(flock_id=first.id, date=first.intake_date + timedelta(days=200)).one()
+        log.eggs_collected += 500
+        log.mortality_female += 3
+        db.session.delete(DailyLog.query.filter_by(flock_id=second.id, date=second.intake_date + timedelta(days=130)).one())
+        moved = DailyLog.query.filter_by(flock_id=second.id, date=second.intake_date + timedelta(days=259)).one()
+        moved.date = moved.date + timedelta(days=40)
+        Hatchability.query.filter_by(flock_id=first.id).one().hatched_chicks = 700
+        db.session.commit()
+
+        incremental = self._rollups()
+        rebuild_rollups()
+        self.assertEqual(self._rollups(), incremental)
+        self.assertEqual(get_iso_aggregated_data(2024)['yearly'][0]['total_chicks'], 1551)
+
+        db.session.delete(second)
+        db.session.commit()
+        self.assertEqual(FlockMonthlyRollup.query.filter_by(flock_id=second.id).count(), 0)
+
+    def test_missing_rollups_build_on_first_read(self):
+        expected = get_iso_aggregated_data(2024)
+        rollups = self._rollups()
+        # As left by the migration that added the tables
+        FlockWeeklyRollup.query.delete()
+        FlockMonthlyRollup.query.delete()
+        db.session.commit()
+
+        self.assertEqual(get_iso_aggregated_data(2024), expected)
+        self.assertEqual(self._rollups(), rollups)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+import importlib.util
+import io
+from datetime import date, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, DailyLog, Hatchability
+from app.services.data_service import process_hatchability_import
+from app.services.male_ratio_service import FlockMaleRatios, ratio_window
+
+class MaleRatioTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Ratio Farm')
+        self.house = House(name='MR1')
+        db.session.add_all([farm, self.house])
+        db.session.flush()
+        # Monday intake; 100 males and 1000 females, one male lost every day
+        self.start = date(2024, 1, 1)
+        self.flock = Flock(house_id=self.house.id, farm_id=farm.id, flock_id='MR1', intake_date=self.start,
+                           intake_male=100, intake_female=1000, status='Active')
+        db.session.add(self.flock)
+        db.session.flush()
+        for i in range(30):
+            db.session.add(DailyLog(flock_id=self.flock.id, date=self.start + timedelta(days=i), mortality_male=1))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_window_averages(self):
+        self.assertEqual(ratio_window(date(2024, 1, 16))[:2], (date(2024, 1, 12), date(2024, 1, 15)))
+        self.assertEqual(ratio_window(date(2024, 1, 19))[:2], (date(2024, 1, 16), date(2024, 1, 18)))
+        self.assertTrue(ratio_window(date(2024, 1, 29), date(2024, 1, 10))[2])
+
+        ratios = FlockMaleRatios(self.flock)
+        # Tuesday 16th: Fri 12th..Mon 15th start with 89..86 males
+        ratio, large_window = ratios.ratio(date(2024, 1, 16))
+        self.assertAlmostEqual(ratio, 8.75)
+        self.assertFalse(large_window)
+        # Wednesday with no earlier setting: the past week, 10th..16th
+        self.assertAlmostEqual(ratios.ratio(date(2024, 1, 17))[0], 8.8)
+        ratios.add_setting(date(2024, 1, 12))
+        self.assertAlmostEqual(ratios.ratio(date(2024, 1, 17))[0], 8.7)
+        self.assertIsNone(ratios.ratio(date(2024, 3, 5))[0])
+
+    def test_import_batch_uses_its_own_settings(self):
+        sheet = pd.DataFrame({
+            'Setting Date': [date(2024, 1, 12), date(2024, 1, 17)],
+            'Flock ID': ['MR1', 'MR1'],
+            'Egg Set': [1000, 1200],
+            'Hatched Chicks': [800, 950],
+        })
+        buf = io.BytesIO()
+        sheet.to_excel(buf, sheet_name='Data', index=False)
+        buf.seek(0)
+        self.assertEqual(process_hatchability_import(buf), (2, 0))
+
+        records = Hatchability.query.filter_by(flock_id=self.flock.id).order_by(Hatchability.setting_date).all()
+        self.assertAlmostEqual(records[0].male_ratio_pct, 9.1)
+        # Wednesday setting averages the days since Friday's setting in the same file
+        self.assertAlmostEqual(records[1].male_ratio_pct, 8.7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import importlib.util
+import io
+import shutil
+import tempfile
+from datetime import date
+from unittest import mock
+
+from werkzeug.datastructures import FileStorage
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import Farm, House, Flock, DailyLog, DailyLogPhoto, User
+from app.services.photo_service import store_photo, build_variants, variant_path, backfill_photos, Image
+
+def upload(raw, name='IMG_0001.JPG'):
+    return FileStorage(stream=io.BytesIO(raw), filename=name)
+
+class PhotoServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Photo Farm')
+        house = House(name='PH1')
+        u = User(username='photo_test', dept='Farm', role='Admin')
+        u.set_password('pass')
+        db.session.add_all([farm, house, u])
+        db.session.flush()
+        flock = Flock(house_id=house.id, farm_id=farm.id, flock_id='PH1', intake_date=date(2024, 1, 1))
+        db.session.add(flock)
+        db.session.flush()
+        self.log = DailyLog(flock_id=flock.id, date=date(2024, 3, 1))
+        db.session.add(self.log)
+        db.session.commit()
+        self.app.post('/login', data={'username': 'photo_test', 'password': 'pass'})
+
+    def tearDown(self):
+        shutil.rmtree(app.config['UPLOAD_FOLDER'], ignore_errors=True)
+        app.config['UPLOAD_FOLDER'] = self.upload_folder
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_photo(self, path):
+        photo = DailyLogPhoto(log_id=self.log.id, file_path=path, original_filename=os.path.basename(path))
+        db.session.add(photo)
+        db.session.commit()
+        return photo
+
+    def test_duplicate_upload_shares_one_file(self):
+        first = store_photo(upload(b'same bytes'), app.config['UPLOAD_FOLDER'])
+        second = store_photo(upload(b'same bytes', 'copy.jpg'), app.config['UPLOAD_FOLDER'])
+        self.assertEqual(first, second)
+        self.assertRegex(os.path.basename(first), r'^[0-9a-f]{32}\.jpg$')
+
+        photos = [self.add_photo(first), self.add_photo(second)]
+        self.assertEqual(self.app.delete(f'/daily_log/photo/{photos[0].id}/delete').status_code, 204)
+        self.assertTrue(os.path.exists(first))
+        self.app.delete(f'/daily_log/photo/{photos[1].id}/delete')
+        self.assertFalse(os.path.exists(first))
+
+    def test_cache_headers(self):
+        path = store_photo(upload(b'photo bytes'), app.config['UPLOAD_FOLDER'])
+        name = os.path.basename(path)
+        response = self.app.get(f'/uploads/{name}')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+
+        # A variant that is not built yet falls back to the original, without the long cache
+        response = self.app.get(f"/uploads/{os.path.basename(variant_path(path, 'web'))}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'photo bytes')
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+
+    def test_backfill_rehashes_upload_names(self):
+        legacy = os.path.join(app.config['UPLOAD_FOLDER'], 'PH1_240301_Note1_IMG_0001.JPG')
+        with open(legacy, 'wb') as fh:
+            fh.write(b'legacy bytes')
+        photo = self.add_photo(legacy)
+
+        stats = backfill_photos(rehash=True)
+        self.assertEqual((stats['photos'], stats['renamed'], stats['missing']), (1, 1, 0))
+        self.assertFalse(os.path.exists(legacy))
+        self.assertRegex(os.path.basename(db.session.get(DailyLogPhoto, photo.id).file_path), r'^[0-9a-f]{32}\.jpg$')
+
+    def test_backfill_crash_keeps_rows_on_files(self):
+        paths = []
+        for n in range(2):
+            paths.append(os.path.join(app.config['UPLOAD_FOLDER'], f'PH1_240301_Note{n}_IMG_0001.JPG'))
+            with open(paths[-1], 'wb') as fh:
+                fh.write(b'legacy bytes %d' % n)
+            self.add_photo(paths[-1])
+
+        with mock.patch('app.services.photo_service.build_variants', side_effect=[[], RuntimeError('crash')]):
+            with self.assertRaises(RuntimeError):
+                backfill_photos(rehash=True)
+        db.session.rollback()
+        photos = DailyLogPhoto.query.order_by(DailyLogPhoto.id).all()
+        self.assertNotEqual(photos[0].file_path, paths[0])
+        self.assertTrue(all(os.path.exists(p.file_path) for p in photos))
+        self.assertFalse(os.path.exists(paths[0]))
+
+    @unittest.skipIf(Image is None, 'Pillow is not installed')
+    def test_variants_fit_their_sizes(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (4000, 3000), 'green').save(buf, 'JPEG')
+        path = store_photo(upload(buf.getvalue()), app.config['UPLOAD_FOLDER'])
+        self.assertEqual(build_variants(path), [])
+        with Image.open(variant_path(path, 'thumb')) as thumb, Image.open(variant_path(path, 'web')) as web:
+            self.assertEqual((thumb.size, web.size), ((320, 240), (1280, 960)))
+
+if __name__ == '__main__':
+    unittest.main()
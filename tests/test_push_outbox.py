@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import User, PushSubscription, PushOutbox, NotificationHistory
+from app.services import notification_service
+from pywebpush import WebPushException
+
+class PushOutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.users = []
+        for name in ('alice', 'bob', 'carol'):
+            u = User(username=name, dept='Farm', role='Admin')
+            u.set_password('pass')
+            db.session.add(u)
+            self.users.append(u)
+        db.session.commit()
+
+        alice, bob, _ = self.users
+        db.session.add_all([
+            PushSubscription(user_id=alice.id, subscription_json='{"endpoint": "https://push/alice-old"}'),
+            PushSubscription(user_id=alice.id, subscription_json='{"endpoint": "https://push/alice"}'),
+            PushSubscription(user_id=bob.id, subscription_json='{"endpoint": "https://push/bob"}'),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _fake_webpush(self, subscription_info, **kwargs):
+        endpoint = subscription_info['endpoint']
+        if endpoint.endswith('alice-old'):
+            raise WebPushException('Gone', response=mock.Mock(status_code=410))
+        if endpoint.endswith('bob'):
+            raise WebPushException('Unavailable', response=mock.Mock(status_code=503))
+
+    def test_queue_then_dispatch(self):
+        queued = notification_service.queue_push_alert([u.id for u in self.users], 'Alert', 'Mortality high', url='/flock/1')
+        self.assertEqual(queued, 3)
+        self.assertEqual(PushOutbox.query.count(), 3)
+        db.session.commit()
+        self.assertEqual(NotificationHistory.query.count(), 3)
+
+        env = {'VAPID_PRIVATE_KEY': 'key', 'VAPID_CLAIM_EMAIL': 'mailto:ops@example.com'}
+        with mock.patch.dict(os.environ, env), mock.patch.object(notification_service, 'webpush', side_effect=self._fake_webpush):
+            stats = notification_service.drain_outbox()
+
+        self.assertEqual(stats, {'claimed': 3, 'sent': 1, 'retry': 1, 'failed': 1})
+        alice, bob, carol = self.users
+        by_user = {o.user_id: o for o in PushOutbox.query.all()}
+        self.assertEqual(by_user[alice.id].status, 'sent')
+        self.assertEqual(by_user[bob.id].status, 'pending')
+        self.assertEqual(by_user[bob.id].attempts, 1)
+        self.assertGreater(by_user[bob.id].next_attempt_at, datetime.utcnow())
+        self.assertEqual(by_user[carol.id].status, 'failed')
+
+        # The expired subscription is cleaned up, the live ones stay
+        endpoints = sorted(s.subscription_json for s in PushSubscription.query.all())
+        self.assertEqual(endpoints, ['{"endpoint": "https://push/alice"}', '{"endpoint": "https://push/bob"}'])
+
+        # Bob's retry is not due yet
+        self.assertEqual(notification_service.process_outbox()['claimed'], 0)
+
+    def test_prune_keeps_pending_and_recent_rows(self):
+        old = datetime.utcnow() - timedelta(days=notification_service.PUSH_RETENTION_DAYS + 1)
+        alice = self.users[0]
+        for status, created in (('sent', old), ('failed', old), ('pending', old), ('sent', datetime.utcnow())):
+            db.session.add(PushOutbox(user_id=alice.id, title=status, body='b', status=status, created_at=created))
+        db.session.commit()
+
+        self.assertEqual(notification_service.prune_outbox(), 2)
+        self.assertEqual(sorted((o.status, o.created_at > old) for o in PushOutbox.query.all()), [('pending', False), ('sent', True)])
+
+if __name__ == '__main__':
+    unittest.main()
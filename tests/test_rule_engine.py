@@ -0,0 +1,134 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+from unittest import mock
+
+from sqlalchemy import inspect
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import House, Flock, DailyLog, Farm, NotificationRule, PushOutbox, User
+from app.services import rule_engine
+from metrics import enrich_flock_data
+
+class RuleEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = app.test_request_context()
+        self.ctx.push()
+        db.create_all()
+        rule_engine.invalidate_rules()
+
+        farm = Farm(name='Test Farm')
+        db.session.add(farm)
+        db.session.add(User(username='admin_test', dept='Admin', role='Admin', password_hash='x'))
+        self.flocks = []
+        for i, deaths in enumerate((1, 8)):
+            house = House(name=f'VA{i + 1}')
+            db.session.add(house)
+            db.session.flush()
+            flock = Flock(flock_id=f'VA{i + 1}_230101_Batch1', farm_id=farm.id, house_id=house.id,
+                          intake_date=date(2023, 1, 1), intake_male=100, intake_female=1000)
+            db.session.add(flock)
+            db.session.flush()
+            for d in range(10):
+                # The second flock has a bad last three days
+                mort = deaths if d >= 7 else 1
+                db.session.add(DailyLog(flock_id=flock.id, date=date(2023, 1, 2) + timedelta(days=d), mortality_female=mort))
+            self.flocks.append(flock)
+        db.session.commit()
+        self.day = date(2023, 1, 11)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _rule(self, **kwargs):
+        db.session.add(NotificationRule(name=kwargs.pop('name', 'Rule'), **kwargs))
+        db.session.commit()
+
+    def test_batch_mode_with_window_and_cumulative_metrics(self):
+        self._rule(name='Daily spike', metric='mortality_female_pct', operator='>', threshold=0.5)
+        self._rule(name='3-day trend', metric='mortality_female', operator='>=', threshold=8, window_days=3)
+        self._rule(name='Cumulative', metric='mortality_cum_female_pct', operator='>', threshold=2.5)
+
+        hits = rule_engine.evaluate_flocks_for_date(self.day)
+        fired = sorted((h.flock.flock_id, h.rule.name) for h in hits)
+        self.assertEqual(fired, [
+            ('VA2_230101_Batch1', '3-day trend'),
+            ('VA2_230101_Batch1', 'Cumulative'),
+            ('VA2_230101_Batch1', 'Daily spike'),
+        ])
+        trend = next(h for h in hits if h.rule.name == '3-day trend')
+        self.assertAlmostEqual(trend.value, 8.0)
+
+        # Nothing logged on that date
+        self.assertEqual(rule_engine.evaluate_flocks_for_date(self.day + timedelta(days=1)), [])
+
+        rule_engine.queue_rule_alerts(hits)
+        db.session.commit()
+        self.assertEqual(PushOutbox.query.count(), 3)
+
+    def test_rule_changes_invalidate_compiled_rules(self):
+        self.assertFalse(rule_engine.get_rule_evaluator())
+        # Rules saved with the old metric name still evaluate
+        self._rule(metric='egg_production_pct', operator='<', threshold=50)
+        evaluator = rule_engine.get_rule_evaluator()
+        self.assertIn('egg_prod_pct', evaluator.rules_by_metric)
+        self.assertIs(rule_engine.get_rule_evaluator(), evaluator)
+
+        NotificationRule.query.first().is_active = False
+        db.session.commit()
+        self.assertFalse(rule_engine.get_rule_evaluator())
+
+    def test_evaluate_unsaved_log(self):
+        self._rule(metric='mortality_female_pct', operator='>', threshold=1)
+        flock = self.flocks[0]
+        log = DailyLog(flock_id=flock.id, date=self.day + timedelta(days=1), mortality_female=20,
+                       feed_male_gp_bird=0, feed_female_gp_bird=0)
+        log.flock = flock
+        db.session.add(log)
+        hits = rule_engine.evaluate_log(log)
+        self.assertEqual(len(hits), 1)
+        self.assertIsNone(log.id)
+        db.session.rollback()
+
+    def test_evaluate_log_reads_only_the_rule_window(self):
+        self._rule(name='Trend', metric='mortality_female_pct', operator='>', threshold=0, window_days=3)
+        self._rule(name='Cumulative', metric='mortality_cum_female_pct', operator='>', threshold=0)
+        self._rule(name='Lay', metric='egg_prod_pct', operator='>', threshold=0)
+        flock = self.flocks[1]
+        flock.prod_start_female = 900
+        for log in DailyLog.query.filter(DailyLog.flock_id == flock.id, DailyLog.date >= date(2023, 1, 5)):
+            log.eggs_collected = 300
+        db.session.commit()
+
+        # Same values as replaying the whole history
+        evaluator = rule_engine.get_rule_evaluator()
+        full = enrich_flock_data(flock, DailyLog.query.filter_by(flock_id=flock.id).order_by(DailyLog.date).all())
+        expected = {rule.name: value for rule, value in evaluator.evaluate(full, len(full) - 1)}
+        db.session.expire(flock)
+
+        log = DailyLog.query.filter_by(flock_id=flock.id, date=self.day).one()
+        with mock.patch.object(rule_engine, 'enrich_flock_data', wraps=enrich_flock_data) as enrich:
+            hits = rule_engine.evaluate_log(log)
+        self.assertEqual(len(enrich.call_args[0][1]), 3)
+        self.assertNotIn('logs', inspect(flock).dict)
+        self.assertEqual(sorted(expected), ['Cumulative', 'Lay', 'Trend'])
+        for hit in hits:
+            self.assertAlmostEqual(hit.value, expected.pop(hit.rule.name))
+        self.assertEqual(expected, {})
+
+if __name__ == '__main__':
+    unittest.main()
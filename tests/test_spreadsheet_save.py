@@ -0,0 +1,136 @@
+import unittest
+import sys
+import os
+import importlib.util
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import House, Flock, DailyLog, PartitionWeight, User, Farm
+
+class SpreadsheetSaveTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['RATELIMIT_ENABLED'] = False
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        farm = Farm(name='Test Farm')
+        house = House(name='VA1')
+        db.session.add_all([farm, house])
+        db.session.commit()
+
+        self.flock = Flock(flock_id='VA1_230101_Batch1', farm_id=farm.id, house_id=house.id,
+                           intake_date=date(2023, 1, 1), intake_male=100, intake_female=1000)
+        db.session.add(self.flock)
+        db.session.commit()
+
+        for i in range(20):
+            db.session.add(DailyLog(flock_id=self.flock.id, date=date(2023, 1, 1) + timedelta(days=i), mortality_female=1))
+        db.session.commit()
+
+        u = User(username='admin_test', dept='Farm', role='Admin')
+        u.set_password('pass')
+        db.session.add(u)
+        db.session.commit()
+        self.app.post('/login', data={'username': 'admin_test', 'password': 'pass'})
+
+        from app.services.data_service import recalculate_flock_inventory
+        recalculate_flock_inventory(self.flock.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _row(self, log, **overrides):
+        row = {'id': log.id, 'date': log.date.strftime('%Y-%m-%d'), 'mortality_female': log.mortality_female}
+        row.update(overrides)
+        return row
+
+    def test_only_changed_rows_are_written(self):
+        logs = DailyLog.query.order_by(DailyLog.date).all()
+        versions = {l.id: l.version for l in logs}
+
+        target = logs[15]
+        payload = [self._row(l) for l in logs]
+        payload[15] = self._row(target, mortality_female=5, bw_F1=1500, uni_F1=80)
+
+        response = self.app.post(f'/api/flock/{self.flock.id}/spreadsheet_save', json={'data': payload})
+        body = response.get_json()
+        self.assertTrue(body['success'])
+        self.assertEqual(body['changed'], 1)
+        self.assertEqual(body['from_date'], '2023-01-16')
+        self.assertEqual(len(body['rows']), 5)
+
+        db.session.expire_all()
+        for l in DailyLog.query.order_by(DailyLog.date).all():
+            if l.date < target.date - timedelta(days=1):
+                self.assertEqual(l.version, versions[l.id], f"{l.date} should not be rewritten")
+
+        self.assertEqual(DailyLog.query.get(logs[16].id).females_at_start, 1000 - 15 - 5)
+        pw = PartitionWeight.query.filter_by(log_id=target.id).one()
+        self.assertEqual((pw.partition_name, pw.body_weight), ('F1', 1500))
+
+    def test_partition_update_in_place(self):
+        log = DailyLog.query.order_by(DailyLog.date).first()
+        self.app.post(f'/api/flock/{self.flock.id}/spreadsheet_save', json={'data': [self._row(log, bw_M1=2000)]})
+        pw_id = PartitionWeight.query.filter_by(log_id=log.id).one().id
+
+        self.app.post(f'/api/flock/{self.flock.id}/spreadsheet_save', json={'data': [self._row(log, bw_M1=2100)]})
+        pw = PartitionWeight.query.filter_by(log_id=log.id).one()
+        self.assertEqual(pw.id, pw_id)
+        self.assertEqual(pw.body_weight, 2100)
+
+    def _snapshot(self):
+        db.session.expire_all()
+        return [(l.date, l.males_at_start, l.females_at_start, l.water_intake_calculated, l.version)
+                for l in DailyLog.query.filter_by(flock_id=self.flock.id).order_by(DailyLog.date).all()]
+
+    def test_incremental_recalc_matches_full(self):
+        from app.services.data_service import recalculate_flock_inventory
+        logs = DailyLog.query.order_by(DailyLog.date).all()
+        for i, l in enumerate(logs):
+            if i != 7:  # gap in readings on day 8
+                l.water_reading_1 = 10000 + i * 250
+        db.session.commit()
+        recalculate_flock_inventory(self.flock.id)
+
+        # Latest day edit only touches that day and its water neighbour
+        before = self._snapshot()
+        logs[-1].mortality_female = 3
+        logs[-1].water_reading_1 = 20000
+        db.session.commit()
+        touched = recalculate_flock_inventory(self.flock.id, from_date=logs[-1].date)
+        self.assertEqual(touched, 1)
+        after = self._snapshot()
+        self.assertEqual([a[4] - b[4] for a, b in zip(after, before)].count(0), len(logs) - 2)
+
+        # Mid-flock edit gives the same result as a full rebuild
+        logs[10].mortality_female = 9
+        logs[10].water_reading_1 = 13000
+        db.session.commit()
+        recalculate_flock_inventory(self.flock.id, from_date=logs[10].date)
+        incremental = [s[:4] for s in self._snapshot()]
+        recalculate_flock_inventory(self.flock.id)
+        self.assertEqual(incremental, [s[:4] for s in self._snapshot()])
+
+        # Nothing changed: nothing is written
+        self.assertEqual(recalculate_flock_inventory(self.flock.id, from_date=logs[5].date), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import sys
+import os
+import importlib.util
+import io
+import random
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spec = importlib.util.spec_from_file_location('main_app', os.path.join(os.path.dirname(__file__), '..', 'run.py'))
+main_app = importlib.util.module_from_spec(spec)
+sys.modules['main_app'] = main_app
+spec.loader.exec_module(main_app)
+
+app = main_app.create_app()
+from app.database import db
+from app.models.models import House, User, FlockGrading
+from app.services.weigh_file_service import parse_weigh_file, WeighFileError
+
+def pen_rows(pens, birds, sep=','):
+    rng = random.Random(3)
+    return ''.join(f"2024-01-01{sep}VC{p}-{'M' if p % 4 == 0 else 'F'} P{p}{sep}{rng.randint(1200, 2400)}\n"
+                   for p in range(1, pens + 1) for _ in range(birds))
+
+class WeighFileTestCase(unittest.TestCase):
+    def test_scale_csv_with_preamble(self):
+        raw = ("Scale 7\nBatch 12\nDate,File,Weight [g]\n" + pen_rows(4, 10) + '2024-01-01,VC1-F P1,"1,250"\n').encode()
+        weights = parse_weigh_file('pen.csv', raw)
+        self.assertEqual(len(weights['Male']), 10)
+        self.assertEqual(len(weights['Female']), 31)
+        self.assertEqual(weights['Female'][-1], 1250.0)
+
+    def test_utf16_tab_export(self):
+        raw = ("Date\tFile\tWeight [g]\n" + pen_rows(4, 10, '\t')).encode('utf-16')
+        weights = parse_weigh_file('scale.txt', raw)
+        self.assertEqual((len(weights['Male']), len(weights['Female'])), (10, 30))
+
+    def test_workbook_blocks_without_header(self):
+        rows = [[None, 'Pen 1 M', None, None], [None, None, None, 'Weight [g]'], [None, None, None, 1500],
+                [None, None, None, 'end'], [None, None, None, 1600],
+                [None, 'Pen 2 F', None, None], [None, None, None, 'Weight [g]'], [None, None, None, '1,400'], [None, None, None, 0]]
+        buf = io.BytesIO()
+        pd.DataFrame(rows).to_excel(buf, header=False, index=False)
+        weights = parse_weigh_file('blocks.xlsx', buf.getvalue())
+        self.assertEqual(list(weights['Male']), [1500.0])
+        self.assertEqual(list(weights['Female']), [1400.0])
+
+    def test_unsupported_format(self):
+        with self.assertRaises(WeighFileError):
+            parse_weigh_file('weights.pdf', b'%PDF')
+
+    def test_large_multi_pen_file(self):
+        raw = ("Date,File,Weight [g]\n" + pen_rows(40, 2500)).encode()
+        start_time = time.time()
+        weights = parse_weigh_file('farm.csv', raw)
+        print(f"Parsed 100000 birds in {(time.time() - start_time) * 1000:.1f} ms")
+        self.assertEqual(len(weights['Male']) + len(weights['Female']), 100000)
+
+class UploadWeightsTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['WTF_CSRF_ENABLED'] = False
+        from app.extensions import limiter
+        limiter.enabled = False
+
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.house = House(name='WF1')
+        u = User(username='weigh_test', dept='Farm', role='Admin')
+        u.set_password('pass')
+        db.session.add_all([self.house, u])
+        db.session.commit()
+        self.app.post('/login', data={'username': 'weigh_test', 'password': 'pass'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_upload_grades_each_sex(self):
+        raw = ("Date,File,Weight [g]\n" + pen_rows(8, 50)).encode()
+        response = self.app.post('/upload_weights', data={'house_id': self.house.id, 'age_week': '20', 'bin_width': '50',
+                                                          'file': (io.BytesIO(raw), 'week20.csv')},
+                                 content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 302)
+        counts = {g.sex: g.count for g in FlockGrading.query.filter_by(house_id=self.house.id, age_week=20)}
+        self.assertEqual(counts, {'Male': 100, 'Female': 300})
+
+if __name__ == '__main__':
+    unittest.main()